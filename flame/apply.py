@@ -28,14 +28,13 @@ import hashlib
 from flame.stats.RF import RF
 from flame.stats.SVM import SVM
 from flame.stats.GNB import GNB
+from flame.stats.SGD import SGD
 from flame.stats.PLSR import PLSR
 from flame.stats.PLSDA import PLSDA
 from flame.stats.combo import median, mean, majority, matrix
 from flame.stats.XGboost import XGBOOST
-from sklearn.metrics import mean_squared_error, matthews_corrcoef as mcc
-from sklearn.metrics import f1_score
-from sklearn.metrics import make_scorer
-from sklearn.metrics import confusion_matrix
+from flame.stats.applicability_domain import ApplicabilityDomain
+from flame.stats import metrics
 from flame.util import utils, get_logger
 LOG = get_logger(__name__)
 
@@ -48,11 +47,16 @@ class Apply:
         self.conveyor = conveyor
         self.conveyor.setOrigin('apply')
 
+        # objects loaded from the model folder. Streamed predictions share
+        # them between the Apply objects of all the chunks
+        self.loaded = None
+
         # expand with new methods here:
         self.registered_methods = [('RF', RF),
                               ('SVM', SVM),
                               ('XGBOOST', XGBOOST),
                               ('GNB', GNB),
+                              ('SGD', SGD),
                               ('PLSR', PLSR),
                               ('PLSDA', PLSDA),
                               ('median', median),
@@ -78,232 +82,74 @@ class Apply:
                 LOG.warning(f'No qualitative activity suitable for external validation "{message}". Skipping.')
                 return
 
+        if Ye.size == 0:
+            raise ValueError("Experimental activity vector is empty")
+        Ye = Ye.astype(np.float64).ravel()
+
         # there are four variants of external validation, depending if the method
         # if conformal or non-conformal and the model is qualitative and quantitative
-
         if not self.param.getVal("conformal"):
-
-            # non-conformal 
+            Yp = np.asarray(self.conveyor.getVal("values")).ravel()
             if not self.param.getVal("quantitative"):
-                
-                # non-conformal & qualitative
-                Yp = np.asarray(self.conveyor.getVal("values"))
-
-                if Ye.size == 0:
-                    raise ValueError("Experimental activity vector is empty")
-                if Yp.size == 0:
-                    raise ValueError("Predicted activity vector is empty")
-
-                # the use of labels is compulsory to inform the confusion matrix that
-                # it must return a 2x2 confussion matrix. Otherwise it will fail when
-                # a single class is represented (all TP, for example)
-                TN, FP, FN, TP = confusion_matrix(
-                    Ye, Yp, labels=[0, 1]).ravel()
-
-                # protect to avoid warnings in special cases (div by zero)
-                MCC = mcc(Ye, Yp)
-
-                if (TP+FN) > 0:
-                    sensitivity = (TP / (TP + FN))
-                else:
-                    sensitivity = 0.0
-
-                if (TN+FP) > 0:
-                    specificity = (TN / (TN + FP))
-                else:
-                    specificity = 0.0
-
-                ext_val_results.append(('TP',
-                                        'True positives in external-validation',
-                                        float(TP)))
-                ext_val_results.append(('TN',
-                                        'True negatives in external-validation',
-                                        float(TN)))
-                ext_val_results.append(('FP',
-                                        'False positives in external-validation',
-                                        float(FP)))
-                ext_val_results.append(('FN',
-                                        'False negatives in external-validation',
-                                        float(FN)))
-                ext_val_results.append(('Sensitivity',
-                                        'Sensitivity in external-validation',
-                                        float(sensitivity)))
-                ext_val_results.append(('Specificity',
-                                        'Specificity in external-validation',
-                                        float(specificity)))
-                ext_val_results.append(('MCC',
-                                        'Mattews Correlation Coefficient in external-validation',
-                                        float(MCC)))
-
+                function = metrics.qualitative
             else:
-
-                # non-conformal & quantitative
-                Yp = np.asarray(self.conveyor.getVal("values"))
-
-                if Ye.size == 0:
-                    raise ValueError("Experimental activity vector is empty")
-                if Yp.size == 0:
-                    raise ValueError("Predicted activity vector is empty")
-
-                Ym = np.mean(Ye)
-                nobj = len(Yp)
-
-                SSY0_out = np.sum(np.square(Ym - Ye))
-                SSY_out = np.sum(np.square(Ye - Yp))
-                scoringP = mean_squared_error(Ye, Yp)
-                SDEP = np.sqrt(SSY_out / (nobj))
-                if SSY0_out == 0:
-                    Q2 = 0.0
-                else:
-                    Q2 = 1.00 - (SSY_out / SSY0_out)
-
-                ext_val_results.append(
-                    ('scoringP', 'Scoring P', scoringP))
-                ext_val_results.append(
-                    ('Q2', 'Determination coefficient in cross-validation', Q2))
-                ext_val_results.append(
-                    ('SDEP', 'Standard Deviation Error of the Predictions', SDEP))
-
-            self.conveyor.addVal(
-                             ext_val_results,
-                             'external-validation',
-                             'external validation',
-                             'method',
-                             'single',
-                             'External validation results')
+                function = metrics.quantitative
+            arrays = (Ye, Yp)
 
         else:
-            # conformal external validation
-
             if not self.param.getVal("quantitative"):
-                
-                # conformal & qualitative
-                Yp = np.concatenate((np.asarray(self.conveyor.getVal('c0')).reshape(
-                    -1, 1), np.asarray(self.conveyor.getVal('c1')).reshape(-1, 1)), axis=1)
-
-                if Ye.size == 0:
-                    raise ValueError("Experimental activity vector is empty")
-                if Yp.size == 0:
-                    raise ValueError("Predicted activity vector is empty")
-
-                c0_correct = 0
-                c1_correct = 0
-                not_predicted = 0
-                c0_incorrect = 0
-                c1_incorrect = 0
-
-                Ye1 = []
-                Yp1 = []
-                for i in range(len(Ye)):
-                    real = float(Ye[i])
-                    predicted = Yp[i]
-                    if predicted[0] != predicted[1]:
-                        Ye1.append(real)
-                        if predicted[0]:
-                            Yp1.append(0)
-                        else:
-                            Yp1.append(1)
-
-                        if real == 0 and predicted[0] == True:
-                            c0_correct += 1
-                        if real == 0 and predicted[1] == True:
-                            c0_incorrect += 1
-                        if real == 1 and predicted[1] == True:
-                            c1_correct += 1
-                        if real == 1 and predicted[0] == True:
-                            c1_incorrect += 1
-                    else:
-                        not_predicted += 1
-                MCC = mcc(Ye1, Yp1)
-                TN = c0_correct
-                FP = c0_incorrect
-                TP = c1_correct
-                FN = c1_incorrect
-                coverage = float((len(Yp) - not_predicted) / len(Yp))
-
-                try:
-                    # Compute accuracy (% of correct predictions)
-                    conformal_accuracy = (float(TN + TP) /
-                                                float(FP + FN + 
-                                                    TN + TP))
-                except Exception as e:
-                    LOG.error(f'Failed to compute conformal accuracy with'
-                                f'exception {e}')
-                    conformal_accuracy = '-'
-                                                            
-                if (TP+FN) > 0:
-                    sensitivity = (TP / (TP + FN))
-                else:
-                    sensitivity = 0.0
-                if (TN+FP) > 0:
-                    specificity = (TN / (TN + FP))
-                else:
-                    specificity = 0.0
-
-                ext_val_results.append(('TP',
-                                        'True positives in external-validation',
-                                        float(TP)))
-                ext_val_results.append(('TN',
-                                        'True negatives in external-validation',
-                                        float(TN)))
-                ext_val_results.append(('FP',
-                                        'False positives in external-validation',
-                                        float(FP)))
-                ext_val_results.append(('FN',
-                                        'False negatives in external-validation',
-                                        float(FN)))
-                ext_val_results.append(('Sensitivity',
-                                        'Sensitivity in external-validation',
-                                        float(sensitivity)))
-                ext_val_results.append(('Specificity',
-                                        'Specificity in external-validation',
-                                        float(specificity)))
-                ext_val_results.append(('MCC',
-                                        'Mattews Correlation Coefficient in external-validation',
-                                        float(MCC)))
-                ext_val_results.append(('Conformal_coverage',
-                                        'Conformal coverage in external-validation',
-                                        float(coverage)))
-                ext_val_results.append(('Conformal_accuracy',
-                                        'Conformal accuracy in external-validation',
-                                        float(conformal_accuracy)))
-
-
-                self.conveyor.addVal(
-                                 ext_val_results,
-                                 'external-validation',
-                                 'external validation',
-                                 'method',
-                                 'single',
-                                 'External validation results')
+                # class set matrix, with a column for every class
+                Yp = np.column_stack((np.asarray(self.conveyor.getVal('c0')).ravel(),
+                                      np.asarray(self.conveyor.getVal('c1')).ravel()))
+                function = metrics.conformal_qualitative
+                arrays = (Ye, Yp)
             else:
-
-                # conformal & quantitative
-                Yp_lower = self.conveyor.getVal('lower_limit')
-                Yp_upper = self.conveyor.getVal('upper_limit')
-
-                mean_interval = np.mean(np.abs(Yp_lower) - np.abs(Yp_upper))
-                inside_interval = (Yp_lower.reshape(-1, 1) <
-                                   Ye) & (Yp_upper.reshape(-1, 1) > Ye)
-                accuracy = len(inside_interval)/len(Ye)
-                conformal_accuracy = float("{0:.2f}".format(accuracy))
-                conformal_mean_interval = float(
-                    "{0:.2f}".format(mean_interval))
-
-                ext_val_results.append(('Conformal_mean_interval',
-                                        'Conformal mean interval',
-                                        conformal_mean_interval))
-                ext_val_results.append(('Conformal_accuracy',
-                                        'Conformal accuracy',
-                                        conformal_accuracy))
-
-                self.conveyor.addVal(
-                                 ext_val_results,
-                                 'external-validation',
-                                 'external validation',
-                                 'method',
-                                 'single',
-                                 'External validation results')
+                Yp = np.asarray(self.conveyor.getVal('lower_limit')).ravel()
+                Yp_upper = np.asarray(self.conveyor.getVal('upper_limit')).ravel()
+                function = metrics.conformal_quantitative
+                arrays = (Ye, Yp, Yp_upper)
+
+        if Yp.size == 0:
+            raise ValueError("Predicted activity vector is empty")
+
+        for key, value in function(*arrays).items():
+            value = float(value)
+            if function is metrics.conformal_quantitative:
+                value = float("{0:.2f}".format(value))
+            ext_val_results.append((key, metrics.EXTERNAL_LABELS[key], value))
+
+        # bootstrap confidence intervals of the metrics (not of the counts)
+        samples = self.param.getVal('validation_bootstrap')
+        if samples:
+            intervals = metrics.bootstrap(function, arrays, samples=samples)
+            for key, (lower, upper) in intervals.items():
+                if key in ('TP', 'TN', 'FP', 'FN'):
+                    continue
+                ext_val_results.append((f'{key}_CI_lower',
+                                        f'Lower limit of the 95% bootstrap CI of {key}',
+                                        float(lower)))
+                ext_val_results.append((f'{key}_CI_upper',
+                                        f'Upper limit of the 95% bootstrap CI of {key}',
+                                        float(upper)))
+
+        self.conveyor.addVal(
+                         ext_val_results,
+                         'external-validation',
+                         'external validation',
+                         'method',
+                         'single',
+                         'External validation results')
+
+    def load(self, key, loader):
+        ''' returns the object loaded by loader, only called once when the
+        loaded objects are shared '''
+
+        if self.loaded is None:
+            return loader()
+
+        if key not in self.loaded:
+            self.loaded[key] = loader()
+        return self.loaded[key]
 
     def preprocess(self, X):
         ''' This function loads the scaler and variable mask from a pickle file 
@@ -312,10 +158,13 @@ class Apply:
         prepro_file = os.path.join(self.param.getVal('model_path'),
                                     'preprocessing.pkl')
 
-        LOG.debug(f'Loading model from pickle file, path: {prepro_file}')
-        try:
+        def load_preprocessing():
+            LOG.debug(f'Loading model from pickle file, path: {prepro_file}')
             with open(prepro_file, "rb") as input_file:
-                dict_prepro = pickle.load(input_file)
+                return pickle.load(input_file)
+
+        try:
+            dict_prepro = self.load('preprocessing', load_preprocessing)
         except FileNotFoundError:
             return False, f'No valid preprocessing tools found at: {prepro_file}'
 
@@ -352,8 +201,44 @@ class Apply:
         if self.scaler is None:
             return False, 'Inconsistency error. Scaling method defined but no Scaler loaded'
         
+        # the scaler was fitted in the descriptor dtype
+        X = X.astype(utils.descriptor_dtype(self.param), copy=False)
+
         return True, self.scaler.transform(X)
 
+    def applicability_domain(self, X):
+        ''' computes the applicability domain scores of the preprocessed
+        X matrix and adds them to the conveyor '''
+
+        def load_ad():
+            ad = ApplicabilityDomain(self.param)
+            return ad if ad.load() else None
+
+        try:
+            ad = self.load('applicability_domain', load_ad)
+            if ad is None:
+                return
+            scores = ad.score(X)
+        except Exception as e:
+            LOG.warning(f'Unable to compute the applicability domain with exception {e}')
+            self.conveyor.setWarning(f'Unable to compute the applicability domain with exception {e}')
+            return
+
+        if 'distance' in scores:
+            self.conveyor.addVal(scores['distance'], 'AD_distance',
+                                 'AD distance', 'decoration', 'objs',
+                                 f'Mean {ad.metric} distance to the {ad.neighbours}'
+                                 ' nearest objects of the training series')
+
+        if 'leverage' in scores:
+            self.conveyor.addVal(scores['leverage'], 'AD_leverage',
+                                 'AD leverage', 'decoration', 'objs',
+                                 'Leverage of the object in the training series')
+
+        self.conveyor.addVal(scores['inside'].tolist(), 'AD_inside',
+                             'Inside AD', 'decoration', 'objs',
+                             'True if the object is inside the applicability domain')
+
     def run_internal(self): 
         ''' 
 
@@ -384,7 +269,8 @@ class Apply:
             return
             
         # Load scaler and variable mask and preprocess the data
-        success, result = self.preprocess(X)
+        with self.conveyor.span('preprocess', nobj):
+            success, result = self.preprocess(X)
         if not success:
             self.conveyor.setError(result)
             return            
@@ -392,44 +278,61 @@ class Apply:
 
 
 
-        # instantiate an appropriate child of base_model
+        # the model is loaded once for all the chunks of streamed predictions
         model = None
-        for imethod in self.registered_methods:
-            if imethod[0] == self.param.getVal('model'):
-
-                # we instantiate the subtype of base_model, 
-                # passing 
-                # - model parameters (param) 
-                # - already obtained results (conveyor)
-
-                model = imethod[1](None, None, self.param, self.conveyor)
-                LOG.debug('Recognized learner: '
-                          f"{self.param.getVal('model')}")
-                break
-
-        if not model:
-            self.conveyor.setError('modeling method not recognized')
-            LOG.error(f'Modeling method {self.param.getVal("model")} '
-                      'not recognized')
-            return
-        
-        if self.conveyor.getError():
-            return
+        if self.loaded is not None:
+            model = self.loaded.get('model')
 
-        # try to load model previously built
-        try:
-            model.load_model()
-            LOG.debug(f'Loading model from pickle file')
-        except Exception as e:
-            self.conveyor.setError(f'No valid model estimator found with exception "{e}"')
-            return False, f'Exception ocurred when loading model: {e}'
+        if model is not None:
+            model.conveyor = self.conveyor
+        else:
+            # instantiate an appropriate child of base_model
+            for imethod in self.registered_methods:
+                if imethod[0] == self.param.getVal('model'):
+
+                    # we instantiate the subtype of base_model, 
+                    # passing 
+                    # - model parameters (param) 
+                    # - already obtained results (conveyor)
+
+                    model = imethod[1](None, None, self.param, self.conveyor)
+                    LOG.debug('Recognized learner: '
+                              f"{self.param.getVal('model')}")
+                    break
+
+            if not model:
+                self.conveyor.setError('modeling method not recognized')
+                LOG.error(f'Modeling method {self.param.getVal("model")} '
+                          'not recognized')
+                return
+            
+            if self.conveyor.getError():
+                return
+
+            # try to load model previously built
+            try:
+                with self.conveyor.span('load_model'):
+                    model.load_model()
+                LOG.debug(f'Loading model from pickle file')
+            except Exception as e:
+                self.conveyor.setError(f'No valid model estimator found with exception "{e}"')
+                return False, f'Exception ocurred when loading model: {e}'
+
+            if self.loaded is not None:
+                self.loaded['model'] = model
 
         # project the X matrix into the model and save predictions in self.conveyor
-        model.project(X)
+        with self.conveyor.span('project', nobj):
+            model.project(X)
+
+        # add the AD scores, for models built with an applicability domain
+        with self.conveyor.span('applicability_domain', nobj):
+            self.applicability_domain(X)
         
         # if the input file contains activity values use them to run external validation 
         if self.conveyor.isKey('ymatrix'):
-            self.external_validation()
+            with self.conveyor.span('external_validation', nobj):
+                self.external_validation()
 
         return
 
@@ -0,0 +1,104 @@
+#! -*- coding: utf-8 -*-
+
+# Description    Flame benchmark command
+#
+# Authors:       Manuel Pastor (manuel.pastor@upf.edu)
+#
+# Copyright 2018 Manuel Pastor
+#
+# This file is part of Flame
+#
+# Flame is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3.
+#
+# Flame is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Flame. If not, see <http://www.gnu.org/licenses/>.
+
+''' Runs the benchmark suite from the command line, e.g.
+
+    python -m flame.benchmarks -n 100,1000 -c idata,learn -o results.json
+    python -m flame.benchmarks --compare reference.json results.json '''
+
+import argparse
+
+from flame.util import get_logger
+from flame.benchmarks import suite
+
+LOG = get_logger(__name__)
+
+
+def comma_list(value, cast=str):
+    return [cast(i) for i in value.split(',')]
+
+
+def boolean_list(value):
+    return [i.lower() in ('true', '1', 'on', 'yes') for i in value.split(',')]
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description='Times the Flame workflows on synthetic series.')
+
+    parser.add_argument('-n', '--sizes', default='100',
+                        help='Comma separated list of training series sizes.')
+    parser.add_argument('-c', '--cases', default=','.join(suite.CASES),
+                        help=f'Comma separated list of benchmarks, among {suite.CASES}.')
+    parser.add_argument('-d', '--descriptors', default=suite.DESCRIPTORS[0],
+                        help=f'Comma separated list of descriptor methods, among {suite.DESCRIPTORS}. '
+                             'learn and apply use the first one.')
+    parser.add_argument('--cpus', default='1',
+                        help='Comma separated list of numCPUs values used by idata.')
+    parser.add_argument('--mol_batch', default=','.join(suite.MOL_BATCH),
+                        help='Comma separated list of mol_batch modes used by idata.')
+    parser.add_argument('-m', '--estimators', default='RF',
+                        help=f'Comma separated list of estimators, among {suite.ESTIMATORS}.')
+    parser.add_argument('--conformal', default='false',
+                        help='Comma separated list of conformal settings, e.g. false,true.')
+    parser.add_argument('--tune', default='false',
+                        help='Comma separated list of tune settings, e.g. false,true.')
+    parser.add_argument('--seed', default=1, type=int,
+                        help='Seed used to generate the synthetic series.')
+    parser.add_argument('-o', '--output',
+                        help='JSON file where the results are saved.')
+    parser.add_argument('--compare', nargs=2, metavar=('REFERENCE', 'CURRENT'),
+                        help='Compares the times of two result files instead of running the benchmarks.')
+
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        suite.print_comparison(suite.compare(*args.compare))
+        return
+
+    success, results = suite.run_suite(sizes=comma_list(args.sizes, int),
+                                       cases=comma_list(args.cases),
+                                       descriptors=comma_list(args.descriptors),
+                                       cpus=comma_list(args.cpus, int),
+                                       mol_batch=comma_list(args.mol_batch),
+                                       estimators=comma_list(args.estimators),
+                                       conformal=boolean_list(args.conformal),
+                                       tune=boolean_list(args.tune),
+                                       output=args.output,
+                                       seed=args.seed)
+    if not success:
+        LOG.error(results)
+        return
+
+    for result in results['results']:
+        if not result['success']:
+            time = 'failed'
+        elif result['time'] is None:
+            time = 'n/a'
+        else:
+            time = f'{result["time"]:10.3f} s'
+        print(f'{result["case"]:8} {result["size"]:8d} {time}  {result["settings"]}')
+
+
+if __name__ == '__main__':
+    main()
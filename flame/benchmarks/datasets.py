@@ -0,0 +1,178 @@
+#! -*- coding: utf-8 -*-
+
+# Description    Synthetic datasets for Flame benchmarks
+#
+# Authors:       Manuel Pastor (manuel.pastor@upf.edu)
+#
+# Copyright 2018 Manuel Pastor
+#
+# This file is part of Flame
+#
+# Flame is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3.
+#
+# Flame is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Flame. If not, see <http://www.gnu.org/licenses/>.
+
+''' Generates synthetic training and query series of any size, without
+    network access.
+
+    Molecules are assembled by joining random building blocks in linear
+    SMILES strings and validated with RDKit. The activity is a noisy
+    function of the logP and the TPSA of the molecule, so that the models
+    built on these series have a meaningful quality '''
+
+import os
+import numpy as np
+from rdkit import Chem, RDLogger
+from rdkit.Chem import AllChem, Crippen, rdMolDescriptors
+
+from flame.util import get_logger
+
+LOG = get_logger(__name__)
+
+# fragments joined in sequence. Rings are closed within every fragment
+BUILDING_BLOCKS = ['C', 'CC', 'CCC', 'C(C)C', 'O', 'N', 'N(C)', 'C(=O)',
+                   'C(=O)N', 'C(=O)O', 'S(=O)(=O)', 'c1ccccc1', 'c1ccncc1',
+                   'c1ccc(F)cc1', 'c1ccc(Cl)cc1', 'c1ccc(O)cc1', 'C1CCNCC1',
+                   'C1CCOCC1', 'C1CC1', 'c1ccsc1', 'c1cnc[nH]1', 'C=C']
+
+# fragments only used at the end of the molecule
+TERMINAL_BLOCKS = ['F', 'Cl', 'Br', 'O', 'N', 'C(F)(F)F', 'OC', 'C(=O)O', 'C', 'C#N']
+
+ACTIVITY = 'activity'
+
+
+def generate_smiles(size, seed=1, min_blocks=2, max_blocks=7):
+    ''' returns a list of size unique canonical SMILES '''
+
+    rng = np.random.RandomState(seed)
+
+    smiles = []
+    unique = set()
+    attempts = 0
+
+    # invalid combinations are expected and discarded silently
+    RDLogger.DisableLog('rdApp.error')
+    while len(smiles) < size:
+        attempts += 1
+        if attempts > size * 100:
+            RDLogger.EnableLog('rdApp.error')
+            raise ValueError(f'Unable to generate {size} unique molecules')
+
+        nblocks = rng.randint(min_blocks, max_blocks+1)
+        blocks = [BUILDING_BLOCKS[i] for i in rng.randint(len(BUILDING_BLOCKS), size=nblocks)]
+        blocks.append(TERMINAL_BLOCKS[rng.randint(len(TERMINAL_BLOCKS))])
+
+        mol = Chem.MolFromSmiles(''.join(blocks))
+        if mol is None:
+            continue
+
+        canonical = Chem.MolToSmiles(mol)
+        if canonical in unique:
+            continue
+
+        unique.add(canonical)
+        smiles.append(canonical)
+
+    RDLogger.EnableLog('rdApp.error')
+    return smiles
+
+
+def activity(mols, seed=1, noise=0.3):
+    ''' synthetic activity of the molecules '''
+
+    rng = np.random.RandomState(seed)
+    values = np.array([Crippen.MolLogP(mol) - 0.02 * rdMolDescriptors.CalcTPSA(mol)
+                       for mol in mols])
+    return values + rng.normal(0.0, noise, len(values))
+
+
+def write_sdf(path, size, seed=1, qualitative=False):
+    ''' writes an SDFile with size molecules, with 2D coordinates, a name
+    and the activity (0/1 values if qualitative) '''
+
+    smiles = generate_smiles(size, seed)
+    mols = [Chem.MolFromSmiles(i) for i in smiles]
+    values = activity(mols, seed)
+    if qualitative:
+        values = (values > np.median(values)).astype(int)
+
+    writer = Chem.SDWriter(path)
+    for i, (mol, value) in enumerate(zip(mols, values)):
+        AllChem.Compute2DCoords(mol)
+        mol.SetProp('_Name', f'mol{i:06d}')
+        mol.SetProp(ACTIVITY, str(value))
+        writer.write(mol)
+    writer.close()
+
+    return path
+
+
+def write_smiles(path, size, seed=1, qualitative=False):
+    ''' writes a tab separated SMILES file with a header and the columns
+    SMILES, name and activity '''
+
+    smiles = generate_smiles(size, seed)
+    values = activity([Chem.MolFromSmiles(i) for i in smiles], seed)
+    if qualitative:
+        values = (values > np.median(values)).astype(int)
+
+    with open(path, 'w') as handle:
+        handle.write(f'SMILES\tname\t{ACTIVITY}\n')
+        for i, (ismiles, value) in enumerate(zip(smiles, values)):
+            handle.write(f'{ismiles}\tmol{i:06d}\t{value}\n')
+
+    return path
+
+
+def write_tsv(path, size, nvarx=100, seed=1, qualitative=False):
+    ''' writes a TSV file with size objects and nvarx variables, in the
+    format read by idata for input_type 'data': variable names in the first
+    row, object names in the first column and the activity in the last one.
+    The variables are correlated, generated from a few latent variables '''
+
+    rng = np.random.RandomState(seed)
+    nlatent = min(5, nvarx)
+
+    latent = rng.normal(size=(size, nlatent))
+    X = latent @ rng.normal(size=(nlatent, nvarx)) + rng.normal(0.0, 0.5, (size, nvarx))
+    values = latent @ rng.normal(size=nlatent) + rng.normal(0.0, 0.3, size)
+    if qualitative:
+        values = (values > np.median(values)).astype(int)
+
+    with open(path, 'w') as handle:
+        handle.write('name\t' + '\t'.join(f'var{i:04d}' for i in range(nvarx)) +
+                     f'\t{ACTIVITY}\n')
+        for i in range(size):
+            row = '\t'.join(f'{x:.5f}' for x in X[i])
+            handle.write(f'obj{i:06d}\t{row}\t{values[i]}\n')
+
+    return path
+
+
+def write_datasets(path, size, seed=1, nvarx=100):
+    ''' writes in directory path the SDF, SMILES and TSV series of the
+    given size, quantitative and qualitative, and returns their names '''
+
+    os.makedirs(path, exist_ok=True)
+    files = {}
+
+    for qualitative in (False, True):
+        suffix = 'qualitative' if qualitative else 'quantitative'
+        files[f'sdf_{suffix}'] = write_sdf(
+            os.path.join(path, f'series_{size}_{suffix}.sdf'), size, seed, qualitative)
+        files[f'smiles_{suffix}'] = write_smiles(
+            os.path.join(path, f'series_{size}_{suffix}.smi'), size, seed, qualitative)
+        files[f'tsv_{suffix}'] = write_tsv(
+            os.path.join(path, f'series_{size}_{suffix}.tsv'), size, nvarx, seed, qualitative)
+
+    LOG.info(f'Synthetic series of {size} objects written to {path}')
+
+    return files
@@ -0,0 +1,482 @@
+#! -*- coding: utf-8 -*-
+
+# Description    Flame benchmark suite
+#
+# Authors:       Manuel Pastor (manuel.pastor@upf.edu)
+#
+# Copyright 2018 Manuel Pastor
+#
+# This file is part of Flame
+#
+# Flame is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3.
+#
+# Flame is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Flame. If not, see <http://www.gnu.org/licenses/>.
+
+''' Times the main workflows of Flame on synthetic series:
+
+    - idata: for every descriptor method, number of CPUs and mol_batch mode,
+      with SDFile and SMILES input, and for TSV input
+    - learn: for every estimator, with conformal prediction and tuning on
+      and off
+    - apply: prediction of a query series with every model built by learn
+    - space: build of a chemical space and search of the query series, for
+      every descriptor method
+    - ad: build of the applicability domain on the training series and
+      scoring of AD_QUERY_SIZE query objects, for every descriptor method,
+      showing how the nearest neighbour searches scale with the size of
+      the training series
+
+    The models and spaces are built in temporary repositories, restoring the
+    configuration of Flame at the end. The results, together with the
+    stages timed by the workflow tracer, are saved as JSON so that different
+    runs can be compared with compare() '''
+
+import os
+import json
+import time
+import shutil
+import platform
+import tempfile
+import multiprocessing
+from datetime import datetime
+
+import numpy as np
+
+from flame.util import utils, get_logger
+from flame.benchmarks import datasets
+
+LOG = get_logger(__name__)
+
+CASES = ('idata', 'learn', 'apply', 'space', 'ad')
+
+DESCRIPTORS = ('RDKit_properties', 'RDKit_md', 'morganFP')
+ESTIMATORS = ('RF', 'XGBOOST', 'SVM', 'PLSR', 'PLSDA', 'GNB', 'SGD')
+MOL_BATCH = ('series', 'objects')
+
+# estimators which only build qualitative models
+QUALITATIVE_ONLY = ('PLSDA', 'GNB')
+
+MODEL = 'BENCHMARK'
+SPACE = 'BENCHMARK'
+LABEL = 'benchmark'
+
+BENCHMARK_VERSION = 1
+
+# number of query objects scored by the applicability domain
+AD_QUERY_SIZE = 100
+
+
+def environment():
+    ''' description of the host and the main libraries '''
+
+    versions = {'python': platform.python_version(), 'numpy': np.__version__}
+    for library in ('sklearn', 'rdkit', 'xgboost'):
+        try:
+            versions[library] = __import__(library).__version__
+        except Exception:
+            versions[library] = None
+
+    return {'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': multiprocessing.cpu_count(),
+            'versions': versions}
+
+
+def remove_idata(ifile):
+    ''' removes the descriptors saved by idata for the input file, so that
+    they are computed again '''
+
+    for name in ('data.pkl', 'xmatrix.npy'):
+        path = os.path.join(os.path.dirname(ifile), name)
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+def stage_time(spans, name):
+    ''' time of the top level stage with the given name '''
+
+    for span in spans:
+        if span['name'] == name:
+            return span['duration']
+    return None
+
+
+def record(case, size, settings, success, message, elapsed, spans=None, stage=None):
+    ''' a single benchmark result. time is the duration of the stage
+    benchmarked and total the time of the whole workflow '''
+
+    result = {'case': case,
+              'size': size,
+              'settings': settings,
+              'success': bool(success),
+              'message': None if success else str(message),
+              'total': elapsed,
+              'time': elapsed,
+              'stages': spans}
+
+    if stage is not None and spans is not None:
+        result['time'] = stage_time(spans, stage)
+
+    if not success:
+        status = f'failed: {message}'
+    elif result['time'] is None:
+        status = 'stage not timed'
+    else:
+        status = f'{result["time"]:.3f} s'
+    LOG.info(f'benchmark {case} {size} {settings}: {status}')
+    return result
+
+
+def run_idata(files, size, descriptors, cpus, mol_batch):
+    ''' times idata for every descriptor method, number of CPUs and
+    mol_batch mode, reading the series from the SDFile and from the SMILES
+    file, and for the TSV input '''
+
+    from flame.parameters import Parameters
+    from flame.conveyor import Conveyor
+    from flame.idata import Idata
+
+    settings_list = []
+    for input_type in ('molecule', 'smiles'):
+        for descriptor in descriptors:
+            for ncpu in cpus:
+                for batch in mol_batch:
+                    settings_list.append({'input_type': input_type,
+                                          'computeMD_method': [descriptor],
+                                          'numCPUs': ncpu,
+                                          'mol_batch': batch})
+    settings_list.append({'input_type': 'data'})
+
+    results = []
+    for settings in settings_list:
+        param = Parameters()
+        success, message = param.loadYaml(MODEL, 0)
+        if not success:
+            results.append(record('idata', size, settings, False, message, None))
+            continue
+
+        for key, value in settings.items():
+            param.setVal(key, value)
+
+        if settings['input_type'] == 'data':
+            ifile = files['tsv_quantitative']
+        elif settings['input_type'] == 'smiles':
+            ifile = files['smiles_quantitative']
+        else:
+            ifile = files['sdf_quantitative']
+        remove_idata(ifile)
+
+        conveyor = Conveyor()
+        start = time.perf_counter()
+        try:
+            with conveyor.span('idata'):
+                Idata(param, conveyor, ifile).run()
+            success, message = not conveyor.getError(), conveyor.getErrorMessage()
+        except Exception as e:
+            success, message = False, e
+        elapsed = time.perf_counter() - start
+
+        results.append(record('idata', size, settings, success, message,
+                              elapsed, conveyor.tracer.to_dict(), 'idata'))
+
+    return results
+
+
+def run_learn_apply(files, query_files, size, descriptor, estimators,
+                    conformal, tune, cases):
+    ''' times the build of a model with every estimator, conformal and tune
+    setting and the prediction of the query series with this model '''
+
+    from flame.build import Build
+    from flame.predict import Predict
+
+    results = []
+    for estimator in estimators:
+        qualitative = estimator in QUALITATIVE_ONLY
+        series = 'sdf_qualitative' if qualitative else 'sdf_quantitative'
+
+        for iconformal in conformal:
+            for itune in tune:
+                settings = {'model': estimator,
+                            'quantitative': not qualitative,
+                            'conformal': iconformal,
+                            'tune': itune,
+                            'computeMD_method': [descriptor],
+                            'input_type': 'molecule',
+                            'numCPUs': 1}
+
+                start = time.perf_counter()
+                try:
+                    build = Build(MODEL, param_string=json.dumps(settings))
+                    success, message = False, build.conveyor.getErrorMessage()
+                    if not build.conveyor.getError():
+                        success, message = build.run(files[series])
+                    spans = build.conveyor.tracer.to_dict()
+                except Exception as e:
+                    success, message, spans = False, e, None
+                elapsed = time.perf_counter() - start
+
+                if 'learn' in cases:
+                    results.append(record('learn', size, settings, success, message,
+                                          elapsed, spans, 'learn'))
+
+                if 'apply' not in cases:
+                    continue
+
+                if not success:
+                    results.append(record('apply', size, settings, False,
+                                          'model build failed', None))
+                    continue
+
+                start = time.perf_counter()
+                try:
+                    predict = Predict(MODEL, 0, label=LABEL)
+                    success, message = predict.run(query_files[series])
+                    spans = predict.conveyor.tracer.to_dict()
+                except Exception as e:
+                    success, message, spans = False, e, None
+                elapsed = time.perf_counter() - start
+
+                results.append(record('apply', size, settings, success, message,
+                                      elapsed, spans, 'apply'))
+
+    return results
+
+
+def run_space(files, query_files, size, descriptors):
+    ''' times the build of a chemical space and a similarity search for
+    every descriptor method '''
+
+    from flame.sbuild import Sbuild
+    from flame.search import Search
+
+    results = []
+    for descriptor in descriptors:
+        settings = {'computeMD_method': [descriptor], 'numCPUs': 1}
+
+        for case in ('sbuild', 'search'):
+            start = time.perf_counter()
+            try:
+                if case == 'sbuild':
+                    workflow = Sbuild(SPACE, param_string=json.dumps(settings))
+                    stage = 'slearn'
+                    arguments = files['sdf_quantitative']
+                else:
+                    workflow = Search(SPACE, 0, label=LABEL)
+                    stage = 'search'
+                    arguments = {'infile': query_files['sdf_quantitative'],
+                                 'metric': None, 'numsel': 10, 'cutoff': None}
+
+                success, message = False, workflow.conveyor.getErrorMessage()
+                if not workflow.conveyor.getError():
+                    success, message = workflow.run(arguments)
+                spans = workflow.conveyor.tracer.to_dict()
+            except Exception as e:
+                success, message, spans, stage = False, e, None, None
+            elapsed = time.perf_counter() - start
+
+            results.append(record(case, size, settings, success, message,
+                                  elapsed, spans, stage))
+            if not success:
+                break
+
+    return results
+
+
+def run_ad(files, query_files, size, descriptors):
+    ''' times the build of the applicability domain and the scoring of the
+    query series for every descriptor method '''
+
+    from flame.parameters import Parameters
+    from flame.conveyor import Conveyor
+    from flame.idata import Idata
+    from flame.stats.applicability_domain import ApplicabilityDomain
+
+    results = []
+    for descriptor in descriptors:
+        settings = {'computeMD_method': [descriptor]}
+
+        param = Parameters()
+        success, message = param.loadYaml(MODEL, 0)
+        if not success:
+            results.append(record('adbuild', size, settings, False, message, None))
+            continue
+
+        param.setVal('input_type', 'molecule')
+        param.setVal('computeMD_method', [descriptor])
+        param.setVal('numCPUs', 1)
+
+        # the descriptors are not timed
+        matrices = []
+        for ifile in (files['sdf_quantitative'], query_files['sdf_quantitative']):
+            remove_idata(ifile)
+            conveyor = Conveyor()
+            Idata(param, conveyor, ifile).run()
+            if conveyor.getError():
+                break
+            matrices.append(conveyor.getVal('xmatrix'))
+
+        if len(matrices) < 2:
+            results.append(record('adbuild', size, settings, False,
+                                  conveyor.getErrorMessage(), None))
+            continue
+
+        X, Xq = matrices[0], matrices[1][:AD_QUERY_SIZE]
+        ad = ApplicabilityDomain(param)
+
+        start = time.perf_counter()
+        try:
+            success, message = ad.build(X)
+        except Exception as e:
+            success, message = False, e
+        elapsed = time.perf_counter() - start
+
+        results.append(record('adbuild', size, settings, success, message, elapsed))
+        if not success:
+            continue
+
+        start = time.perf_counter()
+        try:
+            ad.score(Xq)
+            success, message = True, None
+        except Exception as e:
+            success, message = False, e
+        elapsed = time.perf_counter() - start
+
+        results.append(record('adquery', size, settings, success, message, elapsed))
+
+    return results
+
+
+def run_suite(sizes=(100,), cases=CASES, descriptors=DESCRIPTORS[:1],
+              cpus=(1,), mol_batch=MOL_BATCH, estimators=('RF',),
+              conformal=(False,), tune=(False,), output=None, path=None,
+              seed=1):
+    ''' runs the benchmarks for every size of the training series and
+    returns a dictionary with the results, saved as JSON in output '''
+
+    from flame import manage, smanage
+
+    unknown = [i for i in cases if i not in CASES]
+    if len(unknown) > 0:
+        return False, f'Unknown benchmark cases {unknown}, use {CASES}'
+
+    remove_path = path is None
+    if path is None:
+        path = tempfile.mkdtemp(prefix='flame-benchmark-')
+
+    # the repositories are temporary, but the configuration is updated
+    config_path = utils.get_conf_yml_path()
+    with open(config_path, 'r') as handle:
+        config_text = handle.read()
+
+    report = {'benchmark_version': BENCHMARK_VERSION,
+              'date': datetime.now().isoformat(),
+              'environment': environment(),
+              'settings': {'sizes': list(sizes), 'cases': list(cases),
+                           'descriptors': list(descriptors), 'cpus': list(cpus),
+                           'mol_batch': list(mol_batch),
+                           'estimators': list(estimators),
+                           'conformal': list(conformal), 'tune': list(tune),
+                           'seed': seed},
+              'results': []}
+
+    try:
+        repositories = [os.path.join(path, i) for i in ('models', 'spaces', 'predictions')]
+        for repository in repositories:
+            os.makedirs(repository, exist_ok=True)
+        utils.set_repositories(*repositories)
+
+        success, message = manage.action_new(MODEL)
+        if success and 'space' in cases:
+            success, message = smanage.action_new(SPACE)
+        if not success:
+            return False, message
+
+        for size in sizes:
+            # training and query series are generated with different seeds
+            files = datasets.write_datasets(os.path.join(path, 'training'), size, seed)
+            query_files = datasets.write_datasets(os.path.join(path, 'query'), size, seed+1)
+
+            if 'idata' in cases:
+                report['results'] += run_idata(files, size, descriptors, cpus, mol_batch)
+
+            if 'learn' in cases or 'apply' in cases:
+                report['results'] += run_learn_apply(files, query_files, size,
+                                                     descriptors[0], estimators,
+                                                     conformal, tune, cases)
+
+            if 'space' in cases:
+                report['results'] += run_space(files, query_files, size, descriptors)
+
+            if 'ad' in cases:
+                report['results'] += run_ad(files, query_files, size, descriptors)
+
+    finally:
+        with open(config_path, 'w') as handle:
+            handle.write(config_text)
+        if remove_path:
+            shutil.rmtree(path, ignore_errors=True)
+
+    if output is not None:
+        with open(output, 'w') as handle:
+            json.dump(report, handle, indent=1)
+        LOG.info(f'Benchmark results saved in {output}')
+
+    return True, report
+
+
+def result_key(result):
+    return (result['case'], result['size'], json.dumps(result['settings'], sort_keys=True))
+
+
+def compare(reference, current):
+    ''' compares two benchmark reports (dictionaries or JSON files) and
+    returns a list with the case, size, settings, reference and current times
+    and their ratio, for the benchmarks present in both '''
+
+    reports = []
+    for report in (reference, current):
+        if isinstance(report, str):
+            with open(report, 'r') as handle:
+                report = json.load(handle)
+        reports.append(report)
+
+    reference_times = {result_key(i): i['time'] for i in reports[0]['results']
+                       if i['success']}
+
+    comparison = []
+    for result in reports[1]['results']:
+        key = result_key(result)
+        if not result['success'] or reference_times.get(key) is None:
+            continue
+
+        ratio = None
+        if reference_times[key] > 0:
+            ratio = result['time'] / reference_times[key]
+
+        comparison.append({'case': result['case'],
+                           'size': result['size'],
+                           'settings': result['settings'],
+                           'reference': reference_times[key],
+                           'current': result['time'],
+                           'ratio': ratio})
+
+    return comparison
+
+
+def print_comparison(comparison):
+    ''' prints the result of compare in a human-readable format '''
+
+    for item in comparison:
+        ratio = '   n/a' if item['ratio'] is None else f'{item["ratio"]:6.2f}'
+        print(f'{item["case"]:8} {item["size"]:8d} {item["reference"]:10.3f} s'
+              f' {item["current"]:10.3f} s  x{ratio}  {json.dumps(item["settings"])}')
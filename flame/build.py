@@ -21,10 +21,10 @@
 # along with Flame. If not, see <http://www.gnu.org/licenses/>.
 
 import os
-import sys
 import importlib
 
 from flame.util import utils, get_logger
+from flame import catalog
 from flame.parameters import Parameters
 from flame.conveyor import Conveyor
 from flame.idata import Idata
@@ -55,9 +55,15 @@ class Build:
             success, message = self.param.loadYaml(model, 0)
 
         # being unable to load parameters is a critical error
+        # the error is reported by the caller, which must not run the build
         if not success:
             LOG.critical(f'Unable to load model parameters. "{message}" Aborting...')
-            sys.exit(1)
+            self.conveyor.setError(f'Unable to load model parameters. "{message}"')
+            return
+
+        # optional accounting of the memory used in every stage
+        if self.param.getVal('memory_profile'):
+            self.conveyor.tracer.enable_memory()
 
         # add additional output formats included in the constructor 
         # this is requiered to add JSON format as output when the object is
@@ -97,12 +103,14 @@ class Build:
             odata_child = importlib.import_module(modpath+".odata_child")
 
             # run idata object, in charge of generate model data from input
+            self.conveyor.setProgress(0.1, 'processing training series')
             try:
                 idata = idata_child.IdataChild(self.param, self.conveyor, input_source)
             except:
                 LOG.warning ('Idata child architecture mismatch, defaulting to Idata parent')
                 idata = Idata(self.param, self.conveyor, input_source)
-            idata.run() 
+            with self.conveyor.span('idata'):
+                idata.run() 
             LOG.debug(f'idata child {type(idata).__name__} completed `run()`')
 
         if not self.conveyor.getError():
@@ -115,8 +123,10 @@ class Build:
 
         if not self.conveyor.getError():
             # instantiate learn (build a model from idata) and run it
+            self.conveyor.setProgress(0.5, 'building model')
             learn = learn_child.LearnChild(self.param, self.conveyor)
-            learn.run()
+            with self.conveyor.span('learn', self.conveyor.getVal('obj_num')):
+                learn.run()
 
             try:
                 learn = learn_child.LearnChild(self.param, self.conveyor)
@@ -129,10 +139,17 @@ class Build:
         # run odata object, in charge of formatting the prediction results
         # note that if any of the above steps failed, an error has been inserted in the
         # conveyor and odata will take case of showing an error message
+        self.conveyor.setProgress(0.9, 'formatting results')
         try:
             odata = odata_child.OdataChild(self.param, self.conveyor)
         except:
             LOG.warning ('Odata child architecture mismatch, defaulting to Odata parent')
             odata = Odata(self.param, self.conveyor)
 
-        return odata.run()
\ No newline at end of file
+        with self.conveyor.span('odata'):
+            success, results = odata.run()
+
+        # keep the summary of the new results in the catalog of the repository
+        catalog.update(self.model, 0)
+
+        return success, results
\ No newline at end of file
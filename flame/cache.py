@@ -0,0 +1,206 @@
+#! -*- coding: utf-8 -*-
+
+# Description    Flame persistent cache of molecular computations
+#
+# Authors:       Manuel Pastor (manuel.pastor@upf.edu)
+#
+# Copyright 2018 Manuel Pastor
+#
+# This file is part of Flame
+#
+# Flame is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3.
+#
+# Flame is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Flame. If not, see <http://www.gnu.org/licenses/>.
+
+''' Persistent cache of the results of expensive computations applied to
+    molecular structures (e.g. standardization), shared by all the models
+    of the repository.
+
+    The results are stored in a SQLite database at the root of the model
+    repository, indexed by a namespace, identifying the method, its version
+    and its settings, and by a key identifying the input structure. Values
+    are stored in JSON format.
+
+    Writes are buffered and saved in a single transaction by flush() every
+    FLUSH_SIZE values, so that processes running in parallel do not block each other. Any error
+    accessing the database disables the cache, which only makes the
+    computations slower '''
+
+import os
+import json
+import sqlite3
+import hashlib
+
+from flame.util import utils, get_logger
+
+LOG = get_logger(__name__)
+
+CACHE_FILE = 'cache.sqlite'
+
+# number of stored values saved together, limiting the memory used by
+# the values pending to be saved in long runs
+FLUSH_SIZE = 1000
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (namespace, key)) WITHOUT ROWID;
+'''
+
+
+def cache_path():
+    ''' default location of the cache, in the model repository. None if the
+    repository does not exist '''
+
+    repository = utils.model_repository_path()
+    if not os.path.isdir(repository):
+        return None
+    return os.path.join(repository, CACHE_FILE)
+
+
+def text_key(text):
+    ''' SHA-256 of a text, used as key for structures given as text '''
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def molblock_key(molblock):
+    ''' key of a MolBlock, ignoring the molecule name (first line) so that
+    the same structure is found whatever its name '''
+    return text_key(molblock.split('\n', 1)[-1])
+
+
+def retitle(molblock, title):
+    ''' replaces the name (first line) of a MolBlock obtained from the
+    cache by the one of the current molecule '''
+    return title.split('\n', 1)[0] + '\n' + molblock.split('\n', 1)[1]
+
+
+class Cache:
+    '''
+        Cache of the results of a method, identified by the namespace
+
+        ...
+
+        Attributes
+        ----------
+
+        path : str
+            path to the SQLite database, or None if the cache is disabled
+        namespace : str
+            method, version and settings used to obtain the results
+        hits, misses : int
+            number of keys found and not found in the cache
+
+        Methods
+        -------
+
+        get(key)
+            returns the value stored for the key, or None
+        put(key, value)
+            stores the value for the key, saved by the next flush
+        flush()
+            saves the stored values in the database
+        close()
+            saves the stored values and closes the database
+    '''
+
+    def __init__(self, namespace, path=None):
+        if path is None:
+            path = cache_path()
+
+        self.path = path
+        self.namespace = namespace
+        self.pending = {}
+        self.con = None
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def disable(self, e):
+        LOG.debug(f'Cache {self.path} disabled with exception {e}')
+        self.close(flush=False)
+        self.path = None
+
+    def connect(self):
+        ''' opens the database the first time it is used '''
+
+        if self.con is None and self.path is not None:
+            try:
+                self.con = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+                self.con.execute('PRAGMA journal_mode=WAL')
+                self.con.executescript(SCHEMA)
+            except sqlite3.Error as e:
+                self.disable(e)
+
+        return self.con
+
+    def get(self, key):
+        ''' returns the value stored for the key, or None if not found '''
+
+        value = self.pending.get(key)
+        if value is None and self.connect() is not None:
+            try:
+                row = self.con.execute('SELECT value FROM cache WHERE namespace=? AND key=?',
+                                       (self.namespace, key)).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+            except (sqlite3.Error, ValueError) as e:
+                self.disable(e)
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return value
+
+    def put(self, key, value):
+        ''' stores the value, which must be serializable to JSON '''
+        if self.path is not None:
+            self.pending[key] = value
+            if len(self.pending) >= FLUSH_SIZE:
+                self.flush()
+
+    def flush(self):
+        ''' saves the values stored since the last flush '''
+
+        if len(self.pending) == 0 or self.connect() is None:
+            self.pending = {}
+            return
+
+        try:
+            rows = [(self.namespace, key, json.dumps(value)) for key, value in self.pending.items()]
+            with self.con:
+                self.con.execute('BEGIN IMMEDIATE')
+                self.con.executemany('INSERT OR REPLACE INTO cache (namespace, key, value)'
+                                     ' VALUES (?, ?, ?)', rows)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            self.disable(e)
+
+        self.pending = {}
+
+    def close(self, flush=True):
+        if flush:
+            self.flush()
+
+        if self.con is not None:
+            self.con.close()
+            self.con = None
+
+        if self.hits + self.misses > 0:
+            LOG.debug(f'Cache {self.namespace}: {self.hits} hits, {self.misses} misses')
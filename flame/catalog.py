@@ -0,0 +1,278 @@
+#! -*- coding: utf-8 -*-
+
+# Description    Flame catalog of models and spaces
+#
+# Authors:       Manuel Pastor (manuel.pastor@upf.edu)
+#
+# Copyright 2018 Manuel Pastor
+#
+# This file is part of Flame
+#
+# Flame is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3.
+#
+# Flame is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Flame. If not, see <http://www.gnu.org/licenses/>.
+
+''' Catalog of the models (or spaces) present in a repository, saved as a
+    JSON file at the repository root.
+
+    For every model tree the catalog keeps the list of versions and, for
+    every version, the summary of the build and validation info extracted
+    from results.pkl. Every entry is stored together with the mtime and size
+    of the file or directory it was obtained from, and is recomputed only
+    when these change, so that listing the repository or reporting the
+    quality of all models does not require unpickling the results.
+
+    The catalog is updated explicitly by the actions modifying the
+    repository (build, publish, remove, import, kill), but changes made by
+    other means are also detected by the validation. Writes are atomic; when
+    two processes update the catalog at the same time one of the updates can
+    be lost, and will be recomputed on the next access '''
+
+import os
+import json
+import tempfile
+
+from flame.util import utils, get_logger
+
+LOG = get_logger(__name__)
+
+CATALOG_FILE = 'catalog.json'
+CATALOG_VERSION = 1
+
+
+def stamp(path):
+    ''' mtime and size of the file or directory, or None if it does not exist '''
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def model_summary(results_path):
+    ''' returns the warnings, build and validation info stored in a
+    results.pkl file as a list suitable for being serialized to JSON '''
+
+    from flame.conveyor import Conveyor
+
+    conveyor = Conveyor()
+    with open(results_path, 'rb') as handle:
+        conveyor.load(handle)
+
+    # if there is an error, return the error Message
+    if conveyor.getError():
+        return False, conveyor.getErrorMessage()
+
+    # merge warnings, build and validation info. The warning is a single
+    # message, the build and validation info are lists of tuples
+    info = []
+    if conveyor.getWarningMessage() is not None:
+        info.append(conveyor.getWarningMessage())
+
+    for iinfo in (conveyor.getVal('model_build_info'),
+                  conveyor.getVal('model_valid_info')):
+        if iinfo is not None:
+            info += iinfo
+
+    if len(info) == 0:
+        return False, 'No relevant information found'
+
+    # lists, as they are read back from the catalog file
+    return True, [i if isinstance(i, str) else list(conveyor.modelInfoJSON(i)) for i in info]
+
+
+class Catalog:
+    ''' Catalog of the trees present in the repository given as argument '''
+
+    def __init__(self, path, summary=model_summary):
+        self.path = path
+        self.summary = summary
+        self.catalog_path = os.path.join(path, CATALOG_FILE)
+        self.changed = False
+        self.items = self.load()
+
+    def load(self):
+        ''' returns the items of the catalog file, or an empty catalog if
+        the file does not exist or cannot be used '''
+
+        try:
+            with open(self.catalog_path, 'r') as handle:
+                catalog = json.load(handle)
+        except (OSError, ValueError):
+            return {}
+
+        if not isinstance(catalog, dict) or catalog.get('catalog_version') != CATALOG_VERSION:
+            return {}
+
+        return catalog.get('items', {})
+
+    def save(self):
+        ''' writes the catalog atomically, if there are changes. Failing to
+        write the catalog is not an error, it is only slower '''
+
+        if not self.changed:
+            return
+
+        try:
+            handle, tmp_path = tempfile.mkstemp(prefix='.catalog', dir=self.path)
+            with os.fdopen(handle, 'w') as fo:
+                json.dump({'catalog_version': CATALOG_VERSION,
+                           'items': self.items}, fo)
+            os.replace(tmp_path, self.catalog_path)
+            self.changed = False
+        except OSError as e:
+            LOG.debug(f'Unable to save catalog {self.catalog_path}: {e}')
+
+    def _item(self, name, force=False):
+        ''' returns the catalog entry of the tree, scanning the tree if it
+        changed since the last scan. Returns None if the tree was removed '''
+
+        tree = os.path.join(self.path, name)
+        tree_stamp = stamp(tree)
+
+        item = self.items.get(name)
+        if not force and item is not None and item['stamp'] == tree_stamp:
+            return item
+
+        if tree_stamp is None or not os.path.isdir(os.path.join(tree, 'dev')):
+            if item is not None:
+                del self.items[name]
+                self.changed = True
+            return None
+
+        versions = sorted(utils.modeldir2ver(x) for x in os.listdir(tree)
+                          if x == 'dev' or x.startswith('ver'))
+
+        # info of versions which are still present is validated on access
+        info = {}
+        if item is not None:
+            info = {k: v for k, v in item['info'].items() if int(k) in versions}
+
+        item = {'stamp': tree_stamp, 'versions': versions, 'info': info}
+        self.items[name] = item
+        self.changed = True
+        return item
+
+    def _info(self, name, version, force=False):
+        ''' returns the summary of the results of the version, extracting it
+        from results.pkl if it changed since the last access '''
+
+        item = self._item(name)
+        if item is None or version not in item['versions']:
+            return False, f'Version {version} of {name} not found'
+
+        results_path = os.path.join(utils.path_expand(os.path.join(self.path, name), version),
+                                    'results.pkl')
+        results_stamp = stamp(results_path)
+        if results_stamp is None:
+            return False, 'Info file not found'
+
+        key = str(version)
+        entry = item['info'].get(key)
+        if force or entry is None or entry['stamp'] != results_stamp:
+            try:
+                success, info = self.summary(results_path)
+            except Exception as e:
+                success, info = False, f'Unable to read {results_path}: {e}'
+
+            entry = {'stamp': results_stamp, 'success': success, 'info': info}
+            item['info'][key] = entry
+            self.changed = True
+
+        return entry['success'], entry['info']
+
+    def names(self):
+        ''' returns the sorted list of trees present in the repository '''
+
+        names = []
+        for name in sorted(os.listdir(self.path)):
+            if name in self.items or os.path.isdir(os.path.join(self.path, name, 'dev')):
+                if self._item(name) is not None:
+                    names.append(name)
+
+        # remove trees which are no longer present
+        for name in [i for i in self.items if i not in names]:
+            del self.items[name]
+            self.changed = True
+
+        self.save()
+        return names
+
+    def versions(self, name):
+        ''' returns the sorted list of versions of the tree, 0 for dev, or
+        None if the tree does not exist '''
+
+        item = self._item(name)
+        self.save()
+
+        if item is None:
+            return None
+        return list(item['versions'])
+
+    def info(self, name, version):
+        ''' returns a tuple with a boolean and the summary of the results of
+        the version or an error message '''
+
+        success, info = self._info(name, version)
+        self.save()
+        return success, info
+
+    def report(self):
+        ''' returns a list with a tuple (name, [(version, info)]) for every
+        tree, containing only the versions with valid info '''
+
+        results = []
+        for name in self.names():
+            versions_info = []
+            for version in self.items[name]['versions']:
+                success, info = self._info(name, version)
+                if success:
+                    versions_info.append((version, info))
+            results.append((name, versions_info))
+
+        self.save()
+        return results
+
+    def update(self, name, version=None):
+        ''' rescans the tree after it has been modified and refreshes the
+        info of the version, or of every version if none is given '''
+
+        item = self._item(name, force=True)
+        if item is not None and self.summary is not None:
+            versions = item['versions'] if version is None else [version]
+            for iversion in versions:
+                self._info(name, iversion, force=True)
+
+        self.save()
+
+
+def model_catalog():
+    ''' catalog of the model repository '''
+    return Catalog(utils.model_repository_path())
+
+
+def space_catalog():
+    ''' catalog of the space repository. Only the versions are catalogued '''
+    return Catalog(utils.space_repository_path(), summary=None)
+
+
+def update(name, version=None, isSpace=False):
+    ''' updates the catalog of the repository after modifying the tree. Never
+    fails, since the catalog is rebuilt on access if needed '''
+
+    try:
+        if isSpace:
+            space_catalog().update(name, version)
+        else:
+            model_catalog().update(name, version)
+    except Exception as e:
+        LOG.debug(f'Unable to update catalog for {name}: {e}')
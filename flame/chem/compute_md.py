@@ -81,7 +81,8 @@ def _mordred_descriptors(ifile, **kwargs) -> (bool, (np.ndarray, list, list)):
     # Get descriptors names
     nms = [str(d) for d in calc.descriptors]
     est_obj = len(suppl)
-    xmatrix = np.zeros((est_obj, len(calc.descriptors)))
+    xmatrix = np.zeros((est_obj, len(calc.descriptors)), 
+                       dtype=kwargs.get('dtype', np.float64))
 
     try:
         num_obj = 0
@@ -171,7 +172,8 @@ def _RDKit_morganFPS(ifile, **kwargs) -> (bool, (np.ndarray, list, list)):
 
     success_list = []
     est_obj = len(suppl)
-    xmatrix = np.zeros((est_obj, morgan_nbits), dtype=np.int8)
+    # bits are stored as uint8, whatever the descriptor_dtype
+    xmatrix = np.zeros((est_obj, morgan_nbits), dtype=np.uint8)
 
     try:
         num_obj = 0
@@ -212,8 +214,7 @@ def _RDKit_morganFPS(ifile, **kwargs) -> (bool, (np.ndarray, list, list)):
     if num_obj < est_obj:
         # if some molecules failed to compute we will clean xmatrix by 
         # removing extra rows
-        for i in range (num_obj, est_obj):
-            xmatrix = np.delete(xmatrix,num_obj,axis=0)
+        xmatrix = xmatrix[:num_obj].copy()
 
     LOG.debug(f'computed RDKit Morgan Fingerprints matrix with shape {np.shape(xmatrix)}')
     if num_obj == 0:
@@ -354,7 +355,9 @@ def _RDKit_descriptors(ifile, **kwargs) -> (bool, (np.ndarray, list, list)):
     # the number of rows is an estimation and will be checked
     # and corrected at the end
     est_obj = len(suppl)
-    xmatrix = np.zeros((est_obj,len(nms)))
+    dtype = kwargs.get('dtype', np.float64)
+    xmatrix = np.zeros((est_obj,len(nms)), dtype=dtype)
+    dtype_max = np.finfo(dtype).max
 
     try:
         num_obj = 0
@@ -377,6 +380,13 @@ def _RDKit_descriptors(ifile, **kwargs) -> (bool, (np.ndarray, list, list)):
                 success_list.append(False)
                 continue               
 
+            # values out of range in compact dtypes would be converted to inf
+            if np.max(np.abs(mdi)) > dtype_max:
+                LOG.error(f'RDKit descriptors out of {np.dtype(dtype).name} range for '
+                          f'molecule #{num_obj+1} in {ifile}')
+                success_list.append(False)
+                continue
+
             xmatrix[num_obj]=mdi
             success_list.append(True)
             num_obj += 1
@@ -387,8 +397,7 @@ def _RDKit_descriptors(ifile, **kwargs) -> (bool, (np.ndarray, list, list)):
     if num_obj < est_obj:
         # if some molecules failed to compute we will clean xmatrix by 
         # removing extra rows
-        for i in range (num_obj,est_obj):
-            xmatrix = np.delete(xmatrix,num_obj,axis=0)
+        xmatrix = xmatrix[:num_obj].copy()
 
     LOG.debug(f'computed RDKit descriptors matrix with shape {np.shape(xmatrix)}')
     if num_obj == 0:
@@ -426,7 +435,9 @@ def _RDKit_properties(ifile, **kwargs) -> (bool, (np.ndarray, list, list)):
 
     success_list = []
     est_obj = len(suppl)
-    xmatrix = np.zeros((est_obj,len(md_name)))
+    dtype = kwargs.get('dtype', np.float64)
+    xmatrix = np.zeros((est_obj,len(md_name)), dtype=dtype)
+    dtype_max = np.finfo(dtype).max
 
     try:
         num_obj = 0
@@ -449,6 +460,13 @@ def _RDKit_properties(ifile, **kwargs) -> (bool, (np.ndarray, list, list)):
             if np.isnan(descriptors).any() or np.isinf(descriptors).any():
                 success_list.append(False)
                 continue
+
+            # values out of range in compact dtypes would be converted to inf
+            if np.max(np.abs(descriptors)) > dtype_max:
+                LOG.error(f'RDKit properties out of {np.dtype(dtype).name} range for '
+                          f'molecule #{num_obj+1} in {ifile}')
+                success_list.append(False)
+                continue
             
             xmatrix [num_obj] = descriptors
             
@@ -470,8 +488,7 @@ def _RDKit_properties(ifile, **kwargs) -> (bool, (np.ndarray, list, list)):
     if num_obj < est_obj:
         # if some molecules failed to compute we will clean xmatrix by 
         # removing extra rows
-        for i in range (num_obj,est_obj):
-            xmatrix = np.delete(xmatrix,num_obj,axis=0)
+        xmatrix = xmatrix[:num_obj].copy()
 
     LOG.debug(f'computed RDKit properties matrix with shape {np.shape(xmatrix)}')
     if num_obj == 0:
@@ -21,21 +21,104 @@
 # along with Flame. If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import json
 import numpy as np
 from rdkit import Chem
 from rdkit.Chem import AllChem
 
 from flame.util import get_logger
+from flame.cache import Cache, text_key, retitle
 import flame.chem.sdfileutils as sdfu
 
 LOG = get_logger(__name__)
 
+# default values of the convert3D_settings
+ETKDG_SETTINGS = {
+    'conformers': 1,         # number of conformers embedded for every molecule
+    'selection': 'first',    # 'first' or 'lowest_energy' (after MMFF/UFF optimization)
+    'seed': 42,              # random seed, -1 for a random seed
+    'timeout': 60,           # maximum time in seconds for embedding a single molecule fragment
+    'max_attempts': 0,       # maximum number of attempts per conformer, 0 for RDKit default
+    'threads': 0,            # number of threads, 0 for all the available
+}
 
-def _ETKDG(ifile) -> (bool, str):
+
+def _settings(settings):
+    ''' returns the ETKDG settings, using the default values for the
+    settings not defined '''
+
+    etkdg = dict(ETKDG_SETTINGS)
+    if settings:
+        etkdg.update({k: v for k, v in settings.items() if v is not None})
+    return etkdg
+
+
+def _namespace(settings):
+    ''' name of the cache of conformers, including the settings which change
+    the coordinates (not the number of threads) and the RDKit version.
+
+    A random seed produces different coordinates on every run and therefore
+    the conformers are not cached '''
+
+    if settings['seed'] == -1:
+        return None
+
+    key = {k: v for k, v in settings.items() if k != 'threads'}
+    return f'ETKDGv3 rdkit {Chem.rdBase.rdkitVersion} {json.dumps(key, sort_keys=True)}'
+
+
+def _embed(mol, settings):
+    ''' Embeds the molecule using ETKDG v3 and returns the MolBlock (with
+    hydrogens) of the selected conformer, or None if no conformer was
+    obtained.
+
+    The conformers are generated using multiple threads and, if selection
+    is 'lowest_energy', optimized with MMFF (or UFF if MMFF parameters are
+    not available) to select the one with the lowest energy
+    '''
+
+    mol3 = Chem.AddHs(mol)
+
+    params = AllChem.ETKDGv3()
+    params.randomSeed = int(settings['seed'])
+    params.numThreads = int(settings['threads'])
+    params.timeout = int(settings['timeout'])
+    params.maxIterations = int(settings['max_attempts'])
+
+    nconf = max(1, int(settings['conformers']))
+    cids = list(AllChem.EmbedMultipleConfs(mol3, nconf, params))
+
+    if len(cids) == 0:
+        # recommended for molecules failing with eigenvalue embedding
+        params.useRandomCoords = True
+        cids = list(AllChem.EmbedMultipleConfs(mol3, nconf, params))
+
+    if len(cids) == 0:
+        return None
+
+    cid = cids[0]
+    if settings['selection'] == 'lowest_energy':
+        if AllChem.MMFFHasAllMoleculeParams(mol3):
+            results = AllChem.MMFFOptimizeMoleculeConfs(mol3, numThreads=params.numThreads)
+        else:
+            results = AllChem.UFFOptimizeMoleculeConfs(mol3, numThreads=params.numThreads)
+
+        energies = [energy for not_converged, energy in results]
+        cid = cids[int(np.argmin(energies))]
+
+    return Chem.MolToMolBlock(mol3, confId=cid)
+
+
+def _ETKDG(ifile, settings=None) -> (bool, str):
     """ Assigns 3D structures to the molecular structures provided as input.
+
+    The conformers are stored in a persistent cache, indexed by the canonical
+    SMILES of the molecule and the settings, and only the structures not found
+    in the cache are embedded
     """
 
     success_list = [True for i in range(sdfu.count_mols(ifile))]
+    settings = _settings(settings)
 
     LOG.info('Converting to ETKDG 3D structures')
     try:
@@ -50,6 +133,9 @@ def _ETKDG(ifile) -> (bool, str):
     ofile = filename + '_3d' + fileext
     LOG.debug(f'3D stucture ouput file is: {ofile}')
 
+    namespace = _namespace(settings)
+    cache = Cache(namespace) if namespace is not None else None
+
     with open(ofile, 'w') as fo:
 
         mcount = 0
@@ -58,27 +144,32 @@ def _ETKDG(ifile) -> (bool, str):
                 LOG.debug('Supplier failed to read'
                             f' molecule #{mcount+1} in {ifile}')
                 continue
+
             try:
-                mol3 = Chem.AddHs(mol)
-                AllChem.EmbedMolecule(mol3, AllChem.ETKDG())
-            except:
-                LOG.error('Failed to generate 3D structures using'
-                            f'ETKDG method for molecule #{mcount+1} in {ifile}')
+                key = text_key(Chem.MolToSmiles(mol))
+                molblock = cache.get(key) if cache is not None else None
+
+                if molblock is None:
+                    molblock = _embed(mol, settings)
+                    if molblock is None:
+                        raise ValueError('no conformer embedded')
+                    if cache is not None:
+                        cache.put(key, molblock)
+                else:
+                    molblock = retitle(molblock, mol.GetProp('_Name') if mol.HasProp('_Name') else '')
+
+            except Exception as e:
+                LOG.error(f'Failed to generate 3D structures using'
+                            f' ETKDG method for molecule #{mcount+1} in {ifile}: {e}')
                 success_list[mcount]=False
                 mcount += 1
                 continue
 
-            ## debug for testing error handling. This code simulates a 3D conversion error
-            # if mcount == 3 :
-            #     print ('@ETKDG debug, skipping mol 3')
-            #     LOG.error('Failed to generate 3D structures using'
-            #                 f'ETKDG method for molecule #{mcount+1} in {ifile}')
-            #     success_list[mcount]=False
-            #     mcount += 1
-            #     continue
-
-            fo.write(Chem.MolToMolBlock(mol3))
+            fo.write(molblock)
             fo.write('\n$$$$\n')  # end of mol
             mcount += 1
 
+    if cache is not None:
+        cache.close()
+
     return success_list, ofile
@@ -132,6 +132,56 @@ def split_SDFile(ifile, num_chunks):
     return True, (temp_files_name, temp_files_size)
 
 
+def unique_SDFile(ifile):
+    ''' writes the molecules of the input SDfile with different structure
+    (canonical isomeric SMILES) in a new SDFile, named "filename_unique.sdf"
+
+    Molecular blocks unable to produce a valid 'mol' are ignored, as in
+    split_SDFile
+
+    Argument:
+        ifile       : input SDfile
+
+    Output:
+        name of the file with the unique molecules, or ifile if there are
+        no duplicates
+
+        list with the index of the unique molecule corresponding to every
+        molecule of ifile, or None if there are no duplicates
+    '''
+
+    suppl = Chem.SDMolSupplier(ifile)
+
+    keys = {}
+    index = []
+    for mol in suppl:
+        if mol is None:
+            continue
+        index.append(keys.setdefault(Chem.MolToSmiles(mol), len(keys)))
+
+    if len(keys) == len(index):
+        return ifile, None
+
+    LOG.debug(f'{len(index) - len(keys)} duplicated molecules found in {ifile}')
+
+    filename, fileext = os.path.splitext(ifile)
+    ofile = filename + '_unique' + fileext
+
+    # write only the first occurrence of every structure
+    writer = Chem.SDWriter(ofile)
+    nwritten = 0
+    mi = 0
+    for mol in suppl:
+        if mol is None:
+            continue
+        if index[mi] == nwritten:
+            writer.write(mol)
+            nwritten += 1
+        mi += 1
+    writer.close()
+
+    return ofile, index
+
 def getName(mol, count=1, field=None):
     ''' returns a name for the mol object provided as argument
         Names are extracted from the SDFile fields, using the list of
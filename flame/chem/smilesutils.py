@@ -0,0 +1,252 @@
+#! -*- coding: utf-8 -*-
+
+# Description    SMILES file tools
+#
+# Authors:       Manuel Pastor (manuel.pastor@upf.edu)
+#
+# Copyright 2018 Manuel Pastor
+#
+# This file is part of Flame
+#
+# Flame is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3.
+#
+# Flame is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Flame. If not, see <http://www.gnu.org/licenses/>.
+
+''' Tools for reading molecules from SMILES files, used by the input type
+    "smiles". Two formats are supported:
+
+    - .smi files, with a SMILES and optionally a name in every line. If the
+      first word of the first line is "SMILES" this line is a header with
+      the names of the columns, separated by spaces or tabs
+
+    - .csv and .tsv (or .txt) tables, with a header with the names of the
+      columns. The SMILES are read from the column named "SMILES" (in any
+      case) or from the first column. Tables without extension are also
+      recognised if they contain a column named "SMILES"
+
+    The values of the other columns are assigned to the molecules as
+    properties, so that the names, IDs and activities are read using the
+    same parameters (SDFile_name, SDFile_id, SDFile_activity...) and
+    functions than for SDFiles '''
+
+import os
+import csv
+from rdkit import Chem
+from flame.util import get_logger
+
+LOG = get_logger(__name__)
+
+SMILES_COLUMN = 'SMILES'
+
+# property used by RDKit for the name of the molecule
+NAME_COLUMN = '_Name'
+
+
+def _delimiter(ifile):
+    ''' delimiter of the columns, based on the file extension. None for
+    .smi files, where the columns are separated by any whitespace.
+
+    Files without a known extension (like the training series copied to
+    the model directory) are recognised as tables if the first line is a
+    header with a SMILES column '''
+
+    ext = os.path.splitext(ifile)[1].lower()
+    if ext == '.csv':
+        return ','
+    if ext in ('.tsv', '.txt', '.tab'):
+        return '\t'
+    if ext in ('.smi', '.smiles'):
+        return None
+
+    with open(ifile, 'r') as fi:
+        for line in fi:
+            if line.strip() == '' or line.startswith('#'):
+                continue
+            for delimiter in ('\t', ','):
+                columns = [i.strip().lower() for i in _split(line, delimiter)]
+                if len(columns) > 1 and SMILES_COLUMN.lower() in columns:
+                    return delimiter
+            break
+
+    return None
+
+
+def _split(line, delimiter, maxsplit=-1):
+    if delimiter is None:
+        return line.split(None, maxsplit)
+    return next(csv.reader([line.rstrip('\r\n')], delimiter=delimiter))
+
+
+def _header(line, delimiter):
+    ''' returns the column names defined by the header line or None if the
+    line is not a header (.smi files without header) '''
+
+    columns = _split(line, delimiter)
+    if delimiter is None and columns[0].lower() != SMILES_COLUMN.lower():
+        return None
+
+    columns = [i.strip() for i in columns]
+    lower = [i.lower() for i in columns]
+    if SMILES_COLUMN.lower() in lower:
+        columns[lower.index(SMILES_COLUMN.lower())] = SMILES_COLUMN
+    else:
+        LOG.warning(f'No SMILES column found, reading SMILES from column "{columns[0]}"')
+        columns[0] = SMILES_COLUMN
+
+    return columns
+
+
+def iter_lines(ifile):
+    ''' yields a tuple (line, record) for every line of the SMILES file,
+    where line is the text of the line and record a dictionary with the
+    values of the columns. The SMILES is always stored with key "SMILES"
+    and, in .smi files without header, the rest of the line is the name.
+
+    The header line, if any, is yielded first with record None. Empty
+    lines and lines starting with # are ignored '''
+
+    delimiter = _delimiter(ifile)
+    columns = None
+    maxsplit = -1
+
+    with open(ifile, 'r') as fi:
+        for line in fi:
+            if line.strip() == '' or line.startswith('#'):
+                continue
+
+            if columns is None:
+                columns = _header(line, delimiter)
+                if columns is not None:
+                    yield line, None
+                    continue
+
+                # .smi file without header: SMILES and name
+                columns = [SMILES_COLUMN, NAME_COLUMN]
+                maxsplit = 1
+
+            values = [i.strip() for i in _split(line, delimiter, maxsplit)]
+            yield line, dict(zip(columns, values))
+
+
+def mol_from_record(record):
+    ''' returns a mol object for the record, with the values of the columns
+    as properties, or None if the SMILES cannot be parsed '''
+
+    smiles = record.get(SMILES_COLUMN)
+    if not smiles:
+        return None
+
+    mol = Chem.MolFromSmiles(smiles)
+    if mol is None:
+        return None
+
+    for key, value in record.items():
+        if key != SMILES_COLUMN and value is not None:
+            mol.SetProp(key, value)
+
+    return mol
+
+
+class SmilesSupplier:
+    ''' Iterates the molecules of a SMILES file, like Chem.SDMolSupplier for
+    SDFiles, returning None for the SMILES which cannot be parsed '''
+
+    def __init__(self, ifile):
+        self.ifile = ifile
+
+    def __len__(self):
+        return sum(1 for line, record in iter_lines(self.ifile) if record is not None)
+
+    def __iter__(self):
+        for line, record in iter_lines(self.ifile):
+            if record is not None:
+                yield mol_from_record(record)
+
+
+def count_mols(ifile):
+    ''' returns the number of valid molecules within a SMILES file, ignoring
+    the SMILES unable to produce a valid 'mol' '''
+
+    return sum(1 for mol in SmilesSupplier(ifile) if mol is not None)
+
+
+def split_SMIfile(ifile, num_chunks):
+    ''' splits the input SMILES file in num_chunks files, containing a
+    balanced number of molecules inside, in the same format and with the
+    same header. Lines with SMILES unable to produce a valid 'mol' are
+    ignored, as in sdfileutils.split_SDFile
+
+    Every file is named "filename_0.smi", "filename_1.smi", ...
+
+    Argument:
+        ifile       : input SMILES file
+        num_chunks  : number of pieces
+
+    Output:
+        list of split file names
+        list of number of molecules within each file
+    '''
+
+    num_mols = count_mols(ifile)
+    if num_mols == 0:
+        LOG.critical(f'No molecule found in {ifile}')
+        return False, 'No molecule found in file: '+ifile
+
+    if num_chunks < 2:
+        # If only one CPU, the output will be only the original file
+        return True, ([ifile], [num_mols])
+
+    # Get number of molecules per chunks
+    chunk_size = num_mols // num_chunks
+    LOG.debug(f'Splitting {ifile} into {num_chunks} chunk files with'
+              f' {chunk_size} molecules in every chunk')
+
+    filename, fileext = os.path.splitext(ifile)
+    temp_files_name = []
+    temp_files_size = []
+
+    header = None
+    fo = None
+    mi = 0
+    try:
+        for line, record in iter_lines(ifile):
+
+            if record is None:
+                header = line
+                continue
+
+            if mol_from_record(record) is None:
+                continue
+
+            chunk_i = min(mi // chunk_size, num_chunks - 1)
+            if chunk_i == len(temp_files_name):
+                # Terminate previous chunk and start chunk i
+                if fo is not None:
+                    fo.close()
+
+                chunk_name = '{}_{}{}'.format(filename, chunk_i, fileext)
+                fo = open(chunk_name, 'w')
+                if header is not None:
+                    fo.write(header)
+
+                temp_files_name.append(chunk_name)
+                temp_files_size.append(0)
+
+            if not line.endswith('\n'):
+                line += '\n'
+            fo.write(line)
+            temp_files_size[chunk_i] += 1
+            mi += 1
+    finally:
+        if fo is not None:
+            fo.close()
+
+    return True, (temp_files_name, temp_files_size)
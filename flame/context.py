@@ -27,6 +27,7 @@ import pathlib
 # import json
 
 from flame.util import utils, get_logger
+from flame.util import tracer
 
 # if the number of models is higher, try to run in multithread
 MAX_MODELS_SINGLE_CPU = 2
@@ -91,6 +92,20 @@ def get_ensemble_input(task, model_names, model_versions, infile):
     return True, model_res
 
 
+def write_trace(conveyor, arguments):
+    '''
+    Writes the timings of the workflow stages to the file given in the
+    'trace' argument, in Chrome trace format
+    '''
+    trace_file = arguments.get('trace')
+    if trace_file is None:
+        return
+
+    success, message = tracer.save_trace(conveyor.tracer.to_dict(), trace_file)
+    if not success:
+        LOG.error(message)
+
+
 def predict_cmd(arguments, output_format=None):
     '''
     Instantiates a Predict object to run a prediction using the given input
@@ -116,6 +131,22 @@ def predict_cmd(arguments, output_format=None):
         arguments['label'] = 'temp'
 
     predict = Predict(arguments['endpoint'], version=arguments['version'],  output_format=output_format, label=arguments['label'])
+    if predict.conveyor.getError():
+        return False, predict.conveyor.getErrorMessage()
+
+    # optional list of additional significance levels for conformal models. 
+    # Intervals and class assignments for all of them are obtained in the same run
+    if arguments.get('significances') is not None:
+        predict.param.setVal('conformalSignificanceList', arguments['significances'])
+
+    # optional number of molecules predicted at once, for input files too large
+    # to be processed in memory. Overrides the parameter "predict_chunk"
+    if arguments.get('chunk') is not None:
+        predict.param.setVal('predict_chunk', arguments['chunk'])
+
+    # optional name of the output files, without extension
+    if arguments.get('output_name') is not None:
+        predict.output_name = arguments['output_name']
 
     ensemble = predict.get_ensemble()
 
@@ -141,11 +172,111 @@ def predict_cmd(arguments, output_format=None):
         # run the model with the input file
         success, results = predict.run(arguments['infile'])
 
+    write_trace(predict.conveyor, arguments)
+
     LOG.info('Prediction completed...')
 
     return success, results
 
 
+def predict_multi_cmd(arguments, output_format=None):
+    '''
+    Runs predictions for the same input file with a list of models.
+
+    Models are grouped by their idata-relevant settings and the input file 
+    is processed (normalization, ionization, MD computation...) only once
+    for every group. The results are then used to run apply and odata for 
+    every model of the group.
+
+    arguments contains the lists 'endpoints' and 'versions' instead of the
+    'endpoint' and 'version' of predict_cmd. The prediction of every model 
+    is labelled as label_endpoint_vversion and its results are written to
+    output_endpoint_vversion files (e.g. output_endpoint_vversion.tsv).
+
+    Returns a list with the endpoint, version, success and results of 
+    every prediction, in the order of the input list.
+    '''
+    from flame.predict import Predict
+
+    endpoints = arguments['endpoints']
+    versions = arguments.get('versions')
+
+    if versions is None:
+        versions = [0 for i in endpoints]
+    elif not isinstance(versions, list):
+        versions = [versions for i in endpoints]
+
+    if len(versions) != len(endpoints):
+        return False, 'The number of versions must match the number of endpoints'
+
+    if arguments['infile'] is None:
+        return False, 'An input file is required'
+
+    label = arguments.get('label')
+    if label is None:
+        label = 'temp'
+
+    model_list = os.listdir(pathlib.Path(utils.model_repository_path()))
+
+    results = [None for i in endpoints]
+    groups = {}
+
+    for i, (endpoint, version) in enumerate(zip(endpoints, versions)):
+
+        if endpoint not in model_list:
+            LOG.error(f'Endpoint name {endpoint} not found in model repository.')
+            results[i] = (endpoint, version, False, 
+                          'Endpoint name not found in model repository.')
+            continue
+
+        imodel_cmd = {'endpoint': endpoint,
+                      'version': version,
+                      'infile': arguments['infile'],
+                      'label': f'{label}_{endpoint}_v{version}',
+                      'significances': arguments.get('significances'),
+                      'output_name': f'output_{endpoint}_v{version}'}
+
+        predict = Predict(endpoint, version=version, output_format=output_format, 
+                          label=imodel_cmd['label'])
+        predict.output_name = imodel_cmd['output_name']
+        if predict.conveyor.getError():
+            results[i] = (endpoint, version, False, predict.conveyor.getErrorMessage())
+            continue
+
+        # ensemble models obtain their input from other models
+        if predict.get_ensemble()[0]:
+            success, iresults = predict_cmd(imodel_cmd, output_format)
+            results[i] = (endpoint, version, success, iresults)
+            continue
+
+        if arguments.get('significances') is not None:
+            predict.param.setVal('conformalSignificanceList', arguments['significances'])
+
+        groups.setdefault(predict.idata_key(), []).append((i, predict))
+
+    LOG.info(f'Running idata {len(groups)} times for {len(endpoints)} models')
+
+    for group in groups.values():
+
+        # the first model of every group runs idata for all of them
+        first = group[0][1]
+        first.run_idata(arguments['infile'])
+        shared_conveyor = first.conveyor.copy()
+
+        for i, predict in group:
+            if predict is not first:
+                predict.set_input(shared_conveyor)
+
+            predict.run_apply()
+            success, iresults = predict.run_odata()
+
+            results[i] = (predict.model, predict.version, success, iresults)
+
+    LOG.info('Predictions completed...')
+
+    return True, results
+
+
 def build_cmd(arguments, output_format=None):
     '''
     Instantiates a Build object to build a model using the given
@@ -172,6 +303,9 @@ def build_cmd(arguments, output_format=None):
     else:
         build = Build(arguments['endpoint'], output_format=output_format)
 
+    if build.conveyor.getError():
+        return False, build.conveyor.getErrorMessage()
+
     ensemble = build.get_ensemble()
 
     # ensemble[0]     Boolean with True for ensemble models and False otherwyse
@@ -225,6 +359,8 @@ def build_cmd(arguments, output_format=None):
         # run the model with the input file
         success, results = build.run(lfile)
 
+    write_trace(build.conveyor, arguments)
+
     return success, results
 
 def sbuild_cmd(arguments, output_format=None):
@@ -251,6 +387,9 @@ def sbuild_cmd(arguments, output_format=None):
     else:
         sbuild = Sbuild(arguments['space'], output_format=output_format)
 
+    if sbuild.conveyor.getError():
+        return False, sbuild.conveyor.getErrorMessage()
+
     ifile = arguments['infile']
     epd = utils.space_path(arguments['space'], 0)
     lfile = os.path.join(epd, 'training_series')
@@ -275,6 +414,8 @@ def sbuild_cmd(arguments, output_format=None):
     # run the space building with the input file
     success, results = sbuild.run(lfile)
 
+    write_trace(sbuild.conveyor, arguments)
+
     return success, results
 
 def search_cmd(model, output_format=None):
@@ -292,9 +433,13 @@ def search_cmd(model, output_format=None):
         model['label'] = 'temp'
 
     search = Search(model['space'], version=model['version'], output_format=output_format, label=model['label'])
+    if search.conveyor.getError():
+        return False, search.conveyor.getErrorMessage()
 
     success, results = search.run(model)
 
+    write_trace(search.conveyor, model)
+
     LOG.info('Search completed...')
 
     return success, results
@@ -347,7 +492,9 @@ def manage_cmd(args):
         elif args.action == 'list':
             success, results = manage.action_list(args.endpoint)
         elif args.action == 'export':
-            success, results = manage.action_export(args.endpoint)
+            success, results = manage.action_export(args.endpoint, args.infile)
+        elif args.action == 'manifest':
+            success, results = manage.action_manifest(args.endpoint)
         elif args.action == 'refactoring':
             success, results = manage.action_refactoring(args.file)
         elif args.action == 'info':
@@ -377,6 +524,9 @@ def manage_cmd(args):
             success, results = manage.action_predictions_result(args.label)
         elif args.action == 'predictions_remove':
             success, results = manage.action_predictions_remove(args.label)
+        elif args.action == 'profile':
+            success, results = manage.action_profile(args.endpoint, version,
+                                                     args.label, getattr(args, 'trace', None))
         else: 
             success = False
             results = "Specified manage action is not defined"
@@ -20,13 +20,27 @@
 # You should have received a copy of the GNU General Public License
 # along with Flame. If not, see <http://www.gnu.org/licenses/>.
 
+import copy
 import pickle
 import numpy as np
 import json
-from flame.util import utils
+from contextlib import contextmanager
+from flame.util import utils, get_logger
+from flame.util.tracer import Tracer, MB, memory_text
+
+LOG = get_logger(__name__)
 
 CONVEYOR_VER = 1    # update only for major changes
 
+# function receiving the progress of the workflows, as a fraction and a
+# message. It is set by processes monitoring the progress (e.g. job workers)
+PROGRESS_HANDLER = None
+
+def set_progress_handler(handler):
+    ''' sets the function called by Conveyor.setProgress '''
+    global PROGRESS_HANDLER
+    PROGRESS_HANDLER = handler
+
 class Conveyor:
     ''' Class storing all data generated in the workflows. This class is 
     declared by workflow objects like Build or Predict and passed as an 
@@ -51,9 +65,11 @@ class Conveyor:
         self.meta = { 'main' : [] }
         self.error = None
         self.warning = None
+        self.tracer = Tracer()
 
     def save(self, fo):        
         ''' constructor '''
+        self.publishTrace()
         pickle.dump(self.conveyor_ver, fo)
         pickle.dump(self.origin, fo)
         pickle.dump(self.data, fo)
@@ -78,6 +94,26 @@ class Conveyor:
 
         return True, 'OK'
 
+    def copy(self, shared=('xmatrix',)):
+        ''' returns a copy of the conveyor, which can be modified without 
+        altering the original. The data of the keys listed in shared (by 
+        default the X matrix) is not copied, and must be used as read-only
+        '''
+        new = Conveyor()
+        new.origin = self.origin
+        new.data = {}
+        for key, value in self.data.items():
+            if key in shared:
+                new.data[key] = value
+            else:
+                new.data[key] = copy.deepcopy(value)
+        new.manifest = copy.deepcopy(self.manifest)
+        new.meta = copy.deepcopy(self.meta)
+        new.error = self.error
+        new.warning = self.warning
+        new.tracer = copy.deepcopy(self.tracer)
+        return new
+
     def isKey(self, _key):
         return _key in self.data
 
@@ -110,6 +146,39 @@ class Conveyor:
     def setError (self, message):
         self.error = message
 
+    def setProgress (self, fraction, message):
+        ''' reports the progress of the workflow to the progress handler '''
+        if PROGRESS_HANDLER is not None:
+            PROGRESS_HANDLER(fraction, message)
+
+    @contextmanager
+    def span (self, name, objects=None):
+        ''' context manager recording the time spent in a workflow stage.
+        If the memory accounting is enabled, the top level stages also
+        report the size of the largest arrays '''
+        with self.tracer.span(name, objects) as current:
+            yield current
+
+        if 'memory' in current and len(self.tracer.stack) == 0:
+            current['memory']['arrays'] = self.arraySizes()
+            LOG.info(f'memory used by {name}: {memory_text(current["memory"])}')
+
+    def arraySizes (self, n=5):
+        ''' returns the size in MB of the n largest numpy arrays in memory.
+        Memory mapped arrays are not included '''
+        sizes = {}
+        for key, value in self.data.items():
+            if isinstance(value, np.ndarray) and not isinstance(value, np.memmap):
+                sizes[key] = value.nbytes / MB
+
+        largest = sorted(sizes, key=sizes.get, reverse=True)[:n]
+        return {key: sizes[key] for key in largest}
+
+    def publishTrace (self):
+        ''' copies the workflow timings to the meta, under key "trace" '''
+        if len(self.tracer.spans) > 0:
+            self.meta['trace'] = self.tracer.to_dict()
+
     def getWarning (self):
         return self.warning is not None
 
@@ -205,6 +274,7 @@ class Conveyor:
         if self.warning is not None:
             temp_json['warning'] = self.warning
 
+        self.publishTrace()
         temp_json['manifest'] = self.manifest
         temp_json['meta'] = self.meta
 
@@ -315,6 +315,10 @@ class Documentation:
             self.setInnerVal('AD_method', 'name', 'conformal prediction')
             self.setVal('AD_parameters', f'Conformal Significance '
                      f'{self.parameters.getVal("conformalSignificance")}')
+        elif self.parameters.getVal('applicability_domain'):
+            self.setInnerVal('AD_method', 'name', 'distance to nearest neighbours and leverage')
+            settings = self.parameters.getDict('AD_settings')
+            self.setVal('AD_parameters', ', '.join(f'{k} {v}' for k, v in settings.items()))
 
 
     def assign_results(self):
@@ -49,7 +49,7 @@ def main():
                         required=False)
 
     parser.add_argument('-e', '--endpoint',
-                        help='Endpoint model name.',
+                        help='Endpoint model name. For predict, a comma separated list of names.',
                         required=False)
 
     parser.add_argument('-s', '--space',
@@ -57,7 +57,7 @@ def main():
                         required=False)
 
     parser.add_argument('-v', '--version',
-                        help='Endpoint model version.',
+                        help='Endpoint model version. For predict, a comma separated list of versions.',
                         required=False)
 
     parser.add_argument('-a', '--action',
@@ -70,8 +70,8 @@ def main():
 
     parser.add_argument('-c', '--command',
                         action='store',
-                        choices=['predict', 'search', 'build', 'sbuild', 'manage', 'config'],
-                        help='Action type: \'predict\' or \'search\' or \'build\' \'sbuild\' or \'manage\' or \'config\'',
+                        choices=['predict', 'search', 'build', 'sbuild', 'manage', 'config', 'worker'],
+                        help='Action type: \'predict\' or \'search\' or \'build\' \'sbuild\' or \'manage\' or \'config\' or \'worker\'',
                         required=True)
 
     # parser.add_argument('-log', '--loglevel',
@@ -88,6 +88,21 @@ def main():
                         help='Label for facilitating the identification of the prediction.',
                         required=False )
 
+    parser.add_argument('--trace',
+                        help='File where the time spent in every stage is saved, in Chrome trace format.',
+                        required=False)
+
+    parser.add_argument('--chunk',
+                        help='Number of molecules predicted at once, for input files too large to be predicted in memory.',
+                        type=int,
+                        required=False)
+
+    parser.add_argument('-w', '--workers',
+                        help='Number of jobs run simultaneously by the job worker.',
+                        type=int,
+                        default=2,
+                        required=False)
+
     args = parser.parse_args()
 
     # init logger Level and set general config
@@ -111,17 +126,47 @@ def main():
             print('flame predict : endpoint and input file arguments are compulsory')
             return
 
-        version = utils.intver(args.version)
-
         if args.label is None:
             label = 'temp'
         else:
             label = args.label
 
+        # comma separated lists of endpoints (and versions) are predicted
+        # computing the MD only once for models sharing the same settings
+        if ',' in args.endpoint:
+            endpoints = args.endpoint.split(',')
+            if args.version is None:
+                versions = [0 for i in endpoints]
+            else:
+                versions = [utils.intver(i) for i in args.version.split(',')]
+                if len(versions) == 1:
+                    versions = versions * len(endpoints)
+
+            command_predict = {'endpoints': endpoints,
+                     'versions': versions,
+                     'label': label,
+                     'infile': args.infile}
+
+            LOG.info(f'Starting prediction with models {endpoints}'
+                     f' versions {versions} for file {args.infile}, labelled as {label}')
+
+            success, results = context.predict_multi_cmd(command_predict)
+            if not success:
+                LOG.error(results)
+            else:
+                for endpoint, version, isuccess, iresults in results:
+                    if not isuccess:
+                        LOG.error(f'{endpoint} version {version}: {iresults}')
+            return
+
+        version = utils.intver(args.version)
+
         command_predict = {'endpoint': args.endpoint,
                  'version': version,
                  'label': label,
-                 'infile': args.infile}
+                 'infile': args.infile,
+                 'trace': args.trace,
+                 'chunk': args.chunk}
 
         LOG.info(f'Starting prediction with model {args.endpoint}'
                  f' version {version} for file {args.infile}, labelled as {label}')
@@ -146,7 +191,8 @@ def main():
                  'version': version,
                  'infile': args.infile,
                  'runtime_param': args.parameters,
-                 'label': label}
+                 'label': label,
+                 'trace': args.trace}
 
         LOG.info(f'Starting search on space {args.space}'
                  f' version {version} for file {args.infile}, labelled as {label}')
@@ -161,7 +207,8 @@ def main():
             print('flame build : endpoint argument is compulsory')
             return
 
-        command_build = {'endpoint': args.endpoint, 'infile': args.infile, 'param_file': args.parameters}
+        command_build = {'endpoint': args.endpoint, 'infile': args.infile, 'param_file': args.parameters,
+                         'trace': args.trace}
 
         LOG.info(f'Starting building model {args.endpoint}'
                  f' with file {args.infile} and parameters {args.parameters}')
@@ -177,7 +224,8 @@ def main():
             print('flame sbuild : space argument is compulsory')
             return
 
-        command_build = {'space': args.space, 'infile': args.infile, 'param_file': args.parameters}
+        command_build = {'space': args.space, 'infile': args.infile, 'param_file': args.parameters,
+                         'trace': args.trace}
 
         LOG.info(f'Starting building model {args.space}'
                  f' with file {args.infile} and parameters {args.parameters}')
@@ -197,6 +245,12 @@ def main():
         success = config(args.directory)
         if not success:
             LOG.error('configuration unchanged')
+
+    elif args.command == 'worker':
+        from flame.jobs import Worker
+        success, results = Worker(workers=args.workers).run()
+        if not success:
+            LOG.error(results)
         
 
 # import multiprocessing
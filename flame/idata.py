@@ -34,11 +34,20 @@ from rdkit import Chem
 
 from standardiser import standardise
 
+try:
+    from chembl_structure_pipeline import standardizer as embl
+    from chembl_structure_pipeline import checker
+except ImportError:
+    embl = None
+    checker = None
+
 import flame.chem.sdfileutils as sdfutils
+import flame.chem.smilesutils as smiutils
 import flame.chem.compute_md as computeMD
 import flame.chem.convert_3d as convert3D
 
 from flame.util import utils, get_logger, supress_log
+from flame.cache import Cache, molblock_key, retitle
 
 LOG = get_logger(__name__)
 
@@ -136,10 +145,35 @@ class Idata:
             except:
                 pass
 
+    def molSupplier(self, ifile):
+        '''
+        Returns an iterator of the molecules of the input file, a SMILES
+        file for input type "smiles" and an SDFile otherwise
+        '''
+        if self.param.getVal('input_type') == 'smiles':
+            return smiutils.SmilesSupplier(ifile)
+        return Chem.SDMolSupplier(ifile, sanitize=True)
+
+    def countMols(self, ifile):
+        '''
+        Returns the number of valid molecules within the input file
+        '''
+        if self.param.getVal('input_type') == 'smiles':
+            return smiutils.count_mols(ifile)
+        return sdfutils.count_mols(ifile)
+
+    def splitInput(self, ifile, num_chunks):
+        '''
+        Splits the input file in num_chunks files of the same format
+        '''
+        if self.param.getVal('input_type') == 'smiles':
+            return smiutils.split_SMIfile(ifile, num_chunks)
+        return sdfutils.split_SDFile(ifile, num_chunks)
+
     def extractInformation(self, ifile):
         '''
         Extracts molecule names, biological anotations and experimental values
-        from an SDFile.
+        from an SDFile (or a SMILES file, for input type "smiles").
 
         All this information is added to the results using method utils.add_result,
         so they are also inserted into the results manifest.
@@ -147,7 +181,7 @@ class Idata:
 
         # Initiate a RDKit SDFile iterator to process the molecules one by one
         try:
-            suppl = Chem.SDMolSupplier(ifile, sanitize=True)
+            suppl = self.molSupplier(ifile)
             LOG.debug(f'mol supplier created from {ifile}')
         except Exception as e:
             LOG.debug('Unable to create mol supplier with the exception: '
@@ -171,6 +205,9 @@ class Idata:
         success_list = []
         obj_num = 0
 
+        # resolved parameters, read for every molecule
+        param = self.param.frozen()
+
         # Iterate for every molecule inside the SDFile
         for mol in suppl:
 
@@ -184,33 +221,33 @@ class Idata:
 
             # extract the molecule name, using a sdfileutils algorithm 
             name = sdfutils.getName(
-                mol, count=obj_num, field=self.param.getVal('SDFile_name'))
+                mol, count=obj_num, field=param.get('SDFile_name'))
 
             # extracts molecule ID value, if any.
             idv = ''    
-            if self.param.getVal('SDFile_id') is not None:
-                if isinstance (self.param.getVal('SDFile_id'),str):
-                    idv = sdfutils.getStr(mol, self.param.getVal('SDFile_id'))
+            if param.get('SDFile_id') is not None:
+                if isinstance (param.get('SDFile_id'),str):
+                    idv = sdfutils.getStr(mol, param.get('SDFile_id'))
 
             # extracts biological information (activity) which is used as dependent variable
             # for the model training and is provided as a prediction for new compounds
             bio = None
-            if self.param.getVal('SDFile_activity') is not None:
-                bio = sdfutils.getVal(mol, self.param.getVal('SDFile_activity'))
+            if param.get('SDFile_activity') is not None:
+                bio = sdfutils.getVal(mol, param.get('SDFile_activity'))
             
             # extracts experimental information, if any.
             # note that experimental information is used only in prediction, as a value
             # which overrides any model predicted value
             exp = None    
-            if self.param.getVal('SDFile_experimental') is not None:
-                if isinstance (self.param.getVal('SDFile_experimental'),str):
-                    exp = sdfutils.getVal(mol, self.param.getVal('SDFile_experimental'))
+            if param.get('SDFile_experimental') is not None:
+                if isinstance (param.get('SDFile_experimental'),str):
+                    exp = sdfutils.getVal(mol, param.get('SDFile_experimental'))
 
             # extracts complementary information, if any.
             cmp = None    
-            if self.param.getVal('SDFile_complementary') is not None:
-                if isinstance (self.param.getVal('SDFile_complementary'),str):
-                    cmp = sdfutils.getVal(mol, self.param.getVal('SDFile_complementary'))
+            if param.get('SDFile_complementary') is not None:
+                if isinstance (param.get('SDFile_complementary'),str):
+                    cmp = sdfutils.getVal(mol, param.get('SDFile_complementary'))
 
             # generates a SMILES
             sml = None
@@ -272,6 +309,128 @@ class Idata:
         
         return success_list
 
+    @staticmethod
+    def normalizeNamespace(method):
+        '''
+        Returns the name of the cache of the normalization method, including
+        the versions of the standardizer and RDKit, or None if the results
+        of the method are not cached
+        '''
+        from importlib import metadata
+
+        if 'standardize' in method:
+            package = 'standardiser'
+        elif 'chEMBL' in method:
+            package = 'chembl_structure_pipeline'
+        else:
+            return None
+
+        try:
+            version = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            version = 'unknown'
+
+        return f'{package} {version} rdkit {Chem.rdBase.rdkitVersion}'
+
+    @staticmethod
+    def standardizeMolblock(molblock, method):
+        '''
+        Runs the standardizer of the normalization method on the molblock
+        and returns a dictionary with the parent MolBlock, the issues found
+        by the chEMBL checker and the error raised, if any. The results do
+        not depend on the settings, and can be stored in the cache
+        '''
+
+        result = {'parent': None, 'issues': [], 'error': None, 'message': None}
+
+        try:
+            if 'standardize' in method:
+                result['parent'] = standardise.run(molblock)
+            else:
+                result['parent'] = embl.standardize_molblock(molblock)
+                result['issues'] = [list(i) for i in checker.check_molblock(molblock)]
+
+        except standardise.StandardiseException as e:
+            result['error'] = e.name
+            result['message'] = str(e)
+
+        except Exception as e:
+            result['error'] = 'exception'
+            result['message'] = str(e)
+
+        return result
+
+    def normalizeMol(self, m, method, mcount, name, cache=None):
+        '''
+        Returns the MolBlock of the parent of the molecule m, obtained with
+        the normalization method, or None if the molecule must be discarded
+
+        When a cache is provided, the results of the standardizer are
+        searched in the cache before running it, and stored in the cache
+        otherwyse
+        '''
+
+        try:
+            molblock = Chem.MolToMolBlock(m)
+        except Exception as e:
+            # this error means an severe error when processing the molecule
+            # the molecule is discarded
+            LOG.error(f'Critical molecule processing exception {e}'
+                        f' when processing mol #{mcount} {name}. Discarding molecule')
+            return None
+
+        if 'standardize' not in method and 'chEMBL' not in method:
+            #LOG.info(f'Skipping normalization.')
+            return molblock
+
+        if 'chEMBL' in method and embl is None:
+            LOG.error('chembl_structure_pipeline is not installed.'
+                      f' Discarding mol #{mcount} {name}')
+            return None
+
+        result = None
+        if cache is not None:
+            key = molblock_key(molblock)
+            result = cache.get(key)
+
+        if result is None:
+            result = self.standardizeMolblock(molblock, method)
+            if cache is not None:
+                cache.put(key, result)
+
+        error = result['error']
+        parent = result['parent']
+
+        if error == 'exception':
+            # this error means an execution error running standardizer
+            # the molecule is discarded
+            LOG.error(f'Critical standardize execution exception {result["message"]}'
+                        f' when processing mol #{mcount} {name}. Discarding molecule')
+            return None
+
+        if error == "no_non_salt":
+            # very commong warning, use parent mol and proceed
+            LOG.debug(f'"No non salt error" found. Skiped standardize for mol'
+                    f' #{mcount} {name}')
+            return molblock
+
+        if error is not None:
+            # serious issue, no parent was generated, use original mol
+            LOG.error(f'Critical standardize exception: {result["message"]}'
+                    f' when processing mol #{mcount} {name}. Skipping normalization')
+            return molblock
+
+        if 'chEMBL' in method:
+            # Get allowed penalty score from parameters
+            score = self.param.getDict('normalize_settings')['score']
+            issues = result['issues']
+            if len(issues) > 0:
+                if issues[0][0] > score:
+                    return None
+
+        # the cached parent keeps the name of the molecule stored first
+        return retitle(parent, molblock)
+
     def normalize(self, ifile, method):
         '''
         Generates a simplified SDFile with MolBlock and an internal ID for
@@ -291,14 +450,14 @@ class Idata:
 
         '''
         
-        success_list = [True for i in range(sdfutils.count_mols(ifile))]
+        success_list = [True for i in range(self.countMols(ifile))]
         
         if not method :
             method = ''
 
         LOG.info('Starting normalization...')
         try:
-            suppl = Chem.SDMolSupplier(ifile)
+            suppl = self.molSupplier(ifile)
             LOG.debug(f'mol supplier created from {ifile}')
         except Exception as e:
             LOG.error('Unable to create mol supplier with the exception: '
@@ -311,9 +470,25 @@ class Idata:
             self.conveyor.setError(f'Input file {ifile} is empty')
             return
 
+        # the normalized molecules are always written as an SDFile
         filename, fileext = os.path.splitext(ifile)
+        if self.param.getVal('input_type') == 'smiles':
+            fileext = '.sdf'
         ofile = filename + '_std' + fileext
         LOG.debug(f'writing standarized molecules to {ofile}')
+
+        # parents of the structures already normalized, indexed by their
+        # canonical SMILES, so that duplicates are standardized only once
+        deduplicate = self.param.getVal('deduplicate')
+        parents = {}
+
+        # results of the standardizer are stored in a persistent cache,
+        # shared by all the models using the same normalization method
+        cache = None
+        namespace = self.normalizeNamespace(method)
+        if namespace is not None:
+            cache = Cache(namespace)
+
         with open(ofile, 'w') as fo:
             mcount = 0
             # merror = 0
@@ -328,76 +503,22 @@ class Idata:
                 name = sdfutils.getName(m, count=mcount,
                                     field=self.param.getVal('SDFile_name'))
 
-                parent = None
-
-                if 'standardize' in method:
-                    try:
-
-                        parent = standardise.run(Chem.MolToMolBlock(m))
-
-                    except standardise.StandardiseException as e:
-
-                        if e.name == "no_non_salt":
-                            # very commong warning, use parent mol and proceed
-                            LOG.debug(f'"No non salt error" found. Skiped standardize for mol'
-                                    f' #{mcount} {name}')
-                            parent = Chem.MolToMolBlock(m)
-                        else:
-                            # serious issue, no parent was generated, use original mol
-                            if (parent is None):
-                                LOG.error(f'Critical standardize exception: {e}'
-                                        f' when processing mol #{mcount} {name}. Skipping normalization')
-                                parent = Chem.MolToMolBlock(m)
-                            # minor isse, parent was generated, show a warning and proceed
-                            else:
-                                LOG.info(f'Standardize exception: {e}'
-                                        f' when processing mol #{mcount} {name}. Normalization applied')
-                        #return False, e.name
-
-                    except Exception as e:
-                        # this error means an execution error running standardizer
-                        # the molecule is discarded and therefore the list of molecules must be updated 
-                        LOG.error(f'Critical standardize execution exception {e}'
-                                    f' when processing mol #{mcount} {name}. Discarding molecule')
-                        success_list[mcount]=False
-                        mcount += 1
-                        continue
-
-                elif 'chEMBL' in method:
-                    # Get allowed penalty score from parameters
-                    score = self.param.getDict('normalize_settings')['score']
-                    from chembl_structure_pipeline import standardizer as embl
-                    from chembl_structure_pipeline import checker
-                    try:
-                        parent = embl.standardize_molblock(Chem.MolToMolBlock(m))
-                        issues = checker.check_molblock(Chem.MolToMolBlock(m))
-                        if len(issues) > 0:
-                            if issues[0][0] > score:
-                                success_list[mcount]=False
-                                mcount += 1
-                                continue
-
-                    except Exception as e:
-                        # this error means an execution error running standardizer
-                        # the molecule is discarded and therefore the list of molecules must be updated 
-                        LOG.error(f'Critical standardize execution exception {e}'
-                                    f' when processing mol #{mcount} {name}. Discarding molecule')
-                        success_list[mcount]=False
-                        mcount += 1
-                        continue
+                key = None
+                if deduplicate:
+                    key = Chem.MolToSmiles(m)
 
+                if key in parents:
+                    parent = parents[key]
                 else:
-                    #LOG.info(f'Skipping normalization.')
-                    try:
-                        parent = Chem.MolToMolBlock(m)
-                    except Exception as e:
-                        # this error means an severe error when processing the molecule
-                        # the molecule is discarded and therefore the list of molecules must be updated 
-                        LOG.error(f'Critical molecule processing exception {e}'
-                                    f' when processing mol #{mcount} {name}. Discarding molecule')
-                        success_list[mcount]=False
-                        mcount += 1
-                        continue
+                    parent = self.normalizeMol(m, method, mcount, name, cache)
+                    if key is not None:
+                        parents[key] = parent
+
+                # the molecule is discarded and therefore the list of molecules must be updated 
+                if parent is None:
+                    success_list[mcount]=False
+                    mcount += 1
+                    continue
 
                 # in any case, write parent plus internal ID (flameID)
                 fo.write(parent)
@@ -411,6 +532,12 @@ class Idata:
                 # terminator
                 fo.write('$$$$\n')
 
+        if cache is not None:
+            cache.close()
+
+        if deduplicate and mcount > len(parents):
+            LOG.info(f'{mcount - len(parents)} duplicated structures normalized only once')
+
         return success_list, ofile
 
     def ionize(self, ifile, method):
@@ -432,7 +559,8 @@ class Idata:
 
     def convert3D(self, ifile, method):
         '''
-        Assigns 3D structures to the molecular structures provided as input.
+        Assigns 3D structures to the molecular structures provided as input,
+        using the convert3D_settings
         '''
 
         success_list = [True for i in range(sdfutils.count_mols(ifile))]
@@ -441,21 +569,22 @@ class Idata:
             return success_list, ifile
         
         if method == 'ETKDG':
-            success_list, ofile = convert3D._ETKDG(ifile)
+            success_list, ofile = convert3D._ETKDG(ifile, self.param.getDict('convert3D_settings'))
         else:
             LOG.warning(f'Value of parameter "convert3D_method" not recognized: {method}. No 3D conversion applied')
             ofile = ifile
 
         return success_list, ofile
 
-    def computeMD_custom(self, ifile):
+    def computeMD_custom(self, ifile, **kwargs):
         '''
         Empty method for computing molecular descriptors.
 
-        ifile is a molecular file in SDFile format.
+        ifile is a molecular file in SDFile format. kwargs contains the MD_settings
+        and the dtype used to store the descriptors
 
         returns a boolean anda a tupla of two elements:
-        [0] xmatrix (nparray np.float64)
+        [0] xmatrix (nparray of kwargs['dtype'])
         [1] list of variable names (str)
         [2] list of booleans indicating if the computation succeeded for each molecule
 
@@ -471,7 +600,7 @@ class Idata:
 
         input is the name of a molecule or a series of molecules and a label
         of the methods output is boolean anda a tupla of two elements:
-        [0] xmatrix (nparray np.float64)
+        [0] xmatrix (nparray of the descriptor_dtype, uint8 for fingerprints)
         [1] list of variable names (str)
 
         FIXIT
@@ -481,6 +610,7 @@ class Idata:
         # Load descriptor settings
 
         md_settings = self.param.getDict('MD_settings')
+        dtype = utils.descriptor_dtype(self.param)
 
         registered_methods = dict([('RDKit_properties', computeMD._RDKit_properties),
                                    ('morganFP', computeMD._RDKit_morganFPS),
@@ -505,7 +635,7 @@ class Idata:
 
         for method in methods:
             # success, results = registered_methods[method](ifile)
-            success, results = registered_methods[method](ifile, **md_settings)
+            success, results = registered_methods[method](ifile, dtype=dtype, **md_settings)
 
             if not success:  # if computing returns False in status
                 return success, results
@@ -705,7 +835,17 @@ class Idata:
         md5_parameters = self.param.getVal('md5')
         md5_input = utils.md5sum(self.ifile)  # run md5 in self.ifile
 
+        # in incremental mode the X matrix is saved apart, in numpy format, 
+        # so it can be used as a read-only memory map by learn
+        xmatrix_file = os.path.join(self.dest_path, 'xmatrix.npy')
+        xmatrix_apart = self.param.getVal('incremental') and \
+                        self.conveyor.getVal('xmatrix') is not None
+
         try:
+            if xmatrix_apart:
+                np.save(xmatrix_file, self.conveyor.getVal('xmatrix'))
+                self.conveyor.setVal('xmatrix', None)
+
             with open(os.path.join(self.dest_path, 'data.pkl'), 'wb') as fo:
 
                 pickle.dump(md5_parameters, fo)
@@ -716,6 +856,13 @@ class Idata:
         except Exception as e:
             LOG.error(f"Can't serialize descriptors because of exception: {e}")
 
+        # replace the X matrix in memory by the memory map
+        if xmatrix_apart:
+            try:
+                self.conveyor.setVal('xmatrix', np.load(xmatrix_file, mmap_mode='r'))
+            except Exception as e:
+                self.conveyor.setError(f'Unable to map X matrix with exception: {e}')
+
     def load(self):
         '''
         Loads the results in serialized form, together with the MD5 signature
@@ -748,6 +895,11 @@ class Idata:
                     LOG.error(f'Failed to load pickle file with error: "{message}"')
                     return False
 
+            # X matrices saved apart (incremental mode) are memory mapped
+            if self.conveyor.isKey('xmatrix') and self.conveyor.getVal('xmatrix') is None:
+                xmatrix_file = os.path.join(self.dest_path, 'xmatrix.npy')
+                self.conveyor.setVal('xmatrix', np.load(xmatrix_file, mmap_mode='r'))
+
         except Exception as e:
             self.conveyor.setError('Error loading pickle with exception: {}'.format(e))
             LOG.error('Error loading pickle with exception: {}'.format(e))
@@ -772,8 +924,8 @@ class Idata:
         va_results = []
 
         # split in single molecule pieces
-        num_mol = sdfutils.count_mols(input_file)
-        success, results = sdfutils.split_SDFile(input_file, num_mol)
+        num_mol = self.countMols(input_file)
+        success, results = self.splitInput(input_file, num_mol)
 
         if not success:
             return success, results
@@ -858,23 +1010,40 @@ class Idata:
 
         '''
 
-        mol_index = [True for i in range(sdfutils.count_mols(input_file))]
+        mol_index = [True for i in range(self.countMols(input_file))]
 
         ###
         # 1. normalize
         ###
-        success_list, output_normalize_file = self.normalize(
-            input_file, self.param.getVal('normalize_method'))
+        with self.conveyor.span('normalize', sum(mol_index)):
+            success_list, output_normalize_file = self.normalize(
+                input_file, self.param.getVal('normalize_method'))
         success, mol_index = self.updateMolIndex(mol_index, success_list)
 
         if not success:
             return False, 'failed to normalize '+input_file
 
+        ###
+        # 1b. deduplicate
+        ###
+        # the next steps are applied only once for every unique structure
+        # (mol_index refers then to the unique structures) and the results
+        # are assigned to the original molecules at the end
+        unique = None
+        if self.param.getVal('deduplicate'):
+            with self.conveyor.span('deduplicate', sum(mol_index)):
+                output_normalize_file, unique = sdfutils.unique_SDFile(output_normalize_file)
+
+            if unique is not None:
+                input_index = mol_index
+                mol_index = [True for i in range(max(unique)+1)]
+
         ###
         # 2. ionize
         ###
-        success_list, output_ionize_file = self.ionize(
-            output_normalize_file, self.param.getVal('ionize_method'))
+        with self.conveyor.span('ionize', sum(mol_index)):
+            success_list, output_ionize_file = self.ionize(
+                output_normalize_file, self.param.getVal('ionize_method'))
         success, mol_index = self.updateMolIndex(mol_index, success_list)
 
         if not success:
@@ -883,8 +1052,9 @@ class Idata:
         ###
         # 3. convert3D
         ###
-        success_list, output_convert3D_file = self.convert3D(
-            output_ionize_file, self.param.getVal('convert3D_method'))
+        with self.conveyor.span('convert3D', sum(mol_index)):
+            success_list, output_convert3D_file = self.convert3D(
+                output_ionize_file, self.param.getVal('convert3D_method'))
         success, mol_index = self.updateMolIndex(mol_index, success_list)
 
         if not success:
@@ -893,8 +1063,9 @@ class Idata:
         ###
         # 4. compute MD
         ###
-        success, results = self.computeMD(
-            output_convert3D_file, self.param.getVal('computeMD_method'))
+        with self.conveyor.span('computeMD', sum(mol_index)):
+            success, results = self.computeMD(
+                output_convert3D_file, self.param.getVal('computeMD_method'))
 
         if not success:
             return False, results
@@ -904,9 +1075,31 @@ class Idata:
         success_list = results [2]
 
         success, mol_index = self.updateMolIndex(mol_index, success_list)
+
+        if success and unique is not None:
+            x, success_list = self.scatterUnique(x, mol_index, unique)
+            success, mol_index = self.updateMolIndex(input_index, success_list)
         
         return success, (x, xnames, mol_index)
 
+    @staticmethod
+    def scatterUnique(x, unique_index, unique):
+        '''
+        Assigns the results obtained for the unique structures to the
+        original molecules. unique_index indicates which unique structures
+        completed the workflow (and have a row in x) and unique contains the
+        unique structure of every molecule.
+
+        Returns the X matrix and the success list of the original molecules
+        '''
+        # row of x for every unique structure which completed the workflow
+        rows = np.cumsum(unique_index) - 1
+
+        success_list = [unique_index[u] for u in unique]
+        x = x[[rows[u] for u in unique if unique_index[u]]]
+
+        return x, success_list
+
     def ammend_objects(self, inform, workflow) -> None:
         '''
         The arguments inform and workflow are lists of booleans describing
@@ -973,7 +1166,8 @@ class Idata:
 
         # extract useful information from file
 
-        success_inform = self.extractInformation(self.ifile)
+        with self.conveyor.span('extractInformation'):
+            success_inform = self.extractInformation(self.ifile)
         if self.conveyor.getError():
             return
 
@@ -988,7 +1182,7 @@ class Idata:
         # Execute the workflow in 1 or n CPUs
         if ncpu > 1:
             LOG.debug('Entering molecule workflow for {} cpus'.format(ncpu))
-            success, results = sdfutils.split_SDFile(lfile, ncpu)
+            success, results = self.splitInput(lfile, ncpu)
 
             if not success:
                 self.conveyor.setError('Unable to split input molecule')
@@ -999,19 +1193,22 @@ class Idata:
 
             pool = mp.Pool(ncpu)
 
-            if self.param.getVal('mol_batch') == 'series':
-                results = pool.map(self.workflow_series, split_files_names)
-            else:
-                results = pool.map(self.workflow_objects, split_files_names)
+            # the stages run in the pool are not traced, only the total time
+            with self.conveyor.span('workflow', nobj):
+                if self.param.getVal('mol_batch') == 'series':
+                    results = pool.map(self.workflow_series, split_files_names)
+                else:
+                    results = pool.map(self.workflow_objects, split_files_names)
 
             success, results = self.consolidate(results, split_files_sizes)
 
         else:
 
-            if self.param.getVal('mol_batch') == 'series':
-                success, results = self.workflow_series(lfile)
-            else:
-                success, results = self.workflow_objects(lfile)
+            with self.conveyor.span('workflow', nobj):
+                if self.param.getVal('mol_batch') == 'series':
+                    success, results = self.workflow_series(lfile)
+                else:
+                    success, results = self.workflow_objects(lfile)
 
         # series processing (1 or n CPUs) can produce a success == False if
         # any of the series/pieces contains an error. Abort the processing...
@@ -1122,7 +1319,7 @@ class Idata:
         LOG.debug('creating ymatrix from column {}'.format(activity_param))
         if activity_param in var_nam:
             col = var_nam.index(activity_param)  # Something is failing here: + 1 needed
-            ymatrix = xmatrix[:, col]
+            ymatrix = xmatrix[:, col].copy()
             xmatrix = np.delete(xmatrix, col, 1)
             self.conveyor.addVal( ymatrix, 'ymatrix', 'Activity', 'decoration',
                              'objs', 'Biological anotation to be predicted by the model')
@@ -1132,6 +1329,12 @@ class Idata:
 
         #TODO: optional sanitization step, to check if the X matrix contains extreme values or variables
         # with unreasonable variances
+
+        # the Y values are kept in float64
+        success, xmatrix = utils.cast_matrix(xmatrix, utils.descriptor_dtype(self.param))
+        if not success:
+            self.conveyor.setError(xmatrix)
+            return
         
         self.conveyor.addVal( xmatrix, 'xmatrix',
                          'X matrix', 'method', 'vars', 'Molecular descriptors')
@@ -1279,14 +1482,16 @@ class Idata:
                 return 
 
             # check for the presence of a valid pickle file
-            if self.load():
+            with self.conveyor.span('load'):
+                recycled = self.load()
+            if recycled:
 
                 #print (self.conveyor.data)
 
                 return 
 
-        # processing for molecular input (for now an SDFile)
-        if input_type == 'molecule':
+        # processing for molecular input (SDFile or SMILES file)
+        if input_type in ('molecule', 'smiles'):
 
             self.captureStdError(True)
             self._run_molecule()
@@ -1306,6 +1511,7 @@ class Idata:
 
         # save in a pickle file stamped with MD5 hash of file and control
         if not self.conveyor.getError():
-            self.save()
+            with self.conveyor.span('save'):
+                self.save()
 
         return 
@@ -0,0 +1,435 @@
+#! -*- coding: utf-8 -*-
+
+# Description    Flame job queue and workers
+#
+# Authors:       Manuel Pastor (manuel.pastor@upf.edu)
+#
+# Copyright 2018 Manuel Pastor
+#
+# This file is part of Flame
+#
+# Flame is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3.
+#
+# Flame is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Flame. If not, see <http://www.gnu.org/licenses/>.
+
+''' Asynchronous execution of flame commands.
+
+    Jobs (build, predict, search...) are stored in a SQLite queue, shared
+    by the processes submitting the jobs (e.g. web services) and by the
+    worker daemon (Worker.run) which executes them. Every job runs in its
+    own process, with optional CPU and memory limits, so a failing job
+    never affects the caller or the daemon.
+
+    Jobs are selected by priority (lower values first) and then in order
+    of submission. Predictions and searches have a higher priority than
+    builds, and builds can only use a part of the workers. At least one
+    worker is always kept for predictions and searches, also when the
+    daemon runs a single worker, so that interactive jobs never wait for
+    long builds to finish '''
+
+import os
+import json
+import time
+import sqlite3
+import multiprocessing
+from contextlib import closing
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+from flame.util import utils, get_logger
+
+LOG = get_logger(__name__)
+
+JOBS_FILE = 'jobs.sqlite'
+
+# jobs using the model or space building workflows
+HEAVY_COMMANDS = ('build', 'sbuild')
+COMMANDS = ('predict', 'predict_multi', 'search') + HEAVY_COMMANDS
+
+# default priorities, lower values are run first
+PRIORITIES = {'predict': 0, 'predict_multi': 0, 'search': 0,
+              'build': 10, 'sbuild': 10}
+
+JOB_STATES = ('queued', 'running', 'completed', 'failed', 'cancelled')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    command TEXT NOT NULL,
+    arguments TEXT NOT NULL,
+    label TEXT,
+    priority INTEGER NOT NULL,
+    cpus INTEGER,
+    memory INTEGER,
+    state TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT,
+    success INTEGER,
+    results TEXT,
+    pid INTEGER,
+    cancel INTEGER NOT NULL DEFAULT 0,
+    submitted REAL,
+    started REAL,
+    finished REAL);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (state, priority, id);
+CREATE INDEX IF NOT EXISTS jobs_label ON jobs (label);
+'''
+
+
+def jobs_path():
+    ''' default location of the job queue, in the predictions repository '''
+    return os.path.join(utils.predictions_repository_path(), JOBS_FILE)
+
+
+class JobQueue:
+    '''
+        Persistent queue of flame jobs, stored in a SQLite database
+
+        ...
+
+        Attributes
+        ----------
+
+        path : str
+            path to the SQLite database
+
+        Methods
+        -------
+
+        submit(command, arguments, label, priority, cpus, memory)
+            adds a new job to the queue and returns its id
+        status(job_id)
+            returns a dictionary describing the job
+        jobs(state)
+            returns the list of jobs, optionally in the given state
+        cancel(job_id)
+            cancels a queued job or asks the workers to stop a running job
+        result(label)
+            returns the results of the last job with this label
+    '''
+
+    def __init__(self, path=None):
+        if path is None:
+            path = jobs_path()
+        self.path = path
+
+        with closing(self.connect()) as con:
+            con.execute('PRAGMA journal_mode=WAL')
+            con.executescript(SCHEMA)
+
+    def connect(self):
+        ''' connection in autocommit mode, transactions are explicit '''
+        con = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+        con.row_factory = sqlite3.Row
+        return con
+
+    def execute(self, query, values=()):
+        with closing(self.connect()) as con:
+            return con.execute(query, values).fetchall()
+
+    def submit(self, command, arguments, label=None, priority=None,
+               cpus=None, memory=None):
+        ''' adds a job to the queue. arguments is the dictionary passed to
+        the context command (e.g. context.predict_cmd). cpus and memory
+        (in MB) limit the resources used by the job '''
+
+        if command not in COMMANDS:
+            return False, f'Unknown command {command}, use one of {COMMANDS}'
+
+        try:
+            arguments_json = json.dumps(arguments)
+        except Exception as e:
+            return False, f'Job arguments cannot be serialized with exception {e}'
+
+        if label is None:
+            label = arguments.get('label')
+
+        if priority is None:
+            priority = PRIORITIES[command]
+
+        with closing(self.connect()) as con:
+            cursor = con.execute('INSERT INTO jobs (command, arguments, label,'
+                                 ' priority, cpus, memory, state, submitted)'
+                                 ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                 (command, arguments_json, label, priority,
+                                  cpus, memory, 'queued', time.time()))
+            job_id = cursor.lastrowid
+
+        LOG.info(f'Job {job_id} ({command}) submitted')
+        return True, job_id
+
+    def status(self, job_id):
+        ''' returns a dictionary with the job information '''
+
+        rows = self.execute('SELECT * FROM jobs WHERE id=?', (job_id,))
+        if len(rows) == 0:
+            return False, f'Job {job_id} not found'
+
+        job = dict(rows[0])
+        job['arguments'] = json.loads(job['arguments'])
+        return True, job
+
+    def jobs(self, state=None):
+        ''' returns the list of jobs, without their results '''
+
+        query = ('SELECT id, command, label, priority, state, progress,'
+                 ' message, submitted, started, finished FROM jobs')
+        if state is None:
+            rows = self.execute(query + ' ORDER BY id')
+        else:
+            rows = self.execute(query + ' WHERE state=? ORDER BY id', (state,))
+
+        return True, [dict(i) for i in rows]
+
+    def cancel(self, job_id):
+        ''' queued jobs are cancelled immediately, running jobs are
+        stopped by the worker '''
+
+        with closing(self.connect()) as con:
+            con.execute('BEGIN IMMEDIATE')
+            row = con.execute('SELECT state FROM jobs WHERE id=?', (job_id,)).fetchone()
+            if row is None:
+                con.execute('ROLLBACK')
+                return False, f'Job {job_id} not found'
+
+            if row['state'] == 'queued':
+                con.execute("UPDATE jobs SET state='cancelled', finished=?"
+                            " WHERE id=?", (time.time(), job_id))
+            elif row['state'] == 'running':
+                con.execute('UPDATE jobs SET cancel=1 WHERE id=?', (job_id,))
+            else:
+                con.execute('ROLLBACK')
+                return False, f'Job {job_id} is already {row["state"]}'
+
+            con.execute('COMMIT')
+
+        return True, 'OK'
+
+    def result(self, label):
+        ''' returns the success and the results of the last completed or
+        failed job with the given label '''
+
+        rows = self.execute("SELECT state, success, results FROM jobs"
+                            " WHERE label=? AND state IN ('completed', 'failed')"
+                            " ORDER BY id DESC LIMIT 1", (label,))
+        if len(rows) == 0:
+            return False, f'No finished job with label {label}'
+
+        return bool(rows[0]['success']), rows[0]['results']
+
+    def claim(self, heavy=True):
+        ''' marks the next job of the queue as running and returns it.
+        When heavy is False, build jobs are not considered '''
+
+        query = "SELECT id FROM jobs WHERE state='queued'"
+        if not heavy:
+            query += ' AND command NOT IN (%s)' % ','.join('?'*len(HEAVY_COMMANDS))
+        query += ' ORDER BY priority, id LIMIT 1'
+        values = () if heavy else HEAVY_COMMANDS
+
+        with closing(self.connect()) as con:
+            con.execute('BEGIN IMMEDIATE')
+            row = con.execute(query, values).fetchone()
+            if row is None:
+                con.execute('ROLLBACK')
+                return None
+
+            con.execute("UPDATE jobs SET state='running', started=?, progress=0"
+                        " WHERE id=?", (time.time(), row['id']))
+            con.execute('COMMIT')
+
+        return self.status(row['id'])[1]
+
+    def progress(self, job_id, fraction, message):
+        self.execute('UPDATE jobs SET progress=?, message=? WHERE id=?',
+                     (fraction, message, job_id))
+
+    def set_pid(self, job_id, pid):
+        self.execute('UPDATE jobs SET pid=? WHERE id=?', (pid, job_id))
+
+    def finish(self, job_id, state, success, results):
+        ''' stores the results of a running job '''
+        self.execute("UPDATE jobs SET state=?, success=?, results=?,"
+                     " progress=1, finished=? WHERE id=? AND state='running'",
+                     (state, int(success), results, time.time(), job_id))
+
+    def cancel_requested(self):
+        ''' ids of the running jobs which must be stopped '''
+        rows = self.execute("SELECT id FROM jobs WHERE state='running' AND cancel=1")
+        return [i['id'] for i in rows]
+
+
+def limit_resources(cpus, memory):
+    ''' limits the CPUs and the memory (in MB) of the current process.
+
+    The job processes inherit numpy and its BLAS and OpenMP pools already
+    loaded by the daemon, which ignore the environment variables from now
+    on. Their threads are limited with threadpoolctl, and the variables
+    only apply to the processes started by the job '''
+
+    if cpus is not None:
+        for variable in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+            os.environ[variable] = str(cpus)
+
+        if threadpool_limits is not None:
+            threadpool_limits(limits=cpus)
+        else:
+            LOG.warning('threadpoolctl not found, the threads of the job are not limited')
+
+        if hasattr(os, 'sched_setaffinity'):
+            available = sorted(os.sched_getaffinity(0))
+            os.sched_setaffinity(0, available[:max(1, cpus)])
+
+    if memory is not None:
+        try:
+            import resource
+            limit = int(memory) * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError) as e:
+            LOG.warning(f'Unable to limit the memory with exception {e}')
+
+
+def run_job(path, job):
+    ''' executes a job. This function runs in a separate process '''
+
+    from flame import context
+    from flame import conveyor
+
+    queue = JobQueue(path)
+    job_id = job['id']
+
+    limit_resources(job['cpus'], job['memory'])
+
+    # the workflows report their progress through the conveyor
+    conveyor.set_progress_handler(
+        lambda fraction, message: queue.progress(job_id, fraction, message))
+
+    commands = {'predict': context.predict_cmd,
+                'predict_multi': context.predict_multi_cmd,
+                'search': context.search_cmd,
+                'build': context.build_cmd,
+                'sbuild': context.sbuild_cmd}
+
+    try:
+        success, results = commands[job['command']](job['arguments'], 'JSON')
+        if not isinstance(results, str):
+            results = json.dumps(results)
+    except BaseException as e:
+        success, results = False, f'Job failed with exception {e}'
+
+    queue.finish(job_id, 'completed' if success else 'failed', success, results)
+
+
+class Worker:
+    '''
+        Daemon running the jobs of a JobQueue in a pool of processes
+
+        ...
+
+        Attributes
+        ----------
+
+        queue : JobQueue
+            queue of jobs
+        workers : int
+            maximum number of jobs running at the same time
+        heavy_workers : int
+            maximum number of build jobs running at the same time. By
+            default one worker is kept free for predictions and searches.
+            When all the workers run builds (e.g. workers=1) a prediction
+            or search is started in an additional process
+
+        Methods
+        -------
+
+        run()
+            executes the jobs of the queue until it is stopped
+        step()
+            checks the running jobs and starts new ones
+    '''
+
+    def __init__(self, path=None, workers=2, heavy_workers=None, poll=1.0):
+        self.queue = JobQueue(path)
+        self.workers = max(1, workers)
+        if heavy_workers is None:
+            heavy_workers = max(1, self.workers-1)
+        self.heavy_workers = min(max(0, heavy_workers), self.workers)
+        self.poll = poll
+        self.running = {}
+
+        # jobs left running by a previous daemon cannot be recovered
+        for job in self.queue.jobs('running')[1]:
+            self.queue.finish(job['id'], 'failed', False, 'Job interrupted')
+
+    def step(self):
+        ''' reaps finished jobs, stops cancelled jobs and starts queued
+        jobs in the free workers '''
+
+        for job_id, (process, job) in list(self.running.items()):
+            if not process.is_alive():
+                process.join()
+                # jobs killed by the system (e.g. out of memory)
+                if process.exitcode != 0:
+                    self.queue.finish(job_id, 'failed', False,
+                                      f'Job process exited with code {process.exitcode}')
+                del self.running[job_id]
+
+        for job_id in self.queue.cancel_requested():
+            if job_id in self.running:
+                process, job = self.running.pop(job_id)
+                process.terminate()
+                process.join()
+                self.queue.finish(job_id, 'cancelled', False, 'Job cancelled')
+                LOG.info(f'Job {job_id} cancelled')
+
+        while True:
+            heavy = sum(job['command'] in HEAVY_COMMANDS for process, job
+                        in self.running.values())
+
+            if len(self.running) < self.workers:
+                job = self.queue.claim(heavy=heavy < self.heavy_workers)
+            elif heavy == len(self.running):
+                # predictions never wait for builds to finish
+                job = self.queue.claim(heavy=False)
+            else:
+                break
+
+            if job is None:
+                break
+
+            process = multiprocessing.Process(target=run_job,
+                                              args=(self.queue.path, job))
+            process.start()
+            self.queue.set_pid(job['id'], process.pid)
+            self.running[job['id']] = (process, job)
+            LOG.info(f'Job {job["id"]} ({job["command"]}) started')
+
+    def run(self, max_idle=None):
+        ''' runs the daemon. When max_idle is defined the daemon stops
+        after this number of seconds without jobs '''
+
+        LOG.info(f'Job worker started with {self.workers} workers')
+        idle = 0.0
+        try:
+            while max_idle is None or idle < max_idle:
+                self.step()
+                idle = 0.0 if self.running else idle + self.poll
+                time.sleep(self.poll)
+        finally:
+            for process, job in self.running.values():
+                process.terminate()
+                process.join()
+                self.queue.finish(job['id'], 'failed', False, 'Job interrupted')
+
+        return True, 'OK'
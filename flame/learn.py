@@ -28,6 +28,7 @@ import numpy as np
 from flame.stats.RF import RF
 from flame.stats.SVM import SVM
 from flame.stats.GNB import GNB
+from flame.stats.SGD import SGD
 from flame.stats.PLSR import PLSR
 from flame.stats.PLSDA import PLSDA
 from flame.stats.XGboost import XGBOOST
@@ -39,6 +40,9 @@ from sklearn.preprocessing import RobustScaler
 
 from flame.stats.imbalance import *  
 from flame.stats import feature_selection
+from flame.stats import incremental
+from flame.stats.applicability_domain import ApplicabilityDomain
+from flame.stages import Stages, model_state
 from flame.util import utils, get_logger
 LOG = get_logger(__name__)
 
@@ -58,11 +62,15 @@ class Learn:
         self.scaler = None
         self.variable_mask = None
 
+        # results of the building stages, recycled between builds
+        self.stages = None
+
         # expand with new methods here:
         self.registered_methods = [('RF', RF),
                               ('XGBOOST', XGBOOST),
                               ('SVM', SVM),
                               ('GNB', GNB),
+                              ('SGD', SGD),
                               ('PLSR', PLSR),
                               ('PLSDA', PLSDA), 
                               ('median', median),
@@ -85,6 +93,17 @@ class Learn:
         The scaler and the variable mask are saved in a pickl file 
         '''
 
+        # warn about variables which could be affected by the float32 precision
+        utils.check_precision(self.X, self.conveyor.getVal('var_nam'))
+
+        # in incremental mode the X matrix is not transformed here
+        if self.param.getVal('incremental'):
+            success, message = self.preprocess_incremental()
+            if not success:
+                return False, message
+
+            return self.save_preprocessing()
+
         # Perform subsampling on the majority class. Consider to move.
         # Only for qualitative endpoints.
         if self.param.getVal("imbalance") is not None and \
@@ -103,6 +122,7 @@ class Learn:
 
         # Run scaling.
         self.scaler = None
+        X_raw = None
 
         # # update if other fingerprints are added
         # isFingerprint = (self.param.getVal('computeMD_method') == ['morganFP'])
@@ -129,6 +149,11 @@ class Learn:
                     return False, 'Scaler not recognized'
 
                 if scaler is not None:
+                    # fingerprints are scaled in the descriptor dtype, and the
+                    # unscaled matrix is kept for refitting the scaler
+                    self.X = self.X.astype(utils.descriptor_dtype(self.param), copy=False)
+                    X_raw = self.X
+
                     # The scaler is saved so it can be used later
                     # to prediction instances.
                     self.scaler = scaler.fit(self.X)
@@ -145,9 +170,101 @@ class Learn:
             self.variable_mask, self.scaler = \
                                 feature_selection.run_feature_selection(
                                             self.X, self.Y, self.scaler,
-                                            self.param)
+                                            self.param, X_raw)
             self.X = self.X[:, self.variable_mask]
 
+        return self.save_preprocessing()
+
+    def preprocess_incremental(self):
+        '''
+        Preprocessing for the incremental build mode. The scaler is fitted
+        reading the X matrix in chunks and it is applied to every chunk by 
+        the estimator. Methods requiring the whole X matrix in memory are 
+        not supported
+        '''
+
+        model = self.param.getVal('model')
+        if model not in incremental.INCREMENTAL_MODELS:
+            return False, (f'{model} does not support incremental building,'
+                           f' use one of {incremental.INCREMENTAL_MODELS}')
+
+        if self.param.getVal("imbalance") is not None and \
+                        not self.param.getVal("quantitative"):
+            return False, 'Imbalance sampling is not supported in incremental mode'
+
+        if self.param.getVal("feature_selection"):
+            return False, 'Feature selection is not supported in incremental mode'
+
+        if self.param.getVal("conformal"):
+            return False, 'Conformal models are not supported in incremental mode'
+
+        self.scaler = None
+
+        autoscaling = self.param.getVal('modelAutoscaling')
+        if autoscaling:
+            if autoscaling not in incremental.INCREMENTAL_SCALERS:
+                return False, (f'{autoscaling} is not supported in incremental mode,'
+                               f' use one of {incremental.INCREMENTAL_SCALERS}')
+            try:
+                if autoscaling == 'StandardScaler':
+                    scaler = StandardScaler()
+                else:
+                    scaler = MinMaxScaler(copy=True, feature_range=(0,1))
+
+                chunk, epochs = incremental.incremental_settings(self.param)
+                self.scaler = incremental.fit_scaler(scaler, self.X, chunk)
+                LOG.info(f'Data scaled incrementally using {autoscaling}')
+
+            except Exception as e:
+                return False, f'Unable to perform scaling with exception: {e}'
+
+        return True, 'OK'
+
+    def recycle(self, stage):
+        '''
+        Returns the saved results of the stage if the stage is not affected
+        by the changes in the parameters and data, or None otherwise
+        '''
+        if self.stages is None:
+            return None
+        return self.stages.get(stage)
+
+    def keep(self, stage, results):
+        '''
+        Saves the results of the stage, to be recycled by the next build
+        '''
+        if self.stages is not None:
+            self.stages.put(stage, results)
+
+    def run_preprocess(self):
+        '''
+        Runs the preprocessing or recycles the preprocessed matrices, the
+        scaler and the variable mask of the last build
+        '''
+
+        results = self.recycle('preprocess')
+        if results is None:
+            success, message = self.preprocess()
+            if success:
+                self.keep('preprocess', {'X': self.X,
+                                         'Y': self.Y,
+                                         'scaler': self.scaler,
+                                         'variable_mask': self.variable_mask})
+            return success, message
+
+        self.X = results['X']
+        self.Y = results['Y']
+        self.scaler = results['scaler']
+        self.variable_mask = results['variable_mask']
+
+        return self.save_preprocessing()
+
+    def save_preprocessing(self):
+        '''
+        Checks the preprocessed matrices and saves the scaler and the
+        variable mask in a pickle file 
+        '''
+
         # Set the new number of instances/variables
         # if sampling/feature selection performed
         self.nobj, self.nvarx = np.shape(self.X)
@@ -177,6 +294,43 @@ class Learn:
         return True, 'OK'
 
 
+    def build_AD(self):
+        '''
+        Builds the applicability domain on the preprocessed X matrix and
+        saves it in the model folder
+        '''
+
+        ad = ApplicabilityDomain(self.param)
+
+        results = self.recycle('applicability_domain')
+        if results is not None:
+            ad.__dict__.update(results['state'])
+            ad.save()
+            return True, results['results']
+
+        # in incremental mode the X matrix is scaled in chunks
+        scaler = None
+        chunk = incremental.CHUNK_SIZE
+        if self.param.getVal('incremental'):
+            scaler = self.scaler
+            chunk, epochs = incremental.incremental_settings(self.param)
+
+        try:
+            success, results = ad.build(self.X, scaler, chunk)
+            if success:
+                ad.save()
+                self.keep('applicability_domain',
+                          {'state': {k: v for k, v in ad.__dict__.items() if k != 'param'},
+                           'results': results})
+        except Exception as e:
+            LOG.error(f'Error building the applicability domain with exception {e}')
+            return False, f'Unable to build the applicability domain with exception {e}'
+
+        if not success:
+            LOG.warning(results)
+
+        return success, results
+
     def run_internal(self):
         '''
         Builds a model using the internally defined machine learning tools.
@@ -198,8 +352,15 @@ class Learn:
                 self.conveyor.setError(yresult)
                 return
 
+        # the stages not affected by the changes in the parameters and the
+        # data since the last build are not run again
+        if self.param.getVal('build_cache') and not self.param.getVal('incremental') \
+                and self.param.getVal('input_type') != 'model_ensemble':
+            self.stages = Stages(self.param, self.X, self.Y)
+
         # pre-process data
-        success, message = self.preprocess()
+        with self.conveyor.span('preprocess', self.X.shape[0]):
+            success, message = self.run_preprocess()
         if not success:
             self.conveyor.setError(message)
             return
@@ -216,6 +377,11 @@ class Learn:
                 # - already obtained results (conveyor)
 
                 model = imethod[1](self.X, self.Y, self.param, self.conveyor)
+
+                # the model applies the scaler to every chunk 
+                if self.param.getVal('incremental'):
+                    model.scaler = self.scaler
+
                 LOG.debug('Recognized learner: '
                           f"{self.param.getVal('model')}")
                 break
@@ -232,7 +398,16 @@ class Learn:
 
         # build model
         LOG.info('Starting model building')
-        success, model_building_results = model.build()
+        with self.conveyor.span('build', self.X.shape[0]):
+            results = self.recycle('build')
+            if results is None:
+                success, model_building_results = model.build()
+                if success:
+                    self.keep('build', {'state': model_state(model),
+                                        'results': model_building_results})
+            else:
+                model.__dict__.update(results['state'])
+                success, model_building_results = True, results['results']
         if not success:
             self.conveyor.setError(model_building_results)
             return
@@ -247,7 +422,18 @@ class Learn:
 
         # validate model
         LOG.info('Starting model validation')
-        success, model_validation_results = model.validate()
+        with self.conveyor.span('validate', self.X.shape[0]):
+            results = self.recycle('validate')
+            if results is None:
+                built = model_state(model)
+                success, model_validation_results = model.validate()
+                if success:
+                    # the estimator is already saved by the build stage
+                    self.keep('validate', {'state': model_state(model, built),
+                                           'results': model_validation_results})
+            else:
+                model.__dict__.update(results['state'])
+                success, model_validation_results = True, results['results']
         if not success:
             self.conveyor.setError(model_validation_results)
             return
@@ -298,13 +484,21 @@ class Learn:
         # conformal quantitataive models produce a list of tuples, indicating
         # the minumum and maximum value
 
-        # TODO: compute AD (when applicable)
+        # index the training series to compute the AD of predicted objects
+        if self.param.getVal('applicability_domain'):
+            with self.conveyor.span('applicability_domain', self.X.shape[0]):
+                success, ad_results = self.build_AD()
+            if success:
+                model_building_results.extend(ad_results)
+            else:
+                self.conveyor.setWarning(ad_results)
 
         LOG.info('Model finished successfully')
 
         # save model
         try:
-            model.save_model()
+            with self.conveyor.span('save_model'):
+                model.save_model()
 
         except Exception as e:
             LOG.error(f'Error saving model with exception {e}')
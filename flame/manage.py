@@ -23,12 +23,15 @@
 import os
 import sys
 import shutil
-import tarfile
 import json
 import pickle
 import pathlib
 import numpy as np
 from flame.util import utils, get_logger 
+from flame.util import tracer
+from flame import catalog
+from flame import store
+from flame import package
 from flame.conveyor import Conveyor
 # from flame.parameters import Parameters
 # from flame.conveyor import Conveyor
@@ -103,6 +106,8 @@ def action_new(model):
     shutil.copy(documentation_path, ndir)
   
 
+    catalog.update(model)
+
     LOG.info(f'New endpoint {model} created')
     #print(f'New endpoint {model} created')
     return True, 'new endpoint '+model+' created'
@@ -122,11 +127,14 @@ def action_kill(model):
         #LOG.error(f'Model {model} not found')
         return False, f'Model {model} not found'
 
+    # the objects shared by the versions are removed with the tree
     try:
         shutil.rmtree(ndir, ignore_errors=True)
     except:
         return False, f'Failed to remove model {model}'
 
+    catalog.update(model)
+
     LOG.info(f'Model {model} removed')
     #print(f'Model {model} removed')
     return True, f'Model {model} removed'
@@ -163,11 +171,14 @@ def action_publish(model):
 
     src_path = os.path.join (base_path,'dev')
 
+    # the files of the new version are links to the objects of the tree
     try:
-        shutil.copytree(src_path, new_path)
+        store.copy_version(base_path, src_path, new_path)
     except:
         return False, f'Unable to copy contents of dev version for model {model}'
 
+    catalog.update(model, max_version+1)
+
     LOG.info(f'New model version created from {src_path} to {new_path}')
     return True, f'New model version created from {src_path} to {new_path}'
 
@@ -189,6 +200,11 @@ def action_remove(model, version):
         return False, f'Version {version} not found'
 
     shutil.rmtree(rdir, ignore_errors=True)
+    catalog.update(model)
+
+    # free the objects only used by this version
+    store.collect(utils.model_tree_path(model))
+
     LOG.info(f'Version {version} of model {model} has been removed')
     return True, f'Version {version} of model {model} has been removed'
 
@@ -199,41 +215,35 @@ def action_list(model):
      otherwyse lists all versions for the model provided as argument
     '''
 
+    model_catalog = catalog.model_catalog()
+
     # if no model name is provided, just list the model names
     if not model:
-        rdir = utils.model_repository_path()
+        models = model_catalog.names()
 
-        num_models = 0
         LOG.info('Models found in repository:')
-        for x in os.listdir(rdir):
-            xpath = os.path.join(rdir,x) 
-            # discard if the item is not a directory
-            if not os.path.isdir(xpath):
-                continue
-            # discard if the directory does not contain a 'dev' directory inside
-            if not os.path.isdir(os.path.join(xpath,'dev')):
-                continue
-            num_models += 1
+        for x in models:
             LOG.info('\t'+x)
-        LOG.debug(f'Retrieved list of models from {rdir}')
-        return True, f'{num_models} models found'
+        LOG.debug(f'Retrieved list of models from {model_catalog.path}')
+        return True, f'{len(models)} models found'
 
 
     # if a model name is provided, list versions
-    base_path = utils.model_tree_path(model)
+    versions = model_catalog.versions(model)
+    if versions is None:
+        return False, f'Model {model} not found'
 
-    num_versions = 0
-    for x in os.listdir(base_path):
-        if x.startswith("ver"):
-            num_versions += 1
-            LOG.info(f'\t{model} : {x}')
+    versions = [x for x in versions if x > 0]
+    for x in versions:
+        LOG.info(f'\t{model} : ver{x:06}')
 
-    return True, f'Model {model} has {num_versions} published versions'
+    return True, f'Model {model} has {len(versions)} published versions'
 
 
 def action_import(model):
     '''
-    Creates a new model tree from a tarbal file with the name "model.tgz"
+    Imports the versions of a model package "model.tgz" not present in the
+    model repository, creating the model tree if needed
     '''
 
     if not model:
@@ -246,9 +256,6 @@ def action_import(model):
 
     base_path = utils.model_tree_path(endpoint)
 
-    if os.path.isdir(base_path):
-        return False, f'Endpoint {endpoint} already exists'
-
     if ext != '.tgz':
         importfile = os.path.abspath(model+'.tgz')
     else:
@@ -260,52 +267,71 @@ def action_import(model):
         LOG.info(f'Importing package {importfile} not found')
         return False, f'Importing package {importfile} not found'
 
-    try:
-        os.mkdir(base_path)
-    except Exception as e:
-        return False, f'error creating directory {base_path}: {e}'
+    success, versions = package.import_package(base_path, importfile)
+    if not success:
+        return False, versions
+
+    if len(versions) == 0:
+        return True, f'Endpoint {endpoint} is up to date, no versions imported'
+
+    # share the files identical in several versions
+    for iversion in versions:
+        if iversion.startswith('ver'):
+            store.deduplicate(base_path, os.path.join(base_path, iversion))
 
-    with tarfile.open(importfile, 'r:gz') as tar:
-        tar.extractall(base_path)
+    catalog.update(endpoint)
 
     LOG.info(f'Endpoint {endpoint} imported OK')
     return True, 'Endpoint '+endpoint+' imported OK'
 
 
-def action_export(model):
+def action_export(model, base=None):
     '''
     Exports the whole model tree indicated in the argument as a single
-    tarball file with the same name.
+    package file with the same name. If the manifest of the model in the
+    target installation is provided as base, only the versions and files 
+    not present in the target are exported.
     '''
 
     if not model:
         return False, 'Empty model label'
 
-    current_path = os.getcwd()
-    exportfile = os.path.join(current_path,model+'.tgz')
+    exportfile = os.path.join(os.getcwd(), model+'.tgz')
 
     base_path = utils.model_tree_path(model)
 
     if not os.path.isdir(base_path):
         return False, 'Unable to export, endpoint directory not found'
 
-    # change to model repository to tar the file from there
-    os.chdir(base_path)
+    success, manifest = package.export_package(base_path, model, exportfile, base)
+    if not success:
+        return False, manifest
 
-    itemend = os.listdir()
-    itemend.sort()
+    LOG.info(f'Model {model} exported as {model}.tgz')
+    return True, f'Model {model} exported as {model}.tgz'
 
-    with tarfile.open(exportfile, 'w:gz') as tar:
-        for iversion in itemend:
-            if not os.path.isdir(iversion):
-                continue
-            tar.add(iversion)
 
-    # return to current directory
-    os.chdir(current_path)
+def action_manifest(model):
+    '''
+    Writes the manifest of the model tree indicated in the argument, used
+    as base for exporting to this installation only the missing versions
+    and files
+    '''
 
-    LOG.info(f'Model {model} exported as {model}.tgz')
-    return True, f'Model {model} exported as {model}.tgz'
+    if not model:
+        return False, 'Empty model label'
+
+    base_path = utils.model_tree_path(model)
+
+    if not os.path.isdir(base_path):
+        return False, f'Model {model} not found'
+
+    manifest_file = os.path.join(os.getcwd(), model+'.manifest.json')
+    with open(manifest_file, 'w') as handle:
+        json.dump(package.tree_manifest(base_path, model), handle)
+
+    LOG.info(f'Manifest of model {model} saved as {model}.manifest.json')
+    return True, f'Manifest of model {model} saved as {model}.manifest.json'
 
 
 # TODO: implement refactoring, starting with simple methods
@@ -329,39 +355,10 @@ def action_info(model, version, output='text'):
         return False, 'Empty model label'
 
 
-    rdir = utils.model_path(model, version)
-    if not os.path.isfile(os.path.join(rdir, 'results.pkl')):
-        return False, 'Info file not found'
-
-    from flame.conveyor import Conveyor
-
-    conveyor = Conveyor()
-    with open(os.path.join(rdir, 'results.pkl'), 'rb') as handle:
-        conveyor.load(handle)
-
-    # if there is an error, return the error Message        
-    if conveyor.getError():
-        error = conveyor.getErrorMessage()
-        return False, error
-
-    # collect warnings
-    warning = conveyor.getWarningMessage()
-
-    # collect build and validation info
-    build_info =  conveyor.getVal('model_build_info')
-    valid_info =  conveyor.getVal('model_valid_info')
-
-    # merge everything 
-    info = None
-    for iinfo in (warning, build_info, valid_info):
-        if info == None:
-            info = iinfo
-        else:
-            if iinfo != None:
-                info+=iinfo
-
-    if info == None:
-        return False, 'No relevant information found'
+    # the summary of the results is kept in the catalog of the repository
+    success, info = catalog.model_catalog().info(model, version)
+    if not success:
+        return False, info
 
     # when this function is called from the console, output is 'text'
     # write and exit
@@ -378,15 +375,7 @@ def action_info(model, version, output='text'):
 
     # this is only reached when this funcion is called from a web service
     # asking for a JSON
-    
-    # this code serializes the results in a list and then converts it 
-    # to a JSON  
-    json_results = []
-    for i in info:
-        json_results.append(conveyor.modelInfoJSON(i))
-
-    #print (json.dumps(json_results))
-    return True, json.dumps(json_results)
+    return True, json.dumps(info)
 
 
 def action_results(model, version=None, ouput_variables=False):
@@ -430,21 +419,22 @@ def action_parameters(model, version=None, oformat='text'):
 
         order = ['input_type', 'quantitative', 'SDFile_activity', 'SDFile_name', 'SDFile_id',
         'SDFile_experimental', 'SDFile_complementary', 'normalize_method', 'ionize_method', 'convert3D_method', 
-        'computeMD_method', 'model', 'modelAutoscaling', 'tune', 'conformal', 
-        'conformalSignificance', 'ModelValidationCV', 'ModelValidationLC', 
+        'computeMD_method', 'descriptor_dtype', 'model', 'modelAutoscaling', 'tune', 'conformal', 
+        'conformalSignificance', 'conformalSignificanceList', 'ModelValidationCV', 'ModelValidationLC', 
         'ModelValidationN', 'ModelValidationP', 'output_format', 'output_md', 
         'TSV_activity', 'TSV_objnames', 'TSV_varnames', 'imbalance', 
-        'feature_selection', 'feature_number', 'mol_batch',  
-        'ensemble_names','ensemble_versions', 'numCPUs', 'verbose_error', 'modelingToolkit', 
+        'feature_selection', 'feature_number', 'incremental', 
+        'applicability_domain', 'mol_batch', 'deduplicate', 'build_cache',  
+        'ensemble_names','ensemble_versions', 'numCPUs', 'predict_chunk', 'validation_bootstrap', 'memory_profile', 'verbose_error', 'modelingToolkit', 
         'endpoint', 'model_path', 
         #'md5', 
         'version']
 
-        order += ['MD_settings', 'RF_parameters','RF_optimize',
+        order += ['convert3D_settings', 'MD_settings', 'RF_parameters','RF_optimize',
         'SVM_parameters','SVM_optimize',
         'PLSDA_parameters','PLSDA_optimize',
         'PLSR_parameters','PLSR_optimize',
-        'GNB_parameters']
+        'GNB_parameters', 'SGD_parameters', 'incremental_settings', 'AD_settings']
 
 
         for ik in order:
@@ -633,27 +623,13 @@ def action_dir():
     '''
     Returns a JSON with the list of models and versions
     '''
-    # get de model repo path
-    models_path = pathlib.Path(utils.model_repository_path())
-
-    # get directories in model repo path
-    dirs = [x for x in models_path.iterdir() if x.is_dir()]
-
-    # if dir contains dev/ -> is model (NAIVE APPROACH)
-    # get last dir name [-1]: model name
-    model_dirs = [d.parts[-1] for d in dirs if list(d.glob('dev'))]
+    model_catalog = catalog.model_catalog()
 
     results = []
-    for imodel in model_dirs:
+    for imodel in model_catalog.names():
         idict = {}
         idict ["modelname"] = imodel
-        versions = [0]
-
-        for iversion in os.listdir(utils.model_tree_path(imodel)):
-            if iversion.startswith('ver'):
-                versions.append(utils.modeldir2ver(iversion))
-
-        idict ["versions"] = versions
+        idict ["versions"] = model_catalog.versions(imodel)
         results.append(idict)
 
     #print (json.dumps(results))
@@ -664,47 +640,10 @@ def action_report():
     '''
     Returns a JSON with the list of models and the results of each one
     '''
-    # get de model repo path
-    models_path = pathlib.Path(utils.model_repository_path())
-
-    # get directories in model repo path
-    dirs = [x for x in models_path.iterdir() if x.is_dir()]
-
-    # # if dir contains dev/ -> is model (NAIVE APPROACH)
-    # # get last dir name [-1]: model name
-    # model_dirs = [d.parts[-1] for d in dirs if list(d.glob('dev'))]
-
-    results = []
-
-    # iterate models
-    for d in dirs:
-        imodel_name = d.parts[-1]
-        imodel_vers = [x.parts[-1] for x in d.iterdir() if x.is_dir()]
-        
-        # make sure the model contains 'dev' to recognize models
-        if 'dev' not in imodel_vers:
-            continue
-        
-        imodel_vers_info = []
-        for ivtag in imodel_vers:
-
-            iver = utils.modeldir2ver(ivtag)
-
-            # now we have the model name and version, try to get the ijson text
-            try:
-                isuccess, ijson = action_info(imodel_name, iver, output='JSON')
-            except:
-                continue
+    # the catalog keeps the summary of every version, extracting it from
+    # results.pkl only for versions built since the last report
+    results = catalog.model_catalog().report()
 
-            if not isuccess:
-                continue
-            
-            # build a tuple (version, JSON) for each version and append 
-            imodel_vers_info.append((iver, json.loads(ijson) ))
-
-        # build a tuple (model_name, [version_info]) for each model and append
-        results.append((imodel_name, imodel_vers_info))
-        
     #print (json.dumps(results))
     return True, json.dumps(results)
 
@@ -843,6 +782,49 @@ def action_predictions_remove (label):
     return (True, 'OK')
 
 
+def action_profile(model, version=None, label=None, trace_file=None):
+    '''
+    Shows the time spent in every stage of the last build of a model or,
+    if a label is given, of the prediction with this label.
+    returns
+        - (False, message) if the results or the timings are not found
+        - (True, JSON) with the list of spans otherwyse
+
+    The timings are also saved in Chrome trace format in trace_file
+    '''
+    if label is not None:
+        results_path = os.path.join(utils.predictions_repository_path(),
+                                    label, 'prediction-results.pkl')
+    elif model is not None:
+        results_path = os.path.join(utils.model_path(model, version), 'results.pkl')
+    else:
+        return False, 'Empty model and prediction label'
+
+    if not os.path.isfile(results_path):
+        return False, f'results not found in {results_path}'
+
+    iconveyor = Conveyor()
+    with open(results_path, 'rb') as handle:
+        success, message = iconveyor.load(handle)
+
+    if not success:
+        return False, f'error reading results with message {message}'
+
+    spans = iconveyor.getMeta('trace')
+    if spans is None:
+        return False, 'no timings found, the results were produced by an older version'
+
+    for line in tracer.to_text(spans):
+        print(line)
+
+    if trace_file is not None:
+        success, message = tracer.save_trace(spans, trace_file)
+        if not success:
+            return False, message
+
+    return True, json.dumps(spans)
+
+
 def action_model_template(model, version=None, doc_file=None):
     '''
     Returns a TSV model reporting template
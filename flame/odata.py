@@ -30,6 +30,12 @@ from datetime import datetime
 
 LOG = get_logger(__name__)
 
+def _json_scalar(value):
+    ''' converts numpy scalars found in the object results to JSON '''
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
 class Odata():
     """
     Transforms results into something readable?.
@@ -48,10 +54,13 @@ class Odata():
         if self.label is None:
             self.label = 'temp'
 
+        # name of the output files, without extension
+        self.output_name = 'output'
+
     def _output_md(self):
         ''' dumps the molecular descriptors to a TSV file'''
 
-        with open('output_md.tsv', 'w') as fo:
+        with open(f'{self.output_name}_md.tsv', 'w') as fo:
 
             # Make sure the keys 'var_nam', 'obj_nam', 'xmatrix' actualy exist
             # start writting MD
@@ -86,7 +95,85 @@ class Odata():
                         line += '\t'+str(xmatrix[y])
                     fo.write(line+'\n')
 
-        LOG.info('Molecular descriptors dumped into output_md.tsv')
+        LOG.info(f'Molecular descriptors dumped into {self.output_name}_md.tsv')
+
+    def _output_keys(self):
+        ''' returns the keys of the object results written in the output
+        files: name, SMILES, main result and the rest of object results '''
+
+        # label and smiles
+        key_list = ['obj_nam']
+        if self.conveyor.isKey('SMILES'):
+            key_list.append('SMILES')
+
+        # main result
+        key_list += self.conveyor.getMain()
+
+        # add all object type results
+        for i in self.conveyor.objectKeys():
+            if i not in key_list:
+                key_list.append(i)
+
+        return key_list
+
+    def _write_tsv(self, fo, key_list, header=False):
+        ''' writes a line with the values of key_list for every object,
+        preceded by a header line with the keys if header is True '''
+
+        if header:
+            line = ''
+            for label in key_list:
+                line += label+'\t'
+            fo.write(line+'\n')
+
+        obj_num = int(self.conveyor.getVal('obj_num'))
+
+        for i in range(obj_num):
+            line = ''
+            for key in key_list:
+
+                ikey = self.conveyor.getVal(key)
+
+                if ikey is None:
+                    line += '-\t'
+                    continue
+
+                if i >= len(ikey):
+                    val = None
+                else:
+                    val = ikey[i]
+
+                if val is None:
+                    line += '-'
+                else:
+                    if isinstance(val, float):
+                        line += "%.4f" % val
+                    else:
+                        line += str(val)
+                line += '\t'
+            fo.write(line+'\n')
+
+    def _write_ndjson(self, fo, key_list):
+        ''' writes a JSON object with the values of key_list for every
+        object, one per line '''
+
+        values = {}
+        for key in key_list:
+            ikey = self.conveyor.getVal(key)
+            if isinstance(ikey, np.ndarray):
+                ikey = ikey.tolist()
+            values[key] = ikey
+
+        obj_num = int(self.conveyor.getVal('obj_num'))
+
+        for i in range(obj_num):
+            line = {}
+            for key, ikey in values.items():
+                if ikey is None or i >= len(ikey):
+                    line[key] = None
+                else:
+                    line[key] = ikey[i]
+            fo.write(json.dumps(line, default=_json_scalar)+'\n')
 
     def print_result (self, val):
         ''' Prints in the console the content of results given as an 
@@ -154,7 +241,7 @@ class Odata():
         # 4. results file in TSV format [optional]
         ### 
         if 'TSV' in self.format:
-            LOG.info('writting results to TSV file "output.tsv"')
+            LOG.info(f'writting results to TSV file "{self.output_name}.tsv"')
 
             # label and smiles
             key_list = ['obj_nam']
@@ -169,7 +256,7 @@ class Odata():
                 if item not in key_list:
                     key_list.append(item)
 
-            with open('output.tsv', 'w') as fo:
+            with open(f'{self.output_name}.tsv', 'w') as fo:
                 header = ''
                 for label in key_list:
                     header += label+'\t'
@@ -217,11 +304,7 @@ class Odata():
             self.conveyor.setError('Unable to find main prediction')
             return
         
-        opath = utils.predictions_repository_path()
-        if os.path.isdir (opath):
-            opath = os.path.join(opath,self.label)
-            if not os.path.isdir (opath):
-                os.mkdir(opath)
+        opath = self._prediction_path()
 
         # the ouput generated by the prediction are:
         # 
@@ -255,58 +338,18 @@ class Odata():
         # 3. results file in TSV format [optional]
         ### 
         if 'TSV' in self.format:
-            LOG.info('writting results to TSV file "output.tsv"')
-            # label and smiles
-            key_list = ['obj_nam']
-            if self.conveyor.isKey('SMILES'):
-                key_list.append('SMILES')
-
-            # main result
-            key_list += self.conveyor.getMain()
-
-            # add all object type results
-            # manifest = self.results['manifest']
-            # for item in manifest:
-            #     if item['dimension'] == 'objs' and item['key'] not in key_list:
-            #         key_list.append(item['key'])
-            key_obj = self.conveyor.objectKeys()
-
-            for i in key_obj:
-                if i not in key_list:
-                    key_list.append(i)
-
-            with open('output.tsv', 'w') as fo:
-                header = ''
-                for label in key_list:
-                    header += label+'\t'
-                fo.write(header+'\n')
+            LOG.info(f'writting results to TSV file "{self.output_name}.tsv"')
+            key_list = self._output_keys()
+            with open(f'{self.output_name}.tsv', 'w') as fo:
+                self._write_tsv(fo, key_list, header=True)
 
-                obj_num = int(self.conveyor.getVal('obj_num'))
-
-                for i in range(obj_num):
-                    line = ''
-                    for key in key_list:
-
-                        ikey = self.conveyor.getVal(key)
-
-                        if ikey is None:
-                            line += '-\t'
-                            continue
-
-                        if i >= len(ikey):
-                            val = None
-                        else:
-                            val = ikey[i]
-
-                        if val is None:
-                            line += '-'
-                        else:
-                            if isinstance(val, float):
-                                line += "%.4f" % val
-                            else:
-                                line += str(val)
-                        line += '\t'
-                    fo.write(line+'\n')
+        ###
+        # 3b. results file in NDJSON format [optional]
+        ###
+        if 'NDJSON' in self.format:
+            LOG.info(f'writting results to NDJSON file "{self.output_name}.ndjson"')
+            with open(f'{self.output_name}.ndjson', 'w') as fo:
+                self._write_ndjson(fo, self._output_keys())
 
         # the function returns "True, output". output can be empty or a JSON
         output = ''
@@ -324,37 +367,113 @@ class Odata():
         #print (self.conveyor.getJSON())
         
         # Save conveyor from prediction only if confidential is False
-        if not self.param.getVal('confidential'):
+        if not self.param.getVal('confidential') and opath is not None:
+            self._save_prediction(opath)
+
+            # remove the object results of previous streamed predictions
+            objects_path = os.path.join(opath, 'prediction-results.ndjson')
+            if os.path.isfile(objects_path):
+                os.remove(objects_path)
+
+        return True, output
+
+    def run_apply_chunk(self, chunk, key_list=None):
+        ''' Process the results of apply for a chunk of a streamed
+            prediction. The object results are appended to the TSV and
+            NDJSON output files and to the file prediction-results.ndjson
+            of the prediction repository, which are created for the first
+            chunk (0). Nothing is printed or returned for every chunk.
+
+            Returns True and the list of keys written, which must be used
+            for the next chunks so that all the lines have the same columns
+        '''
+
+        if len(self.conveyor.getMain()) == 0:
+            self.conveyor.setError('Unable to find main prediction')
+            return False, 'Unable to find main prediction'
+
+        if key_list is None:
+            key_list = self._output_keys()
 
-            if not os.path.isdir(opath):
-                return True, output
+        mode = 'w' if chunk == 0 else 'a'
 
-            results_pkl_path = os.path.join(opath,'prediction-results.pkl')
-            meta_pkl_path = os.path.join(opath,'prediction-meta.pkl')
-            LOG.info('saving model results to: {}'.format(opath))
+        if 'TSV' in self.format:
+            with open(f'{self.output_name}.tsv', mode) as fo:
+                self._write_tsv(fo, key_list, header=(chunk == 0))
+
+        if 'NDJSON' in self.format:
+            with open(f'{self.output_name}.ndjson', mode) as fo:
+                self._write_ndjson(fo, key_list)
+
+        if not self.param.getVal('confidential'):
+            opath = self._prediction_path()
+            if opath is not None:
+                with open(os.path.join(opath, 'prediction-results.ndjson'), mode) as fo:
+                    self._write_ndjson(fo, key_list)
+
+        return True, key_list
+
+    def run_apply_summary(self):
+        ''' Process the summary of a streamed prediction, which contains the
+            number of objects and the external validation of the whole
+            series but no object results, written by run_apply_chunk.
+            The summary is printed, saved in the prediction repository and
+            returned in JSON format [optional]
+        '''
 
-            # dump conveyor
-            with open(results_pkl_path, 'wb') as handle:
-                self.conveyor.save(handle)
+        self.print_result(('obj_num','number of objects',self.conveyor.getVal('obj_num')))
 
-            # dump metainfo
-            with open(meta_pkl_path, 'wb') as handle:
-                pickle.dump (self.conveyor.getMeta('endpoint'),handle)
-                pickle.dump (self.conveyor.getMeta('version'),handle)
-                pickle.dump (self.conveyor.getMeta('input_file'),handle)
-                now = datetime.now()
-                pickle.dump (now.strftime("%d/%m/%Y %H:%M:%S"),handle)
-                pickle.dump (datetime.timestamp(now), handle)
+        if self.conveyor.isKey('external-validation'):
+            for val in self.conveyor.getVal('external-validation'):
+                self.print_result (val)
 
-                # print (self.conveyor.getMeta('endpoint'))
-                # print ('saving version',self.conveyor.getMeta('version'))
-                # print (self.conveyor.getMeta('input_file'))
+        output = ''
+        if 'JSON' in self.format:
+            output = self.conveyor.getJSON()
 
-                # now = datetime.now()
-                # print (now.strftime("%d/%m/%Y %H:%M:%S"))
+        if not self.param.getVal('confidential'):
+            opath = self._prediction_path()
+            if opath is not None:
+                self._save_prediction(opath)
 
         return True, output
 
+    def _prediction_path(self):
+        ''' returns the directory of the prediction repository where the
+        results of the prediction are saved, creating it if needed, or None
+        if there is no prediction repository '''
+
+        opath = utils.predictions_repository_path()
+        if not os.path.isdir (opath):
+            return None
+
+        opath = os.path.join(opath,self.label)
+        if not os.path.isdir (opath):
+            os.mkdir(opath)
+
+        return opath
+
+    def _save_prediction(self, opath):
+        ''' saves the conveyor and the metainfo of the prediction in the
+        prediction repository directory opath '''
+
+        results_pkl_path = os.path.join(opath,'prediction-results.pkl')
+        meta_pkl_path = os.path.join(opath,'prediction-meta.pkl')
+        LOG.info('saving model results to: {}'.format(opath))
+
+        # dump conveyor
+        with open(results_pkl_path, 'wb') as handle:
+            self.conveyor.save(handle)
+
+        # dump metainfo
+        with open(meta_pkl_path, 'wb') as handle:
+            pickle.dump (self.conveyor.getMeta('endpoint'),handle)
+            pickle.dump (self.conveyor.getMeta('version'),handle)
+            pickle.dump (self.conveyor.getMeta('input_file'),handle)
+            now = datetime.now()
+            pickle.dump (now.strftime("%d/%m/%Y %H:%M:%S"),handle)
+            pickle.dump (datetime.timestamp(now), handle)
+
 
     def run_slearn(self):
         '''Process the results of slearn,
@@ -431,9 +550,9 @@ class Odata():
         # 2. results file in TSV format [optional]
         ### 
         if 'TSV' in self.format:
-            LOG.info('writting results to TSV file "output.tsv"')
+            LOG.info(f'writting results to TSV file "{self.output_name}.tsv"')
 
-            with open('output.tsv', 'w') as fo:
+            with open(f'{self.output_name}.tsv', 'w') as fo:
                 header = 'source_name'
                 if self.conveyor.isKey('SMILES'):
                     header +='\tsource SMILES'
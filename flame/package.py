@@ -0,0 +1,477 @@
+#! -*- coding: utf-8 -*-
+
+# Description    Flame model packages for export and import
+#
+# Authors:       Manuel Pastor (manuel.pastor@upf.edu)
+#
+# Copyright 2018 Manuel Pastor
+#
+# This file is part of Flame
+#
+# Flame is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3.
+#
+# Flame is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Flame. If not, see <http://www.gnu.org/licenses/>.
+
+''' Model packages used to move model trees between Flame installations.
+
+    A package is a standard gzip compressed tarball. Its first member is a
+    manifest listing the versions and, for every file, its size, mode, mtime
+    and SHA-256. The tar stream is split in blocks compressed in parallel as
+    independent gzip members, which concatenated are still a valid .tgz file
+    readable by tar and by older versions of Flame.
+
+    Every file content is included only once: duplicated files are stored
+    as tar hard links and, in delta packages exported using the manifest of
+    the target tree as base, the contents already present in the target are
+    not included at all and are taken from the target on import.
+
+    Import reads the package as a stream, verifying every file against the
+    manifest while it is written. The versions already present in the target
+    are skipped and the new ones are written in hidden staging directories,
+    renamed only when all their files have been verified. The contents of
+    skipped versions linked by new ones are kept in a temporary directory,
+    since the files of the target with the same path may differ (e.g. the
+    dev version) '''
+
+import os
+import gzip
+import json
+import shutil
+import hashlib
+import tarfile
+import tempfile
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from flame import store
+from flame.util import get_logger
+
+LOG = get_logger(__name__)
+
+PACKAGE_VERSION = 1
+MANIFEST = 'manifest.json'
+
+# size of the tar stream blocks compressed by every thread
+BLOCK_SIZE = 4 << 20
+CHUNK_SIZE = 1 << 20
+
+
+def version_dirs(tree):
+    ''' sorted list of the version directories (dev and verNNNNNN) of the tree '''
+
+    if not os.path.isdir(tree):
+        return []
+
+    return sorted(x for x in os.listdir(tree)
+                  if (x == 'dev' or x.startswith('ver')) and os.path.isdir(os.path.join(tree, x)))
+
+
+def object_index(tree):
+    ''' hashes of the files linked to the objects of the tree, indexed by
+    inode, so that published versions do not need to be hashed again '''
+
+    index = {}
+    objects = os.path.join(tree, store.OBJECTS_DIR)
+    for root, dirs, files in os.walk(objects):
+        for name in files:
+            stat = os.stat(os.path.join(root, name))
+            index[(stat.st_dev, stat.st_ino)] = name
+    return index
+
+
+def tree_manifest(tree, model, versions=None, workers=None):
+    ''' returns the manifest of the versions of the tree given as argument,
+    or of all the versions. The files are hashed in parallel '''
+
+    if versions is None:
+        versions = version_dirs(tree)
+
+    files = []
+    for version in versions:
+        for root, dirs, names in os.walk(os.path.join(tree, version)):
+            dirs[:] = sorted(x for x in dirs if x not in store.LOCAL_FILES)
+            for name in sorted(x for x in names if x not in store.LOCAL_FILES):
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                files.append({'path': os.path.relpath(path, tree).replace(os.sep, '/'),
+                              'size': stat.st_size,
+                              'mode': stat.st_mode & 0o777,
+                              'mtime': stat.st_mtime_ns,
+                              'sha256': None,
+                              'inode': (stat.st_dev, stat.st_ino)})
+
+    index = object_index(tree)
+    unknown = []
+    for entry in files:
+        entry['sha256'] = index.get(entry.pop('inode'))
+        if entry['sha256'] is None:
+            unknown.append(entry)
+
+    with ThreadPoolExecutor(workers) as executor:
+        paths = [os.path.join(tree, i['path']) for i in unknown]
+        for entry, digest in zip(unknown, executor.map(store.file_hash, paths)):
+            entry['sha256'] = digest
+
+    return {'package_version': PACKAGE_VERSION,
+            'model': model,
+            'date': datetime.now().isoformat(),
+            'versions': list(versions),
+            'files': files}
+
+
+def member_blocks(info, path=None, data=None):
+    ''' tar header, content and padding of a member, read from the file
+    path or given as data '''
+
+    yield info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape')
+
+    if data is not None:
+        yield data
+    elif path is not None:
+        remaining = info.size
+        with open(path, 'rb') as handle:
+            while remaining > 0:
+                chunk = handle.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise ValueError(f'{path} changed while exporting')
+                remaining -= len(chunk)
+                yield chunk
+
+    remainder = info.size % tarfile.BLOCKSIZE
+    if remainder > 0:
+        yield tarfile.NUL * (tarfile.BLOCKSIZE - remainder)
+
+
+def package_blocks(tree, manifest):
+    ''' the uncompressed tar stream of the package, in blocks of BLOCK_SIZE '''
+
+    def members():
+        data = json.dumps(manifest, indent=1).encode('utf-8')
+        info = tarfile.TarInfo(MANIFEST)
+        info.size = len(data)
+        info.mtime = int(datetime.now().timestamp())
+        yield from member_blocks(info, data=data)
+
+        for entry in manifest['files']:
+            if entry['source'] == 'base':
+                continue
+
+            info = tarfile.TarInfo(entry['path'])
+            info.mode = entry['mode']
+            info.mtime = entry['mtime'] // 1000000000
+
+            if entry['source'] == 'link':
+                info.type = tarfile.LNKTYPE
+                info.linkname = entry['link']
+                yield from member_blocks(info)
+            else:
+                info.size = entry['size']
+                yield from member_blocks(info, os.path.join(tree, entry['path']))
+
+    size = 0
+    block = bytearray()
+    for data in members():
+        block += data
+        if len(block) >= BLOCK_SIZE:
+            size += len(block)
+            yield bytes(block)
+            block = bytearray()
+
+    # end of archive, padded to a full record
+    block += tarfile.NUL * (2 * tarfile.BLOCKSIZE)
+    size += len(block)
+    remainder = size % tarfile.RECORDSIZE
+    if remainder > 0:
+        block += tarfile.NUL * (tarfile.RECORDSIZE - remainder)
+    yield bytes(block)
+
+
+def export_package(tree, model, package_path, base=None, workers=None, level=6):
+    ''' writes the package of the model tree. If the manifest of the tree in
+    the target installation is given as base, only the versions and the
+    contents not present in the target are exported '''
+
+    versions = version_dirs(tree)
+
+    if base is not None:
+        if isinstance(base, str):
+            try:
+                with open(base, 'r') as handle:
+                    base = json.load(handle)
+            except Exception as e:
+                return False, f'Unable to read base manifest {base}: {e}'
+        versions = [x for x in versions if x not in base['versions']]
+        base_hashes = set(i['sha256'] for i in base['files'])
+    else:
+        base_hashes = set()
+
+    if len(versions) == 0:
+        return False, f'No versions of model {model} to export'
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    manifest = tree_manifest(tree, model, versions, workers)
+    manifest['base'] = base is not None
+
+    # every content is included once
+    included = {}
+    for entry in manifest['files']:
+        if entry['sha256'] in base_hashes:
+            entry['source'] = 'base'
+        elif entry['sha256'] in included:
+            entry['source'] = 'link'
+            entry['link'] = included[entry['sha256']]
+        else:
+            entry['source'] = 'package'
+            included[entry['sha256']] = entry['path']
+
+    # blocks are compressed in parallel and written in order, keeping a
+    # bounded number of blocks in memory
+    compress = lambda block: gzip.compress(block, compresslevel=level, mtime=0)
+    handle, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(package_path)))
+    try:
+        with os.fdopen(handle, 'wb') as fo, ThreadPoolExecutor(workers) as executor:
+            pending = deque()
+            for block in package_blocks(tree, manifest):
+                pending.append(executor.submit(compress, block))
+                if len(pending) > 2 * workers:
+                    fo.write(pending.popleft().result())
+            while pending:
+                fo.write(pending.popleft().result())
+        os.replace(tmp_path, package_path)
+    except Exception as e:
+        os.remove(tmp_path)
+        return False, f'Unable to export model {model}: {e}'
+
+    nincluded = sum(1 for i in manifest['files'] if i['source'] == 'package')
+    LOG.info(f'{len(versions)} versions and {nincluded} of {len(manifest["files"])} '
+             f'files of model {model} exported to {package_path}')
+    return True, manifest
+
+
+def check_path(path, versions):
+    ''' checks that the path of a member is relative and inside a version '''
+
+    parts = path.split('/')
+    if os.path.isabs(path) or '..' in parts or parts[0] not in versions:
+        raise ValueError(f'Invalid member {path} in package')
+    return parts[0], (os.path.join(*parts[1:]) if len(parts) > 1 else '')
+
+
+def write_member(fileobj, path, entry=None):
+    ''' writes the content of the member, verifying it against its manifest
+    entry, and returns its hash '''
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'wb') as fo:
+        for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            size += len(chunk)
+            fo.write(chunk)
+
+    if entry is not None:
+        if size != entry['size'] or digest.hexdigest() != entry['sha256']:
+            raise ValueError(f'Checksum mismatch for {entry["path"]}, the package is corrupted')
+        os.chmod(path, entry['mode'])
+        os.utime(path, ns=(entry['mtime'], entry['mtime']))
+
+    return digest.hexdigest()
+
+
+def copy_content(src, dst, mode, link=True):
+    ''' creates dst with the content of src, as a link if possible. Files
+    which can be modified, like those of the dev version, are never linked '''
+
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if link:
+        try:
+            return os.link(src, dst)
+        except OSError:
+            pass
+
+    shutil.copy2(src, dst)
+    os.chmod(dst, mode)
+
+
+def find_content(tree, digest, index=None):
+    ''' returns the path of a file of the tree with the given hash and the
+    index of the hashes of all the files, built only when the content is
+    not found in the objects of the tree '''
+
+    opath = store.object_path(tree, digest)
+    if os.path.isfile(opath):
+        return opath, index
+
+    if index is None:
+        index = {i['sha256']: os.path.join(tree, i['path'])
+                 for i in tree_manifest(tree, None)['files']}
+
+    return index.get(digest), index
+
+
+def read_manifest(tar, members, first, tree, staging, existing):
+    ''' imports the members of a package with manifest '''
+
+    manifest = json.load(tar.extractfile(first))
+    if manifest.get('package_version') != PACKAGE_VERSION:
+        raise ValueError(f'Unsupported package version {manifest.get("package_version")}')
+
+    versions = manifest['versions']
+    entries = {i['path']: i for i in manifest['files']}
+
+    for version in versions:
+        if version not in existing:
+            staging[version] = tempfile.mkdtemp(prefix=f'.{version}.', dir=tree)
+
+    # contents of the skipped versions needed by the imported ones
+    needed = set(i['sha256'] for i in manifest['files'] if i['source'] == 'link'
+                 and check_path(i['path'], versions)[0] in staging)
+    blobs = None
+
+    try:
+        written = {}
+        for member in members:
+            entry = entries.get(member.name)
+            if entry is None or entry['source'] == 'base':
+                raise ValueError(f'Member {member.name} not found in manifest')
+
+            version, relpath = check_path(member.name, versions)
+            if entry['source'] != 'package':
+                continue
+
+            if version in staging:
+                path = os.path.join(staging[version], relpath)
+            elif entry['sha256'] in needed:
+                if blobs is None:
+                    blobs = tempfile.mkdtemp(prefix='.blobs.', dir=tree)
+                version, path = None, os.path.join(blobs, entry['sha256'])
+            else:
+                continue
+
+            write_member(tar.extractfile(member), path, entry)
+            written[entry['sha256']] = (version, path)
+
+        copy_entries(manifest, versions, tree, staging, written)
+
+    finally:
+        if blobs is not None:
+            shutil.rmtree(blobs, ignore_errors=True)
+
+
+def copy_entries(manifest, versions, tree, staging, written):
+    ''' creates the files of the imported versions not written from the
+    package members, copying or linking the contents written or present
+    in the target '''
+
+    # contents duplicated in the package or already present in the target
+    index = None
+    for entry in manifest['files']:
+        version, relpath = check_path(entry['path'], versions)
+        if version not in staging:
+            continue
+
+        if entry['source'] == 'package':
+            if entry['sha256'] not in written:
+                raise ValueError(f'Member {entry["path"]} not found in package')
+            continue
+
+        dst = os.path.join(staging[version], relpath)
+
+        if entry['sha256'] in written:
+            src_version, src = written[entry['sha256']]
+            copy_content(src, dst, entry['mode'], link='dev' not in (version, src_version))
+            continue
+
+        src, index = find_content(tree, entry['sha256'], index)
+        if src is None:
+            raise ValueError(f'Content of {entry["path"]} not found in package nor in target')
+        copy_content(src, dst, entry['mode'],
+                     link=version != 'dev' and src.startswith(os.path.join(tree, store.OBJECTS_DIR)))
+
+
+def read_legacy(tar, members, first, tree, staging, existing):
+    ''' imports the members of a package without manifest, generated by
+    previous versions of Flame '''
+
+    def member_path(name):
+        version = name.split('/')[0]
+        if version != 'dev' and not version.startswith('ver'):
+            return None, None
+        return check_path(name, [version])
+
+    member = first
+    while member is not None:
+        version, relpath = member_path(member.name)
+
+        if version is not None and version not in existing:
+            if version not in staging:
+                staging[version] = tempfile.mkdtemp(prefix=f'.{version}.', dir=tree)
+            path = os.path.join(staging[version], relpath)
+
+            if member.isdir():
+                os.makedirs(path, exist_ok=True)
+            elif member.isfile():
+                write_member(tar.extractfile(member), path)
+                os.chmod(path, member.mode & 0o777)
+            elif member.islnk():
+                lversion, lrelpath = member_path(member.linkname)
+                if lversion in staging:
+                    copy_content(os.path.join(staging[lversion], lrelpath), path, member.mode & 0o777,
+                                 link='dev' not in (version, lversion))
+                else:
+                    copy_content(os.path.join(tree, lversion, lrelpath), path, member.mode & 0o777,
+                                 link=False)
+
+        member = next(members, None)
+
+
+def import_package(tree, package_path):
+    ''' imports the versions of the package not present in the model tree,
+    creating the tree if needed. Returns the list of imported versions '''
+
+    new_tree = not os.path.isdir(tree)
+    existing = version_dirs(tree)
+    os.makedirs(tree, exist_ok=True)
+
+    staging = {}
+    try:
+        with gzip.open(package_path, 'rb') as handle, \
+             tarfile.open(fileobj=handle, mode='r|') as tar:
+
+            members = iter(tar)
+            first = next(members, None)
+            if first is None:
+                raise ValueError('Empty package')
+
+            if first.name == MANIFEST:
+                read_manifest(tar, members, first, tree, staging, existing)
+            else:
+                read_legacy(tar, members, first, tree, staging, existing)
+
+        for version in sorted(staging):
+            os.rename(staging[version], os.path.join(tree, version))
+
+    except Exception as e:
+        for path in staging.values():
+            shutil.rmtree(path, ignore_errors=True)
+        if new_tree:
+            shutil.rmtree(tree, ignore_errors=True)
+        return False, f'Unable to import {package_path}: {e}'
+
+    if len(existing) > 0:
+        LOG.info(f'Versions {existing} already present, not imported')
+
+    return True, sorted(staging)
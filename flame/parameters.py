@@ -23,11 +23,20 @@
 import os
 import yaml
 import json
+import types
 import hashlib
 import pickle
+import tempfile
 
 from flame.util import utils
 
+# compiled version of parameters.yaml, saved in the same directory
+SNAPSHOT_FILE = 'parameters.snapshot'
+SNAPSHOT_VERSION = 1
+
+# the C implementation of the YAML loader is much faster, when available
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
 
 class Parameters:
     ''' Class storing a large set of parameters defining how a model is built
@@ -43,14 +52,126 @@ class Parameters:
 
         This code supports both versions of the parameter file, but the use of version 1
         is deprecated and will not be supported indefinitely 
+
+        The resolved value of every parameter is kept in a flat dictionary, 
+        updated by the methods modifying the parameters, so that getVal
+        does not need to walk the nested dictionaries. Both are saved in a
+        binary snapshot next to parameters.yaml and reused while the YAML
+        file does not change
     '''
 
     def __init__(self):
         ''' constructor '''
         self.extended = False
         self.param_format = 1
+        self.p = {}
         return
 
+    @property
+    def p(self):
+        return self._p
+
+    @p.setter
+    def p(self, value):
+        # the resolved values are obtained again from the new dictionary
+        self._p = value
+        self._values = None
+
+    @property
+    def values(self):
+        ''' flat dictionary with the resolved value of every parameter '''
+        if self._values is None:
+            self._values = {key: self._resolve(key) for key in self._p}
+        return self._values
+
+    def _resolve(self, key):
+        ''' Return the value of the key parameter in the nested dictionary '''
+
+        ## compatibility with version 1 (remove)
+        if not self.extended:
+            return self._p[key]
+        ## ---------------------------------------
+
+        if isinstance(self._p[key], dict) and 'value' in self._p[key]:
+            return self._p[key]['value']
+        return None
+
+    def _update(self, key):
+        ''' Updates the resolved value of key after modifying the parameter '''
+        if self._values is not None:
+            self._values[key] = self._resolve(key)
+
+    def frozen(self):
+        ''' Returns a read-only mapping with the resolved values of all the 
+            parameters, which can be used in loops instead of getVal
+        '''
+        return types.MappingProxyType(self.values)
+
+    def _loadSnapshot(self, parameters_file_name):
+        ''' Loads the parameters from the snapshot, if it was generated for
+            the current parameters.yaml (same mtime and size or same content),
+            otherwise parses the YAML file and saves a new snapshot
+        '''
+
+        snapshot_file_name = os.path.join(os.path.dirname(parameters_file_name),
+                                          SNAPSHOT_FILE)
+        stat = os.stat(parameters_file_name)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+
+        snapshot = None
+        try:
+            with open(snapshot_file_name, 'rb') as handle:
+                snapshot = pickle.load(handle)
+            if snapshot.get('snapshot_version') != SNAPSHOT_VERSION:
+                snapshot = None
+        except Exception:
+            snapshot = None
+
+        if snapshot is not None and snapshot['stamp'] == stamp:
+            self.p = snapshot['p']
+            self._values = snapshot['values']
+            return
+
+        with open(parameters_file_name, 'rb') as pfile:
+            text = pfile.read()
+        md5 = hashlib.md5(text).hexdigest()
+
+        # the file was copied or rewritten without changes
+        if snapshot is not None and snapshot['md5'] == md5:
+            self.p = snapshot['p']
+            self._values = snapshot['values']
+        else:
+            self.p = yaml.load(text, Loader=YAML_LOADER)
+
+        # required to resolve the values
+        self.extended = 'param_format' in self.p
+        self._saveSnapshot(parameters_file_name, md5)
+
+    def _saveSnapshot(self, parameters_file_name, md5=None):
+        ''' Saves the parameters and their resolved values for the current
+            parameters.yaml. Failing to save the snapshot is not an error 
+        '''
+        snapshot_path = os.path.dirname(parameters_file_name)
+        try:
+            if md5 is None:
+                with open(parameters_file_name, 'rb') as pfile:
+                    md5 = hashlib.md5(pfile.read()).hexdigest()
+            stat = os.stat(parameters_file_name)
+
+            snapshot = {'snapshot_version': SNAPSHOT_VERSION,
+                        'stamp': (stat.st_mtime_ns, stat.st_size),
+                        'md5': md5,
+                        'p': self.p,
+                        'values': self.values}
+
+            # write and rename, so that concurrent runs never read a partial file
+            handle, tmp_path = tempfile.mkstemp(dir=snapshot_path)
+            with os.fdopen(handle, 'wb') as fo:
+                pickle.dump(snapshot, fo, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, os.path.join(snapshot_path, SNAPSHOT_FILE))
+        except Exception:
+            pass
+
     # def loadDict (self, d):
     #     ''' load the content from a dictionary '''
     #     self.p = d    
@@ -78,8 +199,7 @@ class Parameters:
             return False, 'file not found'
 
         try:
-            with open(parameters_file_name, 'r') as pfile:
-                self.p = yaml.safe_load(pfile)
+            self._loadSnapshot(parameters_file_name)
         except Exception as e:
             return False, e
 
@@ -171,6 +291,8 @@ class Parameters:
         except Exception as e:
             return False, 'unable to write parameters'
 
+        self._saveSnapshot(parameters_file_name)
+
         # self.setVal('md5',utils.md5sum(parameters_file_name))
         self.setVal('md5',self.idataHash())
 
@@ -206,23 +328,15 @@ class Parameters:
                 yaml.dump (p, pfile)
         except Exception as e:
             return False, e
+
+        self._saveSnapshot(parameters_file_name)
         return True
 
     def getVal(self, key):
         ''' Return the value of the key parameter or None if it is
             not found in the parameters dictionary
         ''' 
-        if not key in self.p:
-            return None
-
-        ## compatibility with version 1 (remove)
-        if not self.extended:
-            return self.p[key]
-        ## ---------------------------------------
-
-        if 'value' in self.p[key]:
-            return self.p[key]['value']
-        return None
+        return self.values.get(key)
 
     
     def getDict(self, key):
@@ -262,6 +376,7 @@ class Parameters:
         # compatibility with version 1 (remove)
         if not self.extended:
             self.p[key] = value
+            self._update(key)
             return
 
         # for existing keys, replace the contents of 'value'
@@ -277,6 +392,8 @@ class Parameters:
         else:
             self.p[key] = {'value': value}
 
+        self._update(key)
+
     def setInnerVal(self, okey, ikey, value):
         ''' Sets a parameter within an internal dictionary. The entry is defined
             by a key of the outer dictionary (okey) and a second key in the inner
@@ -306,6 +423,8 @@ class Parameters:
         else:
             odict[ikey] = {'value': value}
 
+        self._update(okey)
+
 
     def appVal(self, key, value):
         ''' Appends value to the end of existing key list 
@@ -331,6 +450,8 @@ class Parameters:
             else:
                 self.p[key]['value']=[vt, value]
 
+            self._update(key)
+
     def getEnsemble (self):
         ''' Returns a Boolean indicating if the model uses external input
             sources and a list with the name of these endpoints 
@@ -356,32 +477,41 @@ class Parameters:
     def dumpJSON (self):
         return json.dumps(self.p)
 
-    def idataHash (self):
+    def idataHash (self, shared=False):
         ''' Create a md5 hash for a number of keys describing parameters
             relevant for idata
 
             This hash is compared between runs, to check wether idata must
             recompute or not the MD 
+
+            When shared is True, the keys identifying the model are excluded
+            and the hash is identical for all the models which would obtain
+            the same idata results from the same input file
         '''
 
         # update with any new idata relevant parameter 
         keylist = ['model_path','version','SDFile_name','SDFile_activity','SDFile_experimental',
                    'normalize_method','ionize_method','convert3D_method',
                    'computeMD_method','TSV_varnames','TSV_objnames',
-                   'TSV_activity','input_type','endpoint']
+                   'TSV_activity','input_type','endpoint','descriptor_dtype']
+
+        if shared:
+            keylist = [i for i in keylist if i not in ('model_path','version','endpoint')]
+            keylist += ['SDFile_id', 'SDFile_complementary']
 
         idata_params = []
         for i in keylist:
             idata_params.append(self.getVal(i))
         
-        # MD_settings is a dictionary, obtain and sort the keys+values
-        md_params = self.getDict('MD_settings')
-        md_list = []
-        for key in md_params:
-            # combine key + value in a single string
-            md_list.append(key+str(md_params[key]))
-        md_list.sort()
-        idata_params.append(md_list)
+        # settings are dictionaries, obtain and sort the keys+values
+        for settings in ('MD_settings', 'normalize_settings', 'convert3D_settings'):
+            md_params = self.getDict(settings)
+            md_list = []
+            for key in md_params:
+                # combine key + value in a single string
+                md_list.append(key+str(md_params[key]))
+            md_list.sort()
+            idata_params.append(md_list)
 
         # use picke as a buffered object, neccesary to generate the hexdigest
         p = pickle.dumps(idata_params)
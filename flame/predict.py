@@ -21,7 +21,8 @@
 # along with Flame. If not, see <http://www.gnu.org/licenses/>.
 
 import os
-import sys
+import shutil
+import tempfile
 import importlib
 
 from flame.util import utils, get_logger
@@ -30,6 +31,7 @@ from flame.conveyor import Conveyor
 from flame.idata import Idata
 from flame.apply import Apply
 from flame.odata import Odata
+from flame import stream
 
 LOG = get_logger(__name__)
 
@@ -42,13 +44,31 @@ class Predict:
         self.param = Parameters()
         self.conveyor = Conveyor()
 
+        # modules with the child classes, imported by load_children
+        self.idata_child = None
+        self.apply_child = None
+        self.odata_child = None
+
+        # objects loaded by apply, shared by the chunks of streamed predictions
+        self.loaded = None
+
+        # name of the output files (e.g. output.tsv), without extension
+        self.output_name = 'output'
+
         self.conveyor.addVal(label, 'prediction_label', 'prediction label',
                     'method', 'single',
                     'Label used to identify the prediction')
 
-        if not self.param.loadYaml(model, version):
-            LOG.critical('Unable to load model parameters. Aborting...')
-            sys.exit()
+        # the error is reported by the caller, which must not run the prediction
+        success, message = self.param.loadYaml(model, version)
+        if not success:
+            LOG.critical(f'Unable to load model parameters. "{message}" Aborting...')
+            self.conveyor.setError(f'Unable to load model parameters. "{message}"')
+            return
+
+        # optional accounting of the memory used in every stage
+        if self.param.getVal('memory_profile'):
+            self.conveyor.tracer.enable_memory()
 
         # add additional output formats included in the constructor 
         # this is requiered to add JSON format as output when the object is
@@ -69,10 +89,41 @@ class Predict:
         LOG.debug('parameter "numCPUs" forced to be 1')
         self.param.setVal('numCPUs',1)
 
-    def run(self, input_source):
-        ''' Executes a default predicton workflow '''
+    def idata_key(self):
+        ''' Returns a key identifying the models whose idata results can be
+            shared: models with the same idata-relevant parameters and idata
+            child code obtain the same descriptors from the same input file
+        '''
+        idata_child = os.path.join(utils.model_path(self.model, self.version),
+                                   'idata_child.py')
+        child_md5 = None
+        if os.path.isfile(idata_child):
+            child_md5 = utils.md5sum(idata_child)
+
+        return (self.param.idataHash(shared=True), child_md5)
+
+    def load_children(self):
+        ''' Imports the child classes within the 'model' folder, which
+            allow to customize the processing applied to each model '''
+        modpath = utils.module_path(self.model, self.version)
+
+        self.idata_child = importlib.import_module(modpath+".idata_child")
+        self.apply_child = importlib.import_module(modpath+".apply_child")
+        self.odata_child = importlib.import_module(modpath+".odata_child")
+
+    def set_input(self, conveyor):
+        ''' Uses a copy of the conveyor produced by idata for another model
+            with the same idata_key, instead of running idata '''
+        label = self.conveyor.getVal('prediction_label')
+
+        self.conveyor = conveyor.copy()
+        self.conveyor.setVal('prediction_label', label)
+        self.conveyor.addMeta('endpoint', self.param.getVal('endpoint'))
+        self.conveyor.addMeta('version', self.param.getVal('version'))
+
+    def run_idata(self, input_source):
+        ''' Runs idata, in charge of generating model data from input '''
 
-        # path to endpoint
         # path to endpoint
         endpoint = utils.model_path(self.model, self.version)
         if not os.path.isdir(endpoint):
@@ -80,25 +131,23 @@ class Predict:
             #LOG.error(f'Unable to find model {self.model}')
 
         if not self.conveyor.getError():
-            # uses the child classes within the 'model' folder,
-            # to allow customization of
-            # the processing applied to each model
-            modpath = utils.module_path(self.model, self.version)
-
-            idata_child = importlib.import_module(modpath+".idata_child")
-            apply_child = importlib.import_module(modpath+".apply_child")
-            odata_child = importlib.import_module(modpath+".odata_child")
+            self.load_children()
 
             # run idata object, in charge of generate model data from input
+            self.conveyor.setProgress(0.1, 'processing input')
             try:
-                idata = idata_child.IdataChild(self.param, self.conveyor, input_source)
+                idata = self.idata_child.IdataChild(self.param, self.conveyor, input_source)
             except:
                 LOG.warning ('Idata child architecture mismatch, defaulting to Idata parent')
                 idata = Idata(self.param, self.conveyor, input_source)
 
-            idata.run()
+            with self.conveyor.span('idata'):
+                idata.run()
             LOG.debug(f'idata child {type(idata).__name__} completed `run()`')
 
+    def run_apply(self):
+        ''' Runs apply, in charge of generating a prediction from idata '''
+
         if not self.conveyor.getError():
             # make sure there is X data
             if not self.conveyor.isKey('xmatrix'):
@@ -106,23 +155,169 @@ class Predict:
                 self.conveyor.setError(f'Failed to compute MDs')
 
         if not self.conveyor.getError():
+            if self.apply_child is None:
+                self.load_children()
+
             # run apply object, in charge of generate a prediction from idata
+            self.conveyor.setProgress(0.6, 'applying model')
             try:
-                apply = apply_child.ApplyChild(self.param, self.conveyor)
+                apply = self.apply_child.ApplyChild(self.param, self.conveyor)
             except:
                 LOG.warning ('Apply child architecture mismatch, defaulting to Apply parent')
                 apply = Apply(self.param, self.conveyor)
+            apply.loaded = self.loaded
 
-            apply.run()
+            with self.conveyor.span('apply', self.conveyor.getVal('obj_num')):
+                apply.run()
             LOG.debug(f'apply child {type(apply).__name__} completed `run()`')
 
-        # run odata object, in charge of formatting the prediction results
-        # note that if any of the above steps failed, an error has been inserted in the
-        # conveyor and odata will take case of showing an error message
+    def get_odata(self):
+        ''' Returns the odata object, in charge of formatting the results '''
+
+        if self.odata_child is None:
+            self.load_children()
+
         try:
-            odata = odata_child.OdataChild(self.param, self.conveyor)
+            odata = self.odata_child.OdataChild(self.param, self.conveyor)
         except:
             LOG.warning ('Odata child architecture mismatch, defaulting to Odata parent')
             odata = Odata(self.param, self.conveyor)
+        odata.output_name = self.output_name
+
+        return odata
+
+    def run_odata(self):
+        ''' Runs odata, in charge of formatting the prediction results '''
+
+        # note that if any of the above steps failed, an error has been inserted in the
+        # conveyor and odata will take case of showing an error message
+        self.conveyor.setProgress(0.9, 'formatting results')
+        odata = self.get_odata()
+
+        with self.conveyor.span('odata'):
+            return odata.run()
+
+    def run_stream(self, input_source, chunk_size):
+        ''' Executes a predicton workflow reading the input file in chunks
+            of chunk_size molecules, which are processed one after another
+            by idata, apply and odata, so that the memory used does not
+            depend on the size of the input file.
+
+            The preprocessing, the estimator and the applicability domain
+            are loaded once, by the first chunk, and reused by the rest.
+            The object results of every chunk are appended to the output
+            files and to the prediction repository, and the conveyor
+            obtained at the end only contains the number of objects and the
+            external validation of the whole series
+        '''
+
+        label = self.conveyor.getVal('prediction_label')
+        tracer = self.conveyor.tracer
+
+        if not os.path.isfile(input_source):
+            self.conveyor.setError(f'input data file {input_source} not found')
+            return self.run_odata()
+
+        if self.param.getVal('output_md'):
+            LOG.warning('molecular descriptors are not written in streamed predictions')
+
+        LOG.info(f'Predicting {input_source} in chunks of {chunk_size} molecules')
+
+        validation = stream.ValidationStats(self.param)
+        obj_num = 0
+        key_list = None
+        main = []
+        warnings = []
+        error = None
+
+        self.loaded = {}
+        temp_path = tempfile.mkdtemp()
+        try:
+            for chunk, chunk_file in enumerate(stream.sdf_chunks(input_source, chunk_size, temp_path)):
+
+                # every chunk uses a new conveyor, sharing the workflow timings
+                self.conveyor = Conveyor()
+                self.conveyor.tracer = tracer
+                self.conveyor.addVal(label, 'prediction_label', 'prediction label',
+                            'method', 'single',
+                            'Label used to identify the prediction')
+
+                with self.conveyor.span(f'chunk {chunk}'):
+                    self.run_idata(chunk_file)
+                    self.run_apply()
+
+                    if not self.conveyor.getError():
+                        odata = self.get_odata()
+                        with self.conveyor.span('odata'):
+                            success, key_list = odata.run_apply_chunk(chunk, key_list)
+
+                if self.conveyor.getError():
+                    error = f'chunk {chunk} of {input_source}: {self.conveyor.getErrorMessage()}'
+                    break
+
+                validation.add(self.conveyor)
+                obj_num += int(self.conveyor.getVal('obj_num'))
+                main = self.conveyor.getMain()
+                if self.conveyor.getWarning():
+                    warnings.append(f'chunk {chunk}: {self.conveyor.getWarningMessage()}')
+
+                LOG.info(f'chunk {chunk} completed, {obj_num} molecules predicted')
+        finally:
+            self.loaded = None
+            shutil.rmtree(temp_path, ignore_errors=True)
+
+        if error is None and obj_num == 0:
+            error = f'No molecule found in file: {input_source}'
+
+        # summary of the whole series
+        self.conveyor = Conveyor()
+        self.conveyor.tracer = tracer
+        self.conveyor.setOrigin('apply')
+        self.conveyor.addMeta('endpoint', self.param.getVal('endpoint'))
+        self.conveyor.addMeta('version', self.param.getVal('version'))
+        self.conveyor.addMeta('input_type', self.param.getVal('input_type'))
+        self.conveyor.addMeta('input_file', input_source)
+        self.conveyor.addMeta('chunk_size', chunk_size)
+        for key in main:
+            self.conveyor.addMain(key)
+
+        self.conveyor.addVal(label, 'prediction_label', 'prediction label',
+                    'method', 'single',
+                    'Label used to identify the prediction')
+        self.conveyor.addVal(obj_num, 'obj_num', 'Num mol',
+                    'method', 'single',
+                    'Number of molecules present in the input file')
+
+        ext_val_results = validation.results()
+        if ext_val_results is not None:
+            self.conveyor.addVal(ext_val_results,
+                                 'external-validation',
+                                 'external validation',
+                                 'method',
+                                 'single',
+                                 'External validation results')
+
+        if len(warnings) > 0:
+            self.conveyor.setWarning('\n'.join(warnings))
+
+        if error is not None:
+            self.conveyor.setError(error)
+            return self.run_odata()
+
+        self.conveyor.setProgress(0.9, 'formatting results')
+        odata = self.get_odata()
+        with self.conveyor.span('odata'):
+            return odata.run_apply_summary()
+
+    def run(self, input_source):
+        ''' Executes a default predicton workflow. Molecular input files
+            are read in chunks if the parameter "predict_chunk" is set '''
+
+        chunk_size = self.param.getVal('predict_chunk')
+        if chunk_size and self.param.getVal('input_type') == 'molecule':
+            return self.run_stream(input_source, int(chunk_size))
+
+        self.run_idata(input_source)
+        self.run_apply()
 
-        return odata.run()
+        return self.run_odata()
@@ -77,6 +77,9 @@ class Sapply:
         if self.scaler is None:
             return False, 'Inconsistency error. Scaling method defined but no Scaler loaded'
 
+        # the scaler was fitted in the descriptor dtype
+        X = X.astype(utils.descriptor_dtype(self.param), copy=False)
+
         return True, self.scaler.transform(X)  
 
 
@@ -21,7 +21,6 @@
 # along with Flame. If not, see <http://www.gnu.org/licenses/>.
 
 import os
-import sys
 import importlib
 
 from flame.util import utils, get_logger
@@ -55,9 +54,15 @@ class Sbuild:
             success, message = self.param.loadYaml(space, 0, isSpace=True)
 
         # being unable to load parameters is a critical error
+        # the error is reported by the caller, which must not run the build
         if not success:
             LOG.critical(f'Unable to load space parameters. "{message}" Aborting...')
-            sys.exit(1)
+            self.conveyor.setError(f'Unable to load space parameters. "{message}"')
+            return
+
+        # optional accounting of the memory used in every stage
+        if self.param.getVal('memory_profile'):
+            self.conveyor.tracer.enable_memory()
 
         # add additional output formats included in the constructor 
         # this is requiered to add JSON format as output when the object is
@@ -91,13 +96,15 @@ class Sbuild:
             odata_child = importlib.import_module(modpath+".odata_child")
 
             # run idata object, in charge of generate space data from input
+            self.conveyor.setProgress(0.1, 'processing compound database')
             try:
                 idata = idata_child.IdataChild(self.param, self.conveyor, input_source)
             except:
                 LOG.warning ('Idata child architecture mismatch, defaulting to Idata parent')
                 idata = Idata(self.param, self.conveyor, input_source)
                 
-            idata.run() 
+            with self.conveyor.span('idata'):
+                idata.run() 
             LOG.debug(f'idata child {type(idata).__name__} completed `run()`')
 
         if not self.conveyor.getError():
@@ -107,8 +114,10 @@ class Sbuild:
 
         if not self.conveyor.getError():
             # instantiate learn (build a space from idata) and run it
+            self.conveyor.setProgress(0.5, 'building space')
             slearn = slearn_child.SlearnChild(self.param, self.conveyor)
-            slearn.run()
+            with self.conveyor.span('slearn', self.conveyor.getVal('obj_num')):
+                slearn.run()
 
             try:
                 slearn = slearn_child.SlearnChild(self.param, self.conveyor)
@@ -121,10 +130,12 @@ class Sbuild:
         # run odata object, in charge of formatting the prediction results
         # note that if any of the above steps failed, an error has been inserted in the
         # conveyor and odata will take case of showing an error message
+        self.conveyor.setProgress(0.9, 'formatting results')
         try:
             odata = odata_child.OdataChild(self.param, self.conveyor)
         except:
             LOG.warning ('Odata child architecture mismatch, defaulting to Odata parent')
             odata = Odata(self.param, self.conveyor)
     
-        return odata.run()
\ No newline at end of file
+        with self.conveyor.span('odata'):
+            return odata.run()
\ No newline at end of file
@@ -21,7 +21,6 @@
 # along with Flame. If not, see <http://www.gnu.org/licenses/>.
 
 import os
-import sys
 import yaml
 import importlib
 
@@ -48,9 +47,16 @@ class Search:
             'method', 'single',
             'Label used to identify the prediction')
 
-        if not self.param.loadYaml(space, version, isSpace=True):
-            LOG.critical('Unable to load space parameters. Aborting...')
-            sys.exit()
+        # the error is reported by the caller, which must not run the search
+        success, message = self.param.loadYaml(space, version, isSpace=True)
+        if not success:
+            LOG.critical(f'Unable to load space parameters. "{message}" Aborting...')
+            self.conveyor.setError(f'Unable to load space parameters. "{message}"')
+            return
+
+        # optional accounting of the memory used in every stage
+        if self.param.getVal('memory_profile'):
+            self.conveyor.tracer.enable_memory()
 
         # add additional output formats included in the constructor 
         # this is requiered to add JSON format as output when the object is
@@ -125,13 +131,15 @@ class Search:
             odata_child = importlib.import_module(modpath+".odata_child")
 
             # run idata object, in charge of generate space data from input
+            self.conveyor.setProgress(0.1, 'processing input')
             try:
                 idata = idata_child.IdataChild(self.param, self.conveyor, input_source)
             except:
                 LOG.warning ('Idata child architecture mismatch, defaulting to Idata parent')
                 idata = Idata(self.param, self.conveyor, input_source)
 
-            idata.run()
+            with self.conveyor.span('idata'):
+                idata.run()
             LOG.debug(f'idata child {type(idata).__name__} completed `run()`')
 
         if not self.conveyor.getError():
@@ -142,22 +150,26 @@ class Search:
 
         if not self.conveyor.getError():
             # run apply object, in charge of generate a prediction from idata
+            self.conveyor.setProgress(0.6, 'searching space')
             try:
                 sapply = sapply_child.SapplyChild(self.param, self.conveyor)
             except:
                 LOG.warning ('Sapply child architecture mismatch, defaulting to Sapply parent')
                 sapply = Sapply(self.param, self.conveyor)
 
-            sapply.run(cutoff, numsel, metric)
+            with self.conveyor.span('search', self.conveyor.getVal('obj_num')):
+                sapply.run(cutoff, numsel, metric)
             LOG.debug(f'sapply child {type(sapply).__name__} completed `run()`')
 
         # run odata object, in charge of formatting the prediction results
         # note that if any of the above steps failed, an error has been inserted in the
         # conveyor and odata will take case of showing an error message
+        self.conveyor.setProgress(0.9, 'formatting results')
         try:
             odata = odata_child.OdataChild(self.param, self.conveyor, self.label)
         except:
             LOG.warning ('Odata child architecture mismatch, defaulting to Odata parent')
             odata = Odata(self.param, self.conveyor, self.label)
 
-        return odata.run()
+        with self.conveyor.span('odata'):
+            return odata.run()
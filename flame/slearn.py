@@ -75,6 +75,9 @@ class Slearn:
                         return False, 'Scaler not recognized'
 
                     if scaler is not None:
+                        self.X = self.X.astype(utils.descriptor_dtype(self.param), copy=False)
+                        utils.check_precision(self.X, self.conveyor.getVal('var_nam'))
+
                         # The scaler is saved so it can be used later
                         # to prediction instances.
                         self.scaler = scaler.fit(self.X)
@@ -30,6 +30,7 @@ import pathlib
 import tempfile
 import numpy as np
 from flame.util import utils, get_logger 
+from flame import catalog
 from flame.conveyor import Conveyor
 
 LOG = get_logger(__name__)
@@ -101,6 +102,8 @@ def action_new(space):
     documentation_path = wkd / 'children/documentation.yaml'
     shutil.copy(documentation_path, ndir)
   
+    catalog.update(space, isSpace=True)
+
     LOG.info(f'New space {space} created')
     
     return True, 'New space '+space+' created'
@@ -125,6 +128,8 @@ def action_kill(space):
     except:
         return False, f'Failed to remove space {space}'
 
+    catalog.update(space, isSpace=True)
+
     LOG.info(f'space {space} removed')
     #print(f'space {space} removed')
     return True, f'space {space} removed'
@@ -166,6 +171,8 @@ def action_publish(space):
     except:
         return False, f'Unable to copy contents of dev version for space {space}'
 
+    catalog.update(space, isSpace=True)
+
     LOG.info(f'New space version created from {src_path} to {new_path}')
     return True, f'New space version created from {src_path} to {new_path}'
 
@@ -187,6 +194,8 @@ def action_remove(space, version):
         return False, f'Version {version} not found'
 
     shutil.rmtree(rdir, ignore_errors=True)
+    catalog.update(space, isSpace=True)
+
     LOG.info(f'Version {version} of space {space} has been removed')
     return True, f'Version {version} of space {space} has been removed'
 
@@ -196,15 +205,15 @@ def action_list(space):
     '''
 
     # if a space name is provided, list versions
-    base_path = utils.space_tree_path(space)
+    versions = catalog.space_catalog().versions(space)
+    if versions is None:
+        return False, f'space {space} not found'
 
-    num_versions = 0
-    for x in os.listdir(base_path):
-        if x.startswith("ver"):
-            num_versions += 1
-            LOG.info(f'\t{space} : {x}')
+    versions = [x for x in versions if x > 0]
+    for x in versions:
+        LOG.info(f'\t{space} : ver{x:06}')
 
-    return True, f'space {space} has {num_versions} published versions'
+    return True, f'space {space} has {len(versions)} published versions'
 
 def action_parameters(space, version=None, oformat='text'):
     ''' Returns a JSON with whole results info for a given space and version '''
@@ -224,21 +233,21 @@ def action_parameters(space, version=None, oformat='text'):
 
         order = ['input_type', 'quantitative', 'SDFile_activity', 'SDFile_name','SDFile_id',
         'SDFile_experimental', 'normalize_method', 'ionize_method', 'convert3D_method', 
-        'computeMD_method', 'model', 'modelAutoscaling', 'tune', 'conformal', 
-        'conformalSignificance', 'ModelValidationCV', 'ModelValidationLC', 
+        'computeMD_method', 'descriptor_dtype', 'model', 'modelAutoscaling', 'tune', 'conformal', 
+        'conformalSignificance', 'conformalSignificanceList', 'ModelValidationCV', 'ModelValidationLC', 
         'ModelValidationN', 'ModelValidationP', 'output_format', 'output_md', 
         'TSV_activity', 'TSV_objnames', 'TSV_varnames', 'imbalance', 
-        'feature_selection', 'feature_number', 'mol_batch', 
-        'ensemble_models', 'ensemble_versions', 'numCPUs', 'verbose_error', 'modelingToolkit', 
+        'feature_selection', 'feature_number', 'incremental', 'mol_batch', 'deduplicate', 
+        'ensemble_models', 'ensemble_versions', 'numCPUs', 'memory_profile', 'verbose_error', 'modelingToolkit', 
         'endpoint', 'model_path', 
         #'md5', 
         'version']
 
-        order += ['MD_settings', 'RF_parameters','RF_optimize',
+        order += ['convert3D_settings', 'MD_settings', 'RF_parameters','RF_optimize',
         'SVM_parameters','SVM_optimize',
         'PLSDA_parameters','PLSDA_optimize',
         'PLSR_parameters','PLSR_optimize',
-        'GNB_parameters']
+        'GNB_parameters', 'SGD_parameters', 'incremental_settings']
 
 
         for ik in order:
@@ -359,27 +368,13 @@ def action_dir():
     '''
     Returns a JSON with the list of spaces and versions
     '''
-    # get de space repo path
-    spaces_path = pathlib.Path(utils.space_repository_path())
-
-    # get directories in space repo path
-    dirs = [x for x in spaces_path.iterdir() if x.is_dir()]
-
-    # if dir contains dev/ -> is space (NAIVE APPROACH)
-    # get last dir name [-1]: space name
-    space_dirs = [d.parts[-1] for d in dirs if list(d.glob('dev'))]
+    space_catalog = catalog.space_catalog()
 
     results = []
-    for ispace in space_dirs:
+    for ispace in space_catalog.names():
         idict = {}
         idict ["spacename"] = ispace
-        versions = [0]
-
-        for iversion in os.listdir(utils.space_tree_path(ispace)):
-            if iversion.startswith('ver'):
-                versions.append(utils.modeldir2ver(iversion))
-
-        idict ["versions"] = versions
+        idict ["versions"] = space_catalog.versions(ispace)
         results.append(idict)
 
     # print (json.dumps(results))
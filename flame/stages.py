@@ -0,0 +1,200 @@
+#! -*- coding: utf-8 -*-
+
+# Description    Flame cache of the model building stages
+#
+# Authors:       Manuel Pastor (manuel.pastor@upf.edu)
+#
+# Copyright 2018 Manuel Pastor
+#
+# This file is part of Flame
+#
+# Flame is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3.
+#
+# Flame is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Flame. If not, see <http://www.gnu.org/licenses/>.
+
+''' Cache of the results of the stages of the model building (preprocess,
+    build, validate and applicability domain), so that a rebuild only runs
+    the stages affected by the changes in the parameters or in the data.
+
+    Every stage has a key, obtained from the values of the parameters used
+    by the stage and the key of the stage it depends on. The first stage
+    depends on the X and Y matrices obtained by idata, whose results are
+    already recycled from data.pkl when the idata parameters and the input
+    file did not change.
+
+    The results of the last run of every stage are saved in the "stages"
+    folder of the model, together with their key. This folder is a cache of
+    the dev version, never published nor exported. Failing to save or to
+    load the results is not an error: the stage is simply run again '''
+
+import os
+import pickle
+import hashlib
+import tempfile
+
+import numpy as np
+
+from flame.util import get_logger
+
+LOG = get_logger(__name__)
+
+STAGES_DIR = 'stages'
+
+# stage each stage depends on and parameters used by the stage. Parameters
+# with {model} are resolved with the name of the model (e.g. RF_parameters)
+STAGES = {
+    'preprocess': (None, ['quantitative', 'incremental', 'imbalance',
+                          'modelAutoscaling', 'feature_selection',
+                          'feature_number', 'descriptor_dtype']),
+    'build': ('preprocess', ['model', 'quantitative', 'conformal', 'tune',
+                             'ModelValidationCV', 'ModelValidationN',
+                             'ModelValidationP', '{model}_parameters',
+                             '{model}_optimize']),
+    'validate': ('build', ['ModelValidationCV', 'ModelValidationN',
+                           'ModelValidationP', 'conformalSignificance']),
+    'applicability_domain': ('preprocess', ['applicability_domain', 'AD_settings']),
+}
+
+# parameters used by a stage only with some settings, given as (parameter,
+# value). FFD selects the variables with PLS models, but its results do not
+# depend on numCPUs
+CONDITIONAL = {
+    'preprocess': {('feature_selection', 'FFD'): ['PLSR_parameters']},
+}
+
+
+def data_hash(X, Y):
+    ''' MD5 hash of the contents of the X and Y matrices '''
+
+    md5 = hashlib.md5()
+    for matrix in (X, Y):
+        matrix = np.ascontiguousarray(matrix)
+        md5.update(str((matrix.dtype, matrix.shape)).encode())
+        md5.update(matrix.view(np.uint8).ravel())
+    return md5.hexdigest()
+
+
+def model_state(model, since=None):
+    ''' attributes of a model (child of BaseEstimator) set by its build and
+    validate methods, excluding the data and the shared objects. If a
+    previous state is given as since, only the attributes assigned after
+    it are returned (e.g. not the estimator fitted by build) '''
+
+    state = {k: v for k, v in model.__dict__.items()
+             if k not in ('X', 'Y', 'param', 'conveyor')}
+
+    if since is not None:
+        state = {k: v for k, v in state.items()
+                 if k not in since or since[k] is not v}
+
+    return state
+
+
+class Stages:
+    '''
+        Results of the model building stages, saved in the model directory
+
+        ...
+
+        Attributes
+        ----------
+
+        param : Parameters
+            model parameters
+        path : str
+            folder where the results are saved
+        root : str
+            hash of the X and Y matrices used as input of the first stage
+
+        Methods
+        -------
+
+        key(stage)
+            returns the key of the stage for the current parameters
+        get(stage)
+            returns the saved results of the stage or None if they are
+            not valid for the current key
+        put(stage, results)
+            saves the results of the stage with the current key
+    '''
+
+    def __init__(self, param, X, Y):
+        self.param = param
+        self.path = os.path.join(param.getVal('model_path'), STAGES_DIR)
+        self.root = data_hash(X, Y)
+        self.keys = {}
+
+    def _value(self, key):
+        ''' value of the parameter, without descriptions for dictionaries '''
+
+        value = self.param.getVal(key)
+        if isinstance(value, dict):
+            value = sorted(self.param.getDict(key).items())
+        return value
+
+    def key(self, stage):
+        if stage not in self.keys:
+            parent, keylist = STAGES[stage]
+            model = self.param.getVal('model')
+
+            values = [stage, self.root if parent is None else self.key(parent)]
+            for (setting, value), extra in CONDITIONAL.get(stage, {}).items():
+                if self.param.getVal(setting) == value:
+                    keylist = keylist + extra
+
+            for i in keylist:
+                i = i.format(model=model)
+                values.append((i, self._value(i)))
+
+            self.keys[stage] = hashlib.md5(pickle.dumps(values)).hexdigest()
+
+        return self.keys[stage]
+
+    def get(self, stage):
+        stage_pkl = os.path.join(self.path, stage + '.pkl')
+        if not os.path.isfile(stage_pkl):
+            return None
+
+        try:
+            with open(stage_pkl, 'rb') as handle:
+                if pickle.load(handle) != self.key(stage):
+                    return None
+                results = pickle.load(handle)
+        except Exception as e:
+            LOG.debug(f'Unable to load the results of stage {stage} with exception {e}')
+            return None
+
+        LOG.info(f'Recycling the results of stage {stage}')
+        return results
+
+    def put(self, stage, results):
+        stage_pkl = os.path.join(self.path, stage + '.pkl')
+        tmp_path = None
+
+        try:
+            os.makedirs(self.path, exist_ok=True)
+
+            # write and rename, so that an interrupted build never leaves
+            # a partial file
+            handle, tmp_path = tempfile.mkstemp(dir=self.path)
+            with os.fdopen(handle, 'wb') as fo:
+                pickle.dump(self.key(stage), fo, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(results, fo, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, stage_pkl)
+
+        except Exception as e:
+            LOG.debug(f'Unable to save the results of stage {stage} with exception {e}')
+            if tmp_path is not None and os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+
+            # stale results must not be recycled
+            if os.path.isfile(stage_pkl):
+                os.remove(stage_pkl)
@@ -1,268 +1,235 @@
-  
-  
-  
-  def varSelectionFFD (self, X, Y , A, autoscale=False, gui=True):
-    
-        # TODO : set dummyStep and ratio as tunable parameters
-        
-        dummyStep = 4.0 
-        ratio     = 2.0
-
-        # TODO : check the number of X variables. FFD is not suitable for very large X matrices
-
-        # build a X reduced matrix Xr
-        nobj, nvarx = np.shape (X)
-        nvarxOri = nvarx
-        index = np.ones(nvarx,dtype=np.int)
-        st = np.std (X, axis=0, ddof=1)
-        for i in range (nvarx):
-            if  st[i] < 1e-10:
-                index[i] = 0  # set to 0 to allow creation of reduced matrices 
-
-        """Reduced matrices come from deleting cols with low variance??"""
-        nvarxb = np.sum(index) # number of informative variables (std> 1e-10)
-
-        #print index
-        
-        Xb = np.empty((nobj, nvarxb), dtype=np.float64) # New empty matrix with ncols = nvarxb(reduced)
-        k=0
-        for i in range (nvarx):
-            if index[i]>0:
-                Xb[:,k]=X[:,i]
-                k+=1
-        
-        nobj, nvarx = np.shape (Xb)
-        ndummy = int (np.floor(nvarx/dummyStep))              # number of dummy variables
-        nvarxm = nvarx + ndummy                               # length of expanded vector
-        ncomb, design  = generateDesignFFD (nvarxm, ratio)    # ncomb is the number of reduced models to be generated
-                                                              # design is the matrix that designates is every x variable
-                                                              # is in/out of the design matrix
-        # print nvarx, ndummy, nvarxm, ncomb
-
-        # obtain first estimation of Y std error
-        SSY0 = 0.0
-        for i in range (nobj):
-            SSY0+=np.square(Y[i]-np.mean(Y))
-        SDEP0 = np.sqrt(SSY0/float(nobj))
-        SDEP0x10 = 10.0 * SDEP0
-
-        # initializes effects
-        effect  = np.zeros(nvarxm,dtype=np.float64)
-        xdesign = np.zeros(nvarx ,dtype=np.int)
-
-        # set common model stuff
-        self.autoscale = autoscale
-        self.Y = Y.copy()
-
-        if gui: updateProgress (0.0)
-        
-        for i in range(ncomb):
-
-            # extract x design line (not considering dummies)            
-            k=0
-            for j in range (nvarxm):
-                if j%(dummyStep+1) :         # non-dummy var
-                    xdesign[k]=design[i][j]
-                    k+=1
-                    
-            nvarxr = int(np.sum(xdesign>0))
-
-            # if this design line contains few x vars skip the model validation
-            if nvarxr <= (A+1) : continue
-            
-            # build a X reduced matrix Xr
-            Xr = np.empty((nobj, nvarxr), dtype=np.float64)
-            k=0
-            for j in range (nvarx):
-                if xdesign[j]>0:
-                    Xr[:,k]=Xb[:,j]
-                    k+=1
-
-            # set the reduced matrix as model matrix and validate
-            self.X = Xr.copy()
-            self.validateLOO (A)
-            
-            # accumulate the min SDEP to a effect vector for every variable (including dummies)
-            minSDEP = 2.0e10
-            for a in self.SDEP:
-                if a < minSDEP : minSDEP = a
-
-            if minSDEP > SDEP0x10:
-                minSDEP = SDEP0
-            
-            effect += design[i]*minSDEP
-
-            if gui: updateProgress (float(i)/float(ncomb))
-
-        # calculate effects
-        effect /= (ncomb/2)
-        
-        # compute dummy effects
-        dummyEffect = 0.00
-        dummyMean = 0.00
-        k  = 0
-
-        for i in range(nvarxm):
-            if not (i%(dummyStep+1)) :   # dummy var
-                dummyMean+=effect[i]
-        dummyMean/=ndummy
-
-        for i in range(nvarxm):
-            if not (i%(dummyStep+1)) :   # dummy var
-                dummyEffect+=np.square(effect[i]-dummyMean)
-                ##dummyEffect+=np.square(effect[i])                 ## old version: assuming mean of zero (?) 
-                ##td+=1
-            else :
-                effect[k]=effect[i]
-                k+=1
-
-        if dummyEffect > 1e-6:
-            dummySD = np.sqrt(dummyEffect/ndummy)
-        else :
-            dummySD = 0.001
-            
-        # compare with critical T values (two tail, 95%)    
-        t = stats.t.ppf(0.9725,ndummy-1)
-        effectCutoff = t * dummySD
-        
-        res = np.ones(nvarx,dtype=np.int)          # fixed (default)      
-        for i in range(nvarx):
-            if np.abs(effect[i]) < effectCutoff:   # uncertain
-                res[i] = 2
-            elif effect[i] > 0 :
-                res[i] = 0                         # excluded
-
-        #print res
-
-        # map the result in a vector representing the full, original X
-        resExp = np.ones(nvarxOri,dtype=np.int)
-        k = 0
-        for i in range (nvarxOri):
-            if index[i]==0:
-                resExp[i] = 0       # these were already excluded or are inactive variables
-            else :
-                resExp[i] = res[k]
-                k += 1
-        
-        return resExp, np.sum(res==0)
-
-    def excludeVar (self, X, res):
-        X[:,res==0]=0.000   
-        return X
-
-
-
-###################################
-
-def generateDesignFFD (nvarx, ratio):
-    
-    ncomb = 1
-    R = 0
-    targetCom = nvarx * ratio
+#! -*- coding: utf-8 -*-
 
-    for i in range (nvarx):
-        ncomb *= 2
-        R+=1
-        if (ncomb==4096) : break
-        if (ncomb>targetCom) : break
-
-##    print 'targetCom: %d' % targetCom, 
-##    print 'ncomb: %d' % ncomb, 
-##    print 'R: %d' % R 
-    
-    Dis = np.ones((ncomb,14),dtype=np.int)
-    G   = np.zeros((ncomb+1,14),dtype=np.int)    
-    lineDis = np.ones((ncomb,nvarx), dtype=np.int)
-
-    # Dis is the full factorial design 2^R located at
-    # the beginning of the final design, filling R columns
-    
-    h = 1
-    for y in range(R):
-        h*=2
-        for w in range (ncomb/h):
-            for z in range (h/2):
-                Dis[w*h+(h/2)+z][y] = -1
-
-    # G is the "generator": an index of colums of Dis that
-    # shoud be multiplied for generating the rest of the design
-    # columns
-    
-    for i in range (1,R+1) :
-        G[i][1] = i
-
-    NG = R
-    n1 = 1
-    n2 = R
-    for i in range (1,R+1):
-        for j in range (n1,n2+1):
-            for h in range (G[j][i]+1,R+1):
-                NG+=1
-                for f in range (1,G[j][i]+1):
-                    G[NG][f] = G[j][f]
-
-                G[NG][i+1]=h
-
-        n1 = n2 + 1
-        n2 = NG
-
-    # looks like G is generated in blocks of R elements
-    for i in range (1,(NG-R)+1):
-        for j in range (1,R+1):
-            G[i][j] = G[i+R][j]
-
-    NG -= R
-
-##   Attempt of using C indexing style... failed because the algorithm makes use
-##   of the index values to control the loops
-    
-##    for i in range (R) :
-##        G[i,0] = i
+# Description    FFD (Fractional Factorial Design) variable selection
 ##
-##    NG = R-1
-##    n1 = 0
-##    n2 = R-1
-##    for i in range (R):
-##        for j in range (n1,n2+1):
-##            for h in range (G[j,i]+1,R):
-##                NG+=1
-##                for f in range (G[j,i]):
-##                    G[NG,f] = G[j,f]
-##                print NG, i
-##                G[NG,i+1]=h
+# Authors:       Manuel Pastor (manuel.pastor@upf.edu)
 ##
-##        n1 = n2 +1 
-##        n2 = NG
+# Copyright 2018 Manuel Pastor
 ##
+# This file is part of Flame
 ##
+# Flame is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3.
 ##
-##    # looks like G is generated in blocks of R elements
-##    for i in range (NG-R):
-##        for j in range (R):
-##            G[i,j] = G[i+R,j]
+# Flame is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
 ##
-##    NG -= R
-    
-    # now we fill the real design
-    for i in range (R):
-        lineDis[:,i]=Dis[:,i]
-    
-    for w in range (ncomb):
-        disw = Dis[w,:]
-        # the next columns are generated using the Gen indexes
-        for h in range (nvarx-R):
-            nneg = 0
-            gg = G[NG-h,:]
-            for t in range (1,R+1):
-                if disw[gg[t]-1] < 0 : nneg += 1   ## gg indexes must be decreased (-1) because now Dis use C style indexing
-                #if disw[gg[t-1]] < 0 : nneg += 1   ## C style indexing
-            if nneg%2 : lineDis[w,h+R] = -1
-    
-    
-##    for i in range (ncomb):
-##        for j in range (nvarx):
-##            print '%2d' % lineDis[i][j],
-##        print
-    
-    return (ncomb, lineDis)
+# You should have received a copy of the GNU General Public License
+# along with Flame.  If not, see <http://www.gnu.org/licenses/>.
+
+''' FFD variable selection for PLS models, ported from eTOXlab.
+
+    Every row of a two-level fractional factorial design defines a reduced
+    model, built with a subset of the X variables. The effect of every
+    variable on the predictive quality (LOO SDEP) of the reduced models is
+    compared with the effect of dummy variables, in order to classify the
+    variables as fixed, uncertain or excluded
+'''
+
+import itertools
+import multiprocessing as mp
+
+import numpy as np
+from scipy import stats
+
+from flame.stats.kernel_pls import pls_loo
+from flame.util import get_logger
+
+LOG = get_logger(__name__)
+
+# a dummy variable is inserted every DUMMY_STEP real variables
+DUMMY_STEP = 4
+
+# the number of design rows is at least RATIO times the number of variables
+RATIO = 2.0
+
+# maximum number of design rows (2^12)
+MAX_COMB = 4096
+
+# data shared by the worker processes
+_FFD_DATA = {}
+
+
+def generateDesignFFD(nvarx, ratio):
+    ''' Generates a two-level fractional factorial design for nvarx variables
+
+    The first R columns contain a 2^R full factorial design and the rest of
+    the columns are generated as products of combinations of these columns,
+    starting by the combinations with the larger number of columns
+
+    Returns the number of rows of the design (ncomb) and the design, as a
+    numpy array [ncomb, nvarx] of 1 (variable in) and -1 (variable out)
+    '''
+
+    ncomb = 1
+    R = 0
+    target_comb = nvarx * ratio
+
+    for i in range(nvarx):
+        ncomb *= 2
+        R += 1
+        if ncomb == MAX_COMB or ncomb > target_comb:
+            break
+
+    rows = np.arange(ncomb)
+
+    # generators: combinations of 2 or more of the R base columns, ordered
+    # by size and lexicographically. Used backwards, starting by the last one
+    generators = []
+    for size in range(2, R+1):
+        generators += itertools.combinations(range(R), size)
+    generators = generators[::-1]
+
+    ngen = nvarx - R
+    if ngen > len(generators):
+        LOG.warning(f'FFD design of {ncomb} rows is too small for {nvarx}'
+                    ' variables, generators will be reused')
+
+    # the sign of a product of columns depends on the parity of the
+    # number of base columns with negative values (bits set in the row index)
+    masks = np.zeros(max(ngen, 0), dtype=np.int64)
+    for i in range(ngen):
+        for j in generators[i % len(generators)]:
+            masks[i] |= 1 << j
+
+    bits = np.concatenate((1 << np.arange(R, dtype=np.int64), masks))
+
+    parity = np.zeros((ncomb, len(bits)), dtype=np.int64)
+    selected = rows[:, None] & bits[None, :]
+    for j in range(R):
+        parity ^= (selected >> j) & 1
+
+    design = 1 - 2 * parity
+
+    return ncomb, design
+
+
+def _init_worker(X, Y, A, SDEP0):
+    ''' stores the matrices used by _design_SDEP in the worker processes '''
+
+    _FFD_DATA['X'] = X
+    _FFD_DATA['Y'] = Y
+    _FFD_DATA['A'] = A
+    _FFD_DATA['SDEP0'] = SDEP0
+
+
+def _design_SDEP(xdesign):
+    ''' Computes the minimum LOO SDEP of the reduced models defined by
+    a list of x design rows
+
+    Rows with too few variables are not evaluated and return 0.0
+    '''
+
+    X = _FFD_DATA['X']
+    Y = _FFD_DATA['Y']
+    A = _FFD_DATA['A']
+    SDEP0 = _FFD_DATA['SDEP0']
+
+    nobj = len(Y)
+    results = np.zeros(len(xdesign))
+
+    for i, row in enumerate(xdesign):
+        mask = row > 0
+
+        # if this design line contains few x vars skip the model validation
+        if np.count_nonzero(mask) <= (A+1):
+            continue
+
+        Yp = pls_loo(X[:, mask], Y, A)
+        SDEP = np.sqrt(np.sum(np.square(Y[:, None] - Yp), axis=0) / nobj)
+
+        minSDEP = np.min(SDEP)
+        if minSDEP > 10.0 * SDEP0:
+            minSDEP = SDEP0
+
+        results[i] = minSDEP
+
+    return results
+
+
+def varSelectionFFD(X, Y, A, autoscale=False, ncpu=1):
+    ''' Performs a FFD variable selection for a PLS model with A latent
+    variables
+
+    Returns a vector with the state of every X variable (0 excluded,
+    1 fixed, 2 uncertain) and the number of excluded variables
+    '''
+
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64).ravel()
+
+    # remove variables without variance
+    nobj, nvarx_ori = np.shape(X)
+    st = np.std(X, axis=0, ddof=1)
+    index = st >= 1.0e-10
+
+    Xb = X[:, index]
+    if autoscale:
+        Xb = Xb / st[index]
+
+    nvarx = Xb.shape[1]
+
+    # dummies are located at positions 0, DUMMY_STEP+1, 2*(DUMMY_STEP+1), ...
+    ndummy = int(np.ceil(nvarx / DUMMY_STEP))
+    nvarxm = nvarx + ndummy
+
+    if ndummy < 2:
+        raise ValueError(f'FFD requires more than {DUMMY_STEP} informative '
+                         'variables')
+
+    dummy = (np.arange(nvarxm) % (DUMMY_STEP+1)) == 0
+
+    # ncomb is the number of reduced models to be generated and design the
+    # matrix defining if every x variable is in/out of each reduced model
+    ncomb, design = generateDesignFFD(nvarxm, RATIO)
+    xdesign = design[:, ~dummy]
+
+    # first estimation of Y std error
+    SDEP0 = np.sqrt(np.sum(np.square(Y - np.mean(Y))) / nobj)
+
+    LOG.info(f'FFD variable selection: {nvarx} variables, {ndummy} dummies,'
+             f' {ncomb} reduced models')
+
+    if ncpu > 1:
+        chunks = np.array_split(xdesign, ncpu * 4)
+        pool = mp.Pool(ncpu, initializer=_init_worker,
+                       initargs=(Xb, Y, A, SDEP0))
+        results = pool.map(_design_SDEP, chunks)
+        pool.close()
+        pool.join()
+        minSDEP = np.concatenate(results)
+    else:
+        _init_worker(Xb, Y, A, SDEP0)
+        minSDEP = _design_SDEP(xdesign)
+
+    # effect of every variable (including dummies) on the min SDEP
+    effect = design.T @ minSDEP
+    effect /= (ncomb // 2)
+
+    # distribution of dummy effects
+    dummy_effect = effect[dummy]
+    effect = effect[~dummy]
+
+    dummySS = np.sum(np.square(dummy_effect - np.mean(dummy_effect)))
+    if dummySS > 1e-6:
+        dummySD = np.sqrt(dummySS/ndummy)
+    else:
+        dummySD = 0.001
+
+    # compare with critical T values (two tail, 95%)
+    t = stats.t.ppf(0.9725, ndummy-1)
+    effect_cutoff = t * dummySD
+
+    res = np.ones(nvarx, dtype=int)                 # fixed (default)
+    res[effect > 0] = 0                             # excluded
+    res[np.abs(effect) < effect_cutoff] = 2         # uncertain
+
+    # map the result in a vector representing the full, original X
+    # variables without variance are excluded
+    resExp = np.zeros(nvarx_ori, dtype=int)
+    resExp[index] = res
 
+    return resExp, int(np.sum(res == 0))
@@ -83,10 +83,6 @@ class GNB(BaseEstimator):
     def build(self):
         '''Build a new qualitative GNB model with the X and Y numpy matrices'''
 
-        # Make a copy of data matrices
-        X = self.X.copy()
-        Y = self.Y.copy()
-
         results = []
         results.append(('nobj', 'number of objects', self.nobj))
         results.append(('nvarx', 'number of predictor variables', self.nvarx))
@@ -96,6 +92,16 @@ class GNB(BaseEstimator):
         self.estimator = GaussianNB(**self.estimator_parameters)
         results.append(('model', 'model type', 'GNB qualitative'))
 
+        # in incremental mode the model is fitted in chunks. The class
+        # statistics are accumulated, so every object is used only once
+        if self.param.getVal('incremental'):
+            self.incrementalFit(epochs=1)
+            return True, results
+
+        # Make a copy of data matrices
+        X = self.X.copy()
+        Y = self.Y.copy()
+
         self.estimator.fit(X, Y)
 
         if not self.param.getVal('conformal'):
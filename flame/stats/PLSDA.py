@@ -49,6 +49,7 @@ from sklearn.cross_decomposition import PLSRegression, CCA
 import warnings
 warnings.filterwarnings('ignore')
 
+from flame.stats.kernel_pls import pls_cv, pls_cv_curves
 from flame.util import get_logger
 LOG = get_logger(__name__)
 
@@ -213,6 +214,13 @@ class PLSDA(BaseEstimator):
                 if not success:
                     return False, message
 
+                results.append(('Q2_LV', 'Q2 for 1 to A latent variables',
+                                self.Q2_curve.tolist()))
+                results.append(('SDEP_LV', 'SDEP for 1 to A latent variables',
+                                self.SDEP_curve.tolist()))
+                results.append(('MCC_LV', 'best cutoff and MCC for each number of latent variables',
+                                self.MCC_curve))
+
             else:
 
                 LOG.error('Type of tune not recognized, check the input')
@@ -243,26 +251,29 @@ class PLSDA(BaseEstimator):
 
     def optimize(self, X, Y, estimator, tune_parameters):
         ''' optimizes a model using a grid search over a 
-        range of values for diverse parameters'''
+        range of values for diverse parameters.
+
+        The cross-validation predictions for every number of latent
+        variables are obtained from a single pass over the folds '''
 
         # Max number of latent variables
         latent_variables = tune_parameters["n_components"]
 
         # Mathew correlation coefficient of best threshold
         mcc_final = 0
-        estimator0 = ""
+        best = None
 
         # List to add the best threshold and Matthews correlation
         # coefficient for each number of latent variables
         list_latent = []
         try:
+            Yp = pls_cv(X, Y, max(latent_variables), self.cv)
+            self.Q2_curve, self.SDEP_curve = pls_cv_curves(Y, Yp)
+
             for n_comp in latent_variables:
+                y_pred = Yp[:, n_comp-1]
                 mcc0 = 0
-                estimator.set_params(**{"n_components": n_comp})
-                y_pred = cross_val_predict(estimator, X, Y, 
-                                            cv=self.cv, n_jobs=1)
-                estimator1 = ""
-                threshold_1 = 0
+                threshold_1 = None
                 # Get optimum threshold
                 for threshold in range(0, 100, 5):
                     threshold = threshold / 100
@@ -271,28 +282,24 @@ class PLSDA(BaseEstimator):
                     y_pred2[y_pred2 >= threshold] = 1
                     mcc1 = mcc(Y, y_pred2)
                     # Update threshold value with current best value
-                    if mcc1 >= mcc0:
+                    if mcc1 >= mcc0 or threshold_1 is None:
                         mcc0 = mcc1
-                        estimator1 = copy(estimator)
-                        estimator1.set_params(**{'threshold': threshold})
-                        threshold_1 = (threshold)
+                        threshold_1 = threshold
                 # Assign class estimator the best current estimator
-                if mcc0 >= mcc_final:
+                if mcc0 >= mcc_final or best is None:
                     mcc_final = mcc0
-                    estimator0 = copy(estimator1)
-                    self.estimator = estimator0
+                    best = (n_comp, threshold_1)
 
                 list_latent.append([n_comp, threshold_1, mcc0])
         except Exception as e:
             LOG.error(f'Error optimizing PLS-DA with exception {e}')
             return False, f'Error optimizing PLS-DA with exception {e}'
 
-        # LOG.debug('Number of latent variables, Best cutoff, and its Matthews '
-        # 'correlation coefficient')
-        # for lv in list_latent:
-        #     LOG.debug(f'Number of latent variables: '
-        #     f'{lv[0]} \nBest cutoff: {lv[1]} \nMCC: {lv[2]}\n')
-                  
+        self.MCC_curve = list_latent
+
+        estimator.set_params(**{'n_components': best[0], 'threshold': best[1]})
+        self.estimator = estimator
+
         self.estimator.fit(X, Y)
         LOG.info(f'Estimator best parameters: {self.estimator.get_params()}')
         return True, 'OK'
@@ -39,6 +39,7 @@ from sklearn.model_selection import cross_val_predict
 from sklearn.metrics import r2_score
 from sklearn.neighbors import KNeighborsRegressor
 
+from flame.stats.kernel_pls import pls_cv, pls_cv_curves
 from flame.util import get_logger
 LOG = get_logger(__name__)
 
@@ -171,6 +172,11 @@ class PLSR(BaseEstimator):
                 if not success:
                     return False, message
 
+                results.append(('Q2_LV', 'Q2 for 1 to A latent variables',
+                                self.Q2_curve.tolist()))
+                results.append(('SDEP_LV', 'SDEP for 1 to A latent variables',
+                                self.SDEP_curve.tolist()))
+
             else: 
                 LOG.error('Type of tune not recognized, check the input')
                 return False, 'Type of tune not recognized, check the input'    
@@ -231,44 +237,35 @@ class PLSR(BaseEstimator):
 
     def optimize(self, X, Y, estimator, tune_parameters):
         ''' optimizes a model using a grid search over a 
-        range of values for diverse parameters'''
+        range of values for diverse parameters.
+
+        The cross-validation predictions for every number of latent
+        variables are obtained from a single pass over the folds '''
  
         # Max number of latent variables
         latent_variables = tune_parameters['n_components']
         
         # Best r2
         r2 = 0
-        estimator0 = None
+        best_comp = None
         
-        # List to add r2 for each number of latent variables
-        list_latent = []
         try:
-            for n_comp in latent_variables:
-                r2_0 = 0
-                estimator.set_params(**{"n_components": n_comp})
-                y_pred = cross_val_predict(estimator, X, Y,
-                                             cv=self.cv, n_jobs=1)
+            Yp = pls_cv(X, Y, max(latent_variables), self.cv)
+            self.Q2_curve, self.SDEP_curve = pls_cv_curves(Y, Yp)
 
-            
-                
-                r2_0 = r2_score(Y, y_pred)
-
-                # print (n_comp, r2_0)
+            for n_comp in latent_variables:
+                r2_0 = r2_score(Y, Yp[:, n_comp-1])
 
-                # Update estimator0 to best current estimator
-                if r2_0 >= r2 or estimator0 == None:
+                # Update best number of latent variables
+                if r2_0 >= r2 or best_comp == None:
                     r2 = r2_0
-                    estimator0 = copy(estimator)
+                    best_comp = n_comp
 
-                list_latent.append([n_comp, r2_0])
         except Exception as e:
             return False, f'Error optimizing PLSR with exception {e}'
 
-        self.estimator = estimator0
-
-        # LOG.debug('Number of latent variables, r2')
-        # for lv in list_latent:
-        #     LOG.debug(f'Number of latent variables: {lv[0]} \nr2: {lv[1]}\n')
+        estimator.set_params(**{"n_components": best_comp})
+        self.estimator = estimator
 
         self.estimator.fit(X, Y)
         LOG.info(f'Estimator best parameters: {self.estimator.get_params()}')
@@ -0,0 +1,179 @@
+#! -*- coding: utf-8 -*-
+
+# Description    Flame SGD linear model class
+##
+# Authors:       Manuel Pastor (manuel.pastor@upf.edu)
+##
+# Copyright 2018 Manuel Pastor
+##
+# This file is part of Flame
+##
+# Flame is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3.
+##
+# Flame is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+##
+# You should have received a copy of the GNU General Public License
+# along with Flame.  If not, see <http://www.gnu.org/licenses/>.
+
+from copy import copy
+
+from sklearn.linear_model import SGDRegressor, SGDClassifier
+
+from nonconformist.base import ClassifierAdapter, RegressorAdapter
+from nonconformist.acp import AggregatedCp
+from nonconformist.acp import BootstrapSampler
+from nonconformist.icp import IcpClassifier, IcpRegressor
+from nonconformist.nc import ClassifierNc, MarginErrFunc, RegressorNc
+from nonconformist.nc import AbsErrorErrFunc, RegressorNormalizer
+
+from flame.stats.base_model import BaseEstimator
+from flame.util import get_logger
+LOG = get_logger(__name__)
+
+
+class SGD(BaseEstimator):
+    """
+        This class inherits from BaseEstimator and wraps SKLEARN
+        SGDRegressor or SGDClassifier estimators, linear models fitted
+        by stochastic gradient descent. These models can be built
+        incrementally, in chunks of objects
+
+        ...
+
+        Attributes
+        ----------
+
+        estimator_parameters : dict
+            parameter values
+        name : string
+            name of the estimator
+
+        Methods
+        -------
+
+        build(X)
+            Instance the estimator and fits it to the whole X
+            matrix or incrementally if incremental=true.
+    """
+
+    def __init__(self, X, Y, parameters, conveyor):
+        # Initialize parent class
+        try:
+            BaseEstimator.__init__(self, X, Y, parameters, conveyor)
+            LOG.debug('Initialize BaseEstimator parent class')
+        except Exception as e:
+            LOG.error(f'Error initializing BaseEstimator parent class with exception: {e}')
+            self.conveyor.setError(f'Error initializing BaseEstimator parent class with exception: {e}')
+            return
+
+        # Load estimator parameters
+        self.estimator_parameters = self.param.getDict('SGD_parameters')
+
+        # null values are replaced by the sklearn defaults
+        for key in [k for k, v in self.estimator_parameters.items() if v is None]:
+            self.estimator_parameters.pop(key)
+
+        if self.param.getVal('quantitative'):
+            self.name = "SGD-R"
+            self.estimator_parameters.pop("class_weight", None)
+        else:
+            self.name = "SGD-C"
+
+        if self.param.getVal('tune'):
+            LOG.warning('SGD hyperparameter optimization not implemented, using SGD_parameters')
+
+    def build(self):
+        '''Build a new SGD model with the X and Y numpy matrices '''
+
+        results = []
+        results.append(('nobj', 'number of objects', self.nobj))
+        results.append(('nvarx', 'number of predictor variables', self.nvarx))
+
+        try:
+            if self.param.getVal('quantitative'):
+                LOG.info("Building Quantitative SGD-R model")
+                self.estimator = SGDRegressor(**self.estimator_parameters)
+                results.append(('model', 'model type', 'SGD quantitative'))
+            else:
+                LOG.info("Building Qualitative SGD-C model")
+                self.estimator = SGDClassifier(**self.estimator_parameters)
+                results.append(('model', 'model type', 'SGD qualitative'))
+        except Exception as e:
+            return False, f'Exception building SGD estimator with exception {e}'
+
+        # in incremental mode the model is fitted in chunks, without
+        # loading the X matrix in memory
+        if self.param.getVal('incremental'):
+            try:
+                self.incrementalFit()
+            except Exception as e:
+                return False, f'Exception fitting SGD estimator incrementally with exception {e}'
+
+            results.append(('epochs', 'number of incremental epochs', self.epochs))
+            return True, results
+
+        # Make a copy of data matrices
+        X = self.X.copy()
+        Y = self.Y.copy()
+
+        try:
+            self.estimator.fit(X, Y)
+        except Exception as e:
+            return False, f'Exception building SGD estimator with exception {e}'
+
+        self.estimator_temp = copy(self.estimator)
+
+        if not self.param.getVal('conformal'):
+            return True, results
+
+        # Create the conformal estimator
+        try:
+            if self.param.getVal('quantitative'):
+
+                LOG.info("Building conformal Quantitative SGD-R model")
+
+                underlying_model = RegressorAdapter(self.estimator_temp)
+                normalizing_model = RegressorAdapter(self.estimator_temp)
+                normalizer = RegressorNormalizer(
+                                underlying_model,
+                                normalizing_model,
+                                AbsErrorErrFunc())
+                nc = RegressorNc(underlying_model,
+                                    AbsErrorErrFunc(),
+                                    normalizer)
+
+                self.estimator = AggregatedCp(IcpRegressor(nc),
+                                                BootstrapSampler())
+                self.estimator.fit(X, Y)
+
+                # overrides non-conformal
+                results.append(('model', 'model type', 'conformal SGD quantitative'))
+
+            else:
+
+                LOG.info("Building conformal Qualitative SGD-C model")
+
+                # the classifier adapter requires probabilities, only
+                # available for log and modified_huber losses
+                self.estimator = AggregatedCp(
+                                    IcpClassifier(
+                                        ClassifierNc(
+                                            ClassifierAdapter(self.estimator_temp),
+                                            MarginErrFunc()
+                                        )
+                                    ),
+                                    BootstrapSampler())
+                self.estimator.fit(X, Y)
+
+                # overrides non-conformal
+                results.append(('model', 'model type', 'conformal SGD qualitative'))
+
+        except Exception as e:
+            return False, f'Exception building aggregated conformal SGD estimator with exception {e}'
+
+        return True, results
@@ -0,0 +1,422 @@
+#! -*- coding: utf-8 -*-
+
+# Description    Flame applicability domain class
+##
+# Authors:       Manuel Pastor (manuel.pastor@upf.edu)
+##
+# Copyright 2018 Manuel Pastor
+##
+# This file is part of Flame
+##
+# Flame is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3.
+##
+# Flame is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+##
+# You should have received a copy of the GNU General Public License
+# along with Flame.  If not, see <http://www.gnu.org/licenses/>.
+
+''' This file contains the applicability domain (AD) of the models.
+
+    The AD is characterized by two scores, computed for every query object
+    in the preprocessed descriptor space of the model:
+
+    - distance: mean distance to the k nearest training objects. Training
+      series are indexed when the model is built, so that queries do not
+      compare the objects with the whole series. Binary fingerprints (also
+      once autoscaled) are packed and searched by Tanimoto distance, for
+      blocks of query objects at once, pruning the training objects by their
+      number of bits. Continuous descriptors
+      are stored in a KD-tree, or searched by brute force when they have
+      too many dimensions for the tree to prune. In incremental mode
+      continuous descriptors are not indexed, since the index would hold
+      the whole series in memory
+
+    - leverage: h = 1/n + (x-m) (Xc'Xc)^-1 (x-m)', where m is the mean and
+      Xc the centered training series, computed with the inverse stored
+      when the model is built. Only for continuous descriptors with a
+      small number of variables
+
+    Objects are flagged as inside the AD when all the scores are below the
+    thresholds obtained for the training series '''
+
+import os
+import pickle
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+
+from flame.stats import incremental
+from flame.util import get_logger
+
+LOG = get_logger(__name__)
+
+AD_FILE = 'applicability_domain.pkl'
+
+# default values, used when AD_settings are not defined
+NEIGHBOURS = 5
+PERCENTILE = 95
+SAMPLE_SIZE = 10000
+
+# the leverage requires storing a matrix of nvarx x nvarx and computing
+# nvarx^2 products for every query object
+LEVERAGE_MAX_VARS = 100
+
+# KD-trees do not prune the search in higher dimensions
+KDTREE_MAX_VARS = 15
+
+# number of bits set in every byte value
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.int32)
+
+# number of query objects and training fingerprints compared at once
+QUERY_BLOCK = 256
+INDEX_CHUNK = 2048
+
+
+def ad_settings(param):
+    ''' returns the number of neighbours, the percentile used to define the
+    distance threshold and the number of training objects used to estimate
+    it, as defined in the AD_settings parameter '''
+
+    settings = param.getDict('AD_settings')
+    if settings is None:
+        settings = {}
+
+    values = []
+    for key, default in (('neighbours', NEIGHBOURS),
+                         ('percentile', PERCENTILE),
+                         ('sample_size', SAMPLE_SIZE)):
+        value = settings.get(key)
+        if value is None:
+            value = default
+        values.append(value)
+
+    return max(1, int(values[0])), float(values[1]), max(1, int(values[2]))
+
+
+def binary_thresholds(X, scaler=None, chunk=incremental.CHUNK_SIZE):
+    ''' returns the values separating the bits set and not set in every
+    column of X if all the columns take at most two values (e.g. autoscaled
+    fingerprints), or None otherwise '''
+
+    nobj, nvarx = X.shape
+    cmin = np.full(nvarx, np.inf)
+    cmax = np.full(nvarx, -np.inf)
+    for rows in incremental.chunk_slices(nobj, chunk):
+        Xc = incremental.get_chunk(X, rows, scaler)
+        cmin = np.minimum(cmin, Xc.min(axis=0))
+        cmax = np.maximum(cmax, Xc.max(axis=0))
+
+    for rows in incremental.chunk_slices(nobj, chunk):
+        Xc = incremental.get_chunk(X, rows, scaler)
+        if not np.all((Xc == cmin) | (Xc == cmax)):
+            return None
+
+    # constant columns keep the bit of unscaled 0/1 values and are not set
+    # otherwise (e.g. autoscaled to 0.0)
+    constant = np.where(cmin == 1.0, 0.5, cmin + 0.5)
+    return np.where(cmin == cmax, constant, (cmin + cmax) / 2.0)
+
+
+class FingerprintIndex:
+    '''
+        Index of binary fingerprints for Tanimoto nearest neighbour searches
+
+        The fingerprints are packed in bytes and sorted by their number of
+        bits, in chunks of INDEX_CHUNK fingerprints. The query objects are
+        also sorted by their number of bits and compared in blocks of
+        QUERY_BLOCK objects with every chunk at once, counting the common
+        bits with a matrix product. The Tanimoto similarity of fingerprints
+        with a and b bits cannot exceed min(a,b)/max(a,b), and the chunks
+        which cannot improve the k nearest neighbours of any object of the
+        block are skipped
+
+        ...
+
+        Attributes
+        ----------
+
+        thresholds : numpy.ndarray
+            values above which the bits of every column are set
+        fingerprints : numpy.ndarray
+            packed fingerprints, sorted by number of bits
+        counts : numpy.ndarray
+            number of bits of every fingerprint, in ascending order
+
+        Methods
+        -------
+
+        query(X, k)
+            returns the Tanimoto distances to the k nearest fingerprints
+    '''
+
+    def __init__(self, X, thresholds=None, scaler=None, chunk=incremental.CHUNK_SIZE):
+
+        if thresholds is None:
+            thresholds = np.full(X.shape[1], 0.5)
+        self.thresholds = thresholds
+
+        # one bit per variable, so that the index is much smaller than X
+        packed = []
+        for rows in incremental.chunk_slices(X.shape[0], chunk):
+            packed.append(self.pack(incremental.get_chunk(X, rows, scaler)))
+        packed = np.concatenate(packed)
+
+        counts = POPCOUNT[packed].sum(axis=1)
+        order = np.argsort(counts, kind='stable')
+        self.counts = counts[order]
+        self.fingerprints = packed[order]
+
+    def pack(self, X):
+        ''' returns the fingerprints of the objects in X packed in bytes '''
+
+        return np.packbits(np.asarray(X) > self.thresholds, axis=1)
+
+    def unpack(self, packed):
+        ''' returns the packed fingerprints as a matrix of 0.0/1.0 values,
+        used to count the common bits with a matrix product '''
+
+        return np.unpackbits(packed, axis=1, count=len(self.thresholds)).astype(np.float32)
+
+    def query_block(self, fp, k):
+        ''' returns the similarities to the k most similar fingerprints,
+        in decreasing order, for a block of packed fingerprints '''
+
+        a = POPCOUNT[fp].sum(axis=1).astype(np.float64)[:, np.newaxis]
+        Q = self.unpack(fp)
+
+        starts = np.arange(0, len(self.counts), INDEX_CHUNK)
+        ends = np.minimum(starts + INDEX_CHUNK, len(self.counts))
+        low = self.counts[starts]
+        high = self.counts[ends-1]
+
+        # upper bound of the similarity for every object and chunk
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bound = np.where(a < low, a / low, np.where(a > high, high / a, 1.0))
+        bound[np.isnan(bound)] = 1.0
+
+        best = np.full((len(fp), k), -1.0)
+        for ichunk in np.argsort(-bound.max(axis=0), kind='stable'):
+            if np.all(bound[:, ichunk] <= best[:, -1]):
+                continue
+
+            group = slice(starts[ichunk], ends[ichunk])
+
+            # the counts are exact in float32, for up to 2^24 bits
+            common = Q @ self.unpack(self.fingerprints[group]).T
+            union = a + self.counts[group] - common
+
+            sim = np.ones(common.shape)
+            np.divide(common, union, out=sim, where=union > 0)
+
+            sim = np.concatenate((best, sim), axis=1)
+            if sim.shape[1] > k:
+                sim = -np.partition(-sim, k-1, axis=1)[:, :k]
+            best = -np.sort(-sim, axis=1)
+
+        return best
+
+    def query(self, X, k):
+        ''' returns the Tanimoto distances of every object in X to its
+        k nearest fingerprints, as an array [nobj, k] '''
+
+        packed = self.pack(X)
+
+        # objects with a similar number of bits share the chunks compared
+        order = np.argsort(POPCOUNT[packed].sum(axis=1), kind='stable')
+
+        k = min(k, len(self.counts))
+        dist = np.empty((len(packed), k))
+        for start in range(0, len(packed), QUERY_BLOCK):
+            block = order[start:start+QUERY_BLOCK]
+            dist[block] = 1.0 - self.query_block(packed[block], k)
+
+        return dist
+
+
+class ApplicabilityDomain:
+    '''
+        Applicability domain of a model, built on the preprocessed
+        training series and saved in the model directory
+
+        ...
+
+        Attributes
+        ----------
+
+        param : Parameters
+            model parameters
+        index : FingerprintIndex or sklearn.neighbors.NearestNeighbors
+            nearest neighbour index of the training series, if any
+        center : numpy.ndarray
+            mean of the training series, used to compute leverages
+        hat : numpy.ndarray
+            pseudo-inverse of Xc'Xc, used to compute leverages
+        thresholds : dict
+            distance and leverage limits of the AD
+
+        Methods
+        -------
+
+        build(X, scaler)
+            indexes the training series and computes the thresholds
+        score(X)
+            returns the AD scores of the query objects
+        save(), load()
+            saves or loads the AD in the model directory
+    '''
+
+    def __init__(self, param):
+        self.param = param
+        self.index = None
+        self.center = None
+        self.hat = None
+        self.nobj = None
+        self.metric = None
+        self.thresholds = {}
+        self.neighbours, self.percentile, self.sample_size = ad_settings(param)
+
+    def build(self, X, scaler=None, chunk=incremental.CHUNK_SIZE):
+        ''' indexes the training series X. In incremental mode X is read in
+        chunks and transformed with scaler '''
+
+        nobj, nvarx = X.shape
+        if nobj < 2:
+            return False, 'Not enough objects to define the applicability domain'
+
+        self.neighbours = min(self.neighbours, nobj-1)
+        self.nobj = nobj
+
+        thresholds = binary_thresholds(X, scaler, chunk)
+        if thresholds is not None:
+            self.metric = 'tanimoto'
+            self.index = FingerprintIndex(X, thresholds, scaler, chunk)
+        else:
+            self.metric = 'euclidean'
+
+            # in incremental mode the index would hold the whole series
+            if scaler is None:
+                algorithm = 'kd_tree' if nvarx <= KDTREE_MAX_VARS else 'brute'
+                self.index = NearestNeighbors(algorithm=algorithm)
+                self.index.fit(np.asarray(X, dtype=np.float64))
+
+            # the leverage is only computed for a few continuous variables
+            if nvarx <= LEVERAGE_MAX_VARS:
+                self.center = np.zeros(nvarx)
+                for rows in incremental.chunk_slices(nobj, chunk):
+                    self.center += incremental.get_chunk(X, rows, scaler).sum(axis=0)
+                self.center /= nobj
+
+                XtX = np.zeros((nvarx, nvarx))
+                for rows in incremental.chunk_slices(nobj, chunk):
+                    Xc = incremental.get_chunk(X, rows, scaler) - self.center
+                    XtX += Xc.T @ Xc
+                self.hat = np.linalg.pinv(XtX)
+                self.thresholds['leverage'] = 3.0 * (nvarx+1) / nobj
+
+        if self.index is None and self.hat is None:
+            return False, ('The applicability domain is not computed in incremental '
+                           f'mode for more than {LEVERAGE_MAX_VARS} continuous variables')
+
+        results = []
+        results.append(('AD_metric', 'applicability domain distance metric', self.metric))
+
+        # the distance threshold is estimated on a random sample of the
+        # training series, excluding every object from its own neighbours
+        if self.index is not None:
+            random_state = np.random.RandomState(46)
+            sample = np.arange(nobj)
+            if nobj > self.sample_size:
+                sample = np.sort(random_state.choice(nobj, self.sample_size, replace=False))
+
+            dist = self.query(incremental.get_chunk(X, sample, scaler),
+                              self.neighbours+1)
+            self.thresholds['distance'] = np.percentile(dist[:, 1:].mean(axis=1),
+                                                        self.percentile)
+
+            results.append(('AD_neighbours', 'applicability domain neighbours', self.neighbours))
+            results.append(('AD_distance_threshold', 'applicability domain distance threshold',
+                            float(self.thresholds['distance'])))
+
+        if 'leverage' in self.thresholds:
+            results.append(('AD_leverage_threshold', 'applicability domain leverage threshold',
+                            self.thresholds['leverage']))
+
+        return True, results
+
+    def query(self, X, k):
+        ''' distances of the objects in X to their k nearest training
+        objects, sorted in ascending order '''
+
+        if self.metric == 'tanimoto':
+            return self.index.query(X, k)
+
+        dist, _ = self.index.kneighbors(np.asarray(X, dtype=np.float64), n_neighbors=k)
+        return dist
+
+    def score(self, X):
+        ''' returns a dictionary with the mean distance to the nearest
+        training objects, the leverage and a boolean indicating if each
+        object in X is inside the applicability domain '''
+
+        X = np.asarray(X)
+        scores = {}
+        inside = np.ones(X.shape[0], dtype=bool)
+
+        if self.index is not None:
+            scores['distance'] = self.query(X, self.neighbours).mean(axis=1)
+            inside &= scores['distance'] <= self.thresholds['distance']
+
+        if self.hat is not None:
+            Xd = X.astype(np.float64) - self.center
+            scores['leverage'] = 1.0 / self.nobj + np.einsum('ij,jk,ik->i', Xd, self.hat, Xd)
+            inside &= scores['leverage'] <= self.thresholds['leverage']
+
+        scores['inside'] = inside
+        return scores
+
+    def save(self):
+        ''' saves the AD in the model directory '''
+
+        ad_pkl = os.path.join(self.param.getVal('model_path'), AD_FILE)
+
+        ad = {'metric': self.metric,
+              'index': self.index,
+              'center': self.center,
+              'hat': self.hat,
+              'nobj': self.nobj,
+              'neighbours': self.neighbours,
+              'thresholds': self.thresholds,
+              'version': 2}
+
+        with open(ad_pkl, 'wb') as handle:
+            pickle.dump(ad, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+        LOG.debug(f'Applicability domain saved as: {ad_pkl}')
+
+    def load(self):
+        ''' loads the AD saved in the model directory. Returns False for
+        models built without AD '''
+
+        ad_pkl = os.path.join(self.param.getVal('model_path'), AD_FILE)
+        if not os.path.isfile(ad_pkl):
+            return False
+
+        with open(ad_pkl, 'rb') as handle:
+            ad = pickle.load(handle)
+
+        if ad['version'] != 2:
+            raise Exception('Incompatible applicability domain version')
+
+        self.metric = ad['metric']
+        self.index = ad['index']
+        self.center = ad['center']
+        self.hat = ad['hat']
+        self.nobj = ad['nobj']
+        self.neighbours = ad['neighbours']
+        self.thresholds = ad['thresholds']
+
+        return True
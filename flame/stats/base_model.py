@@ -25,6 +25,8 @@ from flame.stats.imbalance import *
 from flame.stats.model_validation import *
 from flame.stats.scale import center, scale
 from flame.stats.feature_selection import *
+from flame.stats import incremental
+from flame.stats import metrics
 import pickle
 import numpy as np
 import os
@@ -146,6 +148,10 @@ class BaseEstimator:
         if conveyor != None:
             self.conveyor = conveyor
 
+        # in incremental mode X is not scaled in advance and the 
+        # scaler is applied to every chunk of objects
+        self.scaler = None
+
         if X is None:
             return
 
@@ -210,17 +216,11 @@ class BaseEstimator:
             raise e
 
         Y_pred = np.asarray(Y_pred)
-        # Add the n validation interval means
-        interval_mean = np.mean(np.abs((Y_pred[:, 0]) - 
-                        (Y_pred[:, 1])))
-        # Get boolean mask of instances
-        #  within the applicability domain.
-        inside_interval = ((Y_pred[:, 0].reshape(1, -1)
-                                < Y) & 
-                                (Y_pred[:, 1].reshape(1, -1) 
-                                > Y)).reshape(1, -1)
-        # Compute the accuracy (number of instances within the AD).
-        accuracy = np.sum(inside_interval/len(Y))
+        # Add the n validation interval means and the accuracy (fraction
+        # of instances within the prediction interval)
+        quality = metrics.conformal_quantitative(Y, Y_pred[:, 0], Y_pred[:, 1])
+        interval_mean = quality['Conformal_mean_interval']
+        accuracy = quality['Conformal_accuracy']
 
         # Cut into two decimals.
         self.conformal_interval_medians = (np.mean(Y_pred, axis=1))
@@ -254,17 +254,6 @@ class BaseEstimator:
         X = self.X.copy()
         Y = self.Y.copy()
 
-        # Total number of class 0 correct predictions.
-        c0_correct_all = 0
-        # Total number of class 0 incorrect predictions.
-        c0_incorrect_all = 0
-        # Total number of class 1 correct predictions.
-        c1_correct_all = 0
-        # Total number of class 1 incorrect predictions
-        c1_incorrect_all = 0
-        # Total number of instances out of the applicability domain.
-        not_predicted_all = 0
-
         info = []
 
         kf = KFold(n_splits=5, shuffle=True, random_state=46)
@@ -289,32 +278,18 @@ class BaseEstimator:
                 # Assign the prediction the correct index. 
                 for index, el in enumerate(test_index):
                     Y_pred[el] = prediction[index]
-            # Iterate over the prediction and check the result
-            for i in range(len(Y_pred)):
-                real = float(Y[i])
-                predicted = Y_pred[i]
-                if predicted[0] != predicted[1]:
-                    if real == 0 and predicted[0] == True:
-                        c0_correct_all += 1
-                    if real == 0 and predicted[1] == True:
-                        c0_incorrect_all += 1
-                    if real == 1 and predicted[1] == True:
-                        c1_correct_all += 1
-                    if real == 1 and predicted[0] == True:
-                        c1_incorrect_all += 1
-                else:
-                    not_predicted_all += 1
 
         except Exception as e:
             LOG.error(f'Qualitative conformal validation'
                         f' failed with exception: {e}')
             raise e
-        # Get the mean confusion matrix.
-        self.TN = c0_correct_all
-        self.FP = c0_incorrect_all
-        self.TP = c1_correct_all
-        self.FN = c1_incorrect_all
-        not_predicted_all = not_predicted_all
+
+        # Get the confusion matrix of the instances assigned to a single class
+        quality = metrics.conformal_qualitative(Y, np.asarray(Y_pred, dtype=bool))
+        self.TN = int(quality['TN'])
+        self.FP = int(quality['FP'])
+        self.TP = int(quality['TP'])
+        self.FN = int(quality['FN'])
 
         info.append(('TP', 'True positives in cross-validation', self.TP))
         info.append(('TN', 'True negatives in cross-validation', self.TN))
@@ -322,27 +297,9 @@ class BaseEstimator:
         info.append(('FN', 'False negatives in cross-validation', self.FN))
         
         # Compute sensitivity, specificity and MCC
-        try:
-            self.sensitivity = (self.TP / (self.TP + self.FN))
-        except Exception as e:
-            LOG.error(f'Failed to compute sensibility with'
-                        f'exception {e}')
-            self.sensitivity = '-'
-        try:
-            self.specificity = (self.TN / (self.TN + self.FP))
-        except Exception as e:
-            LOG.error(f'Failed to compute specificity with'
-                        f'exception {e}')
-            self.specificity = '-'
-        try:
-            # Compute Matthews Correlation Coefficient
-            self.mcc = (((self.TP * self.TN) - (self.FP * self.FN)) /
-                        np.sqrt((self.TP + self.FP) * (self.TP + self.FN) *
-                         (self.TN + self.FP) * (self.TN + self.FN)))
-        except Exception as e:
-            LOG.error(f'Failed to compute Mathews Correlation Coefficient'
-                        f'exception {e}')
-            self.mcc = '-'
+        self.sensitivity = float(quality['Sensitivity'])
+        self.specificity = float(quality['Specificity'])
+        self.mcc = float(quality['MCC'])
 
         info.append(
             ('Sensitivity', 'Sensitivity in cross-validation', 
@@ -353,26 +310,11 @@ class BaseEstimator:
         info.append(
             ('MCC', 'Matthews Correlation Coefficient in cross-validation',
                  self.mcc))
-        try:
-            # Compute coverage (% of compounds inside the applicability domain)
-            self.conformal_coverage = (self.TN + self.FP + self.TP +
-                                        self.FN) / ((self.TN + self.FP +
-                                        self.TP + self.FN) +
-                                        not_predicted_all)
-        except Exception as e:
-            LOG.error(f'Failed to compute conformal coverage with'
-                        f'exception {e}')
-            self.conformal_coverage = '-'
-        
-        try:
-            # Compute accuracy (% of correct predictions)
-            self.conformal_accuracy = (float(self.TN + self.TP) /
-                                        float(self.FP + self.FN + 
-                                            self.TN + self.TP))
-        except Exception as e:
-            LOG.error(f'Failed to compute conformal accuracy with'
-                        f'exception {e}')
-            self.conformal_accuracy = '-'
+
+        # Coverage (% of compounds inside the applicability domain) and
+        # accuracy (% of correct predictions)
+        self.conformal_coverage = float(quality['Conformal_coverage'])
+        self.conformal_accuracy = float(quality['Conformal_accuracy'])
                                                     
         info.append(
             ('Conformal_coverage', 'Conformal coverage',
@@ -395,22 +337,33 @@ class BaseEstimator:
 
         # Get predicted Y
         Yp = self.estimator.predict(X)
-        # Compute  mean of predicted Y
-        Ym = np.mean(Y)
+
+        # Get cross-validated Y
+        try:
+            y_pred = cross_val_predict(copy.copy(self.estimator),
+                            copy.copy(X), copy.copy(Y),
+                                cv=self.cv,
+                                    n_jobs=1)
+        except Exception as e:
+            LOG.error(f'Error cross-validating the estimator'
+                        f' with exception {e}')
+            raise e
+
+        return self.quantitativeMetrics(Y, Yp, y_pred)
+
+    def quantitativeMetrics(self, Y, Yp, y_pred):
+        ''' computes the quality metrics of quantitative models from the
+        fitted (Yp) and the cross-validation (y_pred) predictions '''
+
         info = []
 
         # Compute Goodness of the fit metric (adjusted Y)
         try:
-            SSY0 = np.sum(np.square(Ym-Y))
-            SSY = np.sum(np.square(Yp-Y))
-
-            self.scoringR = np.mean(
-                mean_squared_error(Y, Yp)) 
-            self.SDEC = np.sqrt(SSY/self.nobj)
-            if SSY0 == 0.0:
-                self.R2 = 0.0
-            else:
-                self.R2 = 1.00 - (SSY/SSY0)
+            fit = metrics.quantitative(Y, Yp)
+
+            self.scoringR = float(fit['scoringP'])
+            self.SDEC = float(fit['SDEP'])
+            self.R2 = float(fit['Q2'])
 
             info.append(('scoringR', 'Scoring P', self.scoringR))
             info.append(('R2', 'Determination coefficient', self.R2))
@@ -425,19 +378,11 @@ class BaseEstimator:
 
         # Compute Cross-validation quality metrics
         try:
-            # Get predicted Y
-            y_pred = cross_val_predict(copy.copy(self.estimator),
-                            copy.copy(X), copy.copy(Y),
-                                cv=self.cv,
-                                    n_jobs=1)
-            SSY0_out = np.sum(np.square(Ym - Y))
-            SSY_out = np.sum(np.square(Y - y_pred))
-            self.scoringP = mean_squared_error(Y, y_pred)
-            self.SDEP = np.sqrt(SSY_out/(self.nobj))
-            if SSY0_out == 0.0:
-                self.Q2 = 0.0
-            else:
-                self.Q2 = 1.00 - (SSY_out/SSY0_out)
+            pred = metrics.quantitative(Y, y_pred)
+
+            self.scoringP = float(pred['scoringP'])
+            self.SDEP = float(pred['SDEP'])
+            self.Q2 = float(pred['Q2'])
 
             info.append(('scoringP', 'Scoring P', self.scoringP))
             info.append(
@@ -454,7 +399,7 @@ class BaseEstimator:
             LOG.debug(f'Squared-Q calculated: {self.scoringP}')
 
         except Exception as e:
-            LOG.error(f'Error cross-validating the estimator'
+            LOG.error(f'Error computing cross-validation quality metrics'
                         f' with exception {e}')
             raise e
               
@@ -478,16 +423,34 @@ class BaseEstimator:
             raise Exception('Lenght of experimental and predicted Y'
                             'do not match')
 
+        # Get cross-validated Y 
+        try:
+            y_pred = cross_val_predict(self.estimator, X, Y,
+                    cv=self.cv,
+                             n_jobs=-1)
+        except Exception as e:
+            LOG.error(f'Cross-validation failed with exception' 
+                        f'exception {e}')
+            raise e
+
+        return self.qualitativeMetrics(Y, Yp, y_pred)
+
+    def qualitativeMetrics(self, Y, Yp, y_pred):
+        ''' computes the quality metrics of qualitative models from the
+        fitted (Yp) and the cross-validation (y_pred) predictions '''
+
         info = []
 
         # Get confusion matrix for predicted Y
         try:
-            self.TNpred, self.FPpred,\
-            self.FNpred, self.TPpred = confusion_matrix(Y, Yp,
-                                                     labels=[0, 1]).ravel()
-            self.sensitivityPred = (self.TPpred / (self.TPpred + self.FNpred))
-            self.specificityPred = (self.TNpred / (self.TNpred + self.FPpred))
-            self.mccp = mcc(Y, Yp)
+            fit = metrics.qualitative(Y, Yp)
+            self.TPpred = int(fit['TP'])
+            self.TNpred = int(fit['TN'])
+            self.FPpred = int(fit['FP'])
+            self.FNpred = int(fit['FN'])
+            self.sensitivityPred = float(fit['Sensitivity'])
+            self.specificityPred = float(fit['Specificity'])
+            self.mccp = float(fit['MCC'])
 
             info.append(('TPpred', 'True positives', self.TPpred))
             info.append(('TNpred', 'True negatives', self.TNpred))
@@ -506,45 +469,21 @@ class BaseEstimator:
                 f'with exception {e}')
             raise e
 
-        # Get cross-validated Y 
+        # Get confusion matrix and metrics of the cross-validation
         try:
-            y_pred = cross_val_predict(self.estimator, X, Y,
-                    cv=self.cv,
-                             n_jobs=-1)
-        except Exception as e:
-            LOG.error(f'Cross-validation failed with exception' 
-                        f'exception {e}')
-            raise e
-        # Get confusion matrix
-        try:
-            self.TN, self.FP, self.FN, self.TP = confusion_matrix(
-                Y, y_pred, labels=[0, 1]).ravel()
+            pred = metrics.qualitative(Y, y_pred)
         except Exception as e:
             LOG.error(f'Failed to compute confusion matrix with'
                         f'exception {e}')
             raise e
-        try:
-            self.sensitivity = (self.TP / (self.TP + self.FN))
-        except Exception as e:
-            LOG.error(f'Failed to compute sensibility with'
-                        f'exception {e}')
-            self.sensitivity = '-'
-        try:
-            self.specificity = (self.TN / (self.TN + self.FP))
-        except Exception as e:
-            LOG.error(f'Failed to compute specificity with'
-                        f'exception {e}')
-            self.specificity = '-'
-        try:
-            # Compute Matthews Correlation Coefficient
-            self.mcc = (((self.TP * self.TN) - (self.FP * self.FN)) /
-                        np.sqrt((self.TP + self.FP) * (self.TP + self.FN) *
-                         (self.TN + self.FP) * (self.TN + self.FN)))
-        except Exception as e:
-            LOG.error(f'Failed to compute Mathews Correlation Coefficient'
-                        f'exception {e}')
-            self.mcc = '-'
 
+        self.TP = int(pred['TP'])
+        self.TN = int(pred['TN'])
+        self.FP = int(pred['FP'])
+        self.FN = int(pred['FN'])
+        self.sensitivity = float(pred['Sensitivity'])
+        self.specificity = float(pred['Specificity'])
+        self.mcc = float(pred['MCC'])
 
         info.append(('TP', 'True positives in cross-validation',
             self.TP))
@@ -587,6 +526,9 @@ class BaseEstimator:
         if self.X is None or self.estimator is None:
             return False, 'no estimator'
 
+        if self.param.getVal('incremental'):
+            return self.incrementalValidation()
+
         if not self.param.getVal('conformal'):
             if self.param.getVal('quantitative'):
                 success, results = self.quantitativeValidation()
@@ -600,6 +542,49 @@ class BaseEstimator:
 
         return success, results
 
+    def incrementalFit(self, epochs=None):
+        ''' fits self.estimator with partial_fit, reading self.X in chunks
+        and scaling every chunk with self.scaler. The number of epochs 
+        defined in incremental_settings can be overriden for estimators
+        which must see every object only once '''
+
+        self.chunk, self.epochs = incremental.incremental_settings(self.param)
+        if epochs is not None:
+            self.epochs = epochs
+
+        self.classes = None
+        if not self.param.getVal('quantitative'):
+            self.classes = np.unique(self.Y)
+
+        LOG.info(f'Fitting {self.nobj} objects in chunks of {self.chunk}, '
+                 f'{self.epochs} epochs')
+
+        incremental.fit_estimator(self.estimator, self.X, self.Y, self.chunk,
+                                  self.scaler, classes=self.classes, 
+                                  epochs=self.epochs)
+
+    def incrementalValidation(self):
+        ''' performs validation for models fitted with incrementalFit, 
+        obtaining the fitted and cross-validation predictions in chunks '''
+
+        try:
+            Yp = incremental.predict_chunks(self.estimator, self.X, 
+                                            self.chunk, self.scaler)
+
+            y_pred = incremental.cross_val_predict_chunks(
+                                            self.estimator, self.X, self.Y, 
+                                            self.cv, self.chunk, self.scaler,
+                                            self.classes, self.epochs)
+        except Exception as e:
+            LOG.error(f'Error validating the estimator incrementally'
+                        f' with exception {e}')
+            return False, f'Error validating the estimator incrementally with exception {e}'
+
+        if self.param.getVal('quantitative'):
+            return self.quantitativeMetrics(self.Y, Yp, y_pred)
+
+        return self.qualitativeMetrics(self.Y, Yp, y_pred)
+
     def optimize(self, X, Y, estimator, tune_parameters):
         ''' optimizes a model using a grid search over a 
         range of values for diverse parameters'''
@@ -666,23 +651,86 @@ class BaseEstimator:
                         'result', 'objs',
                         'Results of the prediction', 'main')
 
+    def conformalSignificances(self):
+        ''' returns the list of significance levels for which conformal
+        predictions must be reported. The first element is always the
+        main significance (conformalSignificance) '''
+
+        significance = self.param.getVal('conformalSignificance')
+        levels = [significance]
+
+        extra_levels = self.param.getVal('conformalSignificanceList')
+        if extra_levels is not None:
+            for s in extra_levels:
+                if s not in levels:
+                    levels.append(s)
+
+        return levels
+
+    def conformalIntervals(self, Xb, significances):
+        ''' computes the conformal prediction intervals of a collection of query
+        objects for a list of significance levels. The underlying and normalizing
+        models of every ICP are run only once and the intervals for each significance
+        are derived from the stored calibration nonconformity scores.
+
+        Returns a numpy array of shape [nobj, 2, len(significances)] '''
+
+        nobj = Xb.shape[0]
+        nsig = len(significances)
+        predictors = self.estimator.predictors
+
+        intervals = np.zeros((nobj, 2, nsig, len(predictors)))
+        for j, icp in enumerate(predictors):
+            nc_function = icp.nc_function
+
+            prediction = nc_function.model.predict(Xb)
+            if nc_function.normalizer is not None:
+                norm = nc_function.normalizer.score(Xb) + nc_function.beta
+            else:
+                norm = np.ones(nobj)
+
+            cal_scores = icp.cal_scores[0]
+            for i, significance in enumerate(significances):
+                err_dist = nc_function.err_func.apply_inverse(cal_scores, significance)
+                intervals[:, 0, i, j] = prediction - err_dist[0] * norm
+                intervals[:, 1, i, j] = prediction + err_dist[1] * norm
+
+        # aggregate the ICP intervals exactly as AggregatedCp does
+        return np.stack([self.estimator.agg_func(intervals[:, :, i, :])
+                         for i in range(nsig)], axis=2)
+
     def conformalProject(self, Xb):
         ''' projects a collection of query objects in a conformal model,
-         for obtaining predictions '''
+         for obtaining predictions. 
+         
+         Intervals (quantitative) and p-values (qualitative) are obtained in a single
+         pass and used to derive the results for the main significance and for any
+         additional significance listed in conformalSignificanceList '''
 
         if not 'nonconformist' in str(type(self.estimator)):
             self.conveyor.setError('Inconsistence error: non-conformal classifier found. Rebuild the model')
             return
 
-        prediction = self.estimator.predict(
-            Xb, significance=self.param.getVal('conformalSignificance'))
+        significances = self.conformalSignificances()
+        multiple = len(significances) > 1
+
+        if multiple:
+            self.conveyor.addVal(significances, 'significance_levels',
+                    'Significance levels', 'method', 'single',
+                    'Significance levels of the conformal predictions')
 
         if self.param.getVal('quantitative'):
+            intervals = self.conformalIntervals(Xb, significances)
+
+            prediction = intervals[:, :, 0]
             Yp = np.mean(prediction, axis=1)
             
             lower_limit = prediction[:, 0]
             upper_limit = prediction[:, 1]
 
+            lower_limits = intervals[:, 0, :]
+            upper_limits = intervals[:, 1, :]
+
             # if conveyor contains experimental values for any of the objects replace the
             # predictions with the experimental results
             exp = self.conveyor.getVal('experim')
@@ -694,6 +742,8 @@ class BaseEstimator:
                             Yp[i] = exp[i]
                             lower_limit[i] = exp[i]
                             upper_limit[i] = exp[i]
+                            lower_limits[i, :] = exp[i]
+                            upper_limits[i, :] = exp[i]
                         # if exp is nan, substitute it with a number which can be recognized
                         # to facilitate handling and do not replace Yp
                         else:
@@ -710,7 +760,32 @@ class BaseEstimator:
             self.conveyor.addVal(upper_limit, 'upper_limit',
                              'Upper limit', 'confidence', 'objs',
                               'Upper limit of the conformal prediction')
+
+            if multiple:
+                self.conveyor.addVal(lower_limits, 'lower_limits',
+                             'Lower limits', 'decoration', 'objs',
+                              'Lower limits of the conformal prediction for '
+                              'every significance level')
+
+                self.conveyor.addVal(upper_limits, 'upper_limits',
+                             'Upper limits', 'decoration', 'objs',
+                              'Upper limits of the conformal prediction for '
+                              'every significance level')
         else:
+            # p-values are computed only once. The class assignment for any
+            # significance is obtained comparing them with the significance,
+            # as done by nonconformist AggregatedCp
+            p_values = self.estimator.predict(Xb, significance=None)
+
+            for i in range(len(p_values[0])):
+                self.conveyor.addVal(p_values[:, i], 
+                                'p' + str(i), 
+                                'p-value class ' + str(i),
+                                'decoration', 'objs', 
+                                'Conformal p-value for class ' + str(i))
+
+            prediction = p_values >= significances[0]
+
             # Returns a dictionary with class
             # predictions
             # / c0 / c1 
@@ -726,6 +801,16 @@ class BaseEstimator:
                                 'confidence', 'objs', 
                                 'Conformal class assignment')
 
+            if multiple:
+                for i in range(len(p_values[0])):
+                    class_sets = np.stack([p_values[:, i] >= s for s in significances],
+                                          axis=1)
+                    self.conveyor.addVal(class_sets, 
+                                'c' + str(i) + '_sets', 
+                                'Class ' + str(i) + ' sets',
+                                'decoration', 'objs', 
+                                'Conformal class assignment for every significance level')
+
             # the use of np.zeros defaults to 0 (negative)
 
             nobj, nvary = np.shape(prediction)
@@ -21,20 +21,39 @@
 # along with Flame.  If not, see <http://www.gnu.org/licenses/>.
 
 import numpy as np
-import copy
 import yaml
 import os
-from sklearn.metrics import mean_squared_error
-from sklearn.metrics import confusion_matrix
-from sklearn.metrics import matthews_corrcoef
 from scipy import stats
 from flame.stats.base_model import BaseEstimator
+from flame.stats import metrics
 from flame.util import get_logger
 
 LOG = get_logger(__name__)
 SIMULATION_SIZE = 500
 CONFIDENCE = 0.95
 
+# max number of simulated values processed at once by matrix
+SIMULATION_CHUNK = 2**22
+
+
+def CI_weights(CI_vals, z):
+    ''' computes the weights of the predictions of every model from the
+    width of their CI (pairs of columns lower, upper in CI_vals), assuming
+    a normal distribution '''
+
+    r = CI_vals[:, 1::2] - CI_vals[:, 0::2]
+    sd = r/(z*2)
+    return 1.0/np.square(sd)
+
+
+def first_true(mask):
+    ''' returns, for every row of a boolean matrix, the index of the first
+    True element or the index of the last column if there is none '''
+
+    k = np.argmax(mask, axis=1)
+    k[~np.any(mask, axis=1)] = mask.shape[1] - 1
+    return k
+
 class Combo (BaseEstimator):
     """
        Generic class for combining results of multiple models
@@ -88,21 +107,13 @@ class Combo (BaseEstimator):
         info = []
 
         if self.param.getVal('quantitative'):
-            # Compute  mean of predicted Y
-            Ym = np.mean(Y)
-
             # Compute Goodness of the fit metric (adjusted Y)
             try:
-                SSY0 = np.sum(np.square(Ym-Y))
-                SSY = np.sum(np.square(Yp-Y))
-
-                self.scoringR = np.mean(
-                    mean_squared_error(Y, Yp)) 
-                self.SDEC = np.sqrt(SSY/self.nobj)
-                if SSY0 == 0.00:
-                    self.R2 = 0.0
-                else:
-                    self.R2 = 1.00 - (SSY/SSY0)
+                fit = metrics.quantitative(Y, Yp)
+
+                self.scoringR = float(fit['scoringP'])
+                self.SDEC = float(fit['SDEP'])
+                self.R2 = float(fit['Q2'])
 
                 info.append(('scoringR', 'Scoring P', self.scoringR))
                 info.append(('R2', 'Determination coefficient', self.R2))
@@ -116,17 +127,15 @@ class Combo (BaseEstimator):
         else:
             # Get confusion matrix for predicted Y
             try:
-                self.TNpred, self.FPpred,self.FNpred, self.TPpred = confusion_matrix(Y, Yp, labels=[0, 1]).ravel()
-
-                self.sensitivityPred = 0.000
-                if (self.TPpred + self.FNpred) > 0:
-                    self.sensitivityPred = (self.TPpred / (self.TPpred + self.FNpred))
-                
-                self.specificityPred = 0.000
-                if (self.TNpred + self.FPpred) > 0:
-                    self.specificityPred = (self.TNpred / (self.TNpred + self.FPpred))
+                fit = metrics.qualitative(Y, Yp)
 
-                self.mccp = matthews_corrcoef(Y, Yp)
+                self.TPpred = int(fit['TP'])
+                self.TNpred = int(fit['TN'])
+                self.FPpred = int(fit['FP'])
+                self.FNpred = int(fit['FN'])
+                self.sensitivityPred = float(fit['Sensitivity'])
+                self.specificityPred = float(fit['Specificity'])
+                self.mccp = float(fit['MCC'])
 
                 # TODO: it is not too clear if the results of validation in ensemble models is internal or
                 # external. Both sets are added to avoid problems with the GUI but this requires futher
@@ -186,72 +195,56 @@ class median (Combo):
         if  CI_names is not None and len(CI_names)==(2 * self.nvarx):
 
             # get values
-            CI_vals = self.conveyor.getVal('ensemble_confidence')
+            CI_vals = np.asarray(self.conveyor.getVal('ensemble_confidence'),
+                                 dtype=np.float64)
 
             # assume that the CI represent 95% CI and normal distribution        
             z = 1.96 
     
-            # compute weighted average 
-            w = np.zeros(self.nvarx, dtype = np.float64 )
-            xmedian = []
-            cilow = []
-            ciupp = []
-
-            for j in range (self.nobj):
-                pred = []
-                for i in range (self.nvarx):
-                    r = CI_vals[j,i*2+1] - CI_vals[j,i*2]
-                    sd = r/(z*2)
-                    w[i] = 1.0/np.square(sd)
-
-                    # create a tupla with prediction ID, value and weight
-                    pred.append ( (i, X[j,i], w[i]) )
-                    
-                wcenter = np.sum(w)/2.00
-
-                # sort pred
-                sorted_pred = sorted(pred, key=lambda tup: tup[1])
-
-                # fpr even number of predictions
-                if self.nvarx % 2 == 0:
-
-                    if self.nvarx == 2:
-                        selectedA = 0
-                        selectedB = 1
-                    else:
-                        acc_w = 0.00
-                        selectedA = sorted_pred[0][0]
-                        for i,ipred in enumerate(sorted_pred):
-                            selectedB = ipred[0]
-                            # accumulate weights
-                            acc_w += ipred[2]
-                            if acc_w > wcenter:
-                                break
-                        selectedA = sorted_pred[i-1][0]
-
-                    print ('even',j, selectedA, selectedB)
-
-                    xmedian.append(np.mean((X[j,selectedA], X[j,selectedB])))
-                    cilow.append(np.mean((CI_vals[j,selectedA*2], CI_vals[j,selectedB*2])))
-                    ciupp.append(np.mean((CI_vals[j,(selectedA*2)+1], CI_vals[j,(selectedB*2)+1])))
-
-                # for odd number of predictions
-                else:
-                    acc_w = 0.00
-                    for ipred in sorted_pred:
-                        selected = ipred[0]    
-                        # accumulate weights
-                        acc_w += ipred[2]
-                        if acc_w >= wcenter:
-                            break
+            # weights of every prediction
+            w = CI_weights(CI_vals, z)
+            wcenter = np.sum(w, axis=1)/2.00
+
+            # sort the predictions of every object and accumulate the weights
+            # (stable sort, ties keep the order of the models)
+            order = np.argsort(X, axis=1, kind='stable')
 
-                    print ('odd',j, selected)
+            # NaN predictions are not sorted last by sorted(), which defines
+            # the median of these objects
+            for j in np.flatnonzero(np.isnan(X).any(axis=1)):
+                order[j] = sorted(range(self.nvarx), key=lambda i: X[j, i])
 
-                    xmedian.append(X[j,selected])
-                    cilow.append(CI_vals[j,selected*2])
-                    ciupp.append(CI_vals[j,(selected*2)+1])
+            acc_w = np.cumsum(np.take_along_axis(w, order, axis=1), axis=1)
 
-            self.conveyor.addVal(np.array(cilow), 
+            rows = np.arange(self.nobj)
+
+            # fpr even number of predictions
+            if self.nvarx % 2 == 0:
+
+                if self.nvarx == 2:
+                    selectedA = np.zeros(self.nobj, dtype=int)
+                    selectedB = np.ones(self.nobj, dtype=int)
+                else:
+                    # first prediction where the accumulated weight exceeds
+                    # the center (or the last one) and the previous one
+                    k = first_true(acc_w > wcenter[:, None])
+                    selectedB = order[rows, k]
+                    selectedA = order[rows, k-1]
+
+                xmedian = (X[rows, selectedA] + X[rows, selectedB]) / 2
+                cilow = (CI_vals[rows, selectedA*2] + CI_vals[rows, selectedB*2]) / 2
+                ciupp = (CI_vals[rows, (selectedA*2)+1] + CI_vals[rows, (selectedB*2)+1]) / 2
+
+            # for odd number of predictions
+            else:
+                k = first_true(acc_w >= wcenter[:, None])
+                selected = order[rows, k]
+
+                xmedian = X[rows, selected]
+                cilow = CI_vals[rows, selected*2]
+                ciupp = CI_vals[rows, (selected*2)+1]
+
+            self.conveyor.addVal(cilow, 
                         'lower_limit', 
                         'Lower limit', 
                         'confidence',
@@ -259,7 +252,7 @@ class median (Combo):
                         'Lower limit of the conformal prediction'
                     )
 
-            self.conveyor.addVal(np.array(ciupp), 
+            self.conveyor.addVal(ciupp, 
                         'upper_limit', 
                         'Upper limit', 
                         'confidence',
@@ -267,9 +260,7 @@ class median (Combo):
                         'Upper limit of the conformal prediction'
                     )
 
-            #print (xmedian, cilow, ciupp)
-
-            return np.array(xmedian)
+            return xmedian
 
         else:
 
@@ -299,35 +290,27 @@ class mean (Combo):
             #
 
             # get values
-            CI_vals = self.conveyor.getVal('ensemble_confidence')
+            CI_vals = np.asarray(self.conveyor.getVal('ensemble_confidence'),
+                                 dtype=np.float64)
 
             # assume that the CI represent 95% CI and normal distribution        
             z = 1.96 
     
             # compute weighted average 
-            xmean = []
-            cilow = []
-            ciupp = []
-
-            for j in range (self.nobj):
-                w = np.zeros(self.nvarx, dtype = np.float64 )
-                for i in range (self.nvarx):
-                    r = CI_vals[j,i*2+1] - CI_vals[j,i*2]
-                    sd = r/(z*2)
-                    w[i] = 1.0/np.square(sd)
+            w = CI_weights(CI_vals, z)
 
-                ws = np.sum(w)
-                s = 1.0/np.sqrt(ws)
+            ws = np.sum(w, axis=1)
+            s = 1.0/np.sqrt(ws)
 
-                xm = 0.0
-                for i in range (self.nvarx):
-                    xm += X[j,i]*w[i]
-                xmean.append(xm/ws) 
+            xm = np.zeros(self.nobj, dtype=np.float64)
+            for i in range (self.nvarx):
+                xm += X[:,i]*w[:,i]
+            xmean = xm/ws
 
-                cilow.append(xm-z*s)
-                ciupp.append(xm+z*s)
+            cilow = xmean-z*s
+            ciupp = xmean+z*s
 
-            self.conveyor.addVal(np.array(cilow), 
+            self.conveyor.addVal(cilow, 
                         'lower_limit', 
                         'Lower limit', 
                         'confidence',
@@ -335,7 +318,7 @@ class mean (Combo):
                         'Lower limit of the conformal prediction'
                     )
 
-            self.conveyor.addVal(np.array(ciupp), 
+            self.conveyor.addVal(ciupp, 
                         'upper_limit', 
                         'Upper limit', 
                         'confidence',
@@ -343,7 +326,7 @@ class mean (Combo):
                         'Upper limit of the conformal prediction'
                     )
             
-            return np.array(xmean)
+            return xmean
         else:
             return np.mean (X,1)
 
@@ -377,18 +360,17 @@ class majority (Combo):
         # if all models are conformal, simply add the classes
         # and return 0 if majority is class 0, 1 if majority is class 1
         # and -1 if there is a tie
-        yp = np.zeros(self.nobj, dtype=np.float64)
+        confidence = np.asarray(confidence, dtype=np.float64)
+
         c0 = np.zeros(self.nobj, dtype=np.float64)
         c1 = np.zeros(self.nobj, dtype=np.float64)
+        for j in range(self.nvarx):
+            c0 += confidence[:, j*2]
+            c1 += confidence[:, (j*2)+1]
 
-        for i,iobj in enumerate(confidence):
-            for j in range(self.nvarx):
-                c0[i] += iobj[j*2]
-                c1[i] += iobj[(j*2)+1] 
-            if c1[i] > c0[i]:
-                yp[i] = 1
-            elif c0[i] == c1[i]:
-                yp[i] = -1
+        yp = np.zeros(self.nobj, dtype=np.float64)
+        yp[c1 > c0] = 1
+        yp[c0 == c1] = -1
 
         # add the sum of classes for evaluating the result
         self.conveyor.addVal(c0, 
@@ -424,18 +406,15 @@ class matrix (Combo):
         self.method_name = 'matrix'
 
 
-    def lookup (self, x, vmatrix):
-        """Uses the array x of quantitative values to lookup in the matrix of values vmatrix the
-         corresponding value 
+    def cell_index (self, X):
+        """Transforms the matrix X of quantitative values [nobj, nvarx] into the indexes of the
+         corresponding cells in the deconvoluted monodimensional vmatrix 
          
          The binning of the cells of vmatrix are defined by the following class variables which 
          define, for each matrix dimension: 
           - self.vzero: starting value
           - self.vsize: number of cells
           - self.vstep: width of bins 
-         
-         Once the variables are transformed into vmatrix indexes, a single matrix_index is computed
-         since the n-dimensional vmatrix is stored as a deconvoluted monodimensional array
         """
 
         # transform the values of the vectors into vmatrix indexes
@@ -443,38 +422,49 @@ class matrix (Combo):
         #   values < self.vzero are set to 0
         #   values > self.vzero + self.vsize*self.vstep are set to self.vsize
 
-        index = []
+        matrix_index = np.zeros(X.shape[0], dtype=np.int64)
         for i in range (self.nvarx):
-            cellmax = self.vzero[i]
+            vsize = int(self.vsize[i])
             step = self.vstep[i]
 
+            # upper (or lower) limit of every bin, accumulated as in a
+            # sequential loop to obtain the very same limits
+            edges = np.cumsum(np.concatenate(([self.vzero[i]], np.full(vsize, step))))[1:]
+
             # if values grow, find the first j producing matrix 
             # value bigger than the x 
             if step > 0.0: 
-                for j in range (int(self.vsize[i])):
-                    cellmax += step
-                    if x[i] < cellmax:
-                        break
-                        # if values shrink, find the first j producing matrix 
+                index = np.searchsorted(edges, X[:,i], side='right')
+            # if values shrink, find the first j producing matrix 
             # value lower than the x 
-            else:          
-                for j in range (int(self.vsize[i])):
-                    cellmax += step
-                    if x[i] > cellmax:
-                        break
-            index.append (j)
+            else:
+                index = np.searchsorted(-edges, -X[:,i], side='right')
+
+            # values beyond the last limit are assigned to the last bin
+            index = np.minimum(index, vsize-1)
 
-        # compute the index in the deconvoluted monodimensional vector where
-        # the values of vmatrix are stored
-        matrix_index = 0
-        for i in range(self.nvarx):
-            matrix_index += (index[i]*self.offset[i])
+            # compute the index in the deconvoluted monodimensional vector where
+            # the values of vmatrix are stored
+            matrix_index += index * self.offset[i]
 
-        return vmatrix[matrix_index]
+        return matrix_index
+
+    def lookup (self, x, vmatrix):
+        """Uses the array x of quantitative values to lookup in the matrix of values vmatrix the
+         corresponding value. x can be a single object or a matrix of objects
+        """
+        x = np.asarray(x, dtype=np.float64)
+        if x.ndim == 1:
+            return vmatrix[self.cell_index(x[None,:])[0]]
+
+        return vmatrix[self.cell_index(x)]
 
     def load_data(self):
         ''' read the matrix, stored as a 1D or 2D table of floats, separted by ',' 
             and the metaiformation 
+
+            A binary copy of the matrix (vmatrix.npy) is used as a cache to avoid
+            parsing the text file in every prediction
         '''
         #load input matrix metadata
         mmatrix_path = os.path.join(self.model_path,'mmatrix.yaml')
@@ -483,11 +473,22 @@ class matrix (Combo):
         
         #load input matrix 
         vmatrix_path = os.path.join(self.model_path,'vmatrix.txt')
+        vmatrix_cache = os.path.join(self.model_path,'vmatrix.npy')
+
+        if os.path.isfile(vmatrix_cache) and \
+            os.path.getmtime(vmatrix_cache) >= os.path.getmtime(vmatrix_path):
+            return mmatrix, np.load(vmatrix_cache)
+
         with open(vmatrix_path) as f:
             vmatrix = np.loadtxt(f, delimiter=',')
             if len(np.shape(vmatrix))>1:
                 vmatrix = vmatrix.flatten()
 
+        try:
+            np.save(vmatrix_cache, vmatrix)
+        except Exception as e:
+            LOG.warning(f'unable to save vmatrix cache with exception {e}')
+
         return mmatrix, vmatrix
 
     def preprocess (self, X):
@@ -512,14 +513,11 @@ class matrix (Combo):
         self.nobj, self.nvarx = np.shape(X)
 
         # apply custom modifications to the input values
-        X = self.preprocess (X)
+        X = np.asarray(self.preprocess (X), dtype=np.float64)
 
         # load matrix and matrix metadata        
         mmatrix, vmatrix = self.load_data()
 
-        # this is the array of predicted Y values 
-        yarray = []
-
         # assign metainformation to every variable
         var_names = self.conveyor.getVal('var_nam')
         
@@ -549,13 +547,10 @@ class matrix (Combo):
         # variable value must be multiplied in order to identify
         # the position the linear vector representing 
 
-        self.offset = []
-        for i in range(self.nvarx):
-            ioffset = 1.0
-            for j in range(self.nvarx):
-                if self.vloop[j]<self.vloop[i]:
-                    ioffset*=self.vsize[j]
-            self.offset.append(int(ioffset))
+        vloop = np.array(self.vloop)
+        vsize = np.array(self.vsize, dtype=np.float64)
+        self.offset = np.array([int(np.prod(vsize[vloop < vloop[i]])) 
+                                for i in range(self.nvarx)], dtype=np.int64)
 
         # if all the original methods contain CI run a simulation to compute the CI for the 
         # output values and return the mean, the 5% percentil and 95% percentil of the values obtained 
@@ -563,7 +558,8 @@ class matrix (Combo):
         if  CI_names is not None and len(CI_names)==(2 * self.nvarx):
 
             # get CI values
-            CI_vals = self.conveyor.getVal('ensemble_confidence')
+            CI_vals = np.asarray(self.conveyor.getVal('ensemble_confidence'),
+                                 dtype=np.float64)
 
             # we read the conformal significance from the top model
             # ideally we must read this from every bottom model and store a list of
@@ -576,40 +572,42 @@ class matrix (Combo):
 
             confidence_left  = (1.0 - CONFIDENCE)/2.0
             confidence_right = 1.0 - confidence_left
-            print ("confidences: ", CONFIDENCE, confidence_left, confidence_right)
+            LOG.debug(f'confidences: {CONFIDENCE} {confidence_left} {confidence_right}')
 
             z = stats.norm.ppf (conformal_confidence_right)
+
+            #ci range is the width of the CI
+            cirange = CI_vals[:,1::2] - CI_vals[:,0::2]
+
+            # we asume that the CI were estimated as +/- 1.96 * SE
+            sd = cirange/(z*2)
     
-            cilow = []
-            ciupp = []
-            cimean = []
+            cilow = np.zeros(self.nobj, dtype=np.float64)
+            ciupp = np.zeros(self.nobj, dtype=np.float64)
+            cimean = np.zeros(self.nobj, dtype=np.float64)
 
             # make sure the random numbers are reproducible
             np.random.seed(2324)
 
-            for j in range (self.nobj):
-                ymulti = []
-                for m in range (SIMULATION_SIZE):
-                    x = copy.copy(X[j])
-                    for i in range (self.nvarx):
-                        #ci range is the width of the CI
-                        cirange = CI_vals[j,i*2+1] - CI_vals[j,i*2]
-
-                        # we asume that the CI were estimated as +/- 1.96 * SE
-                        sd = cirange/(z*2)
+            # the objects are simulated in chunks to limit the memory used. The random 
+            # numbers are drawn in the same order (object, simulation, variable) than 
+            # simulating one object at a time
+            chunk = max(1, SIMULATION_CHUNK // (SIMULATION_SIZE * self.nvarx))
+            for start in range (0, self.nobj, chunk):
+                end = min(start+chunk, self.nobj)
 
-                        # now we add normal random noise, with mean 0 and SD = sd
-                        x[i]+=np.random.normal(0.0,sd)
+                # now we add normal random noise, with mean 0 and SD = sd
+                noise = np.random.normal(0.0, sd[start:end,None,:], 
+                                size=(end-start, SIMULATION_SIZE, self.nvarx))
+                x = X[start:end,None,:] + noise
 
-                    ymulti.append (self.lookup (x,vmatrix))
-
-                ymulti_array = np.array(ymulti)
+                ymulti_array = self.lookup(x.reshape(-1, self.nvarx), vmatrix)
+                ymulti_array = ymulti_array.reshape(end-start, SIMULATION_SIZE)
 
                 # obtain percentiles to estimate the left and right part of the CI 
-                cilow.append (np.percentile(ymulti_array,confidence_left*100 ,interpolation='linear'))
-                ciupp.append (np.percentile(ymulti_array,confidence_right*100 ,interpolation='linear'))
-                cimean.append(np.percentile(ymulti_array,50,interpolation='linear'))
-                # cimean.append(np.median(ymulti_array))
+                cilow[start:end] = np.percentile(ymulti_array, confidence_left*100, axis=1)
+                ciupp[start:end] = np.percentile(ymulti_array, confidence_right*100, axis=1)
+                cimean[start:end] = np.percentile(ymulti_array, 50, axis=1)
 
             cival = [cilow, ciupp, cimean]
             cival = self.postprocess (cival)
@@ -629,20 +627,16 @@ class matrix (Combo):
                         'objs',
                         'Upper limit of the conformal prediction'
                     )
-        
-            for i in range (len(cival[0])):
-                print (f'{cival[0][i]:.2f} - {cival[2][i]:.2f} - {cival[1][i]:.2f}')
 
             yarray = np.array(cival[2])
 
         else:
 
-            # For each object look up in the vmatrix, by transforming the input X variables
+            # look up in the vmatrix, by transforming the input X variables
             # into indexes and then extracting the corresponding values
-            for j in range (self.nobj):
-                yarray.append (self.lookup (X[j],vmatrix))
+            yarray = self.lookup (X, vmatrix)
 
-            sval = [np.array(yarray)]
+            sval = [yarray]
             yarray = self.postprocess(sval)[0] 
 
         return yarray
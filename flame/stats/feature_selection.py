@@ -28,6 +28,7 @@ from sklearn.preprocessing import MinMaxScaler
 from sklearn.feature_selection import  SelectKBest
 from sklearn.feature_selection import chi2
 from sklearn.feature_selection import f_regression
+from flame.stats.FDD import varSelectionFFD
 from flame.util import utils, get_logger, supress_log
 import numpy as np
 
@@ -48,16 +49,43 @@ def selectkBest(X, Y, n, quantitative):
     return mask
 
 
-def run_feature_selection(X, Y, scaler, param):
+def selectFFD(X, Y, param):
+    ''' FFD variable selection, using PLS models with the number of latent
+    variables defined in PLSR_parameters. Only excluded variables are
+    removed '''
+
+    if not param.getVal('quantitative'):
+        raise ValueError('FFD feature selection only applies to quantitative endpoints')
+
+    pls_parameters = param.getDict('PLSR_parameters')
+    A = int(pls_parameters.get('n_components', 2))
+
+    ncpu = param.getVal('numCPUs')
+    if ncpu is None:
+        ncpu = 1
+
+    res, nexcluded = varSelectionFFD(X, Y, A, ncpu=ncpu)
+    LOG.info(f'FFD excluded {nexcluded} variables')
+
+    return res != 0
+
+
+def run_feature_selection(X, Y, scaler, param, X_raw=None):
     """Compute the number of variables to be retained.
+
+    X_raw is the unscaled X matrix, used to refit the scaler. If it is not
+    provided, it is recovered from X with the scaler inverse_transform
     """
 
     nobj, nvarx = np.shape(X)
     variable_mask = ''
+    method = param.getVal("feature_selection")
 
-
+    # FFD decides by itself the number of variables retained
+    if method == "FFD":
+        n_features = None
     # When auto, the 10% top informative variables are retained.
-    if param.getVal("feature_number") == "auto":
+    elif param.getVal("feature_number") == "auto":
         # Use 10% of the total number of objects:
         # The number of variables is greater than the 10% of the objects
         # And the number of objects is greater than 100
@@ -79,15 +107,21 @@ def run_feature_selection(X, Y, scaler, param):
         # Apply the variable selection algorithm obtaining
         # the variable mask.
         X_copy = X.copy()
-        variable_mask = selectkBest(X_copy, Y, n_features, 
-                                    param.getVal('quantitative'))
+        if method == "FFD":
+            variable_mask = selectFFD(X_copy, Y, param)
+            n_features = int(np.sum(variable_mask))
+        else:
+            variable_mask = selectkBest(X_copy, Y, n_features, 
+                                        param.getVal('quantitative'))
         
         # The scaler has to be fitted to the reduced matrix
         # in order to be applied in prediction.
-        X = scaler.inverse_transform(X)
-        X = X[:, variable_mask]
-        scaler = scaler.fit(X)
-        X = scaler.transform(X)
+        if scaler is not None:
+            if X_raw is None:
+                X_raw = scaler.inverse_transform(X)
+            X = X_raw[:, variable_mask]
+            scaler = scaler.fit(X)
+            X = scaler.transform(X)
         LOG.info(f'Variable selection applied, number of final variables:'
                     f'{n_features}')
     except Exception as e:
@@ -95,4 +129,4 @@ def run_feature_selection(X, Y, scaler, param):
                     f' with exception: {e}')
         raise e 
 
-    return variable_mask, scaler
\ No newline at end of file
+    return variable_mask, scaler
@@ -0,0 +1,178 @@
+#! -*- coding: utf-8 -*-
+
+# Description    Tools for building models out-of-core, in chunks
+##
+# Authors:       Manuel Pastor (manuel.pastor@upf.edu)
+##
+# Copyright 2018 Manuel Pastor
+##
+# This file is part of Flame
+##
+# Flame is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3.
+##
+# Flame is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+##
+# You should have received a copy of the GNU General Public License
+# along with Flame.  If not, see <http://www.gnu.org/licenses/>.
+
+''' This file contains the functions used by the incremental build mode.
+
+    In this mode the X matrix is never loaded or copied as a whole. It is
+    normally a read-only memory map of the descriptors stored by idata and
+    only chunks of rows are extracted, scaled and passed to estimators
+    implementing partial_fit '''
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.model_selection import KFold, LeaveOneOut, LeavePOut
+
+from flame.util import get_logger
+
+LOG = get_logger(__name__)
+
+# modeling methods and scalers which can be trained in chunks
+INCREMENTAL_MODELS = ('SGD', 'GNB')
+INCREMENTAL_SCALERS = ('StandardScaler', 'MinMaxScaler')
+
+# default values, used when incremental_settings are not defined
+CHUNK_SIZE = 10000
+EPOCHS = 5
+
+
+def incremental_settings(param):
+    ''' returns the chunk size and the number of epochs defined in the
+    incremental_settings parameter '''
+
+    settings = param.getDict('incremental_settings')
+    if settings is None:
+        settings = {}
+
+    chunk = settings.get('chunk_size')
+    if chunk is None:
+        chunk = CHUNK_SIZE
+
+    epochs = settings.get('epochs')
+    if epochs is None:
+        epochs = EPOCHS
+
+    return max(1, int(chunk)), max(1, int(epochs))
+
+
+def chunk_slices(nobj, chunk):
+    ''' yields slices of chunk consecutive objects '''
+
+    for start in range(0, nobj, chunk):
+        yield slice(start, min(start+chunk, nobj))
+
+
+def get_chunk(X, rows, scaler=None):
+    ''' extracts the rows of X (a slice or a sorted array of indexes) as
+    a matrix in memory, scaled with scaler. Floating point matrices keep
+    their dtype and small integers (e.g. uint8 fingerprints) are exactly
+    represented as float32 '''
+
+    Xc = np.asarray(X[rows])
+    if not np.issubdtype(Xc.dtype, np.floating):
+        if Xc.dtype.itemsize <= 2:
+            Xc = Xc.astype(np.float32)
+        else:
+            Xc = Xc.astype(np.float64)
+
+    if scaler is not None:
+        Xc = scaler.transform(Xc)
+    return Xc
+
+
+def fit_scaler(scaler, X, chunk):
+    ''' fits a scaler implementing partial_fit, reading X in chunks '''
+
+    for rows in chunk_slices(X.shape[0], chunk):
+        scaler.partial_fit(get_chunk(X, rows))
+    return scaler
+
+
+def fit_estimator(estimator, X, Y, chunk, scaler=None, index=None,
+                  classes=None, epochs=1, seed=46):
+    ''' fits an estimator implementing partial_fit, reading X in chunks
+
+    Only the objects in index (all by default) are used. In every epoch
+    the chunks are presented in a random order, but the objects of each
+    chunk are always read sequentially, in order to keep the access to
+    memory mapped matrices efficient
+    '''
+
+    if index is None:
+        index = np.arange(len(Y))
+
+    kwargs = {}
+    if classes is not None:
+        kwargs['classes'] = classes
+
+    slices = list(chunk_slices(len(index), chunk))
+    random_state = np.random.RandomState(seed)
+
+    for epoch in range(epochs):
+        for i in random_state.permutation(len(slices)):
+            rows = index[slices[i]]
+            estimator.partial_fit(get_chunk(X, rows, scaler), Y[rows], **kwargs)
+
+    return estimator
+
+
+def predict_chunks(estimator, X, chunk, scaler=None, index=None):
+    ''' returns the predictions of the estimator for the objects in
+    index (all by default), reading X in chunks '''
+
+    if index is None:
+        index = np.arange(X.shape[0])
+
+    Yp = []
+    for rows in chunk_slices(len(index), chunk):
+        Yp.append(estimator.predict(get_chunk(X, index[rows], scaler)))
+
+    if len(Yp) == 0:
+        return np.array([])
+
+    return np.concatenate(Yp)
+
+
+def cross_val_predict_chunks(estimator, X, Y, cv, chunk, scaler=None,
+                             classes=None, epochs=1):
+    ''' cross-validation predictions obtained by fitting a clone of the
+    estimator in chunks for every fold
+
+    Leave-one-out and leave-p-out are not feasible for large series, and
+    are replaced by a 5-fold cross-validation '''
+
+    nobj = len(Y)
+
+    if cv is None or isinstance(cv, (LeaveOneOut, LeavePOut)):
+        LOG.warning(f'{cv} cross-validation replaced by 5-fold in incremental mode')
+        cv = KFold(n_splits=5, shuffle=True, random_state=46)
+
+    y_pred = np.zeros(nobj)
+    npred = np.zeros(nobj, dtype=int)
+
+    for train, test in cv.split(np.zeros((nobj, 1)), Y):
+        # sorted indexes are read faster from memory maps
+        train = np.sort(train)
+        test = np.sort(test)
+
+        fold_estimator = clone(estimator)
+        fit_estimator(fold_estimator, X, Y, chunk, scaler, train,
+                      classes, epochs)
+
+        y_pred[test] = predict_chunks(fold_estimator, X, chunk, scaler, test)
+        npred[test] += 1
+
+    # the same constraint applies to sklearn cross_val_predict
+    if np.any(npred != 1):
+        raise ValueError('incremental cross-validation only works for '
+                         'cross-validators producing partitions')
+
+    return y_pred
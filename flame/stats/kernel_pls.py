@@ -0,0 +1,214 @@
+#! -*- coding: utf-8 -*-
+
+# Description    Kernel PLS tools for fast model validation
+##
+# Authors:       Manuel Pastor (manuel.pastor@upf.edu)
+##
+# Copyright 2018 Manuel Pastor
+##
+# This file is part of Flame
+##
+# Flame is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3.
+##
+# Flame is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+##
+# You should have received a copy of the GNU General Public License
+# along with Flame.  If not, see <http://www.gnu.org/licenses/>.
+
+''' This file contains a PLS1 implementation working on cross-product
+    matrices (improved kernel algorithm, Dayal & MacGregor 1997), which
+    allows to obtain the models for 1..A latent variables at once and to
+    validate them without refitting the model from the raw data '''
+
+import numpy as np
+from sklearn.model_selection import LeaveOneOut
+from flame.stats import metrics
+
+# maximum size (in bytes) of the stack of X'X matrices used in pls_loo
+LOO_MAX_BYTES = 2**28
+
+
+def kernel_pls(XX, XY, A):
+    ''' Computes the PLS1 regression coefficients for 1..A latent variables
+    from the centered cross-product matrices XX (X'X) and XY (X'y).
+
+    The arguments can be stacks of problems, with XX of shape [b, p, p] and
+    XY of shape [b, p], which are solved simultaneously.
+
+    Returns an array of coefficients of shape [b, A, p] (or [A, p] for a
+    single problem). Latent variables which cannot be extracted (e.g.
+    rank deficient matrices) do not modify the coefficients.
+    '''
+
+    single = XY.ndim == 1
+    if single:
+        XX = XX[None, :, :]
+        XY = XY[None, :]
+
+    XY = XY.copy()
+    nprob, nvarx = XY.shape
+
+    B = np.zeros((nprob, A, nvarx))
+    Bi = np.zeros((nprob, nvarx))
+    R = []
+    P = []
+
+    for a in range(A):
+
+        # for a single response the weights are the normalized X'y
+        wnorm = np.linalg.norm(XY, axis=1)
+        wnorm[wnorm == 0.0] = 1.0
+        w = XY / wnorm[:, None]
+
+        # rotations, relating the scores with the original X
+        r = w.copy()
+        for rj, pj in zip(R, P):
+            r -= np.sum(pj * w, axis=1)[:, None] * rj
+
+        XXr = np.einsum('bij,bj->bi', XX, r)
+        tt = np.sum(r * XXr, axis=1)
+        tt[tt <= 1.0e-12] = np.inf
+
+        p = XXr / tt[:, None]
+        q = np.sum(r * XY, axis=1) / tt
+
+        # deflation of X'y only
+        XY -= p * (q * tt)[:, None]
+
+        R.append(r)
+        P.append(p)
+
+        Bi = Bi + r * q[:, None]
+        B[:, a, :] = Bi
+
+    if single:
+        return B[0]
+
+    return B
+
+
+def pls_fit(X, Y, A):
+    ''' Fits PLS1 models with 1..A latent variables
+
+    Returns the X means, the Y mean and the coefficients [A, p]
+    '''
+
+    mx = np.mean(X, axis=0)
+    my = np.mean(Y)
+
+    Xc = X - mx
+    B = kernel_pls(Xc.T @ Xc, Xc.T @ (Y - my), A)
+
+    return mx, my, B
+
+
+def pls_predict(X, mx, my, B):
+    ''' Projects X on the models obtained by pls_fit
+
+    Returns the predictions for 1..A latent variables [nobj, A]
+    '''
+
+    return my + (X - mx) @ B.T
+
+
+def pls_loo(X, Y, A, max_bytes=LOO_MAX_BYTES):
+    ''' Exact leave-one-out predictions of PLS1 models with 1..A latent
+    variables.
+
+    Rather than refitting the model for every object, the cross-product
+    matrices of the complete series are downdated by removing each object
+    and the models are recomputed in batches with the kernel algorithm.
+
+    Returns the LOO predictions [nobj, A]
+    '''
+
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64).ravel()
+
+    nobj, nvarx = X.shape
+    m = nobj - 1
+
+    Sx = np.sum(X, axis=0)
+    Sy = np.sum(Y)
+    XtX = X.T @ X
+    XtY = X.T @ Y
+
+    Yp = np.zeros((nobj, A))
+    batch = max(1, int(max_bytes // (8 * nvarx * nvarx)))
+
+    for start in range(0, nobj, batch):
+        end = min(start + batch, nobj)
+
+        xi = X[start:end]
+        yi = Y[start:end]
+
+        # means without the left out objects
+        mx = (Sx - xi) / m
+        my = (Sy - yi) / m
+
+        # centered cross-products without the left out objects
+        XX = (XtX[None, :, :]
+              - xi[:, :, None] * xi[:, None, :]
+              - m * mx[:, :, None] * mx[:, None, :])
+        XY = XtY[None, :] - xi * yi[:, None] - m * mx * my[:, None]
+
+        B = kernel_pls(XX, XY, A)
+
+        Yp[start:end] = my[:, None] + np.einsum('bap,bp->ba', B, xi - mx)
+
+    return Yp
+
+
+def pls_cv(X, Y, A, cv):
+    ''' Cross-validation predictions of PLS1 models with 1..A latent
+    variables, obtained from a single pass over the folds of the
+    cross-validator cv.
+
+    Since the PLS models are nested, a single A latent variables model is
+    computed for every fold and the predictions for any smaller number of
+    latent variables are obtained truncating its coefficients. LOO
+    cross-validations are computed with pls_loo.
+
+    Returns the predictions [nobj, A]
+    '''
+
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64).ravel()
+
+    if isinstance(cv, LeaveOneOut):
+        return pls_loo(X, Y, A)
+
+    nobj = X.shape[0]
+    Yp = np.zeros((nobj, A))
+    npred = np.zeros(nobj, dtype=int)
+
+    for train, test in cv.split(X, Y):
+        mx, my, B = pls_fit(X[train], Y[train], A)
+        Yp[test] = pls_predict(X[test], mx, my, B)
+        npred[test] += 1
+
+    # the same constraint applies to sklearn cross_val_predict
+    if np.any(npred != 1):
+        raise ValueError('pls_cv only works for cross-validators producing partitions')
+
+    return Yp
+
+
+def pls_cv_curves(Y, Yp):
+    ''' Computes the Q2 and SDEP for every number of latent variables from
+    the cross-validation predictions returned by pls_cv '''
+
+    Y = np.asarray(Y, dtype=np.float64).ravel()
+
+    # one row of predictions for every number of latent variables
+    quality = metrics.quantitative(Y, np.asarray(Yp).T)
+
+    Q2 = quality['Q2']
+    SDEP = quality['SDEP']
+
+    return Q2, SDEP
@@ -0,0 +1,191 @@
+#! -*- coding: utf-8 -*-
+
+# Description    Flame model quality metrics
+#
+# Authors:       Manuel Pastor (manuel.pastor@upf.edu)
+#
+# Copyright 2018 Manuel Pastor
+#
+# This file is part of Flame
+#
+# Flame is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3.
+#
+# Flame is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Flame. If not, see <http://www.gnu.org/licenses/>.
+
+''' Quality metrics of qualitative, quantitative and conformal models, used
+    by the internal validation of the estimators, the external validation of
+    predictions and the ensemble models.
+
+    All the functions compute the metrics along the last axis of the arrays,
+    so that they can be applied at once to a batch of samples (e.g. bootstrap
+    samples) stored in the rows of 2D arrays. The metrics are returned in
+    dictionaries, with the keys used in the model results. Metrics which
+    cannot be computed (e.g. sensitivity without positive objects) are 0.0 '''
+
+import numpy as np
+
+# labels of the metrics in the external validation results
+EXTERNAL_LABELS = {
+    'TP': 'True positives in external-validation',
+    'TN': 'True negatives in external-validation',
+    'FP': 'False positives in external-validation',
+    'FN': 'False negatives in external-validation',
+    'Sensitivity': 'Sensitivity in external-validation',
+    'Specificity': 'Specificity in external-validation',
+    'MCC': 'Mattews Correlation Coefficient in external-validation',
+    'Conformal_coverage': 'Conformal coverage in external-validation',
+    'Conformal_accuracy': 'Conformal accuracy in external-validation',
+    'scoringP': 'Scoring P',
+    'Q2': 'Determination coefficient in cross-validation',
+    'SDEP': 'Standard Deviation Error of the Predictions',
+    'Conformal_mean_interval': 'Conformal mean interval in external-validation',
+}
+
+# maximum number of elements of the arrays of a bootstrap batch
+BOOTSTRAP_BATCH = 10000000
+
+
+def _ratio(numerator, denominator):
+    ''' element-wise division, 0.0 where the denominator is 0 '''
+
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    out = np.zeros(np.broadcast(numerator, denominator).shape)
+    return np.divide(numerator, denominator, out=out, where=denominator != 0)
+
+
+def mcc(TP, TN, FP, FN):
+    ''' Matthews Correlation Coefficient computed from the confusion matrix,
+    with the same convention than sklearn (0.0 when undefined) '''
+
+    TP, TN, FP, FN = (np.asarray(i, dtype=np.float64) for i in (TP, TN, FP, FN))
+    return _ratio(TP * TN - FP * FN, np.sqrt((TP + FP) * (TP + FN) * (TN + FP) * (TN + FN)))
+
+
+def classification(TP, TN, FP, FN):
+    ''' metrics of binary classifiers computed from the confusion matrix '''
+
+    return {'TP': TP,
+            'TN': TN,
+            'FP': FP,
+            'FN': FN,
+            'Sensitivity': _ratio(TP, TP + FN),
+            'Specificity': _ratio(TN, TN + FP),
+            'MCC': mcc(TP, TN, FP, FN)}
+
+
+def confusion(Y, Yp, mask=None):
+    ''' returns the confusion matrix (TP, TN, FP, FN) of the predicted
+    classes Yp (0 or 1) for the experimental classes Y, considering only the
+    objects selected by the boolean mask, if any '''
+
+    Y = np.asarray(Y)
+    Yp = np.asarray(Yp)
+
+    pos = Yp == 1
+    neg = Yp == 0
+    if mask is not None:
+        pos = pos & mask
+        neg = neg & mask
+
+    return (np.sum(pos & (Y == 1), axis=-1),
+            np.sum(neg & (Y == 0), axis=-1),
+            np.sum(pos & (Y == 0), axis=-1),
+            np.sum(neg & (Y == 1), axis=-1))
+
+
+def qualitative(Y, Yp):
+    ''' metrics of the predicted classes Yp for the experimental classes Y '''
+
+    return classification(*confusion(Y, Yp))
+
+
+def conformal_qualitative(Y, C):
+    ''' metrics of conformal classifiers, where C is the class set matrix,
+    with a column for every class (0 and 1) which is True if the class is
+    included in the prediction of the object.
+
+    Only the objects assigned to a single class are considered predicted.
+    The coverage is the fraction of objects predicted and the accuracy the
+    fraction of correct predictions among them '''
+
+    C = np.asarray(C, dtype=bool)
+    c0 = C[..., 0]
+    c1 = C[..., 1]
+    predicted = c0 != c1
+
+    TP, TN, FP, FN = confusion(Y, c1, predicted)
+    results = classification(TP, TN, FP, FN)
+
+    npredicted = np.sum(predicted, axis=-1)
+    results['Conformal_coverage'] = _ratio(npredicted, C.shape[-2])
+    results['Conformal_accuracy'] = _ratio(TP + TN, npredicted)
+    return results
+
+
+def quantitative(Y, Yp):
+    ''' metrics of the predicted values Yp for the experimental values Y:
+    mean squared error, determination coefficient and standard deviation of
+    the errors. These are named as the predictive metrics (scoringP, Q2 and
+    SDEP) but represent the goodness of the fit (scoringR, R2 and SDEC) when
+    Yp are the fitted values '''
+
+    Y = np.asarray(Y, dtype=np.float64)
+    Yp = np.asarray(Yp, dtype=np.float64)
+    nobj = Y.shape[-1]
+
+    SSY0 = np.sum(np.square(Y - np.mean(Y, axis=-1, keepdims=True)), axis=-1)
+    SSY = np.sum(np.square(Y - Yp), axis=-1)
+
+    return {'scoringP': SSY / nobj,
+            'Q2': np.where(SSY0 == 0, 0.0, 1.00 - _ratio(SSY, SSY0)),
+            'SDEP': np.sqrt(SSY / nobj)}
+
+
+def conformal_quantitative(Y, lower, upper):
+    ''' metrics of conformal regressors: mean width of the prediction
+    intervals and accuracy (fraction of objects inside the interval) '''
+
+    Y = np.asarray(Y, dtype=np.float64)
+    lower = np.asarray(lower, dtype=np.float64)
+    upper = np.asarray(upper, dtype=np.float64)
+
+    return {'Conformal_mean_interval': np.mean(np.abs(upper - lower), axis=-1),
+            'Conformal_accuracy': np.mean((lower < Y) & (upper > Y), axis=-1)}
+
+
+def bootstrap(function, arrays, samples=1000, alpha=0.05, seed=46):
+    ''' Confidence intervals of the metrics computed by function for the
+    arrays (e.g. metrics.qualitative and (Y, Yp)), obtained by percentile
+    bootstrap of the objects.
+
+    The samples are drawn and evaluated in batches, where every row is a
+    sample of objects, using the vectorization of the metric functions.
+
+    Returns a dictionary with a tuple (lower, upper) for every metric '''
+
+    arrays = [np.asarray(i) for i in arrays]
+    nobj = len(arrays[0])
+    if nobj == 0:
+        return {}
+
+    rng = np.random.RandomState(seed)
+    batch = max(1, BOOTSTRAP_BATCH // nobj)
+
+    values = {}
+    for start in range(0, samples, batch):
+        index = rng.randint(0, nobj, size=(min(batch, samples - start), nobj))
+        for key, value in function(*[i[index] for i in arrays]).items():
+            values.setdefault(key, []).append(value)
+
+    limits = [100.0 * alpha / 2.0, 100.0 * (1.0 - alpha / 2.0)]
+    return {key: tuple(np.percentile(np.concatenate(value), limits))
+            for key, value in values.items()}
@@ -0,0 +1,178 @@
+#! -*- coding: utf-8 -*-
+
+# Description    Flame content-addressed storage of model versions
+#
+# Authors:       Manuel Pastor (manuel.pastor@upf.edu)
+#
+# Copyright 2018 Manuel Pastor
+#
+# This file is part of Flame
+#
+# Flame is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3.
+#
+# Flame is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Flame. If not, see <http://www.gnu.org/licenses/>.
+
+''' Deduplicated storage of the published versions of a model.
+
+    Every model tree contains an "objects" directory where the files of the
+    published versions are stored once, named by the SHA-256 of their
+    content (e.g. objects/3f/3fa4...). The files of the versions are hard
+    links to these objects, so that identical training series, descriptors
+    and estimators are stored only once, whatever the number of versions.
+
+    The number of links of every object is the reference count: once no
+    version uses an object it has a single link and collect() removes it.
+
+    The dev version is never linked, since it is modified by every build,
+    and neither are the files edited in place in published versions
+    (parameters and documentation). The caches of the dev version are not
+    published. When the filesystem does not support hard links, the files
+    are copied as usual '''
+
+import os
+import shutil
+import hashlib
+import tempfile
+
+from flame.stages import STAGES_DIR
+from flame.parameters import SNAPSHOT_FILE
+from flame.util import get_logger
+
+LOG = get_logger(__name__)
+
+OBJECTS_DIR = 'objects'
+
+# files modified in place in published versions, which cannot be shared
+MUTABLE_FILES = ('parameters.yaml', 'documentation.yaml')
+
+# caches of the dev version, regenerated on use, which are neither
+# published nor exported
+LOCAL_FILES = (STAGES_DIR, SNAPSHOT_FILE, '__pycache__')
+
+CHUNK_SIZE = 1 << 20
+
+
+def file_hash(path):
+    ''' SHA-256 of the file content '''
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def object_path(tree, digest):
+    return os.path.join(tree, OBJECTS_DIR, digest[:2], digest)
+
+
+def store_object(tree, src):
+    ''' stores a copy of the file src in the objects directory of the tree,
+    if not present, and returns the path of the object '''
+
+    opath = object_path(tree, file_hash(src))
+    if os.path.isfile(opath):
+        return opath
+
+    odir = os.path.dirname(opath)
+    os.makedirs(odir, exist_ok=True)
+
+    # copy and rename, so that an object is always complete
+    handle, tmp_path = tempfile.mkstemp(dir=odir)
+    os.close(handle)
+    try:
+        shutil.copy2(src, tmp_path)
+        os.replace(tmp_path, opath)
+    except OSError:
+        os.remove(tmp_path)
+        raise
+
+    return opath
+
+
+def link_file(tree, src, dst):
+    ''' creates dst as a link to the object with the content of src, copying
+    the file if this is not possible '''
+
+    if os.path.basename(dst) in MUTABLE_FILES:
+        return shutil.copy2(src, dst)
+
+    try:
+        os.link(store_object(tree, src), dst)
+    except OSError as e:
+        LOG.debug(f'Unable to link {dst} ({e}), copying it')
+        shutil.copy2(src, dst)
+
+    return dst
+
+
+def copy_version(tree, src_path, dst_path):
+    ''' creates the version dst_path from src_path, linking its files to
+    the objects of the tree '''
+
+    return shutil.copytree(src_path, dst_path,
+                           ignore=shutil.ignore_patterns(*LOCAL_FILES),
+                           copy_function=lambda src, dst: link_file(tree, src, dst))
+
+
+def deduplicate(tree, version_path):
+    ''' replaces the files of an existing version with links to the objects
+    of the tree, e.g. after importing the version '''
+
+    for root, dirs, files in os.walk(version_path):
+        for name in files:
+            if name in MUTABLE_FILES:
+                continue
+
+            path = os.path.join(root, name)
+            try:
+                opath = store_object(tree, path)
+                if os.path.samefile(path, opath):
+                    continue
+
+                # link with a temporary name and rename over the file
+                tmp_path = path + '.link'
+                os.link(opath, tmp_path)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                LOG.debug(f'Unable to deduplicate {path}: {e}')
+
+
+def collect(tree):
+    ''' removes the objects no longer used by any version of the tree and
+    returns the number of bytes freed '''
+
+    objects = os.path.join(tree, OBJECTS_DIR)
+    if not os.path.isdir(objects):
+        return 0
+
+    freed = 0
+    for root, dirs, files in os.walk(objects, topdown=False):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+                if stat.st_nlink == 1:
+                    os.remove(path)
+                    freed += stat.st_size
+            except OSError:
+                continue
+
+        # remove empty fan-out directories
+        if root != objects and len(os.listdir(root)) == 0:
+            try:
+                os.rmdir(root)
+            except OSError:
+                pass
+
+    LOG.debug(f'{freed} bytes freed from {objects}')
+    return freed
+
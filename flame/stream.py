@@ -0,0 +1,207 @@
+#! -*- coding: utf-8 -*-
+
+# Description    Flame tools for streamed predictions
+#
+# Authors:       Manuel Pastor (manuel.pastor@upf.edu)
+#
+# Copyright 2018 Manuel Pastor
+#
+# This file is part of Flame
+#
+# Flame is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3.
+#
+# Flame is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Flame. If not, see <http://www.gnu.org/licenses/>.
+
+''' Tools for predicting input files of any size with bounded memory.
+
+    The input SDFile is split in chunks with a fixed number of molecules,
+    which are processed one after another by idata, apply and odata. Only
+    a chunk is kept in memory, together with the sufficient statistics of
+    the external validation, which are combined at the end to obtain the
+    same results than a prediction of the whole file '''
+
+import os
+import numpy as np
+
+from flame.stats import metrics
+from flame.util import get_logger
+
+LOG = get_logger(__name__)
+
+SDF_END = b'$$$$'
+
+
+def sdf_chunks(ifile, chunk_size, dest_path):
+    ''' yields the names of SDFiles created in dest_path with chunk_size
+    molecules of the SDFile ifile. The input is copied as text, without
+    parsing the molecules, and every chunk file is removed when the next
+    one is requested.
+
+    Molecules without name are named as in a prediction of the whole file
+    (mol0000000001...) so that the names do not restart for every chunk
+    '''
+
+    name, ext = os.path.splitext(os.path.basename(ifile))
+    if ext == '':
+        ext = '.sdf'
+
+    chunk = 0
+    count = 0
+    block = []
+    fo = None
+    chunk_path = None
+
+    def write_block():
+        # the first line of the molfile is the name
+        if block[0].strip() == b'':
+            block[0] = b'mol%0.10d\n' % count
+        fo.writelines(block)
+        block.clear()
+
+    try:
+        with open(ifile, 'rb') as fi:
+            for line in fi:
+                block.append(line)
+                if line.strip() != SDF_END:
+                    continue
+
+                if fo is None:
+                    chunk_path = os.path.join(dest_path, f'{name}_{chunk}{ext}')
+                    fo = open(chunk_path, 'wb')
+
+                write_block()
+                count += 1
+
+                if count % chunk_size == 0:
+                    fo.close()
+                    fo = None
+                    yield chunk_path
+                    os.remove(chunk_path)
+                    chunk += 1
+
+        # last molecule, when the file does not end with $$$$
+        if len(b''.join(block).strip()) > 0:
+            if fo is None:
+                chunk_path = os.path.join(dest_path, f'{name}_{chunk}{ext}')
+                fo = open(chunk_path, 'wb')
+            block.append(b'\n' + SDF_END + b'\n')
+            write_block()
+            count += 1
+
+        if fo is not None:
+            fo.close()
+            fo = None
+            yield chunk_path
+            os.remove(chunk_path)
+
+    finally:
+        # the generator can be closed before reading all the chunks
+        if fo is not None:
+            fo.close()
+        if chunk_path is not None and os.path.isfile(chunk_path):
+            os.remove(chunk_path)
+
+
+class ValidationStats:
+    ''' Accumulates the sufficient statistics of the external validation
+    of the chunks of a streamed prediction, which are combined by results()
+    to obtain the external validation of the whole series, as computed by
+    Apply.external_validation. Only the chunks for which Apply run the
+    external validation are considered '''
+
+    def __init__(self, parameters):
+        self.quantitative = parameters.getVal('quantitative')
+        self.conformal = parameters.getVal('conformal')
+        self.nobj = 0
+        self.sums = {}
+
+    def _add(self, key, value):
+        self.sums[key] = self.sums.get(key, 0) + value
+
+    def add(self, conveyor):
+        ''' adds the experimental and predicted values of a chunk '''
+
+        if not conveyor.isKey('external-validation'):
+            return
+
+        Ye = np.asarray(conveyor.getVal('ymatrix'), dtype=np.float64).ravel()
+        self.nobj += len(Ye)
+
+        if not self.conformal:
+            Yp = np.asarray(conveyor.getVal('values'), dtype=np.float64).ravel()
+
+            if not self.quantitative:
+                self._add('TP', int(np.sum((Ye == 1) & (Yp == 1))))
+                self._add('TN', int(np.sum((Ye == 0) & (Yp == 0))))
+                self._add('FP', int(np.sum((Ye == 0) & (Yp == 1))))
+                self._add('FN', int(np.sum((Ye == 1) & (Yp == 0))))
+            else:
+                self._add('Ye', float(np.sum(Ye)))
+                self._add('Ye2', float(np.sum(np.square(Ye))))
+                self._add('SSY', float(np.sum(np.square(Ye - Yp))))
+
+        else:
+            if not self.quantitative:
+                c0 = np.asarray(conveyor.getVal('c0'), dtype=bool).ravel()
+                c1 = np.asarray(conveyor.getVal('c1'), dtype=bool).ravel()
+
+                # objects assigned to a single class
+                predicted = c0 != c1
+                self._add('TP', int(np.sum(predicted & c1 & (Ye == 1))))
+                self._add('TN', int(np.sum(predicted & c0 & (Ye == 0))))
+                self._add('FP', int(np.sum(predicted & c1 & (Ye == 0))))
+                self._add('FN', int(np.sum(predicted & c0 & (Ye == 1))))
+                self._add('predicted', int(np.sum(predicted)))
+            else:
+                lower = np.asarray(conveyor.getVal('lower_limit'), dtype=np.float64).ravel()
+                upper = np.asarray(conveyor.getVal('upper_limit'), dtype=np.float64).ravel()
+
+                self._add('interval', float(np.sum(np.abs(upper - lower))))
+                self._add('inside', int(np.sum((lower < Ye) & (upper > Ye))))
+
+    def results(self):
+        ''' returns the external validation of all the chunks added, as a
+        list of tuples (key, label, value), or None if no chunk was added '''
+
+        if self.nobj == 0:
+            return None
+
+        nobj = self.nobj
+
+        if not self.quantitative:
+            TP = self.sums['TP']
+            TN = self.sums['TN']
+            FP = self.sums['FP']
+            FN = self.sums['FN']
+
+            results = metrics.classification(TP, TN, FP, FN)
+
+            if self.conformal:
+                results['Conformal_coverage'] = self.sums['predicted'] / nobj
+                total = TP + TN + FP + FN
+                results['Conformal_accuracy'] = (TP + TN) / total if total > 0 else 0.0
+
+        elif not self.conformal:
+            SSY = self.sums['SSY']
+            SSY0 = self.sums['Ye2'] - self.sums['Ye'] ** 2 / nobj
+
+            results = {'scoringP': SSY / nobj,
+                       'Q2': 0.0 if SSY0 == 0 else 1.00 - (SSY / SSY0),
+                       'SDEP': np.sqrt(SSY / nobj)}
+
+        else:
+            results = {'Conformal_mean_interval': float("{0:.2f}".format(self.sums['interval'] / nobj)),
+                       'Conformal_accuracy': float("{0:.2f}".format(self.sums['inside'] / nobj))}
+
+        ext_val_results = [(key, metrics.EXTERNAL_LABELS[key], float(value))
+                           for key, value in results.items()]
+
+        return ext_val_results
@@ -0,0 +1,127 @@
+import numpy as np
+from scipy.spatial import distance
+
+from flame.parameters import Parameters
+from flame.stats import applicability_domain
+from flame.stats.applicability_domain import ApplicabilityDomain, FingerprintIndex
+
+
+def test_fingerprint_index(monkeypatch):
+    """test that the pruned Tanimoto search matches a brute force search"""
+
+    rng = np.random.RandomState(0)
+    X = (rng.rand(500, 64) < rng.rand(500, 1) * 0.5).astype(np.uint8)
+    Q = (rng.rand(20, 64) < 0.2).astype(np.uint8)
+    Q[:5] = X[:5]
+
+    dist = FingerprintIndex(X).query(Q, 3)
+    brute = np.sort(distance.cdist(Q.astype(bool), X.astype(bool), 'jaccard'), axis=1)
+
+    assert np.allclose(dist, brute[:, :3])
+    assert np.allclose(dist[:5, 0], 0.0)
+
+    # several blocks of queries and chunks of the index, with empty fingerprints
+    monkeypatch.setattr(applicability_domain, 'QUERY_BLOCK', 7)
+    monkeypatch.setattr(applicability_domain, 'INDEX_CHUNK', 32)
+    X[:3] = 0
+    Q[5:7] = 0
+
+    def jaccard(a, b):
+        union = np.sum(a | b)
+        return 0.0 if union == 0 else 1.0 - np.sum(a & b) / union
+
+    brute = np.sort([[jaccard(q, x) for x in X] for q in Q], axis=1)
+    index = FingerprintIndex(X)
+    for k in (1, 3, 40):
+        assert np.array_equal(index.query(Q, k), brute[:, :k])
+
+
+def test_applicability_domain(tmp_path):
+    """test the AD scores of objects inside and outside the training series"""
+
+    param = Parameters()
+    param.p = {}
+    param.extended = True
+    param.setVal('model_path', str(tmp_path))
+
+    rng = np.random.RandomState(0)
+    X = rng.rand(300, 4)
+
+    ad = ApplicabilityDomain(param)
+    success, results = ad.build(X)
+    assert success
+    ad.save()
+
+    loaded = ApplicabilityDomain(param)
+    assert loaded.load()
+    assert loaded.metric == 'euclidean'
+
+    scores = loaded.score(np.vstack((X[:5], X[:5] + 10.0)))
+    assert scores['inside'][:5].all()
+    assert not scores['inside'][5:].any()
+    assert np.all(scores['leverage'][5:] > scores['leverage'][:5])
+
+    # the leverage of a centered series with intercept sums p+1
+    assert np.isclose(loaded.score(X)['leverage'].sum(), 5.0)
+
+
+def test_autoscaled_fingerprints(tmp_path):
+    """test that autoscaled fingerprints are indexed by Tanimoto distance"""
+
+    from sklearn.preprocessing import StandardScaler
+
+    param = Parameters()
+    param.p = {}
+    param.extended = True
+    param.setVal('model_path', str(tmp_path))
+
+    rng = np.random.RandomState(1)
+    X = (rng.rand(200, 256) < 0.2).astype(np.uint8)
+    X[:, 0] = 0
+    Q = (rng.rand(10, 256) < 0.2).astype(np.uint8)
+    scaler = StandardScaler().fit(X)
+
+    ad = ApplicabilityDomain(param)
+    assert ad.build(scaler.transform(X))[0]
+    assert ad.metric == 'tanimoto'
+    assert ad.hat is None
+
+    raw = ApplicabilityDomain(param)
+    assert raw.build(X)[0]
+    assert np.allclose(ad.score(scaler.transform(Q))['distance'], raw.score(Q)['distance'])
+
+    # in incremental mode the series is read in chunks through the scaler
+    chunked = ApplicabilityDomain(param)
+    assert chunked.build(X, scaler, chunk=64)[0]
+    assert np.allclose(chunked.score(scaler.transform(Q))['distance'], raw.score(Q)['distance'])
+
+
+def test_incremental_continuous(tmp_path):
+    """test that continuous descriptors are not indexed in incremental mode"""
+
+    from sklearn.preprocessing import StandardScaler
+
+    param = Parameters()
+    param.p = {}
+    param.extended = True
+    param.setVal('model_path', str(tmp_path))
+
+    rng = np.random.RandomState(2)
+    X = rng.rand(300, 6) * 10.0
+    scaler = StandardScaler().fit(X)
+
+    ad = ApplicabilityDomain(param)
+    assert ad.build(X, scaler, chunk=50)[0]
+    assert ad.index is None
+
+    full = ApplicabilityDomain(param)
+    full.build(scaler.transform(X))
+    Q = scaler.transform(X[:5] + 5.0)
+    scores = ad.score(Q)
+    assert 'distance' not in scores
+    assert np.allclose(scores['leverage'], full.score(Q)['leverage'])
+
+    # neither index nor leverage for many continuous variables
+    X = rng.rand(100, 200)
+    success, message = ApplicabilityDomain(param).build(X, StandardScaler().fit(X))
+    assert not success
@@ -0,0 +1,61 @@
+import numpy as np
+from rdkit import Chem
+
+from flame.benchmarks import datasets, suite
+
+
+def test_synthetic_series(tmp_path):
+    """test that the synthetic series are valid and reproducible"""
+
+    smiles = datasets.generate_smiles(50, seed=3)
+    assert len(set(smiles)) == 50
+    assert smiles == datasets.generate_smiles(50, seed=3)
+    assert all(Chem.MolFromSmiles(i) is not None for i in smiles)
+
+    files = datasets.write_datasets(str(tmp_path), 20, nvarx=10)
+
+    mols = [i for i in Chem.SDMolSupplier(files['sdf_qualitative'])]
+    assert len(mols) == 20
+    assert set(int(i.GetProp('activity')) for i in mols) == {0, 1}
+
+    with open(files['tsv_quantitative']) as handle:
+        lines = handle.readlines()
+    assert len(lines) == 21
+    assert lines[0].strip().split('\t')[-1] == 'activity'
+    assert np.array(lines[1].split('\t')[1:], dtype=float).shape == (11,)
+
+
+def test_compare():
+    """test the comparison of benchmark reports"""
+
+    def report(times):
+        return {'results': [{'case': 'idata', 'size': 10, 'settings': {'numCPUs': i},
+                             'success': True, 'time': t} for i, t in times]}
+
+    comparison = suite.compare(report([(1, 2.0), (2, 1.0)]), report([(2, 0.5), (4, 1.0)]))
+    assert len(comparison) == 1
+    assert comparison[0]['settings'] == {'numCPUs': 2}
+    assert comparison[0]['ratio'] == 0.5
+
+
+def test_idata_suite(tmp_path):
+    """test that idata is timed for SDFile, SMILES and TSV input"""
+
+    success, report = suite.run_suite(sizes=(10,), cases=('idata',), mol_batch=('series',),
+                                      path=str(tmp_path))
+    assert success
+    results = report['results']
+    assert [i['settings']['input_type'] for i in results] == ['molecule', 'smiles', 'data']
+    assert all(i['success'] and i['time'] is not None for i in results)
+
+
+def test_ad_suite(tmp_path):
+    """test that the applicability domain is timed for every descriptor"""
+
+    success, report = suite.run_suite(sizes=(20,), cases=('ad',),
+                                      descriptors=('morganFP', 'RDKit_properties'),
+                                      path=str(tmp_path))
+    assert success
+    results = report['results']
+    assert [i['case'] for i in results] == ['adbuild', 'adquery'] * 2
+    assert all(i['success'] and i['time'] is not None for i in results)
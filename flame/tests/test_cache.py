@@ -0,0 +1,71 @@
+import os
+
+from flame import cache
+from flame.conveyor import Conveyor
+from flame.idata import Idata
+from flame.parameters import Parameters
+
+TEST_SDF = os.path.join(os.path.dirname(__file__), 'data', 'minicaco.sdf')
+
+
+def test_cache(tmp_path):
+    """test that the values are stored by namespace and saved by flush"""
+
+    path = str(tmp_path / cache.CACHE_FILE)
+
+    with cache.Cache('method 1.0', path) as c:
+        assert c.get('a') is None
+        c.put('a', {'parent': 'x', 'issues': [[2, 'issue']]})
+        assert c.get('a')['parent'] == 'x'
+        assert (c.hits, c.misses) == (1, 1)
+
+    with cache.Cache('method 1.0', path) as c:
+        assert c.get('a') == {'parent': 'x', 'issues': [[2, 'issue']]}
+    assert cache.Cache('method 2.0', path).get('a') is None
+
+    # the key ignores the name of the molecule
+    assert cache.molblock_key('a\nb\nc') == cache.molblock_key('d\nb\nc')
+    assert cache.molblock_key('a\nb\nc') != cache.molblock_key('a\nb\nd')
+
+    # the stored values are saved every FLUSH_SIZE values
+    with cache.Cache('method 3.0', path) as c:
+        for i in range(cache.FLUSH_SIZE + 1):
+            c.put(str(i), i)
+        assert len(c.pending) == 1
+        assert cache.Cache('method 3.0', path).get(str(cache.FLUSH_SIZE - 1)) == cache.FLUSH_SIZE - 1
+
+    # a database which cannot be opened disables the cache
+    c = cache.Cache('method 1.0', str(tmp_path / 'missing' / cache.CACHE_FILE))
+    c.put('a', 1)
+    c.flush()
+    assert c.get('a') is None
+    assert c.path is None
+
+
+def test_normalize_cache(tmp_path, monkeypatch):
+    """test that the second normalization of the same structures reads the
+    results of the standardizer from the cache"""
+
+    monkeypatch.setattr(cache, 'cache_path', lambda: str(tmp_path / cache.CACHE_FILE))
+
+    param = Parameters()
+    param.p = {}
+    param.extended = True
+    param.setVal('input_type', 'molecule')
+    param.setVal('deduplicate', False)
+
+    ifile = str(tmp_path / 'input.sdf')
+    with open(TEST_SDF) as fi, open(ifile, 'w') as fo:
+        fo.write(fi.read())
+
+    idata = Idata(param, Conveyor(), ifile)
+    success_list, ofile = idata.normalize(ifile, 'standardize')
+    expected = open(ofile).read()
+
+    def standardize(*args):
+        raise AssertionError('structure not found in the cache')
+
+    monkeypatch.setattr(Idata, 'standardizeMolblock', staticmethod(standardize))
+    success_list, ofile = idata.normalize(ifile, 'standardize')
+    assert all(success_list)
+    assert open(ofile).read() == expected
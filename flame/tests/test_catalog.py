@@ -0,0 +1,64 @@
+import os
+import json
+import shutil
+
+import numpy as np
+
+from flame import catalog
+from flame.conveyor import Conveyor
+
+
+def write_results(path, r2):
+    conveyor = Conveyor()
+    conveyor.addVal([('nobj', 'number of objects', np.int64(10)),
+                     ('R2', 'coefficient of determination', np.float64(r2))],
+                    'model_valid_info', 'model validation info', 'method', 'single')
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, 'results.pkl'), 'wb') as handle:
+        conveyor.save(handle)
+
+
+def test_catalog(tmp_path):
+    """test that the catalog summarises the results once and detects changes"""
+
+    repo = str(tmp_path)
+    write_results(os.path.join(repo, 'MODEL', 'dev'), 0.5)
+    shutil.copytree(os.path.join(repo, 'MODEL', 'dev'), os.path.join(repo, 'MODEL', 'ver000001'))
+    os.makedirs(os.path.join(repo, 'OTHER'))
+
+    calls = []
+
+    def summary(results_path):
+        calls.append(results_path)
+        return catalog.model_summary(results_path)
+
+    model_catalog = catalog.Catalog(repo, summary)
+    assert model_catalog.names() == ['MODEL']
+    assert model_catalog.versions('MODEL') == [0, 1]
+
+    report = model_catalog.report()
+    assert report[0][0] == 'MODEL'
+    assert [i[0] for i in report[0][1]] == [0, 1]
+    assert report[0][1][0][1] == [['nobj', 'number of objects', 10],
+                                  ['R2', 'coefficient of determination', 0.5]]
+    assert len(calls) == 2
+
+    # a new instance reads the catalog file and does not unpickle the results
+    model_catalog = catalog.Catalog(repo, summary)
+    assert json.loads(json.dumps(model_catalog.report())) == json.loads(json.dumps(report))
+    assert len(calls) == 2
+
+    # changes in the results are detected by size and mtime
+    write_results(os.path.join(repo, 'MODEL', 'dev'), 0.123456789)
+    success, info = catalog.Catalog(repo, summary).info('MODEL', 0)
+    assert success and info[1][2] == 0.123456789
+    assert len(calls) == 3
+
+    # removal of versions and trees
+    shutil.rmtree(os.path.join(repo, 'MODEL', 'ver000001'))
+    catalog.Catalog(repo, summary).update('MODEL')
+    assert catalog.Catalog(repo, summary).versions('MODEL') == [0]
+
+    shutil.rmtree(os.path.join(repo, 'MODEL'))
+    assert catalog.Catalog(repo, summary).names() == []
+    assert catalog.Catalog(repo, summary).versions('MODEL') is None
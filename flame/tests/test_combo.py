@@ -0,0 +1,221 @@
+import os
+
+import numpy as np
+import yaml
+from scipy import stats
+
+from flame.conveyor import Conveyor
+from flame.parameters import Parameters
+from flame.stats import combo
+
+
+def make_estimator(cls, X, CI=None):
+    """combination estimator with the CI of the models in its conveyor"""
+
+    conveyor = Conveyor()
+    if CI is not None:
+        conveyor.addVal(['CI'] * CI.shape[1], 'ensemble_confidence_names',
+                        'Confidence names', 'method', 'single')
+        conveyor.addVal(CI, 'ensemble_confidence', 'Confidence', 'method', 'objs')
+
+    estimator = cls.__new__(cls)
+    estimator.conveyor = conveyor
+    return estimator
+
+
+def loop_median(X, CI_vals, z=1.96):
+    """weighted median computed object by object, as in previous versions"""
+
+    nobj, nvarx = X.shape
+    w = np.zeros(nvarx)
+    xmedian, cilow, ciupp = [], [], []
+    for j in range(nobj):
+        pred = []
+        for i in range(nvarx):
+            sd = (CI_vals[j, i*2+1] - CI_vals[j, i*2]) / (z*2)
+            w[i] = 1.0 / np.square(sd)
+            pred.append((i, X[j, i], w[i]))
+        wcenter = np.sum(w) / 2.0
+        sorted_pred = sorted(pred, key=lambda tup: tup[1])
+
+        if nvarx % 2 == 0:
+            if nvarx == 2:
+                selected = (0, 1)
+            else:
+                acc_w = 0.0
+                for i, ipred in enumerate(sorted_pred):
+                    acc_w += ipred[2]
+                    if acc_w > wcenter:
+                        break
+                selected = (sorted_pred[i-1][0], ipred[0])
+        else:
+            acc_w = 0.0
+            for ipred in sorted_pred:
+                acc_w += ipred[2]
+                if acc_w >= wcenter:
+                    break
+            selected = (ipred[0],)
+
+        xmedian.append(np.mean([X[j, i] for i in selected]))
+        cilow.append(np.mean([CI_vals[j, i*2] for i in selected]))
+        ciupp.append(np.mean([CI_vals[j, i*2+1] for i in selected]))
+
+    return np.array(xmedian), np.array(cilow), np.array(ciupp)
+
+
+def test_weighted_median():
+    """test that the weighted median matches the object by object version,
+    with ties, NaN predictions and NaN CI"""
+
+    rng = np.random.RandomState(0)
+    for nvarx in (2, 3, 4, 5, 6):
+        for case in range(20):
+            # rounded values produce ties
+            X = np.round(rng.rand(30, nvarx) * 3)
+            if case % 2:
+                X[rng.rand(30, nvarx) < 0.1] = np.nan
+            width = rng.rand(30, nvarx) + 0.1
+            CI = np.empty((30, 2*nvarx))
+            CI[:, 0::2] = X - width
+            CI[:, 1::2] = X + width
+            if case % 3 == 0:
+                CI[rng.rand(30, 2*nvarx) < 0.05] = np.nan
+
+            estimator = make_estimator(combo.median, X, CI)
+            expected = loop_median(X, CI)
+            results = (estimator.predict(X),
+                       estimator.conveyor.getVal('lower_limit'),
+                       estimator.conveyor.getVal('upper_limit'))
+            for result, value in zip(results, expected):
+                assert np.array_equal(result, value, equal_nan=True)
+
+    # models without CI
+    X = rng.rand(10, 4)
+    assert np.array_equal(make_estimator(combo.median, X).predict(X), np.median(X, 1))
+    assert np.array_equal(make_estimator(combo.mean, X).predict(X), np.mean(X, 1))
+
+
+def test_majority():
+    """test the majority voting of conformal classifiers, with ties"""
+
+    rng = np.random.RandomState(1)
+    for nvarx in (1, 2, 3, 4):
+        X = rng.randint(0, 2, (50, nvarx)).astype(float)
+        confidence = rng.randint(0, 2, (50, 2*nvarx)).astype(float)
+
+        # votes computed object by object
+        c0 = np.array([sum(row[j*2] for j in range(nvarx)) for row in confidence])
+        c1 = np.array([sum(row[j*2+1] for j in range(nvarx)) for row in confidence])
+        expected = np.array([1.0 if a > b else (-1.0 if a == b else 0.0)
+                             for b, a in zip(c0, c1)])
+        assert np.any(expected == -1)
+
+        estimator = make_estimator(combo.majority, X, confidence)
+        assert np.array_equal(estimator.predict(X), expected)
+        assert np.array_equal(estimator.conveyor.getVal('ensemble_c0'), c0)
+        assert np.array_equal(estimator.conveyor.getVal('ensemble_c1'), c1)
+
+    # non conformal models
+    X = rng.randint(0, 2, (50, 3)).astype(float)
+    assert np.array_equal(make_estimator(combo.majority, X).predict(X), np.round(np.mean(X, 1)))
+
+
+def test_weighted_mean():
+    """test that the weighted mean and its CI match the inverse-variance
+    weighting of the models"""
+
+    X = np.array([[1.0, 3.0],
+                  [2.0, 2.0]])
+    # CI of every model (lower, upper), with standard deviations 1 and 2
+    CI = np.array([[1.0 - 1.96, 1.0 + 1.96, 3.0 - 3.92, 3.0 + 3.92],
+                   [2.0 - 1.96, 2.0 + 1.96, 2.0 - 3.92, 2.0 + 3.92]])
+
+    estimator = make_estimator(combo.mean, X, CI)
+    conveyor = estimator.conveyor
+    Yp = estimator.predict(X)
+
+    # weights 1 and 1/4
+    assert np.allclose(Yp, [(1.0 + 3.0 / 4) / 1.25, 2.0])
+
+    # the CI is centered on the weighted mean
+    half = 1.96 / np.sqrt(1.25)
+    assert np.allclose(conveyor.getVal('lower_limit'), Yp - half)
+    assert np.allclose(conveyor.getVal('upper_limit'), Yp + half)
+
+
+def loop_lookup(x, vsize, vzero, vstep, offset):
+    """bin of every variable found one step at a time, as in previous versions"""
+
+    matrix_index = 0
+    for i in range(len(x)):
+        cellmax = vzero[i]
+        for j in range(vsize[i]):
+            cellmax += vstep[i]
+            if (vstep[i] > 0.0 and x[i] < cellmax) or (vstep[i] < 0.0 and x[i] > cellmax):
+                break
+        matrix_index += j * offset[i]
+    return matrix_index
+
+
+def make_matrix(model_path, X, CI=None):
+    """matrix combination reading the vmatrix of model_path"""
+
+    estimator = make_estimator(combo.matrix, X, CI)
+    estimator.conveyor.addVal(['model:a', 'model:b'], 'var_nam', 'Var. names', 'method', 'vars')
+    estimator.model_path = str(model_path)
+    estimator.param = Parameters()
+    estimator.param.p = {'conformalSignificance': 0.05}
+    return estimator
+
+
+def test_matrix(tmp_path):
+    """test that the matrix lookup and the simulation of the CI match the
+    object by object version, and that the binary cache follows the matrix"""
+
+    # 'b' is the inner loop and its bins go downwards
+    mmatrix = {'a': [1, 4, 0.0, 0.5], 'b': [0, 3, 1.0, -0.3]}
+    vsize, vzero, vstep, offset = (4, 3), (0.0, 1.0), (0.5, -0.3), (3, 1)
+    with open(os.path.join(tmp_path, 'mmatrix.yaml'), 'w') as handle:
+        yaml.safe_dump(mmatrix, handle)
+    vmatrix = np.arange(12, dtype=float).reshape(4, 3) * 1.5
+    np.savetxt(os.path.join(tmp_path, 'vmatrix.txt'), vmatrix, delimiter=',')
+
+    rng = np.random.RandomState(2)
+    X = np.column_stack((rng.uniform(-0.5, 2.5, 40), rng.uniform(-0.2, 1.3, 40)))
+    # values on the limits of the bins
+    X[:4] = [[0.5, 0.7], [1.0, 0.4], [2.0, 1.0], [0.0, 0.1]]
+    expected = np.array([vmatrix.flatten()[loop_lookup(x, vsize, vzero, vstep, offset)]
+                         for x in X])
+
+    estimator = make_matrix(tmp_path, X)
+    assert np.array_equal(estimator.predict(X), expected)
+    assert np.array_equal(estimator.lookup(X[0], vmatrix.flatten()), expected[0])
+    assert os.path.isfile(os.path.join(tmp_path, 'vmatrix.npy'))
+
+    # simulation of the CI, with the random numbers drawn object by object
+    width = rng.uniform(0.1, 0.5, X.shape)
+    CI = np.empty((40, 4))
+    CI[:, 0::2] = X - width
+    CI[:, 1::2] = X + width
+    z = stats.norm.ppf(1.0 - 0.05 / 2.0)
+    np.random.seed(2324)
+    ymulti = np.empty((40, combo.SIMULATION_SIZE))
+    for j in range(40):
+        for m in range(combo.SIMULATION_SIZE):
+            x = X[j] + [np.random.normal(0.0, (CI[j, i*2+1] - CI[j, i*2]) / (z*2))
+                        for i in range(2)]
+            ymulti[j, m] = vmatrix.flatten()[loop_lookup(x, vsize, vzero, vstep, offset)]
+
+    estimator = make_matrix(tmp_path, X, CI)
+    assert np.allclose(estimator.predict(X), np.percentile(ymulti, 50, axis=1))
+    assert np.allclose(estimator.conveyor.getVal('lower_limit'),
+                       np.percentile(ymulti, 2.5, axis=1))
+    assert np.allclose(estimator.conveyor.getVal('upper_limit'),
+                       np.percentile(ymulti, 97.5, axis=1))
+
+    # a new matrix replaces the cached one
+    np.savetxt(os.path.join(tmp_path, 'vmatrix.txt'), vmatrix * 2, delimiter=',')
+    mtime = os.path.getmtime(os.path.join(tmp_path, 'vmatrix.npy')) + 10
+    os.utime(os.path.join(tmp_path, 'vmatrix.txt'), (mtime, mtime))
+    assert np.array_equal(make_matrix(tmp_path, X).predict(X), expected * 2)
+    assert np.array_equal(np.load(os.path.join(tmp_path, 'vmatrix.npy')), vmatrix.flatten() * 2)
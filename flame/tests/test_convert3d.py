@@ -0,0 +1,60 @@
+import os
+
+from rdkit import Chem
+
+from flame import cache
+import flame.chem.convert_3d as convert3D
+
+TEST_SDF = os.path.join(os.path.dirname(__file__), 'data', 'minicaco.sdf')
+
+
+def copy_input(tmp_path):
+    ifile = str(tmp_path / 'input.sdf')
+    with open(TEST_SDF) as fi, open(ifile, 'w') as fo:
+        fo.write(fi.read())
+    return ifile
+
+
+def test_etkdg_cache(tmp_path, monkeypatch):
+    """test that the second conversion of the same structures reads the
+    conformers from the cache"""
+
+    monkeypatch.setattr(cache, 'cache_path', lambda: str(tmp_path / cache.CACHE_FILE))
+    ifile = copy_input(tmp_path)
+
+    success_list, ofile = convert3D._ETKDG(ifile)
+    assert all(success_list)
+    expected = open(ofile).read()
+
+    mols = [mol for mol in Chem.SDMolSupplier(ofile, removeHs=False)]
+    assert len(mols) == 10
+    assert all(mol.GetConformer().Is3D() for mol in mols)
+    assert mols[0].GetProp('_Name') == 'furosemide'
+
+    def embed(*args):
+        raise AssertionError('structure not found in the cache')
+
+    monkeypatch.setattr(convert3D, '_embed', embed)
+    success_list, ofile = convert3D._ETKDG(ifile)
+    assert all(success_list)
+    assert open(ofile).read() == expected
+
+    # other settings are not found in the cache
+    success_list, ofile = convert3D._ETKDG(ifile, {'seed': 7})
+    assert not any(success_list)
+
+
+def test_etkdg_conformers(tmp_path, monkeypatch):
+    """test the selection of the lowest energy conformer"""
+
+    monkeypatch.setattr(cache, 'cache_path', lambda: None)
+    ifile = copy_input(tmp_path)
+
+    settings = {'conformers': 4, 'selection': 'lowest_energy', 'threads': 2}
+    success_list, ofile = convert3D._ETKDG(ifile, settings)
+    assert all(success_list)
+    assert len(list(Chem.SDMolSupplier(ofile))) == 10
+
+    assert convert3D._namespace(convert3D._settings({'seed': -1})) is None
+    assert convert3D._namespace(convert3D._settings({'threads': 1})) == \
+        convert3D._namespace(convert3D._settings({'threads': None}))
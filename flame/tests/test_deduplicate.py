@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+from rdkit import Chem
+
+import flame.chem.sdfileutils as sdfutils
+from flame.conveyor import Conveyor
+from flame.idata import Idata
+from flame.parameters import Parameters
+
+TEST_SDF = os.path.join(os.path.dirname(__file__), 'data', 'minicaco.sdf')
+
+
+def write_duplicates(path):
+    """writes the test SDFile with some molecules repeated, including a salt
+    form which is identical to its parent only after standardization"""
+
+    mols = [mol for mol in Chem.SDMolSupplier(TEST_SDF)]
+    order = [0, 1, 2, 1, 3, 0, 4, 5, 6, 7, 8, 9, 2, 2]
+    writer = Chem.SDWriter(path)
+    for i in order:
+        writer.write(mols[i])
+    salt = Chem.MolFromSmiles(Chem.MolToSmiles(mols[5]) + '.Cl')
+    salt.SetProp('_Name', 'salt')
+    writer.write(salt)
+    writer.close()
+    return order + [5]
+
+
+def test_unique_SDFile(tmp_path):
+    """test that duplicated structures are written only once"""
+
+    ifile = str(tmp_path / 'input.sdf')
+    write_duplicates(ifile)
+
+    ofile, index = sdfutils.unique_SDFile(ifile)
+    assert index == [0, 1, 2, 1, 3, 0, 4, 5, 6, 7, 8, 9, 2, 2, 10]
+    assert sdfutils.count_mols(ofile) == 11
+
+    # no duplicates, no new file
+    assert sdfutils.unique_SDFile(TEST_SDF) == (TEST_SDF, None)
+
+
+def test_scatter_unique():
+    """test that the results of unique structures are assigned to every molecule"""
+
+    x = np.array([[0.0], [2.0], [3.0]])
+    x, success_list = Idata.scatterUnique(x, [True, False, True, True], [0, 1, 2, 0, 3, 1, 2])
+    assert success_list == [True, False, True, True, True, False, True]
+    assert x.ravel().tolist() == [0.0, 2.0, 0.0, 3.0, 2.0]
+
+
+def test_workflow_deduplicate(tmp_path):
+    """test that the workflow obtains the same descriptors processing every
+    structure once"""
+
+    ifile = str(tmp_path / 'input.sdf')
+    order = write_duplicates(ifile)
+
+    param = Parameters()
+    param.p = {}
+    param.extended = True
+    for key, value in (('input_type', 'molecule'),
+                       ('normalize_method', 'standardize'),
+                       ('computeMD_method', ['RDKit_properties']),
+                       ('MD_settings', {})):
+        param.setVal(key, value)
+
+    results = {}
+    for deduplicate in (False, True):
+        param.setVal('deduplicate', deduplicate)
+        conveyor = Conveyor()
+        idata = Idata(param, conveyor, ifile)
+        success, results[deduplicate] = idata.workflow_series(ifile)
+        assert success
+
+    # 11 unique structures before and 10 after standardization
+    assert sdfutils.count_mols(str(tmp_path / 'input_std_unique.sdf')) == 10
+
+    x, xnames, mol_index = results[True]
+    assert mol_index == results[False][2]
+    assert np.allclose(x, results[False][0])
+    assert x.shape[0] == len(order)
+
+    # the salt is described as its parent
+    assert np.allclose(x[-1], x[order.index(5)])
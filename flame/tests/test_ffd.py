@@ -0,0 +1,27 @@
+import numpy as np
+
+from flame.stats.FDD import generateDesignFFD, varSelectionFFD
+
+
+def test_design_ffd():
+    """test that the FFD design is balanced and orthogonal"""
+
+    ncomb, design = generateDesignFFD(30, 2.0)
+
+    assert ncomb == 64
+    assert design.shape == (64, 30)
+    assert np.all(np.sum(design, axis=0) == 0)
+    assert np.all(np.diag(design.T @ design) == ncomb)
+
+
+def test_ffd_selection():
+    """test that FFD keeps the informative variables"""
+
+    rng = np.random.RandomState(0)
+    X = rng.rand(50, 30)
+    Y = X[:, :3] @ np.array([3.0, 2.0, 1.0]) + 0.05 * rng.rand(50)
+
+    res, nexcluded = varSelectionFFD(X, Y, 3)
+
+    assert np.all(res[:3] == 1)
+    assert nexcluded == np.sum(res == 0)
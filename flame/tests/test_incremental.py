@@ -0,0 +1,39 @@
+import os
+
+import numpy as np
+from sklearn.model_selection import KFold
+from sklearn.naive_bayes import GaussianNB
+from sklearn.preprocessing import StandardScaler
+
+from flame.stats import incremental
+
+
+def test_incremental_fit(tmp_path):
+    """test that chunked fitting from a memory map matches the full fit"""
+
+    rng = np.random.RandomState(0)
+    X = rng.rand(103, 5)
+    Y = (X[:, 0] + X[:, 1] > 1.0).astype(float)
+
+    xfile = os.path.join(tmp_path, 'xmatrix.npy')
+    np.save(xfile, X)
+    Xm = np.load(xfile, mmap_mode='r')
+
+    scaler = incremental.fit_scaler(StandardScaler(), Xm, 10)
+    full_scaler = StandardScaler().fit(X)
+    assert np.allclose(scaler.mean_, full_scaler.mean_)
+    assert np.allclose(scaler.scale_, full_scaler.scale_)
+
+    gnb = incremental.fit_estimator(GaussianNB(), Xm, Y, 10, scaler,
+                                    classes=np.unique(Y))
+    full_gnb = GaussianNB().fit(full_scaler.transform(X), Y)
+    assert np.allclose(gnb.theta_, full_gnb.theta_)
+
+    Yp = incremental.predict_chunks(gnb, Xm, 10, scaler)
+    assert np.array_equal(Yp, full_gnb.predict(full_scaler.transform(X)))
+
+    cv = KFold(n_splits=4)
+    y_pred = incremental.cross_val_predict_chunks(GaussianNB(), Xm, Y, cv, 10,
+                                                  scaler, np.unique(Y))
+    assert y_pred.shape == Y.shape
+    assert np.mean(y_pred == Y) > 0.8
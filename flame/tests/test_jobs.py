@@ -0,0 +1,119 @@
+from flame import jobs
+from flame.jobs import JobQueue
+
+
+def test_queue_priorities(tmp_path):
+    """test that interactive jobs are run before builds"""
+
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite'))
+
+    success, build_id = queue.submit('build', {'endpoint': 'A'})
+    assert success
+    success, predict_id = queue.submit('predict', {'endpoint': 'A', 'label': 'first'})
+    assert success
+    assert not queue.submit('unknown', {})[0]
+
+    # builds are skipped when no heavy worker is free
+    assert queue.claim(heavy=False)['id'] == predict_id
+    assert queue.claim(heavy=False) is None
+
+    job = queue.claim()
+    assert job['id'] == build_id
+    assert job['arguments'] == {'endpoint': 'A'}
+    assert queue.jobs('queued')[1] == []
+
+
+def test_queue_results(tmp_path):
+    """test job cancellation and the retrieval of results by label"""
+
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite'))
+
+    success, first = queue.submit('predict', {'label': 'first'})
+    success, second = queue.submit('predict', {'label': 'second'})
+    assert queue.cancel(second)[0]
+    assert queue.status(second)[1]['state'] == 'cancelled'
+    assert not queue.cancel(second)[0]
+
+    job = queue.claim()
+    assert job['id'] == first
+    queue.progress(first, 0.5, 'running')
+    assert queue.status(first)[1]['progress'] == 0.5
+
+    assert queue.cancel(first)[0]
+    assert queue.cancel_requested() == [first]
+
+    assert not queue.result('first')[0]
+    queue.finish(first, 'completed', True, '{"values": [1]}')
+    assert queue.result('first') == (True, '{"values": [1]}')
+    assert not queue.result('second')[0]
+
+
+class FakeProcess:
+    ''' process which keeps running until it is terminated '''
+
+    pid = 0
+    exitcode = 0
+
+    def __init__(self, target, args):
+        self.alive = True
+
+    def start(self):
+        pass
+
+    def is_alive(self):
+        return self.alive
+
+    def join(self):
+        pass
+
+    def terminate(self):
+        self.alive = False
+
+
+def test_worker_slots(tmp_path, monkeypatch):
+    """test that a single worker running a build still starts predictions"""
+
+    monkeypatch.setattr(jobs.multiprocessing, 'Process', FakeProcess)
+    worker = jobs.Worker(str(tmp_path / 'jobs.sqlite'), workers=1)
+    queue = worker.queue
+
+    success, build_id = queue.submit('build', {'endpoint': 'A'})
+    worker.step()
+    assert list(worker.running) == [build_id]
+
+    success, second_build = queue.submit('build', {'endpoint': 'B'})
+    success, first = queue.submit('predict', {'endpoint': 'A'})
+    success, second = queue.submit('predict', {'endpoint': 'A'})
+    worker.step()
+    assert sorted(worker.running) == [build_id, first]
+
+    # without builds running, the jobs use the single worker again
+    worker.running[build_id][0].alive = False
+    worker.step()
+    assert sorted(worker.running) == [first]
+    worker.running[first][0].alive = False
+    worker.step()
+    assert sorted(worker.running) == [second]
+
+
+def report_threads(results):
+    from threadpoolctl import threadpool_info
+
+    jobs.limit_resources(1, None)
+    results.put([pool['num_threads'] for pool in threadpool_info()])
+
+
+def test_limit_threads():
+    """test that the threads of the libraries already loaded are limited"""
+
+    import multiprocessing
+
+    # BLAS is loaded before the job process starts
+    import numpy
+
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=report_threads, args=(results,))
+    process.start()
+    threads = results.get(timeout=60)
+    process.join()
+    assert all(i == 1 for i in threads)
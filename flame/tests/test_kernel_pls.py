@@ -0,0 +1,42 @@
+import numpy as np
+
+from sklearn.cross_decomposition import PLSRegression
+from sklearn.model_selection import cross_val_predict, LeaveOneOut, KFold
+
+from flame.stats.kernel_pls import pls_loo, pls_cv, pls_cv_curves
+
+
+def make_data():
+    rng = np.random.RandomState(3)
+    X = rng.rand(40, 12)
+    Y = X[:, :3] @ np.array([3.0, 2.0, 1.0]) + 0.1 * rng.rand(40)
+    return X, Y
+
+
+def test_pls_loo():
+    """test the fast PLS LOO against refitting the models"""
+
+    X, Y = make_data()
+    Yp = pls_loo(X, Y, 3)
+
+    for a in range(1, 4):
+        estimator = PLSRegression(n_components=a, scale=False)
+        Yref = cross_val_predict(estimator, X, Y, cv=LeaveOneOut()).ravel()
+        assert np.allclose(Yp[:, a-1], Yref)
+
+
+def test_pls_cv():
+    """test the nested-component CV against one CV per number of LV"""
+
+    X, Y = make_data()
+    cv = KFold(n_splits=5, shuffle=True, random_state=46)
+    Yp = pls_cv(X, Y, 4, cv)
+
+    for a in range(1, 5):
+        estimator = PLSRegression(n_components=a, scale=False)
+        Yref = cross_val_predict(estimator, X, Y, cv=cv).ravel()
+        assert np.allclose(Yp[:, a-1], Yref)
+
+    Q2, SDEP = pls_cv_curves(Y, Yp)
+    assert len(Q2) == len(SDEP) == 4
+    assert np.all(Q2 <= 1.0)
@@ -0,0 +1,84 @@
+import numpy as np
+from sklearn.metrics import confusion_matrix, matthews_corrcoef, r2_score
+
+from flame.stats import metrics
+
+
+def test_qualitative():
+    """test that the metrics match sklearn, also for batches of samples"""
+
+    rng = np.random.RandomState(0)
+    Y = rng.randint(0, 2, (5, 100))
+    Yp = np.where(rng.rand(5, 100) < 0.8, Y, 1 - Y)
+
+    batch = metrics.qualitative(Y, Yp)
+    for i in range(5):
+        single = metrics.qualitative(Y[i], Yp[i])
+        TN, FP, FN, TP = confusion_matrix(Y[i], Yp[i], labels=[0, 1]).ravel()
+        assert (single['TP'], single['TN'], single['FP'], single['FN']) == (TP, TN, FP, FN)
+        assert np.isclose(single['Sensitivity'], TP / (TP + FN))
+        assert np.isclose(single['MCC'], matthews_corrcoef(Y[i], Yp[i]))
+        for key, value in single.items():
+            assert np.isclose(batch[key][i], value)
+
+    # undefined metrics are 0.0
+    single = metrics.qualitative([1, 1, 1], [1, 1, 1])
+    assert single['Specificity'] == 0.0 and single['MCC'] == 0.0
+
+
+def test_quantitative():
+    rng = np.random.RandomState(1)
+    Y = rng.rand(50) * 5
+    Yp = Y + rng.normal(0, 0.5, (3, 50))
+
+    batch = metrics.quantitative(Y, Yp)
+    for i in range(3):
+        assert np.isclose(batch['Q2'][i], r2_score(Y, Yp[i]))
+        assert np.isclose(batch['SDEP'][i], np.sqrt(np.mean(np.square(Y - Yp[i]))))
+
+    assert metrics.quantitative(np.ones(4), np.zeros(4))['Q2'] == 0.0
+
+
+def test_conformal():
+    """test the conformal metrics against a per-object count"""
+
+    rng = np.random.RandomState(2)
+    Y = rng.randint(0, 2, 200)
+    C = rng.rand(200, 2) < 0.6
+
+    TP = TN = FP = FN = predicted = 0
+    for y, (c0, c1) in zip(Y, C):
+        if c0 != c1:
+            predicted += 1
+            TP += y == 1 and c1
+            TN += y == 0 and c0
+            FP += y == 0 and c1
+            FN += y == 1 and c0
+
+    results = metrics.conformal_qualitative(Y, C)
+    assert (results['TP'], results['TN'], results['FP'], results['FN']) == (TP, TN, FP, FN)
+    assert np.isclose(results['Conformal_coverage'], predicted / 200)
+    assert np.isclose(results['Conformal_accuracy'], (TP + TN) / predicted)
+
+    Y = np.array([1.0, 2.0, 3.0, 4.0])
+    results = metrics.conformal_quantitative(Y, Y - [0.5, 0.5, 1.0, -0.1], Y + [0.5, 1.5, 1.0, 0.2])
+    assert np.isclose(results['Conformal_mean_interval'], 1.275)
+    assert np.isclose(results['Conformal_accuracy'], 0.75)
+
+
+def test_bootstrap(monkeypatch):
+    """test that the intervals contain the estimate and do not depend on
+    the size of the batches"""
+
+    rng = np.random.RandomState(3)
+    Y = rng.randint(0, 2, 300)
+    C = np.column_stack((Y == 0, Y == 1)) ^ (rng.rand(300, 2) < 0.3)
+
+    estimate = metrics.conformal_qualitative(Y, C)
+    intervals = metrics.bootstrap(metrics.conformal_qualitative, (Y, C), samples=200)
+    for key in ('MCC', 'Conformal_coverage', 'Conformal_accuracy'):
+        lower, upper = intervals[key]
+        assert lower < estimate[key] < upper
+
+    monkeypatch.setattr(metrics, 'BOOTSTRAP_BATCH', 300 * 7)
+    assert metrics.bootstrap(metrics.conformal_qualitative, (Y, C), samples=200) == intervals
@@ -0,0 +1,105 @@
+import os
+import gzip
+import tarfile
+
+from flame import package
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as handle:
+        handle.write(content)
+
+
+def test_package(tmp_path):
+    """test the export and import of full and delta packages"""
+
+    source = str(tmp_path / 'source' / 'MODEL')
+    target = str(tmp_path / 'target' / 'MODEL')
+    estimator = os.urandom(100000)
+    write(os.path.join(source, 'dev', 'estimator.pkl'), estimator)
+    write(os.path.join(source, 'ver000001', 'estimator.pkl'), estimator)
+    write(os.path.join(source, 'ver000001', 'parameters.yaml'), b'version 1')
+
+    # the caches of the dev version are not exported
+    write(os.path.join(source, 'dev', 'stages', 'build.pkl'), estimator)
+    write(os.path.join(source, 'dev', 'parameters.snapshot'), b'snapshot')
+
+    full = str(tmp_path / 'full.tgz')
+    success, manifest = package.export_package(source, 'MODEL', full, workers=2)
+    assert success
+    assert [i['source'] for i in manifest['files']] == ['package', 'link', 'package']
+
+    # a standard tgz file with the manifest as first member
+    with tarfile.open(full, 'r:gz') as tar:
+        assert tar.getnames()[0] == package.MANIFEST
+
+    assert package.import_package(target, full) == (True, ['dev', 'ver000001'])
+    with open(os.path.join(target, 'ver000001', 'estimator.pkl'), 'rb') as handle:
+        assert handle.read() == estimator
+
+    # the dev version never shares files with the published versions
+    assert os.stat(os.path.join(target, 'dev', 'estimator.pkl')).st_nlink == 1
+
+    # versions already present are not imported again
+    assert package.import_package(target, full) == (True, [])
+
+    # delta packages only contain the contents missing in the target
+    write(os.path.join(source, 'ver000002', 'estimator.pkl'), estimator)
+    write(os.path.join(source, 'ver000002', 'parameters.yaml'), b'version 2')
+    base = package.tree_manifest(target, 'MODEL')
+
+    delta = str(tmp_path / 'delta.tgz')
+    success, manifest = package.export_package(source, 'MODEL', delta, base=base)
+    assert manifest['versions'] == ['ver000002']
+    assert [i['source'] for i in manifest['files']] == ['base', 'package']
+
+    assert package.import_package(target, delta) == (True, ['ver000002'])
+    with open(os.path.join(target, 'ver000002', 'estimator.pkl'), 'rb') as handle:
+        assert handle.read() == estimator
+
+
+def test_package_update(tmp_path):
+    """test the import of a full package in a target with a different dev
+    version, when the new versions link to the contents of dev"""
+
+    source = str(tmp_path / 'source' / 'MODEL')
+    target = str(tmp_path / 'target' / 'MODEL')
+    first, second, local = os.urandom(1000), os.urandom(1000), os.urandom(1000)
+    write(os.path.join(source, 'dev', 'estimator.pkl'), second)
+    write(os.path.join(source, 'ver000001', 'estimator.pkl'), first)
+    write(os.path.join(source, 'ver000002', 'estimator.pkl'), second)
+    write(os.path.join(target, 'dev', 'estimator.pkl'), local)
+    write(os.path.join(target, 'ver000001', 'estimator.pkl'), first)
+
+    full = str(tmp_path / 'full.tgz')
+    success, manifest = package.export_package(source, 'MODEL', full)
+    assert [i['source'] for i in manifest['files']] == ['package', 'package', 'link']
+
+    assert package.import_package(target, full) == (True, ['ver000002'])
+    with open(os.path.join(target, 'ver000002', 'estimator.pkl'), 'rb') as handle:
+        assert handle.read() == second
+    with open(os.path.join(target, 'dev', 'estimator.pkl'), 'rb') as handle:
+        assert handle.read() == local
+    assert sorted(os.listdir(target)) == ['dev', 'ver000001', 'ver000002']
+
+
+def test_corrupted_package(tmp_path):
+    """test that corrupted packages are not imported"""
+
+    source = str(tmp_path / 'source' / 'MODEL')
+    write(os.path.join(source, 'dev', 'estimator.pkl'), os.urandom(100000))
+
+    path = str(tmp_path / 'model.tgz')
+    assert package.export_package(source, 'MODEL', path)[0]
+
+    with gzip.open(path, 'rb') as handle:
+        data = bytearray(handle.read())
+    data[len(data)//2] ^= 0xff
+    with gzip.open(path, 'wb') as handle:
+        handle.write(data)
+
+    target = str(tmp_path / 'target' / 'MODEL')
+    success, message = package.import_package(target, path)
+    assert not success and 'Checksum mismatch' in message
+    assert not os.path.exists(target)
@@ -0,0 +1,61 @@
+import os
+import shutil
+
+import pytest
+import yaml
+
+from flame import parameters
+from flame.parameters import Parameters
+from flame.util import utils
+
+
+@pytest.fixture
+def model_path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'dev')
+    os.makedirs(path)
+    shutil.copy(os.path.join(os.path.dirname(parameters.__file__), 'children', 'parameters.yaml'), path)
+    monkeypatch.setattr(utils, 'model_path', lambda model, version: path)
+    return path
+
+
+def test_snapshot(model_path):
+    """test that the snapshot reproduces the YAML file and follows its changes"""
+
+    param = Parameters()
+    assert param.loadYaml('MODEL', 0)[0]
+    assert os.path.isfile(os.path.join(model_path, parameters.SNAPSHOT_FILE))
+
+    with open(os.path.join(model_path, 'parameters.yaml')) as handle:
+        p = yaml.safe_load(handle)
+
+    cached = Parameters()
+    assert cached.loadYaml('MODEL', 0)[0]
+    for key in p:
+        assert cached.getVal(key) == p[key]['value']
+    assert cached.getDict('MD_settings') == param.getDict('MD_settings')
+    assert cached.getVal('md5') == param.getVal('md5')
+
+    # the YAML file is parsed again when it changes
+    p['numCPUs']['value'] = 7
+    with open(os.path.join(model_path, 'parameters.yaml'), 'w') as handle:
+        yaml.dump(p, handle)
+
+    assert cached.loadYaml('MODEL', 0)[0]
+    assert cached.getVal('numCPUs') == 7
+
+
+def test_frozen(model_path):
+    """test that the frozen view is read-only and follows setVal"""
+
+    param = Parameters()
+    param.loadYaml('MODEL', 0)
+
+    values = param.frozen()
+    assert values['endpoint'] == 'MODEL'
+    with pytest.raises(TypeError):
+        values['numCPUs'] = 2
+
+    param.setVal('SDFile_name', 'NAME')
+    param.appVal('computeMD_method', 'morganFP')
+    assert values['SDFile_name'] == 'NAME'
+    assert values['computeMD_method'][-1] == 'morganFP'
@@ -56,3 +56,26 @@ def test_regression_conformal(make_model, build_model, fixed_results):
     result_values = np.array(prediction_results_dict["values"])
 
     assert all(np.isclose(fixed_results, result_values, rtol=1e-4))
+
+
+def test_regression_conformal_significances(make_model, build_model):
+    """test that several significances are obtained in a single prediction"""
+
+    build_status, _ = build_model
+    assert build_status is True
+
+    predictor = predict.Predict(MODEL_NAME, 0, label='temp')
+    predictor.param.setVal("output_format", "JSON")
+    predictor.param.setVal("conformalSignificanceList", [0.05, 0.1])
+    _, results_str = predictor.run(SDF_FILE_NAME)
+
+    prediction_results_dict = json.load(io.StringIO(results_str))
+    lower = np.array(prediction_results_dict["lower_limits"])
+    upper = np.array(prediction_results_dict["upper_limits"])
+
+    assert prediction_results_dict["significance_levels"] == [0.2, 0.05, 0.1]
+    assert np.allclose(lower[:, 0], prediction_results_dict["lower_limit"])
+    assert np.allclose(upper[:, 0], prediction_results_dict["upper_limit"])
+
+    # lower significance levels produce wider intervals
+    assert np.all(upper[:, 1] - lower[:, 1] >= upper[:, 0] - lower[:, 0])
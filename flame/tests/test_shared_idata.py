@@ -0,0 +1,102 @@
+import os
+
+import numpy as np
+
+from flame.conveyor import Conveyor
+from flame.parameters import Parameters
+
+
+def make_parameters(endpoint, version):
+    param = Parameters()
+    param.p = {}
+    param.extended = True
+    for key, value in (('endpoint', endpoint), ('version', version),
+                       ('model_path', f'/models/{endpoint}/dev'),
+                       ('input_type', 'molecule'),
+                       ('computeMD_method', ['RDKit_properties'])):
+        param.setVal(key, value)
+    return param
+
+
+def test_idata_hash_shared():
+    """test that the shared hash ignores the model identity"""
+
+    first = make_parameters('A', 0)
+    second = make_parameters('B', 1)
+    assert first.idataHash() != second.idataHash()
+    assert first.idataHash(shared=True) == second.idataHash(shared=True)
+
+    second.setVal('computeMD_method', ['morganFP'])
+    assert first.idataHash(shared=True) != second.idataHash(shared=True)
+
+
+def test_conveyor_copy():
+    """test that copies share the X matrix but not the rest of the data"""
+
+    conveyor = Conveyor()
+    conveyor.addVal(np.ones((3, 2)), 'xmatrix', 'X matrix', 'method', 'vars')
+    conveyor.addVal(np.array([1.0, np.nan, 2.0]), 'experim', 'Experimental',
+                    'decoration', 'objs')
+
+    new = conveyor.copy()
+    new.getVal('experim')[1] = -99999
+    new.addVal([1, 2, 3], 'values', 'Prediction', 'result', 'objs')
+
+    assert new.getVal('xmatrix') is conveyor.getVal('xmatrix')
+    assert np.isnan(conveyor.getVal('experim')[1])
+    assert not conveyor.isKey('values')
+    assert len(conveyor.manifest) == 2
+
+
+def test_multi_output(tmp_path, monkeypatch):
+    """test that every model of a multiple prediction writes its own
+    output files"""
+
+    import types
+    from flame import context, predict
+    from flame.odata import Odata
+    from flame.util import utils
+
+    for endpoint in ('A', 'B'):
+        (tmp_path / endpoint).mkdir()
+    monkeypatch.setattr(utils, 'model_repository_path', lambda: str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+
+    class FakePredict(predict.Predict):
+        """prediction adding the version of the model to the input values"""
+
+        def __init__(self, model, version=0, output_format=None, label=None):
+            self.model = model
+            self.version = version
+            self.param = make_parameters(model, version)
+            self.param.setVal('output_format', ['TSV'])
+            self.param.setVal('confidential', True)
+            self.conveyor = Conveyor()
+            self.conveyor.addVal(label, 'prediction_label', 'prediction label', 'method', 'single')
+            self.odata_child = types.SimpleNamespace(OdataChild=Odata)
+            self.output_name = 'output'
+
+        def run_idata(self, input_source):
+            self.conveyor.addVal(np.arange(3.0).reshape(3, 1), 'xmatrix', 'X matrix', 'method', 'vars')
+            self.conveyor.addVal(['a', 'b', 'c'], 'obj_nam', 'Mol name', 'label', 'objs')
+            self.conveyor.addVal(3, 'obj_num', 'Num mol', 'method', 'single')
+
+        def run_apply(self):
+            self.conveyor.setOrigin('apply')
+            values = self.conveyor.getVal('xmatrix')[:, 0] + self.version
+            self.conveyor.addVal(values, 'values', 'Prediction', 'result', 'objs')
+            self.conveyor.addMain('values')
+
+    monkeypatch.setattr(predict, 'Predict', FakePredict)
+
+    success, results = context.predict_multi_cmd({'endpoints': ['A', 'B', 'A'],
+                                                  'versions': [1, 2, 3],
+                                                  'infile': 'input.sdf'})
+    assert success
+    assert [i[2] for i in results] == [True, True, True]
+    assert not os.path.isfile('output.tsv')
+    for endpoint, version in (('A', 1), ('B', 2), ('A', 3)):
+        with open(f'output_{endpoint}_v{version}.tsv') as fi:
+            lines = fi.read().splitlines()
+        assert [line.split('\t')[1] for line in lines[1:]] == \
+            [f'{i + version:.4f}' for i in range(3)]
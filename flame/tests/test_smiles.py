@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+from rdkit import Chem
+
+import flame.chem.smilesutils as smiutils
+from flame.conveyor import Conveyor
+from flame.idata import Idata
+from flame.parameters import Parameters
+
+TEST_SDF = os.path.join(os.path.dirname(__file__), 'data', 'minicaco.sdf')
+
+
+def write_smiles(path):
+    """writes the molecules of the test SDFile as a CSV table, with an
+    invalid SMILES in the middle"""
+
+    mols = [mol for mol in Chem.SDMolSupplier(TEST_SDF)]
+    with open(path, 'w') as fo:
+        fo.write('name,ID,smiles,activity\n')
+        for i, mol in enumerate(mols):
+            fo.write(f'"{mol.GetProp("name")}",id{i},{Chem.MolToSmiles(mol)},{mol.GetProp("activity")}\n')
+            if i == 4:
+                fo.write('wrong,idX,C1CC,1.0\n')
+    return mols
+
+
+def test_smiles_files(tmp_path):
+    """test the supplier and the split of .smi and CSV files"""
+
+    smi = str(tmp_path / 'input.smi')
+    with open(smi, 'w') as fo:
+        fo.write('CCO ethanol\n\n# comment\nc1ccccc1 benzene ring\nXX\n')
+
+    mols = list(smiutils.SmilesSupplier(smi))
+    assert len(mols) == 3 and mols[2] is None
+    assert [mol.GetProp('_Name') for mol in mols[:2]] == ['ethanol', 'benzene ring']
+    assert smiutils.count_mols(smi) == 2
+
+    csv = str(tmp_path / 'input.csv')
+    expected = write_smiles(csv)
+
+    mols = [mol for mol in smiutils.SmilesSupplier(csv) if mol is not None]
+    assert len(mols) == len(expected)
+    assert mols[3].GetProp('name') == expected[3].GetProp('name')
+    assert mols[3].GetProp('ID') == 'id3'
+    assert float(mols[3].GetProp('activity')) == float(expected[3].GetProp('activity'))
+
+    success, (names, sizes) = smiutils.split_SMIfile(csv, 3)
+    assert success
+    assert sizes == [3, 3, 4]
+    assert [smiutils.count_mols(i) for i in names] == sizes
+    assert open(names[1]).readline() == 'name,ID,smiles,activity\n'
+
+
+def test_idata_smiles(tmp_path):
+    """test that idata extracts the same information from SMILES and SDFiles"""
+
+    csv = str(tmp_path / 'input.csv')
+    write_smiles(csv)
+
+    param = Parameters()
+    param.p = {}
+    param.extended = True
+    for key, value in (('SDFile_name', ['GENERIC_NAME', 'name']),
+                       ('SDFile_id', 'ID'),
+                       ('SDFile_activity', 'activity')):
+        param.setVal(key, value)
+
+    results = {}
+    for input_type, ifile in (('molecule', TEST_SDF), ('smiles', csv)):
+        param.setVal('input_type', input_type)
+        conveyor = Conveyor()
+        idata = Idata(param, conveyor, ifile)
+        success_list = idata.extractInformation(ifile)
+        assert len(success_list) == 10
+        results[input_type] = conveyor
+
+    for key in ('obj_nam', 'SMILES'):
+        assert results['smiles'].getVal(key) == results['molecule'].getVal(key)
+    assert np.allclose(results['smiles'].getVal('ymatrix'), results['molecule'].getVal('ymatrix'))
+    assert results['smiles'].getVal('obj_id')[9] == 'id9'
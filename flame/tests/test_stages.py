@@ -0,0 +1,137 @@
+import os
+
+import numpy as np
+import yaml
+
+from flame import stages
+from flame.conveyor import Conveyor
+from flame.parameters import Parameters
+
+TEMPLATE = os.path.join(os.path.dirname(__file__), '..', 'children', 'parameters.yaml')
+
+
+def make_param(model_path):
+    """default parameters of the template, for a quantitative RF model"""
+
+    param = Parameters()
+    with open(TEMPLATE) as handle:
+        param.p = yaml.safe_load(handle)
+    param.extended = True
+    for key, value in (('model_path', str(model_path)),
+                       ('input_type', 'data'),
+                       ('model', 'RF'),
+                       ('quantitative', True),
+                       ('conformal', False),
+                       ('tune', False),
+                       ('build_cache', True)):
+        param.setVal(key, value)
+    param.setInnerVal('RF_parameters', 'n_estimators', 10)
+    return param
+
+
+def test_stage_keys(tmp_path):
+    """test that every change invalidates only the stages using it"""
+
+    rng = np.random.RandomState(0)
+    X = rng.rand(20, 4)
+    Y = rng.rand(20)
+    param = make_param(tmp_path)
+
+    def keys(X=X):
+        s = stages.Stages(param, X, Y)
+        return {stage: s.key(stage) for stage in stages.STAGES}
+
+    reference = keys()
+    assert keys() == reference
+
+    param.setVal('conformalSignificance', 0.1)
+    changed = keys()
+    assert [i for i in reference if reference[i] != changed[i]] == ['validate']
+
+    param.setInnerVal('RF_parameters', 'n_estimators', 20)
+    changed = keys()
+    assert [i for i in reference if reference[i] != changed[i]] == ['build', 'validate']
+
+    # parameters of other models are ignored
+    param.setInnerVal('SVM_parameters', 'C', 2.0)
+    assert keys() == changed
+
+    # the PLS models of FFD are used only by this feature selection
+    param.setInnerVal('PLSR_parameters', 'n_components', 3)
+    assert keys() == changed
+    param.setVal('feature_selection', 'FFD')
+    reference = keys()
+    param.setInnerVal('PLSR_parameters', 'n_components', 4)
+    changed = keys()
+    assert all(reference[i] != changed[i] for i in reference)
+    param.setVal('numCPUs', 4)
+    assert keys() == changed
+
+    changed = keys(X=X * 2)
+    assert all(reference[i] != changed[i] for i in reference)
+
+
+def test_stage_results(tmp_path):
+    """test that the results are recycled only with the same key"""
+
+    param = make_param(tmp_path)
+    X = np.ones((3, 2))
+    Y = np.ones(3)
+
+    s = stages.Stages(param, X, Y)
+    assert s.get('build') is None
+    s.put('build', {'results': [1, 2]})
+    assert os.path.isfile(os.path.join(tmp_path, stages.STAGES_DIR, 'build.pkl'))
+    assert stages.Stages(param, X, Y).get('build') == {'results': [1, 2]}
+
+    param.setVal('tune', True)
+    assert stages.Stages(param, X, Y).get('build') is None
+
+    # results which cannot be saved remove the previous ones
+    s = stages.Stages(param, X, Y)
+    s.put('build', {'results': lambda x: x})
+    assert not os.path.isfile(os.path.join(tmp_path, stages.STAGES_DIR, 'build.pkl'))
+
+
+def test_learn_stages(tmp_path, monkeypatch):
+    """test that a rebuild changing only the validation settings recycles
+    the fitted model"""
+
+    from flame.learn import Learn
+    from flame.stats import base_model
+    from flame.stats.RF import RF
+
+    # leave-one-out avoids depending on the cross-validators of the model
+    monkeypatch.setattr(base_model, 'getCrossVal', lambda *args: None)
+
+    rng = np.random.RandomState(1)
+    X = rng.rand(30, 4)
+    Y = X[:, 0] * 2 + rng.normal(0, 0.1, 30)
+    param = make_param(tmp_path)
+
+    def learn():
+        conveyor = Conveyor()
+        conveyor.addVal(X, 'xmatrix', 'X matrix', 'method', 'vars')
+        conveyor.addVal(Y, 'ymatrix', 'Activity', 'method', 'objs')
+        Learn(param, conveyor).run()
+        assert not conveyor.getError()
+        return dict((i[0], i[2]) for i in conveyor.getVal('model_valid_info')
+                    if not isinstance(i[2], np.ndarray))
+
+    expected = learn()
+
+    # the estimator is only saved by the build stage
+    s = stages.Stages(param, X, Y)
+    assert 'estimator' in s.get('build')['state']
+    assert 'estimator' not in s.get('validate')['state']
+
+    def build(self):
+        raise AssertionError('the model was built again')
+
+    monkeypatch.setattr(RF, 'build', build)
+    assert learn() == expected
+
+    # the validation is run again with the recycled estimator
+    param.setVal('conformalSignificance', 0.1)
+    assert learn() == expected
+    assert os.path.isfile(os.path.join(tmp_path, 'estimator.pkl'))
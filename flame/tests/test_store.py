@@ -0,0 +1,51 @@
+import os
+
+from flame import store
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as handle:
+        handle.write(content)
+
+
+def test_store(tmp_path):
+    """test that published versions share identical files and that unused objects are freed"""
+
+    tree = str(tmp_path)
+    dev = os.path.join(tree, 'dev')
+    write(os.path.join(dev, 'estimator.pkl'), 'estimator')
+    write(os.path.join(dev, 'parameters.yaml'), 'parameters')
+
+    store.copy_version(tree, dev, os.path.join(tree, 'ver000001'))
+    store.copy_version(tree, dev, os.path.join(tree, 'ver000002'))
+
+    estimators = [os.path.join(tree, i, 'estimator.pkl') for i in ('ver000001', 'ver000002')]
+    assert os.path.samefile(*estimators)
+    assert os.stat(estimators[0]).st_nlink == 3
+
+    # the caches of the dev version are not published
+    write(os.path.join(dev, 'stages', 'build.pkl'), 'stage')
+    write(os.path.join(dev, 'parameters.snapshot'), 'snapshot')
+    store.copy_version(tree, dev, os.path.join(tree, 'ver000005'))
+    assert sorted(os.listdir(os.path.join(tree, 'ver000005'))) == ['estimator.pkl', 'parameters.yaml']
+    os.remove(os.path.join(tree, 'ver000005', 'estimator.pkl'))
+
+    # the dev version and the mutable files are never linked
+    assert os.stat(os.path.join(dev, 'estimator.pkl')).st_nlink == 1
+    assert os.stat(os.path.join(tree, 'ver000001', 'parameters.yaml')).st_nlink == 1
+
+    # an imported copy is linked to the same object
+    write(os.path.join(tree, 'ver000003', 'estimator.pkl'), 'estimator')
+    store.deduplicate(tree, os.path.join(tree, 'ver000003'))
+    assert os.stat(estimators[0]).st_nlink == 4
+
+    # objects are only freed when no version uses them
+    write(os.path.join(dev, 'estimator.pkl'), 'new estimator')
+    store.copy_version(tree, dev, os.path.join(tree, 'ver000004'))
+    assert store.collect(tree) == 0
+
+    os.remove(os.path.join(tree, 'ver000004', 'estimator.pkl'))
+    assert store.collect(tree) == len('new estimator')
+    with open(estimators[1]) as handle:
+        assert handle.read() == 'estimator'
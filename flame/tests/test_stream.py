@@ -0,0 +1,159 @@
+import os
+
+import numpy as np
+import yaml
+from rdkit import Chem
+
+from flame import stream
+from flame.apply import Apply
+from flame.conveyor import Conveyor
+from flame.parameters import Parameters
+
+TEST_SDF = os.path.join(os.path.dirname(__file__), 'data', 'minicaco.sdf')
+
+
+def test_sdf_chunks(tmp_path):
+    """test that the chunks contain all the molecules of the input file"""
+
+    # remove the name of the last molecule
+    text = open(TEST_SDF).read().split('$$$$\n')
+    text[9] = '\n' + text[9].split('\n', 1)[1]
+    ifile = str(tmp_path / 'input.sdf')
+    with open(ifile, 'w') as fo:
+        fo.write('$$$$\n'.join(text))
+
+    dest = tmp_path / 'chunks'
+    dest.mkdir()
+
+    names = []
+    sizes = []
+    for chunk_file in stream.sdf_chunks(ifile, 4, str(dest)):
+        mols = [mol for mol in Chem.SDMolSupplier(chunk_file)]
+        sizes.append(len(mols))
+        names += [mol.GetProp('_Name') for mol in mols]
+
+    expected = [mol.GetProp('_Name') for mol in Chem.SDMolSupplier(TEST_SDF)]
+    assert sizes == [4, 4, 2]
+    assert names[:9] == expected[:9]
+    assert names[9] == 'mol0000000009'
+
+    # chunk files are removed, also when the generator is not consumed
+    next(stream.sdf_chunks(ifile, 4, str(dest)))
+    assert os.listdir(dest) == []
+
+
+def make_conveyor(Ye, **values):
+    conveyor = Conveyor()
+    conveyor.addVal(Ye, 'ymatrix', 'Activity', 'decoration', 'objs')
+    for key, value in values.items():
+        conveyor.addVal(value, key, key, 'result', 'objs')
+    return conveyor
+
+
+def validate(param, Ye, **values):
+    conveyor = make_conveyor(Ye, **values)
+    Apply(param, conveyor).external_validation()
+    return conveyor
+
+
+def test_validation_stats():
+    """test that the statistics combined over chunks match the external
+    validation of the whole series"""
+
+    rng = np.random.RandomState(0)
+    split = 37
+
+    for quantitative, conformal in ((True, False), (False, False), (False, True), (True, True)):
+        param = Parameters()
+        param.p = {}
+        param.extended = True
+        param.setVal('quantitative', quantitative)
+        param.setVal('conformal', conformal)
+
+        if quantitative and not conformal:
+            Ye = rng.rand(100) * 5
+            values = {'values': Ye + rng.normal(0, 0.5, 100)}
+        elif not conformal:
+            Ye = rng.randint(0, 2, 100).astype(float)
+            values = {'values': np.where(rng.rand(100) < 0.8, Ye, 1 - Ye)}
+        elif not quantitative:
+            Ye = rng.randint(0, 2, 100).astype(float)
+            c0 = rng.rand(100) < 0.6
+            values = {'c0': c0, 'c1': ~c0 | (rng.rand(100) < 0.2)}
+        else:
+            Ye = rng.rand(100) * 5
+            center = Ye + rng.normal(0, 0.5, 100)
+            values = {'lower_limit': center - 0.6, 'upper_limit': center + 0.6}
+
+        whole = validate(param, Ye, **values)
+
+        stats = stream.ValidationStats(param)
+        stats.add(validate(param, Ye[:split], **{k: v[:split] for k, v in values.items()}))
+        stats.add(validate(param, Ye[split:], **{k: v[split:] for k, v in values.items()}))
+
+        expected = whole.getVal('external-validation')
+        results = stats.results()
+        assert [i[0] for i in results] == [i[0] for i in expected]
+        assert np.allclose([i[2] for i in results], [i[2] for i in expected])
+
+    # bootstrap confidence intervals of the metrics
+    param.setVal('validation_bootstrap', 100)
+    results = dict((i[0], i[2]) for i in validate(param, Ye, **values).getVal('external-validation'))
+    assert results['Conformal_accuracy_CI_lower'] <= results['Conformal_accuracy'] <= \
+        results['Conformal_accuracy_CI_upper']
+
+    # chunks without external validation are ignored
+    assert stream.ValidationStats(param).results() is None
+    stats = stream.ValidationStats(param)
+    stats.add(Conveyor())
+    assert stats.results() is None
+
+
+def test_shared_model(tmp_path):
+    """test that the chunks of a streamed prediction load the model once"""
+
+    import pickle
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.preprocessing import StandardScaler
+
+    rng = np.random.RandomState(0)
+    X = rng.rand(40, 4)
+    Y = X[:, 0] * 2
+    scaler = StandardScaler().fit(X)
+    estimator = RandomForestRegressor(n_estimators=5, random_state=46)
+    estimator.fit(scaler.transform(X), Y)
+
+    with open(tmp_path / 'preprocessing.pkl', 'wb') as handle:
+        pickle.dump({'version': 1, 'scaler': scaler, 'variable_mask': None}, handle)
+    with open(tmp_path / 'estimator.pkl', 'wb') as handle:
+        pickle.dump({'version': 1, 'estimator': estimator}, handle)
+
+    # default parameters of the template
+    param = Parameters()
+    with open(os.path.join(os.path.dirname(__file__), '..', 'children', 'parameters.yaml')) as handle:
+        param.p = yaml.safe_load(handle)
+    param.extended = True
+    for key, value in (('model_path', str(tmp_path)),
+                       ('model', 'RF'),
+                       ('quantitative', True),
+                       ('conformal', False),
+                       ('feature_selection', False),
+                       ('modelAutoscaling', 'StandardScaler')):
+        param.setVal(key, value)
+
+    loaded = {}
+    values = []
+    for chunk in (X[:20], X[20:]):
+        conveyor = Conveyor()
+        conveyor.addVal(chunk, 'xmatrix', 'X matrix', 'method', 'vars')
+        apply = Apply(param, conveyor)
+        apply.loaded = loaded
+        apply.run()
+        assert not conveyor.getError()
+        values.append(conveyor.getVal('values'))
+
+        # the next chunks do not read the model folder
+        for name in os.listdir(tmp_path):
+            os.remove(tmp_path / name)
+
+    assert np.allclose(np.concatenate(values), estimator.predict(scaler.transform(X)))
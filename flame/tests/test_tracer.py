@@ -0,0 +1,79 @@
+import io
+import tracemalloc
+
+import numpy as np
+
+from flame.conveyor import Conveyor
+from flame.util import tracer
+
+
+def test_tracer_spans():
+    """test that the spans are nested and repeated stages accumulated"""
+
+    conveyor = Conveyor()
+    with conveyor.span('idata'):
+        for i in range(3):
+            with conveyor.span('normalize', 2):
+                pass
+        with conveyor.span('computeMD', 6):
+            pass
+    with conveyor.span('odata'):
+        spans = conveyor.tracer.to_dict()
+
+    assert [i['name'] for i in spans] == ['idata', 'odata']
+    normalize, compute = spans[0]['children']
+    assert normalize['calls'] == 3 and normalize['objects'] == 6
+    assert compute['calls'] == 1 and spans[0]['objects'] is None
+    assert spans[0]['duration'] >= normalize['duration'] + compute['duration']
+
+    # spans still open are exported with the time elapsed
+    assert spans[1]['duration'] >= 0.0
+
+    events = tracer.to_chrome(spans)['traceEvents']
+    assert [i['name'] for i in events] == ['idata', 'normalize', 'computeMD', 'odata']
+    assert all(i['ph'] == 'X' for i in events)
+
+
+def test_trace_saved():
+    """test that the trace is saved with the conveyor meta"""
+
+    conveyor = Conveyor()
+    with conveyor.span('apply', 10):
+        pass
+
+    handle = io.BytesIO()
+    conveyor.save(handle)
+    handle.seek(0)
+
+    loaded = Conveyor()
+    assert loaded.load(handle)[0]
+    assert loaded.getMeta('trace')[0]['name'] == 'apply'
+    assert loaded.getMeta('trace')[0]['objects'] == 10
+
+
+def test_memory_accounting():
+    """test the peak memory allocated by nested stages"""
+
+    conveyor = Conveyor()
+    conveyor.tracer.enable_memory()
+
+    with conveyor.span('learn'):
+        with conveyor.span('build'):
+            X = np.ones((1000, 1000))
+            del X
+        with conveyor.span('validate'):
+            pass
+        conveyor.addVal(np.ones((500, 500)), 'xmatrix', 'X matrix', 'method', 'vars')
+
+    assert not tracemalloc.is_tracing()
+
+    learn = conveyor.tracer.to_dict()[0]
+    build, validate = learn['children']
+
+    # 8 MB allocated and released within build
+    assert build['memory']['allocated_peak'] >= 7.5
+    assert validate['memory']['allocated_peak'] < 1.0
+    assert learn['memory']['allocated_peak'] >= 7.5
+    assert len(learn['memory']['top']) > 0
+    assert learn['memory']['arrays']['xmatrix'] == 500 * 500 * 8 / tracer.MB
+    assert 'arrays' not in build['memory']
@@ -3,6 +3,8 @@ import pathlib
 import os
 import sys
 
+import numpy as np
+
 from flame.util import utils
 from flame import manage
 
@@ -53,3 +55,26 @@ def test_module_path_module_name():
     manage.action_new(MODEL_NAME)
     module_name = utils.module_path(MODEL_NAME, 0)
     assert module_name == (MODEL_NAME + ".dev")
+
+
+def test_cast_matrix():
+    X = np.array([[1.0, 2.0], [3.0, 1.0e200]])
+
+    success, Xc = utils.cast_matrix(X, np.float64)
+    assert success and Xc is X
+
+    success, message = utils.cast_matrix(X, np.float32)
+    assert not success
+
+    success, Xc = utils.cast_matrix(X[:, :1], np.float32)
+    assert success and Xc.dtype == np.float32
+
+
+def test_check_precision():
+    rng = np.random.RandomState(0)
+    X = np.ones((50, 3), dtype=np.float32)
+    X[:, 0] = rng.rand(50)
+    X[:, 1] = 1.0e4 + rng.rand(50) * 1.0e-2
+
+    assert utils.check_precision(X, chunk=7) == [1]
+    assert utils.check_precision(X.astype(np.float64)) == []
@@ -0,0 +1,319 @@
+#! -*- coding: utf-8 -*-
+
+# Description    Flame workflow tracer
+#
+# Authors:       Manuel Pastor (manuel.pastor@upf.edu)
+#
+# Copyright 2018 Manuel Pastor
+#
+# This file is part of Flame
+#
+# Flame is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 3.
+#
+# Flame is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Flame. If not, see <http://www.gnu.org/licenses/>.
+
+''' Records the time spent in every stage of the workflows as a tree of
+    nested spans. Every span is a dictionary with the keys:
+
+    - name: name of the stage (e.g. 'idata', 'normalize')
+    - start: seconds since the start of the trace
+    - duration: total seconds spent in the stage
+    - calls: number of times the stage was run
+    - objects: number of objects processed (None if unknown)
+    - children: list of nested spans
+
+    Stages run repeatedly within the same parent (e.g. the normalization of
+    every molecule) are accumulated in a single span
+
+    When the memory accounting is enabled every span also contains a key
+    'memory', with the values in MB:
+
+    - rss_peak: high-water mark of the process resident memory at the end
+    - rss_growth: increase of the high-water mark during the stage
+    - allocated_peak: peak of the memory allocated by Python during the
+      stage (tracemalloc), above the memory allocated at the start
+
+    The two outer levels of spans also list the source lines responsible for
+    the largest allocations still alive at the end of the stage (top) and
+    the conveyor adds to the top level spans the size of its largest arrays
+    (arrays). Only the maximum value of repeated stages is kept '''
+
+import sys
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# not available in Windows
+try:
+    import resource
+except ImportError:
+    resource = None
+
+MB = 1024 * 1024
+
+# number of allocators reported and levels of spans where they are computed
+TOP_ALLOCATORS = 5
+TOP_LEVELS = 2
+
+
+def rss_peak():
+    ''' high-water mark of the resident memory of the process, in MB '''
+
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in bytes in macOS and in KB in Linux
+    if sys.platform == 'darwin':
+        return peak / MB
+    return peak / 1024
+
+
+def top_allocators(n=TOP_ALLOCATORS):
+    ''' source lines with the largest memory blocks currently allocated '''
+
+    if not tracemalloc.is_tracing():
+        return []
+
+    snapshot = tracemalloc.take_snapshot()
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>')))
+
+    top = []
+    for stat in snapshot.statistics('lineno')[:n]:
+        frame = stat.traceback[0]
+        top.append({'line': f'{frame.filename}:{frame.lineno}',
+                    'size': stat.size / MB,
+                    'count': stat.count})
+    return top
+
+
+class Tracer:
+    '''
+        Tree of timed spans of a workflow run
+
+        ...
+
+        Attributes
+        ----------
+
+        spans : list
+            top level spans
+        stack : list
+            spans currently open, from the outermost to the innermost
+        memory : bool
+            if True, the memory used by every span is recorded
+
+        Methods
+        -------
+
+        span(name, objects)
+            context manager timing the code within
+        enable_memory()
+            starts recording the memory used by the spans
+        to_dict()
+            returns the spans, including the time elapsed in the open ones
+    '''
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.stack = []
+        self.memory = False
+
+    def enable_memory(self):
+        self.memory = True
+
+    def memory_start(self, span):
+        ''' records the memory at the start of the span. Python allocations
+        are traced only within the top level spans '''
+
+        if len(self.stack) == 0:
+            span['_tracing'] = not tracemalloc.is_tracing()
+            if span['_tracing']:
+                tracemalloc.start()
+
+        # the peak of the parent is reset, keeping the value reached so far
+        current, peak = tracemalloc.get_traced_memory()
+        if len(self.stack) > 0:
+            parent = self.stack[-1]
+            parent['_peak'] = max(parent['_peak'], peak)
+        tracemalloc.reset_peak()
+
+        span['_start'] = (current, rss_peak())
+        span['_peak'] = current
+
+    def memory_stop(self, span):
+        ''' stores the memory used by the span, propagating its peak
+        to the parent span '''
+
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(span.pop('_peak'), peak)
+        start_allocated, start_rss = span.pop('_start')
+
+        rss = rss_peak()
+        memory = {'rss_peak': rss,
+                  'rss_growth': None if rss is None else rss - start_rss,
+                  'allocated_peak': (peak - start_allocated) / MB}
+
+        if len(self.stack) < TOP_LEVELS:
+            memory['top'] = top_allocators()
+
+        if len(self.stack) > 0:
+            parent = self.stack[-1]
+            parent['_peak'] = max(parent['_peak'], peak)
+        elif span.pop('_tracing'):
+            tracemalloc.stop()
+
+        # repeated stages keep the maximum values
+        previous = span.get('memory')
+        if previous is not None:
+            for key in ('rss_peak', 'rss_growth', 'allocated_peak'):
+                if previous[key] is not None:
+                    memory[key] = max(memory[key], previous[key])
+            if 'top' in memory and 'top' in previous:
+                memory['top'] = previous['top']
+
+        span['memory'] = memory
+
+    @contextmanager
+    def span(self, name, objects=None):
+        ''' times the code within the context as a child of the innermost
+        open span '''
+
+        siblings = self.stack[-1]['children'] if self.stack else self.spans
+
+        current = None
+        for item in siblings:
+            if item['name'] == name:
+                current = item
+                break
+
+        start = time.perf_counter() - self.origin
+        if current is None:
+            current = {'name': name, 'start': start, 'duration': 0.0,
+                       'calls': 0, 'objects': None, 'children': []}
+            siblings.append(current)
+
+        current['calls'] += 1
+        if objects is not None:
+            current['objects'] = (current['objects'] or 0) + int(objects)
+
+        if self.memory:
+            self.memory_start(current)
+
+        current['open'] = start
+        self.stack.append(current)
+        try:
+            yield current
+        finally:
+            self.stack.pop()
+            current['duration'] += time.perf_counter() - self.origin - current.pop('open')
+            if self.memory:
+                self.memory_stop(current)
+
+    def to_dict(self):
+        ''' returns a copy of the spans, where the spans still open include
+        the time elapsed until now '''
+
+        now = time.perf_counter() - self.origin
+
+        def closed(span):
+            item = {key: value for key, value in span.items()
+                    if key not in ('open', 'children') and key[0] != '_'}
+            if 'open' in span:
+                item['duration'] += now - span['open']
+            item['children'] = [closed(i) for i in span['children']]
+            return item
+
+        return [closed(i) for i in self.spans]
+
+
+def to_chrome(spans):
+    ''' converts a list of spans, as returned by Tracer.to_dict, to Chrome
+    trace event format (chrome://tracing, Perfetto). Accumulated spans are
+    shown as a single event starting at the first call '''
+
+    events = []
+
+    def add(span):
+        events.append({'name': span['name'],
+                       'ph': 'X',
+                       'ts': span['start'] * 1e6,
+                       'dur': span['duration'] * 1e6,
+                       'pid': 1,
+                       'tid': 1,
+                       'args': {'calls': span['calls'],
+                                'objects': span['objects'],
+                                'memory': span.get('memory')}})
+        for child in span['children']:
+            add(child)
+
+    for span in spans:
+        add(span)
+
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def to_text(spans):
+    ''' returns a list of lines representing the spans as an indented tree '''
+
+    lines = []
+
+    def add(span, level):
+        objects = '' if span['objects'] is None else f'{span["objects"]} objs'
+        lines.append(f'{"  "*level+span["name"]:30} {span["duration"]:10.4f} s'
+                     f' {span["calls"]:6d} calls  {objects}')
+
+        memory = span.get('memory')
+        if memory is not None:
+            lines.append(f'{"  "*(level+1)}memory: {memory_text(memory)}')
+        for child in span['children']:
+            add(child, level+1)
+
+    for span in spans:
+        add(span, 0)
+
+    return lines
+
+
+def memory_text(memory):
+    ''' summary of the memory used by a span, in a single line '''
+
+    text = f'allocated peak {memory["allocated_peak"]:.1f} MB'
+    if memory['rss_peak'] is not None:
+        text += (f', RSS peak {memory["rss_peak"]:.1f} MB'
+                 f' (+{memory["rss_growth"]:.1f} MB)')
+
+    if len(memory.get('arrays', {})) > 0:
+        largest = max(memory['arrays'], key=memory['arrays'].get)
+        text += f', largest array {largest} {memory["arrays"][largest]:.1f} MB'
+
+    return text
+
+
+def save_trace(spans, path, oformat='chrome'):
+    ''' writes the spans to a JSON file, as Chrome trace events or as
+    the tree of spans (oformat='JSON') '''
+
+    if oformat == 'chrome':
+        spans = to_chrome(spans)
+
+    try:
+        with open(path, 'w') as handle:
+            json.dump(spans, handle)
+    except Exception as e:
+        return False, f'Unable to write trace to {path} with exception {e}'
+
+    return True, 'OK'
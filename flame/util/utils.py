@@ -374,3 +374,74 @@ def qualitative_Y (Y):
         return False, f'Y values not suitable for building a qualitative model. Found {ext} objects not 1.000 or 0.000'
     
     return True, 'OK'
+
+def descriptor_dtype (param):
+    ''' Returns the numpy dtype used to store descriptor matrices, as defined by the 
+        descriptor_dtype parameter (float64 by default). Fingerprints are always
+        stored as uint8
+    '''
+    if param.getVal('descriptor_dtype') == 'float32':
+        return np.float32
+    return np.float64
+
+def cast_matrix (X, dtype):
+    ''' Converts the X matrix to dtype, without copying if it has already this dtype.
+        Fails if any finite value is out of the range of dtype
+    '''
+    X = np.asarray(X)
+    if X.dtype == dtype:
+        return True, X
+
+    with np.errstate(over='ignore'):
+        Xc = X.astype(dtype)
+
+    if np.count_nonzero(np.isinf(Xc)) != np.count_nonzero(np.isinf(X)):
+        return False, f'X matrix contains values out of the {np.dtype(dtype).name} range'
+
+    return True, Xc
+
+def check_precision (X, var_nam=None, chunk=10000):
+    ''' Identifies the variables of float32 X matrices with a standard deviation too small, 
+        relative to their mean, to be represented accurately. Models built with such 
+        variables can differ from models built with float64 matrices
+
+        The statistics are computed in float64 and in chunks of objects, so X can be
+        a memory map
+
+        Returns a list with the index of these variables
+    '''
+    if X.dtype != np.float32:
+        return []
+
+    nobj, nvarx = np.shape(X)
+    n = 0
+    mean = np.zeros(nvarx)
+    M2 = np.zeros(nvarx)
+
+    # merge the mean and the sum of squares of every chunk (Chan et al.)
+    for start in range (0, nobj, chunk):
+        Xc = np.asarray(X[start:start+chunk], dtype=np.float64)
+        nc = Xc.shape[0]
+        mc = np.mean(Xc, axis=0)
+        M2c = np.sum(np.square(Xc-mc), axis=0)
+
+        delta = mc-mean
+        total = n+nc
+        mean += delta*nc/total
+        M2 += M2c + np.square(delta)*n*nc/total
+        n = total
+
+    std = np.sqrt(M2/max(n,1))
+
+    # below this limit the variability is described by the last 3 digits of float32
+    limit = np.abs(mean) * np.finfo(np.float32).eps * 1000.0
+    lost = np.where((std > 0.0) & (std < limit))[0].tolist()
+
+    if len(lost) > 0:
+        names = lost
+        if var_nam is not None and len(var_nam) == nvarx:
+            names = [var_nam[i] for i in lost]
+        LOG.warning(f'{len(lost)} variables have a variance too small to be represented accurately '
+                    f'in float32, consider using float64 descriptors: {names[:10]}')
+
+    return lost